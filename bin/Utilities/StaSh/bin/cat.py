@@ -6,13 +6,18 @@
 from __future__ import print_function
 
 import argparse
+import re
 import string
 import sys
-import fileinput
+
+_stash = globals()["_stash"]
+
+# \w and \s match the characters for which isalnum() and isspace() are true
+_NON_PRINTABLE_RE = re.compile(r'[^\w\s' + re.escape(string.punctuation) + r']', re.UNICODE)
 
 
 def filter_non_printable(s):
-    return ''.join([c if c.isalnum() or c.isspace() or c in string.punctuation else ' ' for c in s])
+    return _NON_PRINTABLE_RE.sub(' ', s)
 
 
 def main(args):
@@ -22,15 +27,18 @@ def main(args):
 
     status = 0
 
-    fileinput.close()  # in case it is not closed
-    try:
-        for line in fileinput.input(ns.files, openhook=fileinput.hook_encoded("utf-8")):
-            print(filter_non_printable(line), end='')
-    except Exception as e:
-        print('cat: %s' % str(e))
-        status = 1
-    finally:
-        fileinput.close()
+    for reader, filename, error in _stash.libcore.input_readers(ns.files):
+        if reader is None:
+            print('cat: %s' % str(error))
+            status = 1
+            continue
+        with reader:
+            try:
+                for text in reader.text_blocks():
+                    sys.stdout.write(filter_non_printable(text))
+            except Exception as e:
+                print('cat: %s' % str(e))
+                status = 1
 
     sys.exit(status)
 
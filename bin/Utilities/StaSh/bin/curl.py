@@ -8,6 +8,8 @@ import requests
 
 from six.moves.urllib.parse import urlparse
 
+from stashutils.download import Downloader, DownloadError
+
 try:
     import clipboard
 except ImportError:
@@ -41,6 +43,19 @@ def main(args):
     )
     ap.add_argument('-H', '--header', help='Custom header to pass to server (H)')
     ap.add_argument('-d', '--data', help='HTTP POST data (H)')
+    ap.add_argument(
+        '-C',
+        '--continue-at',
+        metavar='-',
+        help="resume a partial download to the output file ('-' to find out where)"
+    )
+    ap.add_argument(
+        '--segments',
+        type=int,
+        default=1,
+        help='download files written with -o/-O over this many parallel connections'
+    )
+    ap.add_argument('--chunk-size', type=int, default=64 * 1024, help='number of bytes read at a time')
 
     ns = ap.parse_args(args)
     url = ns.url or clipboard.get()
@@ -51,6 +66,33 @@ def main(args):
             name, value = h.split(':')
             headers[name.strip()] = value.strip()
 
+    if ns.output_file:
+        filename = ns.output_file
+    elif ns.remote_name:
+        # get basename of url
+        url_path = urlparse(url).path
+        filename = url_path.split('/')[-1]
+    else:
+        filename = None
+
+    if filename and ns.request_method == 'GET':
+        # files are written by the download engine, which can resume them
+        if ns.continue_at not in (None, '-'):
+            print("only '-C -' is supported")
+            sys.exit(2)
+        downloader = Downloader(
+            segments=ns.segments,
+            chunk_size=ns.chunk_size,
+            headers=headers,
+            allow_redirects=ns.location
+        )
+        try:
+            downloader.download(url, filename, resume=ns.continue_at is not None)
+        except DownloadError as e:
+            print('curl: {}'.format(e))
+            sys.exit(1)
+        return
+
     if ns.request_method == 'GET':
         r = requests.get(
             url,
@@ -74,13 +116,7 @@ def main(args):
         print('unknown request method: {}'.format(ns.request_method))
         return
 
-    if ns.output_file:
-        with open(ns.output_file, 'wb') as outs:
-            outs.write(r.content)
-    elif ns.remote_name:
-        # get basename of url
-        url_path = urlparse(url).path
-        filename = url_path.split('/')[-1]
+    if filename:
         with open(filename, 'wb') as outs:
             outs.write(r.content)
     else:
@@ -7,6 +7,8 @@ import sys
 from argparse import ArgumentParser
 from fnmatch import fnmatch
 
+_stash = globals()['_stash']
+
 
 def is_excluded(path, pattern):
     if pattern:
@@ -21,17 +23,33 @@ def is_excluded(path, pattern):
         return False
 
 
+def entry_size(entry):
+    try:
+        return entry.stat().st_size
+    except OSError:
+        # e.g. a broken symlink
+        return 0
+
+
 def main(args):
     ap = ArgumentParser(description='Summarize disk usage of the set of FILEs, recursively for directories.')
     ap.add_argument('-s', '--summarize', action='store_true', help='display only a total for each argument')
     ap.add_argument('--exclude', dest='exclude_pattern', metavar='PATTERN', help='exclude files that match PATTERN')
+    ap.add_argument('-j', '--jobs', type=int, default=4, help='number of threads scanning directories (default: 4)')
     ap.add_argument('FILEs', nargs='*', default=['.'], help='files to summarize (default to current working directory')
 
     ns = ap.parse_args(args)
 
     exclude_pattern = ns.exclude_pattern if ns.exclude_pattern else None
 
-    sizeof_fmt = globals()['_stash'].libcore.sizeof_fmt
+    sizeof_fmt = _stash.libcore.sizeof_fmt
+
+    # Excluded directories are skipped by the walker, so only the names of the
+    # entries need to be matched instead of every component of their paths.
+    walker = _stash.libwalk.TreeWalker(
+        jobs=ns.jobs,
+        dir_filter=(lambda entry: not fnmatch(entry.name, exclude_pattern)) if exclude_pattern else None,
+    )
 
     for path in ns.FILEs:
 
@@ -47,20 +65,13 @@ def main(args):
             dirs_dict = {}
             # We need to walk the tree from the bottom up so that a directory can have easy
             # access to the size of its subdirectories.
-            for root, dirs, files in os.walk(path, topdown=False):
-                # This is to make sure the directory is not exclude from its ancestor
-                if is_excluded(os.path.relpath(root, path_base), exclude_pattern):
-                    continue
-
-                # Loop through every non directory file in this directory and sum their sizes
-                size = sum(
-                    os.path.getsize(os.path.join(root,
-                                                 name)) for name in files if not is_excluded(name,
-                                                                                             exclude_pattern)
-                )
+            for root, depth, dirs, files in walker.walk(path, topdown=False):
+                # Sum the sizes of all non directory files, reusing the stat results of the walk
+                size = sum(entry_size(f) for f in files if not (exclude_pattern and fnmatch(f.name, exclude_pattern)))
 
-                # Look at all of the subdirectories and add up their sizes from the `dirs_dict`
-                subdir_size = sum(dirs_dict[os.path.join(root, d)] for d in dirs if not is_excluded(d, exclude_pattern))
+                # Look at all of the subdirectories and add up their sizes from the `dirs_dict`,
+                # they are not needed any more after that
+                subdir_size = sum(dirs_dict.pop(d.path, 0) for d in dirs)
 
                 # store the size of this directory (plus subdirectories) in a dict so we
                 # can access it later
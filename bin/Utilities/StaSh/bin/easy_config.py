@@ -126,6 +126,36 @@ OPTIONS = {
                             "traced"),
                 "description": "Which type of threads to use. 'ctypes' is faster and should be preferred",
             },
+            {
+                "display_name": "Concurrent Pipes",
+                "option_name": "concurrent_pipes",
+                "type": TYPE_BOOL,
+                "description": "Run all commands of a pipe sequence at the same time, streaming data between them",
+            },
+            {
+                "display_name": "Pipe Buffer Size",
+                "option_name": "pipe_buffer_size",
+                "type": TYPE_INT,
+                "description": "Maximum number of characters buffered between two concurrent commands",
+            },
+            {
+                "display_name": "Code Cache Size",
+                "option_name": "code_cache_size",
+                "type": TYPE_INT,
+                "description": "Number of compiled scripts to keep in memory and on disk, 0 to disable the cache",
+            },
+            {
+                "display_name": "Persistent Code Cache",
+                "option_name": "persistent_code_cache",
+                "type": TYPE_BOOL,
+                "description": "Also store compiled scripts on disk, so commands start faster after a restart",
+            },
+            {
+                "display_name": "Parse Cache Size",
+                "option_name": "parse_cache_size",
+                "type": TYPE_INT,
+                "description": "Number of parsed command lines to keep in memory, 0 to disable the cache",
+            },
         ],
     "display":
         [
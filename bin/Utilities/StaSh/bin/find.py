@@ -10,83 +10,85 @@ import time
 import fnmatch
 from functools import partial
 
+_stash = globals()['_stash']
+
 
 class FilePredicate(object):
-    def __init__(self):
+    """
+    Streams the entries below the given paths which pass all filters.
+    Every filter is called with the DirEntry and its level and the stat
+    results cached by the DirEntry are reused by all of them.
+    """
+
+    def __init__(self, mindepth=0, maxdepth=sys.maxsize, ftype='f', jobs=1):
         self.funclist = []
+        self.mindepth = mindepth
+        self.maxdepth = maxdepth
+        self.ftype = ftype
+        self.jobs = jobs
 
     def add_filter(self, func):
         self.funclist.append(func)
 
+    def matches(self, entry):
+        return all(func(entry) for func in self.funclist)
+
     def run(self, paths):
-        names = []
+        walker = _stash.libwalk.TreeWalker(jobs=self.jobs)
         for pth in paths:
-            for root, dirs, files in os.walk(os.path.normpath(pth)):
-                for func in self.funclist:
-                    root, dirs, files = func(root, dirs, files, pth)
-                    if root is None:
-                        break
-                if root is not None:
-                    names.extend(os.path.join(root, f) for f in files)
-                    names.extend(os.path.join(root, d + os.path.sep) for d in dirs)
-
-        return names
-
-
-def filter_depth_and_type(mindepth, maxdepth, ftype, root, dirs, files, pth):
-    root_rel = os.path.relpath(root, pth)
-    if root_rel == '.':
-        level = 0
+            # the entries directly inside a path are on level 0
+            for root, level, dirs, files in walker.walk(os.path.normpath(pth), maxdepth=self.maxdepth):
+                if level < self.mindepth:
+                    continue
+                if self.ftype != 'd':
+                    for f in files:
+                        if self.matches(f):
+                            yield f.path
+                if self.ftype != 'f':
+                    for d in dirs:
+                        if self.matches(d):
+                            yield d.path + os.path.sep
+
+
+def filter_name(pattern, entry):
+    return fnmatch.fnmatch(entry.name, pattern)
+
+
+def filter_mtime(oldest_time, newest_time, entry):
+    try:
+        st_mtime = entry.stat().st_mtime
+    except OSError:
+        return False
+    return newest_time > st_mtime > oldest_time
+
+
+def filter_size(min_size, max_size, entry):
+    try:
+        st_size = entry.stat().st_size
+    except OSError:
+        return False
+    return min_size <= st_size <= max_size
+
+
+def parse_size(size):
+    """
+    Parse a size argument of the form [+-]n[kMG].
+    :return: (min_size, max_size)
+    """
+    units = {'k': 1024, 'M': 1024 ** 2, 'G': 1024 ** 3}
+    sign = size[0] if size[0] in '+-' else ''
+    size = size[len(sign):]
+    factor = 1
+    if size and size[-1] in units:
+        factor = units[size[-1]]
+        size = size[:-1]
+    n = int(size) * factor
+    if sign == '+':
+        return n + 1, sys.maxsize
+    elif sign == '-':
+        return 0, n - 1
     else:
-        level = len(root_rel.split(os.path.sep))
-
-    if level > maxdepth:
-        return None, None, None
-
-    elif not (mindepth <= level <= maxdepth):
-        files = []
-
-    if ftype == 'f':
-        if not dirs and not files:
-            return None, None, None
-        else:
-            if level == maxdepth:
-                dirs = []
-            else:
-                return root, dirs, files
-    elif ftype == 'd':
-        files = []
-
-    return root, dirs, files
-
-
-def filter_name(pattern, root, dirs, files, pth):
-    files = fnmatch.filter(files, pattern)
-    dirs = fnmatch.filter(dirs, pattern)
-    if not files and not dirs and not fnmatch.fnmatch(root, pattern):
-        return None, None, None
-    return root, dirs, files
-
-
-def filter_mtime(oldest_time, newest_time, root, dirs, files, pth):
-    fnames = []
-    for f in files:
-        st_mtime = os.stat(os.path.join(root, f)).st_mtime
-        if newest_time > st_mtime > oldest_time:
-            fnames.append(f)
-
-    dnames = []
-    for d in dirs:
-        st_mtime = os.stat(os.path.join(root, d)).st_mtime
-        if newest_time > st_mtime > oldest_time:
-            dnames.append(d)
-
-    if not fnames and not dnames:
-        st_mtime = os.stat(root).st_mtime
-        if not (newest_time > st_mtime > oldest_time):
-            return None, None, None
-
-    return root, dnames, fnames
+        return n, n
 
 
 def main(args):
@@ -105,6 +107,14 @@ def main(args):
         help='specify the file type to match'
     )
     ap.add_argument('-d', '-mtime', '--mtime', metavar='n', nargs='?', help='specify modification time range')
+    ap.add_argument(
+        '-s',
+        '-size',
+        '--size',
+        metavar='n',
+        nargs='?',
+        help='specify file size in bytes, with optional k, M or G suffix; +n for larger, -n for smaller'
+    )
 
     ap.add_argument(
         '-mindepth',
@@ -124,13 +134,13 @@ def main(args):
         type=int,
         help='descend at most n directory levels below command line arguments'
     )
+    ap.add_argument('-j', '--jobs', type=int, default=4, help='number of threads scanning directories (default: 4)')
     ns = ap.parse_args(args)
 
-    file_predicate = FilePredicate()
-
-    file_predicate.add_filter(partial(filter_depth_and_type, ns.mindepth, ns.maxdepth, ns.type))
+    file_predicate = FilePredicate(ns.mindepth, ns.maxdepth, ns.type, jobs=ns.jobs)
 
-    file_predicate.add_filter(partial(filter_name, ns.pattern))
+    if ns.pattern != '*':
+        file_predicate.add_filter(partial(filter_name, ns.pattern))
 
     if ns.mtime:
         oldest_time = 0
@@ -147,9 +157,16 @@ def main(args):
             newest_time = tnow - ndays * 86400.0
         file_predicate.add_filter(partial(filter_mtime, oldest_time, newest_time))
 
-    names = file_predicate.run(ns.paths)
+    if ns.size:
+        try:
+            min_size, max_size = parse_size(ns.size)
+        except ValueError:
+            print('find: invalid size: {}'.format(ns.size), file=sys.stderr)
+            sys.exit(1)
+        file_predicate.add_filter(partial(filter_size, min_size, max_size))
 
-    print('\n'.join(names))
+    for name in file_predicate.run(ns.paths):
+        print(name)
 
 
 if __name__ == "__main__":
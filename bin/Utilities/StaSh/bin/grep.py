@@ -4,11 +4,257 @@
 from __future__ import print_function
 
 import argparse
-import collections
-import fileinput
+import io
+import mmap
 import os
 import re
 import sys
+from multiprocessing.pool import ThreadPool
+
+_stash = globals()['_stash']
+
+# files smaller than this are read instead of memory-mapped
+MMAP_MIN_SIZE = 64 * 1024
+# number of bytes checked for a NUL byte to detect binary files
+BINARY_CHECK_SIZE = 8192
+
+
+# escapes which mean the same in a bytes pattern matched against UTF-8
+_BYTES_ESCAPES = 'ntrfvAZ'
+
+
+def _bytes_compatible(pattern):
+    """
+    Return True if pattern finds the same lines in UTF-8 bytes as in text.
+    This is the case for ASCII patterns without '.', character classes and
+    escapes like \\w, which would match single bytes or ASCII characters only.
+    """
+    try:
+        pattern.encode('ascii')
+    except UnicodeError:
+        # quantifiers would only repeat the last byte of a character
+        return False
+    i = 0
+    while i < len(pattern):
+        c = pattern[i]
+        if c == '\\':
+            i += 1
+            if i < len(pattern) and pattern[i].isalnum() and pattern[i] not in _BYTES_ESCAPES:
+                return False
+        elif c in '.[':
+            return False
+        i += 1
+    return True
+
+
+class Match(object):
+    """
+    A line selected by the search.
+    :param lineno: number of the line, starting at 1, or None if not counted
+    :param segments: list of (text, is_match) tuples making up the line
+    """
+
+    def __init__(self, lineno, segments):
+        self.lineno = lineno
+        self.segments = segments
+
+
+class FileResult(object):
+    """
+    The result of searching a single file.
+    """
+
+    def __init__(self, filename):
+        self.filename = filename
+        self.matches = []
+        self.count = 0
+        self.binary = False
+        self.error = None
+
+
+class Grep(object):
+    """
+    Search engine of grep.
+    Files are searched as a whole with a bytes pattern (memory-mapped when
+    they are large), instead of decoding and searching them line by line.
+    Only the lines which are actually printed are decoded. Patterns which
+    would match differently in bytes are searched line by line as text.
+    """
+
+    def __init__(self, pattern, ignore_case=False, invert=False, max_count=None, count_only=False, files_only=False,
+                 line_numbers=False):
+        flags = re.MULTILINE
+        if ignore_case:
+            flags |= re.IGNORECASE
+        self.text_pattern = re.compile(pattern, flags=flags)
+        if _bytes_compatible(pattern):
+            self.bytes_pattern = re.compile(pattern.encode('ascii'), flags=flags)
+        else:
+            self.bytes_pattern = None
+        self.invert = invert
+        self.max_count = max_count
+        # whether only the number of matching lines or the names of matching files are needed
+        self.count_only = count_only
+        self.files_only = files_only
+        self.line_numbers = line_numbers
+
+    @property
+    def needs_lines(self):
+        return not (self.count_only or self.files_only)
+
+    def is_done(self, result):
+        """
+        Return True if no more lines of a file need to be searched.
+        """
+        if self.files_only:
+            return result.count > 0
+        return self.max_count is not None and result.count >= self.max_count
+
+    def search_file(self, filename):
+        """
+        Search a file and return a FileResult.
+        """
+        result = FileResult(filename)
+        try:
+            with io.open(filename, 'rb') as f:
+                size = os.fstat(f.fileno()).st_size
+                if self.bytes_pattern is None:
+                    lines = io.TextIOWrapper(f, encoding='utf-8', errors='replace')
+                    self.search_lines(lines, result)
+                elif size >= MMAP_MIN_SIZE:
+                    buf = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+                    try:
+                        self.search_buffer(buf, result)
+                    finally:
+                        buf.close()
+                else:
+                    self.search_buffer(f.read(), result)
+        except (IOError, OSError, ValueError) as err:
+            result.error = err
+        return result
+
+    def search_lines(self, lines, result, on_match=None):
+        """
+        Search text lines one by one. Used for stdin and patterns which can not be used on bytes.
+        If on_match is given, it is called with each Match as soon as it is found
+        instead of collecting the matches in the result.
+        """
+        pattern = self.text_pattern
+        for lineno, line in enumerate(lines, 1):
+            line = line.rstrip('\r\n')
+            m = pattern.search(line)
+            if bool(m) == self.invert:
+                continue
+            result.count += 1
+            if self.needs_lines:
+                segments = self._split_line(pattern, line, m, 0, len(line), lambda s: s)
+                match = Match(lineno if self.line_numbers else None, segments)
+                if on_match is not None:
+                    on_match(match)
+                else:
+                    result.matches.append(match)
+            if self.is_done(result):
+                break
+
+    def search_buffer(self, buf, result):
+        """
+        Search a bytes-like buffer as a whole.
+        """
+        pattern = self.bytes_pattern
+        size = len(buf)
+        result.binary = buf.find(b'\0', 0, BINARY_CHECK_SIZE) != -1
+        pos = 0
+        # position and number of the line the line counter has reached
+        counted_pos = 0
+        lineno = 1
+
+        while pos < size and not self.is_done(result):
+            m = pattern.search(buf, pos)
+            if m is None:
+                line_start = line_end = size
+            else:
+                line_start = buf.rfind(b'\n', pos, m.start()) + 1 or pos
+                line_end = buf.find(b'\n', m.start())
+                if line_end == -1:
+                    line_end = size
+                if m.end() > line_end:
+                    # the match spans several lines, check the line on its own
+                    m = pattern.search(buf, line_start, line_end)
+
+            if self.invert:
+                # select the lines before the matching one, including the line
+                # itself if its match could not be confirmed
+                select_end = line_start if m is not None else line_end
+                while pos < select_end and not self.is_done(result):
+                    end = buf.find(b'\n', pos, select_end)
+                    if end == -1:
+                        end = select_end
+                    if self.line_numbers:
+                        lineno += buf[counted_pos:pos].count(b'\n')
+                        counted_pos = pos
+                    self._add_line(result, buf, None, pos, end, lineno)
+                    pos = end + 1
+
+            elif m is not None:
+                if self.line_numbers:
+                    lineno += buf[counted_pos:line_start].count(b'\n')
+                    counted_pos = line_start
+                self._add_line(result, buf, m, line_start, line_end, lineno)
+
+            pos = line_end + 1
+
+    def _add_line(self, result, buf, m, start, end, lineno):
+        """
+        Add a selected line of a buffer to the result.
+        """
+        result.count += 1
+        if self.needs_lines and not result.binary:
+            if end > start and buf[end - 1:end] == b'\r':
+                end -= 1
+            segments = self._split_line(self.bytes_pattern, buf, m, start, end, _decode)
+            result.matches.append(Match(lineno if self.line_numbers else None, segments))
+
+    @staticmethod
+    def _split_line(pattern, s, m, start, end, decode):
+        """
+        Split a line into matching and non-matching segments for highlighting.
+        m is the first match of the line or None.
+        """
+        segments = []
+        pos = start
+        while m is not None:
+            if m.start() > pos:
+                segments.append((decode(s[pos:m.start()]), False))
+            if m.end() > m.start():
+                segments.append((decode(s[m.start():m.end()]), True))
+            pos = m.end()
+            if pos >= end:
+                break
+            # an empty match must not be found again at the same position
+            m = pattern.search(s, pos if m.end() > m.start() else pos + 1, end)
+        if pos < end:
+            segments.append((decode(s[pos:end]), False))
+        return segments
+
+
+def _decode(b):
+    return b.decode('utf-8', 'replace')
+
+
+def iter_files(paths, recursive):
+    """
+    Yield the files to search. Directories are searched recursively if
+    requested and skipped otherwise.
+    """
+    for path in paths:
+        if path != '-' and os.path.isdir(path):
+            if recursive:
+                for dirpath, dirnames, filenames in os.walk(path):
+                    dirnames.sort()
+                    for filename in sorted(filenames):
+                        yield os.path.join(dirpath, filename)
+        else:
+            yield path
 
 
 def main(args):
@@ -19,45 +265,89 @@ def main(args):
     ap.add_argument('-i', '--ignore-case', action='store_true', help='ignore case while searching')
     ap.add_argument('-v', '--invert', action='store_true', help='invert the search result')
     ap.add_argument('-c', '--count', action='store_true', help='count the search results instead of normal output')
+    ap.add_argument('-l', '--files-with-matches', action='store_true', help='only print the names of matching files')
+    ap.add_argument('-n', '--line-number', action='store_true', help='prefix each line with its line number')
+    ap.add_argument(
+        '-m',
+        '--max-count',
+        type=int,
+        default=None,
+        metavar='NUM',
+        help='stop reading a file after NUM matching lines',
+    )
+    ap.add_argument('-r', '--recursive', action='store_true', help='search the files in directories recursively')
+    ap.add_argument('-j', '--jobs', type=int, default=4, help='number of files searched at the same time (default: 4)')
     ns = ap.parse_args(args)
 
-    flags = 0
-    if ns.ignore_case:
-        flags |= re.IGNORECASE
+    try:
+        grep = Grep(
+            ns.pattern,
+            ignore_case=ns.ignore_case,
+            invert=ns.invert,
+            max_count=ns.max_count,
+            count_only=ns.count,
+            files_only=ns.files_with_matches,
+            line_numbers=ns.line_number,
+        )
+    except re.error as err:
+        print("grep: invalid pattern: {!s}".format(err), file=sys.stderr)
+        sys.exit(2)
 
-    pattern = re.compile(ns.pattern, flags=flags)
+    files = list(iter_files(ns.files, ns.recursive)) if ns.files else ['-']
 
-    # Do not try to grep directories
-    files = [f for f in ns.files if not os.path.isdir(f)]
+    def print_match(filename, match):
+        line = u''.join(_stash.text_color(text, 'red') if is_match else text for text, is_match in match.segments)
+        prefix = []
+        if files != ['-']:
+            prefix.append(filename)
+        if match.lineno is not None:
+            prefix.append(str(match.lineno))
+        print(u': '.join(prefix + [line]))
 
-    fileinput.close()  # in case it is not closed
+    def search(filename):
+        if filename == '-':
+            result = FileResult('(standard input)')
+            # stdin may be a pipe or the console which stays open, print the lines right away
+            lines = _stash.libcore.BlockReader(sys.stdin, close=False).lines()
+            grep.search_lines(lines, result, on_match=lambda match: print_match(result.filename, match))
+            return result
+        return grep.search_file(filename)
+
+    pool = None
+    if ns.jobs > 1 and len(files) > 1 and '-' not in files:
+        # Files are searched by worker threads, results are printed in order by this thread
+        pool = ThreadPool(min(ns.jobs, len(files)))
+        results = pool.imap(search, files)
+    else:
+        results = (search(filename) for filename in files)
+
+    found = False
     try:
-        counts = collections.defaultdict(int)
-        for line in fileinput.input(files, openhook=fileinput.hook_encoded("utf-8")):
-            if bool(pattern.search(line)) != ns.invert:
-                if ns.count:
-                    counts[fileinput.filename()] += 1
-                else:
-                    if ns.invert:  # optimize: if ns.invert, then no match, so no highlight color needed
-                        newline = line
-                    else:
-                        newline = re.sub(pattern, lambda m: _stash.text_color(m.group(), 'red'), line)
-                    if fileinput.isstdin():
-                        fmt = u'{lineno}: {line}'
-                    else:
-                        fmt = u'{filename}: {lineno}: {line}'
-
-                    print(fmt.format(filename=fileinput.filename(), lineno=fileinput.filelineno(), line=newline.rstrip()))
-
-        if ns.count:
-            for filename, count in counts.items():
+        for result in results:
+            if result.error is not None:
+                print("grep: {}: {!s}".format(result.filename, result.error), file=sys.stderr)
+                continue
+            found = found or result.count > 0
+            if ns.files_with_matches:
+                if result.count:
+                    print(result.filename)
+            elif ns.count:
                 fmt = u'{count:6} {filename}'
-                print(fmt.format(filename=filename, count=count))
+                print(fmt.format(filename=result.filename, count=result.count))
+            elif result.binary:
+                if result.count:
+                    print(u'Binary file {} matches'.format(result.filename))
+            else:
+                for match in result.matches:
+                    print_match(result.filename, match)
 
     except Exception as err:
         print("grep: {}: {!s}".format(type(err).__name__, err), file=sys.stderr)
     finally:
-        fileinput.close()
+        if pool is not None:
+            pool.terminate()
+
+    sys.exit(0 if found else 1)
 
 
 if __name__ == "__main__":
@@ -5,9 +5,12 @@
 from __future__ import print_function
 
 import argparse
+import itertools
 import string
 import sys
-import fileinput
+from collections import deque
+
+_stash = globals()["_stash"]
 
 
 def filter_non_printable(s):
@@ -15,24 +18,17 @@ def filter_non_printable(s):
 
 
 def head(f, nlines):
+    """
+    Print the first nlines lines of a file, or the last -nlines lines if nlines is negative.
+    Lines are printed as soon as they are read and reading stops once
+    enough lines have been printed.
+    """
     if nlines >= 0:
-        for i, line in enumerate(f):
-            if i >= nlines:
-                break
-            print(line, end='')
+        for line in itertools.islice(f, nlines):
+            sys.stdout.write(line)
     else:
-        buf = []
-        print(1)
-        line = f.readline()
-        print(2)
-        while line:
-            buf.append(line)
-            if len(buf) > -nlines:
-                del buf[0]
-            line = f.readline()
-
-        for line in buf:
-            print(line, end='')
+        for line in deque(f, maxlen=-nlines):
+            sys.stdout.write(line)
 
 
 def main(args):
@@ -65,30 +61,12 @@ def main(args):
                 else:
                     print(header_fmt.format(fname), end='')
 
-            fileinput.close()
-            inp = fileinput.input(fname, openhook=fileinput.hook_encoded("utf-8"))
-            if ns.lines >= 0:
-                buf = []
-                for i, line in enumerate(inp):
-                    if i >= ns.lines:
-                        break
-                    buf.append(line)
-                for line in buf:
-                    print(line, end='')
-            else:
-                buf = []
-                for line in fileinput.input(inp, openhook=fileinput.hook_encoded("utf-8")):
-                    buf.append(line)
-                    if len(buf) > -ns.lines:
-                        del buf[0]
-                for line in buf:
-                    print(line, end='')
+            with _stash.libcore.open_input(fname) as reader:
+                head(reader.lines(), ns.lines)
 
     except Exception as e:
         print('head :%s' % str(e))
         status = 1
-    finally:
-        fileinput.close()
 
     sys.exit(status)
 
@@ -10,22 +10,62 @@ and HEAD requests in a fairly straightforward manner.
 
 from __future__ import absolute_import, print_function
 
-import cgi
+import email.utils
 import mimetypes
 import os
 import posixpath
 import re
-import shutil
+import threading
+from collections import OrderedDict
 
-from six import StringIO
-from six.moves import BaseHTTPServer
+from six.moves import BaseHTTPServer, socketserver
 from six.moves.urllib.parse import quote, unquote
 
-__version__ = "0.1"
+try:
+    from html import escape
+except ImportError:
+    from cgi import escape
+
+__version__ = "0.2"
 __all__ = ["SimpleHTTPRequestHandler"]
 __author__ = "bones7456"
 __home_page__ = "http://li2z.cn/"
 
+# size of the blocks files are sent and received in
+BLOCK_SIZE = 64 * 1024
+# number of directory listings which are kept
+LISTING_CACHE_SIZE = 64
+
+RANGE_RE = re.compile(r"^bytes=(\d*)-(\d*)$")
+FILENAME_RE = re.compile(br'Content-Disposition.*name="file"; filename="(.*)"', re.IGNORECASE)
+
+
+class ListingCache(object):
+    """
+    The rendered directory listings, keyed by the path of the directory and
+    valid as long as the mtime of the directory does not change.
+    """
+
+    def __init__(self, maxsize=LISTING_CACHE_SIZE):
+        self.maxsize = maxsize
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key, mtime):
+        with self._lock:
+            entry = self._entries.pop(key, None)
+            if entry is None or entry[0] != mtime:
+                return None
+            self._entries[key] = entry
+            return entry[1]
+
+    def put(self, key, mtime, data):
+        with self._lock:
+            self._entries.pop(key, None)
+            self._entries[key] = (mtime, data)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+
 
 class SimpleHTTPRequestHandler(BaseHTTPServer.BaseHTTPRequestHandler):
     """Simple HTTP request handler with GET/HEAD/POST commands.
@@ -38,109 +78,135 @@ class SimpleHTTPRequestHandler(BaseHTTPServer.BaseHTTPRequestHandler):
     The GET/HEAD/POST requests are identical except that the HEAD
     request omits the actual contents of the file.
 
+    Connections are kept alive (HTTP/1.1) until they are idle for
+    'timeout' seconds, single byte ranges are served with
+    "206 Partial Content" and unchanged files with "304 Not Modified".
+
     """
 
     server_version = "SimpleHTTPWithUpload/" + __version__
+    protocol_version = "HTTP/1.1"
+    timeout = 30
+    listing_cache = ListingCache()
 
     def do_GET(self):
         """Serve a GET request."""
-        f = self.send_head()
-        if f:
-            self.copyfile(f, self.wfile)
-            f.close()
+        body = self.send_head()
+        if body:
+            self.send_body(body)
 
     def do_HEAD(self):
         """Serve a HEAD request."""
-        f = self.send_head()
-        if f:
-            f.close()
+        body = self.send_head()
+        if body and not isinstance(body, bytes):
+            body[0].close()
 
     def do_POST(self):
         """Serve a POST request."""
         r, info = self.deal_post_data()
         print(r, info, "by: ", self.client_address)
-        f = StringIO()
-        f.write('<!DOCTYPE html PUBLIC "-//W3C//DTD HTML 3.2 Final//EN">')
-        f.write("<html>\n<title>Upload Result Page</title>\n")
-        f.write("<body>\n<h2>Upload Result Page</h2>\n")
-        f.write("<hr>\n")
+        parts = []
+        parts.append('<!DOCTYPE html PUBLIC "-//W3C//DTD HTML 3.2 Final//EN">')
+        parts.append("<html>\n<title>Upload Result Page</title>\n")
+        parts.append("<body>\n<h2>Upload Result Page</h2>\n")
+        parts.append("<hr>\n")
         if r:
-            f.write("<strong>Success:</strong>")
+            parts.append("<strong>Success:</strong>")
         else:
-            f.write("<strong>Failed:</strong>")
-        f.write(info)
-        f.write("<br><a href=\"%s\">back</a>" % self.headers['referer'])
-        f.write("<hr><small>Powerd By: bones7456, check new version at ")
-        f.write("<a href=\"http://li2z.cn/?s=SimpleHTTPServerWithUpload\">")
-        f.write("here</a>.</small></body>\n</html>\n")
-        length = f.tell()
-        f.seek(0)
+            parts.append("<strong>Failed:</strong>")
+        parts.append(escape(info))
+        parts.append("<br><a href=\"%s\">back</a>" % escape(self.headers.get('referer') or self.path, True))
+        parts.append("<hr><small>Powerd By: bones7456, check new version at ")
+        parts.append("<a href=\"http://li2z.cn/?s=SimpleHTTPServerWithUpload\">")
+        parts.append("here</a>.</small></body>\n</html>\n")
+        body = "".join(parts).encode("utf-8")
         self.send_response(200)
-        self.send_header("Content-type", "text/html")
-        self.send_header("Content-Length", str(length))
+        self.send_header("Content-type", "text/html; charset=utf-8")
+        self.send_header("Content-Length", str(len(body)))
         self.end_headers()
-        if f:
-            self.copyfile(f, self.wfile)
-            f.close()
+        self.send_body(body)
 
     def deal_post_data(self):
-        boundary = self.headers.plisttext.split("=")[1]
-        remainbytes = int(self.headers['content-length'])
-        line = self.rfile.readline()
-        remainbytes -= len(line)
-        if not boundary in line:
-            return (False, "Content NOT begin with boundary")
-        line = self.rfile.readline()
-        remainbytes -= len(line)
-        fn = re.findall(r'Content-Disposition.*name="file"; filename="(.*)"', line)
-        if not fn:
-            return (False, "Can't find out file name...")
-        path = self.translate_path(self.path)
-        fn = os.path.join(path, fn[0])
-        line = self.rfile.readline()
-        remainbytes -= len(line)
-        line = self.rfile.readline()
-        remainbytes -= len(line)
+        """
+        Stream the file of a multipart/form-data upload to disk.
+        The request body is always read completely, so that the connection
+        can be reused.
+        """
+        ctype = self.headers.get('content-type') or ""
+        m = re.search(r'boundary=("?)([^";]+)\1', ctype)
+        remainbytes = int(self.headers.get('content-length') or 0)
         try:
-            out = open(fn, 'wb')
-        except IOError:
-            return (False, "Can't create file to write, do you have permission to write?")
-
-        preline = self.rfile.readline()
-        remainbytes -= len(preline)
-        while remainbytes > 0:
-            line = self.rfile.readline()
+            if not m:
+                return (False, "Content-Type is not multipart/form-data")
+            boundary = m.group(2).encode("latin-1")
+            line = self.rfile.readline(BLOCK_SIZE)
             remainbytes -= len(line)
-            if boundary in line:
-                preline = preline[0:-1]
-                if preline.endswith('\r'):
-                    preline = preline[0:-1]
-                out.write(preline)
-                out.close()
-                return (True, "File '%s' upload success!" % fn)
-            else:
-                out.write(preline)
-                preline = line
-        return (False, "Unexpect Ends of data.")
+            if not boundary in line:
+                return (False, "Content NOT begin with boundary")
+            fn = None
+            # the headers of the part end with an empty line
+            while remainbytes > 0:
+                line = self.rfile.readline(BLOCK_SIZE)
+                remainbytes -= len(line)
+                if not line.strip():
+                    break
+                found = FILENAME_RE.findall(line)
+                if found:
+                    fn = found[0]
+            if not fn:
+                return (False, "Can't find out file name...")
+            fn = os.path.basename(fn.decode("utf-8", "replace").replace("\\", "/"))
+            if not fn:
+                return (False, "Can't find out file name...")
+            path = self.translate_path(self.path)
+            fn = os.path.join(path, fn)
+            try:
+                out = open(fn, 'wb')
+            except IOError:
+                return (False, "Can't create file to write, do you have permission to write?")
+            delimiter = b"\r\n--" + boundary
+            buf = b""
+            with out:
+                while remainbytes > 0:
+                    data = self.rfile.read(min(BLOCK_SIZE, remainbytes))
+                    if not data:
+                        break
+                    remainbytes -= len(data)
+                    buf += data
+                    idx = buf.find(delimiter)
+                    if idx != -1:
+                        out.write(buf[:idx])
+                        return (True, "File '%s' upload success!" % fn)
+                    # keep enough data to find a delimiter split between reads
+                    keep = len(delimiter) - 1
+                    out.write(buf[:-keep])
+                    buf = buf[-keep:]
+            return (False, "Unexpect Ends of data.")
+        finally:
+            while remainbytes > 0:
+                data = self.rfile.read(min(BLOCK_SIZE, remainbytes))
+                if not data:
+                    break
+                remainbytes -= len(data)
 
     def send_head(self):
         """Common code for GET and HEAD commands.
 
         This sends the response code and MIME headers.
 
-        Return value is either a file object (which has to be copied
-        to the outputfile by the caller unless the command was HEAD,
-        and must be closed by the caller under all circumstances), or
-        None, in which case the caller has nothing further to do.
+        Return value is either the body as bytes, a tuple
+        (file object, offset, length) describing the part of a file to send
+        (the caller has to send and close it unless the command was HEAD),
+        or None, in which case the caller has nothing further to do.
 
         """
         path = self.translate_path(self.path)
-        f = None
         if os.path.isdir(path):
             if not self.path.endswith('/'):
                 # redirect browser - doing basically what apache does
                 self.send_response(301)
                 self.send_header("Location", self.path + "/")
+                self.send_header("Content-Length", "0")
                 self.end_headers()
                 return None
             for index in "index.html", "index.htm":
@@ -159,57 +225,151 @@ class SimpleHTTPRequestHandler(BaseHTTPServer.BaseHTTPRequestHandler):
         except IOError:
             self.send_error(404, "File not found")
             return None
-        self.send_response(200)
-        self.send_header("Content-type", ctype)
-        fs = os.fstat(f.fileno())
-        self.send_header("Content-Length", str(fs[6]))
-        self.send_header("Last-Modified", self.date_time_string(fs.st_mtime))
-        self.end_headers()
-        return f
+        try:
+            fs = os.fstat(f.fileno())
+            size = fs.st_size
+            last_modified = self.date_time_string(fs.st_mtime)
+            if self.not_modified(fs.st_mtime):
+                f.close()
+                self.send_response(304)
+                self.send_header("Last-Modified", last_modified)
+                self.end_headers()
+                return None
+            byte_range = self.parse_range(size, last_modified)
+            if byte_range is False:
+                f.close()
+                self.send_response(416)
+                self.send_header("Content-Range", "bytes */%d" % size)
+                self.send_header("Content-Length", "0")
+                self.end_headers()
+                return None
+            if byte_range is None:
+                self.send_response(200)
+                start, length = 0, size
+            else:
+                self.send_response(206)
+                start, end = byte_range
+                length = end - start + 1
+                self.send_header("Content-Range", "bytes %d-%d/%d" % (start, end, size))
+            self.send_header("Content-type", ctype)
+            self.send_header("Content-Length", str(length))
+            self.send_header("Accept-Ranges", "bytes")
+            self.send_header("Last-Modified", last_modified)
+            self.end_headers()
+        except:
+            f.close()
+            raise
+        return (f, start, length)
+
+    def not_modified(self, mtime):
+        """Return True if the If-Modified-Since header allows a 304 reply."""
+        ims = self.headers.get("If-Modified-Since")
+        if not ims or self.headers.get("Range"):
+            return False
+        try:
+            since = email.utils.mktime_tz(email.utils.parsedate_tz(ims))
+        except (TypeError, ValueError, OverflowError):
+            return False
+        return int(mtime) <= since
+
+    def parse_range(self, size, last_modified):
+        """Parse the Range header.
+
+        Return value is None if the whole file should be sent, a tuple
+        (first byte, last byte) for a satisfiable single range or False
+        if the range can not be satisfied. Multiple ranges are not
+        supported and cause the whole file to be sent, as does an
+        If-Range header not matching last_modified.
+
+        """
+        header = self.headers.get("Range")
+        if not header:
+            return None
+        if_range = self.headers.get("If-Range")
+        if if_range and if_range != last_modified:
+            # the file changed since the client got the first part
+            return None
+        m = RANGE_RE.match(header.strip())
+        if m is None:
+            return None
+        first, last = m.groups()
+        if not first:
+            if not last:
+                return None
+            # the last N bytes
+            length = int(last)
+            if length == 0:
+                return False
+            return (max(size - length, 0), size - 1)
+        first = int(first)
+        last = int(last) if last else size - 1
+        if first >= size or last < first:
+            return False
+        return (first, min(last, size - 1))
+
+    def send_body(self, body):
+        """Send a body returned by send_head()."""
+        if isinstance(body, bytes):
+            self.wfile.write(body)
+            return
+        f, offset, length = body
+        try:
+            self.copyfile(f, self.wfile, offset, length)
+        finally:
+            f.close()
 
     def list_directory(self, path):
         """Helper to produce a directory listing (absent index.html).
 
-        Return value is either a file object, or None (indicating an
+        Return value is either the listing as bytes, or None (indicating an
         error).  In either case, the headers are sent, making the
         interface the same as for send_head().
+        Listings are cached as long as the directory is not modified.
 
         """
         try:
-            list = os.listdir(path)
+            mtime = os.stat(path).st_mtime
         except os.error:
             self.send_error(404, "No permission to list directory")
             return None
-        list.sort(key=lambda a: a.lower())
-        f = StringIO()
-        displaypath = cgi.escape(unquote(self.path))
-        f.write('<!DOCTYPE html PUBLIC "-//W3C//DTD HTML 3.2 Final//EN">')
-        f.write("<html>\n<title>Directory listing for %s</title>\n" % displaypath)
-        f.write("<body>\n<h2>Directory listing for %s</h2>\n" % displaypath)
-        f.write("<hr>\n")
-        f.write("<form ENCTYPE=\"multipart/form-data\" method=\"post\">")
-        f.write("<input name=\"file\" type=\"file\"/>")
-        f.write("<input type=\"submit\" value=\"upload\"/></form>\n")
-        f.write("<hr>\n<ul>\n")
-        for name in list:
-            fullname = os.path.join(path, name)
-            displayname = linkname = name
-            # Append / for directories or @ for symbolic links
-            if os.path.isdir(fullname):
-                displayname = name + "/"
-                linkname = name + "/"
-            if os.path.islink(fullname):
-                displayname = name + "@"
-                # Note: a link to a directory displays with @ and links with /
-            f.write('<li><a href="%s">%s</a>\n' % (quote(linkname), cgi.escape(displayname)))
-        f.write("</ul>\n<hr>\n</body>\n</html>\n")
-        length = f.tell()
-        f.seek(0)
+        key = (path, self.path)
+        body = self.listing_cache.get(key, mtime)
+        if body is None:
+            try:
+                list = os.listdir(path)
+            except os.error:
+                self.send_error(404, "No permission to list directory")
+                return None
+            list.sort(key=lambda a: a.lower())
+            f = []
+            displaypath = escape(unquote(self.path))
+            f.append('<!DOCTYPE html PUBLIC "-//W3C//DTD HTML 3.2 Final//EN">')
+            f.append("<html>\n<title>Directory listing for %s</title>\n" % displaypath)
+            f.append("<body>\n<h2>Directory listing for %s</h2>\n" % displaypath)
+            f.append("<hr>\n")
+            f.append("<form ENCTYPE=\"multipart/form-data\" method=\"post\">")
+            f.append("<input name=\"file\" type=\"file\"/>")
+            f.append("<input type=\"submit\" value=\"upload\"/></form>\n")
+            f.append("<hr>\n<ul>\n")
+            for name in list:
+                fullname = os.path.join(path, name)
+                displayname = linkname = name
+                # Append / for directories or @ for symbolic links
+                if os.path.isdir(fullname):
+                    displayname = name + "/"
+                    linkname = name + "/"
+                if os.path.islink(fullname):
+                    displayname = name + "@"
+                    # Note: a link to a directory displays with @ and links with /
+                f.append('<li><a href="%s">%s</a>\n' % (quote(linkname), escape(displayname)))
+            f.append("</ul>\n<hr>\n</body>\n</html>\n")
+            body = "".join(f).encode("utf-8")
+            self.listing_cache.put(key, mtime, body)
         self.send_response(200)
-        self.send_header("Content-type", "text/html")
-        self.send_header("Content-Length", str(length))
+        self.send_header("Content-type", "text/html; charset=utf-8")
+        self.send_header("Content-Length", str(len(body)))
         self.end_headers()
-        return f
+        return body
 
     def translate_path(self, path):
         """Translate a /-separated PATH to the local filename syntax.
@@ -233,21 +393,44 @@ class SimpleHTTPRequestHandler(BaseHTTPServer.BaseHTTPRequestHandler):
             path = os.path.join(path, word)
         return path
 
-    def copyfile(self, source, outputfile):
-        """Copy all data between two file objects.
+    def copyfile(self, source, outputfile, offset=0, length=None):
+        """Copy length bytes starting at offset from a file to the client.
 
-        The SOURCE argument is a file object open for reading
-        (or anything with a read() method) and the DESTINATION
-        argument is a file object open for writing (or
-        anything with a write() method).
+        The SOURCE argument is a file object open for reading in binary
+        mode and the DESTINATION argument is the output file of the
+        connection.
 
-        The only reason for overriding this would be to change
-        the block size or perhaps to replace newlines by CRLF
-        -- note however that this the default server uses this
-        to copy binary data as well.
+        os.sendfile() is used if it is available, so that the data does not
+        need to be copied through python. Otherwise the file is copied
+        in blocks.
 
         """
-        shutil.copyfileobj(source, outputfile)
+        if length is None:
+            length = os.fstat(source.fileno()).st_size - offset
+        outputfile.flush()
+        sendfile = getattr(os, "sendfile", None)
+        if sendfile is not None:
+            try:
+                out_fd = self.connection.fileno()
+                in_fd = source.fileno()
+                while length > 0:
+                    sent = sendfile(out_fd, in_fd, offset, min(length, 0x7fffffff))
+                    if sent == 0:
+                        # the file was truncated
+                        return
+                    offset += sent
+                    length -= sent
+                return
+            except (AttributeError, OSError, ValueError):
+                # not supported for this kind of file or socket
+                pass
+        source.seek(offset)
+        while length > 0:
+            data = source.read(min(BLOCK_SIZE, length))
+            if not data:
+                return
+            outputfile.write(data)
+            length -= len(data)
 
     def guess_type(self, path):
         """Guess the type of a file.
@@ -284,8 +467,32 @@ class SimpleHTTPRequestHandler(BaseHTTPServer.BaseHTTPRequestHandler):
         })
 
 
-def main(port=8000):
-    server = BaseHTTPServer.HTTPServer(('0.0.0.0', port), SimpleHTTPRequestHandler)
+class ClosingHTTPRequestHandler(SimpleHTTPRequestHandler):
+    """
+    A SimpleHTTPRequestHandler closing the connection after each request
+    (HTTP/1.0), for servers handling one connection at a time, where an
+    idle kept-alive connection would block all other clients.
+    """
+    protocol_version = "HTTP/1.0"
+
+
+class ThreadedHTTPServer(socketserver.ThreadingMixIn, BaseHTTPServer.HTTPServer):
+    """A HTTP server handling each connection in its own thread."""
+    daemon_threads = True
+
+
+def make_server(address, threaded=False):
+    """
+    Return a HTTP server for address. Connections are only kept alive
+    by the threaded server.
+    """
+    if threaded:
+        return ThreadedHTTPServer(address, SimpleHTTPRequestHandler)
+    return BaseHTTPServer.HTTPServer(address, ClosingHTTPRequestHandler)
+
+
+def main(port=8000, threaded=False):
+    server = make_server(('0.0.0.0', port), threaded=threaded)
 
     try:
         print('Serving HTTP on 0.0.0.0 port %d ...' % port)
@@ -301,5 +508,6 @@ if __name__ == '__main__':
     import argparse
     ap = argparse.ArgumentParser()
     ap.add_argument('port', nargs='?', type=int, default=8000, help='port to server HTTP')
+    ap.add_argument('-t', '--threaded', action='store_true', help='handle each connection in its own thread')
     ns = ap.parse_args()
-    main(ns.port)
+    main(ns.port, threaded=ns.threaded)
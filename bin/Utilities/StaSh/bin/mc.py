@@ -8,11 +8,13 @@ import cmd
 import sys
 import tempfile
 import shlex
+import threading
 
 from stashutils.fsi.errors import OperationFailure, IsDir, IsFile
 from stashutils.fsi.errors import AlreadyExists
 from stashutils.fsi.interfaces import INTERFACES
 from stashutils.fsi.local import LocalFSI
+from stashutils.snapshot import TreeSnapshot
 
 _stash = globals()["_stash"]
 Text = _stash.text_color  # alias for cleaner code
@@ -26,8 +28,6 @@ TODO:
 				but this was removed as it lead to ugly code
 			=>low prio as this script is designed for use with different fs;
 				this bug only occurs when using the same fs.
-		-make run command transferring file deletions in "w"-mode (low prio)
-		-make run command more efficient (only cp file changes) (low prio)
 """
 
 # =====================
@@ -51,27 +51,52 @@ class InternalFSI(LocalFSI):
 # utility classes and functions
 
 
-def modified(path, prev=None):
-    """if prev is None, calculates a state to be later passed to modified().
-if prev is such a state,
-modified() will return wether the path has been modified or not."""
-    dirs = []
-    files = []
-    for n in os.listdir(path):
-        ap = os.path.join(path, n)
-        if os.path.isfile(ap):
-            stat = os.stat(ap)
-            size = stat.st_size
-            mod = stat.st_mtime
-            files.append((ap, size, mod))
-        else:
-            res = modified(ap, prev=None)
-            dirs += res[0]
-            files += res[1]
-    if prev is None:
-        return (dirs, files)
-    else:
-        return prev != (dirs, files)
+def copy_file(rfsi, rfp, wfsi, wfp):
+    """copies file 'rfp' on 'rfsi' to 'wfp' on 'wfsi'."""
+    rf = rfsi.open(rfp, "rb")
+    try:
+        wf = wfsi.open(wfp, "wb")
+        try:
+            while True:
+                data = rf.read(64 * 1024)
+                if len(data) == 0:
+                    break
+                wf.write(data)
+        finally:
+            wf.close()
+    finally:
+        rf.close()
+
+
+def copy_files(rfsi, wfsi, names, nthreads, callback):
+    """
+copies the files 'names' from the cwd of 'rfsi' to the cwd of 'wfsi',
+using up to 'nthreads' threads.
+callback(name, error) is called after each file; error is None on success.
+"""
+    todo = list(reversed(names))
+    lock = threading.Lock()
+
+    def worker():
+        while True:
+            with lock:
+                if not todo:
+                    return
+                name = todo.pop()
+            try:
+                copy_file(rfsi, name, wfsi, name)
+            except (IOError, OSError) as e:
+                error = e
+            else:
+                error = None
+            with lock:
+                callback(name, error)
+
+    threads = [threading.Thread(target=worker) for i in range(min(nthreads, len(names)))]
+    for thr in threads:
+        thr.start()
+    for thr in threads:
+        thr.join()
 
 
 # =============================
@@ -88,6 +113,7 @@ class McCmd(cmd.Cmd):
     def __init__(self):
         cmd.Cmd.__init__(self)
         internal_fsi = InternalFSI(self)
+        internal_fsi.connect()
         self.FSIs = {INTERN_FS_ID: internal_fsi}
 
     def do_connected(self, cmd):
@@ -335,6 +361,18 @@ class McCmd(cmd.Cmd):
             wfsi.cd(wfp)
             try:
                 content = rfsi.listdir()
+                nthreads = min(rfsi.max_transfers, wfsi.max_transfers)
+                if rfsi is wfsi:
+                    # each copy has a file open for reading and one for writing
+                    # on the same FSI; with more threads all of them could wait
+                    # for their second file forever
+                    nthreads //= 2
+                if nthreads > 1:
+                    # files are copied concurrently, so that the transfers
+                    # are not slowed down by the latency of each request
+                    files = [fn for fn in content if rfsi.isfile(fn)]
+                    content = [fn for fn in content if fn not in files]
+                    copy_files(rfsi, wfsi, files, nthreads, self._report_copy)
                 for fn in content:
                     subcommand = '{rfi} "{name}" {wfi} "{name}"'.format(rfi=rfi, name=fn, wfi=wfi)
                     self.do_cp(subcommand)
@@ -350,6 +388,16 @@ class McCmd(cmd.Cmd):
 
     do_copy = do_cp
 
+    def _report_copy(self, name, error):
+        """reports the result of a file copied by copy_files()."""
+        if error is None:
+            self.stdout.write("Copying file '{n}'... ".format(n=name))
+            self.stdout.write(Text("Done", "green"))
+            self.stdout.write(".\n")
+        else:
+            msg = getattr(error, "message", None) or str(error)
+            self.stdout.write(Text("Error copying '{n}': {m}!\n".format(n=name, m=msg), "red"))
+
     def do_mv(self, command):
         """mv <ri> <rf> <wi> <wn>: move file 'rf' from 'ri' to file 'wf' on 'wi'."""
         args = shlex.split(command)
@@ -539,7 +587,7 @@ MODE should be either 'r' or 'w'. 'r' only downloads the files,
             self.do_cp(rawcpcmd.format(ri=rid, rp=remotepath, lfp=lfp, li=INTERN_FS_ID))
             if mode in ("w", "W"):
                 self.stdout.write("Scanning content... ")
-                oldstate = modified(localpath, prev=None)
+                oldstate = TreeSnapshot(localpath)
                 self.stdout.write(Text("Done", "green"))
                 self.stdout.write(".\n")
             if cd_path is None:
@@ -553,28 +601,12 @@ MODE should be either 'r' or 'w'. 'r' only downloads the files,
             try:
                 if mode in ("w", "W"):
                     self.stdout.write("Checking for content modification... ")
-                    moded = modified(localpath, prev=oldstate)
+                    changes = oldstate.compare(oldstate.rescan())
                     self.stdout.write(Text("Done", "green"))
-                    self.stdout.write(".\nContent modified: {m}\n".format(m=moded))
-                    if moded:
+                    self.stdout.write(".\nChanges: {n}\n".format(n=len(changes)))
+                    if changes:
                         self.stdout.write("Copying modifified content... \n")
-                        if lfp == "exec":
-                            tp = "/"
-                        else:
-                            tp = remotepath
-                        if os.path.isfile(lfp):
-                            if tp != "/":
-                                if tp.endswith("/"):
-                                    tp = tp[:-1]
-                                tp = "/".join(tp.split("/")[:-1])
-                            lfp = lfsi.get_path()
-                            if lfp.endswith("/"):
-                                lfp = lfp[1:]
-                            lfsi.cd(lfp)
-                            lfp = lfp.split("/")[-1]
-                        rawcpcmd = '{li} "{lfp}" {ri} "{tp}"'
-                        cpcmd = rawcpcmd.format(lfp=lfp, ri=rid, tp=tp, li=INTERN_FS_ID)
-                        self.do_cp(cpcmd)
+                        self.sync_changes(changes, localpath, lfp, rfsi, remotepath)
                         self.stdout.write(Text("Copying finished.\n", "green"))
                 else:
                     pass
@@ -590,6 +622,58 @@ MODE should be either 'r' or 'w'. 'r' only downloads the files,
             self.stdout.write(Text("Done", "green"))
             self.stdout.write(".\n")
 
+    def sync_changes(self, changes, localpath, lfp, rfsi, remotepath):
+        """
+applies the changes made in 'localpath' by 'run' to 'rfsi'.
+'lfp' is the name of the downloaded file or directory in 'localpath',
+which was downloaded from 'remotepath'.
+"""
+        lfsi = self.FSIs[INTERN_FS_ID]
+        prefix = lfp + "/"
+        if lfp == "exec":
+            remotepath = "/"
+
+        def remote(path):
+            """returns the remote path of a path relative to localpath."""
+            if path == lfp:
+                return remotepath
+            return remotepath.rstrip("/") + "/" + path[len(prefix):]
+
+        # changes outside of the downloaded content are not synced
+        def relevant(paths):
+            return [p for p in paths if p == lfp or p.startswith(prefix)]
+
+        for path in relevant(changes.removed):
+            self.stdout.write("Removing '{n}'... ".format(n=remote(path)))
+            try:
+                rfsi.remove(remote(path))
+            except OperationFailure as e:
+                self.stdout.write(Text("Error: {m}!\n".format(m=e.message), "red"))
+            else:
+                self.stdout.write(Text("Done", "green"))
+                self.stdout.write(".\n")
+        for path in relevant(changes.added_dirs):
+            self.stdout.write("Creating dir '{n}'... ".format(n=remote(path)))
+            try:
+                rfsi.mkdir(remote(path))
+            except AlreadyExists:
+                pass
+            except OperationFailure as e:
+                self.stdout.write(Text("Error: {m}!\n".format(m=e.message), "red"))
+                continue
+            self.stdout.write(Text("Done", "green"))
+            self.stdout.write(".\n")
+        for path in relevant(changes.added + changes.modified):
+            self.stdout.write("Copying file '{n}'... ".format(n=remote(path)))
+            try:
+                copy_file(lfsi, os.path.join(localpath, path), rfsi, remote(path))
+            except (IOError, OSError) as e:
+                msg = getattr(e, "message", None) or str(e)
+                self.stdout.write(Text("Error: {m}!\n".format(m=msg), "red"))
+            else:
+                self.stdout.write(Text("Done", "green"))
+                self.stdout.write(".\n")
+
     def parse_fs_command(self, command, nargs=0, ret=str):
         """parses a filesystem command. returns the interface and the actual command.
 nargs specifies the number of arguments, -1 means any number."""
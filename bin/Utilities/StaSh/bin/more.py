@@ -25,13 +25,13 @@ def clear_screen():
 def more(filenames, pagesize=10, clear=False, fmt='{line}'):
     '''Display content of filenames pagesize lines at a time (cleared if specified) with format fmt for each output line'''
 
-    fileinput.close()  # in case still open
+    inp = fileinput.FileInput(filenames, openhook=fileinput.hook_encoded("utf-8"))
     try:
         pageno = 1
         if clear:
             clear_screen()
-        for line in fileinput.input(filenames, openhook=fileinput.hook_encoded("utf-8")):
-            lineno, filename, filelineno = fileinput.lineno(), fileinput.filename(), fileinput.filelineno()
+        for line in inp:
+            lineno, filename, filelineno = inp.lineno(), inp.filename(), inp.filelineno()
             print(fmt.format(**locals()), end='')
             if pagesize and lineno % pagesize == 0:
                 console.alert('Abort or continue', filename, 'Next page')  # TODO: use less intrusive mechanism than alert
@@ -39,7 +39,7 @@ def more(filenames, pagesize=10, clear=False, fmt='{line}'):
                 if clear:
                     clear_screen()
     finally:
-        fileinput.close()
+        inp.close()
 
 
 # --- main
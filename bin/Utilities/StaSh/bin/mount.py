@@ -10,6 +10,7 @@ from six.moves import input
 
 from stashutils import mount_ctrl, mount_manager
 from stashutils.fsi.interfaces import FILESYSTEM_TYPES
+from stashutils.fsi.cached import CachingFSI, DEFAULT_TTL
 
 _stash = globals()["_stash"]
 
@@ -37,6 +38,21 @@ if __name__ == "__main__":
     parser.add_argument("-f", "--fake", action="store_false", dest="do_mount", help="dry run; do not mount fs")
     parser.add_argument("-r", "--read-only", action="store_true", dest="readonly", help="mount the filesystem read-only")
     parser.add_argument("-t", "--type", action="store", dest="type", default=None, help="Type of the filesystem to mount")
+    parser.add_argument(
+        "-c",
+        "--cache",
+        action="store_true",
+        dest="cache",
+        help="cache metadata and file contents of the filesystem",
+    )
+    parser.add_argument(
+        "--cache-ttl",
+        action="store",
+        dest="cache_ttl",
+        type=float,
+        default=DEFAULT_TTL,
+        help="seconds for which cached metadata is used (default: {})".format(DEFAULT_TTL)
+    )
     parser.add_argument("options", action="store", nargs="*", help="additional arguments for mounting the fs", default=[])
     parser.add_argument("dir", action="store", help="dir to mount to")
     ns = parser.parse_args()
@@ -75,6 +91,8 @@ if __name__ == "__main__":
     else:
         logger = None
     fsi = fsic(logger=logger)
+    if ns.cache:
+        fsi = CachingFSI(fsi, logger=logger, ttl=ns.cache_ttl)
     if ns.v:
         print("Connecting FSI...")
     msg = fsi.connect(*tuple(ns.options))
@@ -2,11 +2,15 @@
 """
 Install and manage python packages
 
-usage: pip.py [-h] [--verbose] sub-command ...
+usage: pip.py [-h] [--verbose] [-i INDEX_URL] [--cache-dir CACHE_DIR] sub-command ...
 
 optional arguments:
   -h, --help    show this help message and exit
   --verbose     be more chatty
+  -i INDEX_URL, --index-url INDEX_URL
+                base url of the package index (PyPI JSON API)
+  --cache-dir CACHE_DIR
+                directory of the download cache
 
 List of sub-commands:
     sub-command     "pip sub-command -h" for more help on a sub-command
@@ -21,6 +25,7 @@ List of sub-commands:
 from __future__ import print_function
 import sys
 import os
+import re
 import ast
 import shutil
 import types
@@ -30,6 +35,10 @@ import operator
 import traceback
 import platform
 import json
+import sqlite3
+import uuid
+from collections import OrderedDict
+from multiprocessing.pool import ThreadPool
 
 import six
 from distutils.util import convert_path
@@ -37,7 +46,9 @@ from fnmatch import fnmatchcase
 # noinspection PyUnresolvedReferences
 from six.moves import filterfalse
 
+from stashutils.download import STATE_SUFFIX, Downloader, make_session
 from stashutils.extensions import create_command
+from stashutils.hashing import hash_file
 from stashutils.wheels import Wheel, wheel_is_compatible
 
 _stash = globals()['_stash']
@@ -46,8 +57,16 @@ SITE_PACKAGES_FOLDER = _stash.libdist.SITE_PACKAGES_FOLDER
 OLD_SITE_PACKAGES_FOLDER = _stash.libdist.SITE_PACKAGES_FOLDER_6
 BUNDLED_MODULES = _stash.libdist.BUNDLED_MODULES
 BLOCKLIST_PATH = os.path.join(os.path.expandvars("$STASH_ROOT"), "data", "pip_blocklist.json")
-PIP_INDEX_FILE = os.path.join(SITE_PACKAGES_FOLDER,'pip_index.json')
 PIP_INFO_FILE = os.path.join(SITE_PACKAGES_FOLDER, '.package_info', '%s.json')
+PIP_CACHE_DIR = os.path.join(os.path.expandvars("$STASH_ROOT"), ".pip_cache")
+DEFAULT_INDEX_URL = 'https://pypi.python.org/pypi'
+
+# number of concurrent metadata requests during dependency resolution
+METADATA_THREADS = 8
+# number of archives downloaded in parallel
+PARALLEL_DOWNLOADS = 4
+# the resolver gives up if the chosen versions still change after this many rounds
+MAX_RESOLVE_ROUNDS = 100
 
 # Some packages use wrong name for their dependencies
 PACKAGE_NAME_FIXER = {
@@ -62,6 +81,7 @@ FLAG_DIST_ALLOW_WHL = 2
 FLAG_DIST_PREFER_SRC = 4
 FLAG_DIST_PREFER_WHL = 8
 FLAG_IGNORE_BLOCKLIST = 16
+FLAG_ZIP_IMPORT = 32
 DEFAULT_FLAGS = FLAG_DIST_ALLOW_SRC | FLAG_DIST_ALLOW_WHL | FLAG_DIST_PREFER_WHL
 
 
@@ -215,116 +235,172 @@ class SetuptoolsStub(types.ModuleType):
                 return PackageFinder.find
         return OmniClass()
 
-def get_requires(package, index_file=PIP_INDEX_FILE):
+# a comparison in an environment marker, e.g. 'python_version < "3.8"'
+_MARKER_CLAUSE_RE = re.compile(r'''^\s*\(?\s*([\w.]+)\s*(===|==|!=|<=|>=|~=|<|>|not in|in)\s*['"]([^'"]*)['"]\s*\)?\s*$''')
+
+
+def normalize_name(name):
+    """
+    Return the normalized form of a package name, e.g. 'Foo_Bar' -> 'foo-bar'.
+    :param name: name of package
+    :type name: str
+    :return: the normalized name
+    :rtype: str
+    """
+    return re.sub(r'[-_.]+', '-', name).lower()
+
+
+def _marker_environment():
+    """returns the values of the environment marker variables."""
+    return {
+        'python_version': '.'.join(platform.python_version_tuple()[:2]),
+        'python_full_version': platform.python_version(),
+        'os_name': os.name,
+        'sys_platform': sys.platform,
+        'platform_system': platform.system(),
+        'platform_machine': platform.machine(),
+        'platform_python_implementation': platform.python_implementation(),
+        'implementation_name': platform.python_implementation().lower(),
+    }
+
+
+def _marker_clause_matches(clause, extras, environment):
+    """checks a single comparison of an environment marker."""
+    match = _MARKER_CLAUSE_RE.match(clause)
+    if match is None:
+        # can not evaluate this, assume the dependency is required
+        return True
+    var, op, value = match.groups()
+    if var == 'extra':
+        wanted = [normalize_name(extra) for extra in extras]
+        if op == '==':
+            return normalize_name(value) in wanted
+        elif op == '!=':
+            return normalize_name(value) not in wanted
+        return True
+    if var not in environment:
+        return True
+    current = environment[var]
+    if op == 'in':
+        return current in value
+    elif op == 'not in':
+        return current not in value
+    elif op == '===':
+        return current == value
+    elif var.endswith('version'):
+        return VersionSpecifier(((op, value), )).match(current)
+    elif op == '==':
+        return current == value
+    elif op == '!=':
+        return current != value
+    return True
+
+
+def marker_matches(marker, extras=()):
+    """
+    Check if the environment marker of a requirement applies.
+    Only 'and' and 'or' of comparisons are understood. Comparisons which can
+    not be evaluated are assumed to apply.
+    :param marker: the marker, e.g. 'python_version < "3" and extra == "test"'
+    :type marker: str
+    :param extras: the extras to install
+    :type extras: list of str
+    :return: whether the marker applies
+    :rtype: bool
+    """
+    environment = _marker_environment()
+    for alternative in re.split(r'\s+or\s+', marker.strip()):
+        if all(_marker_clause_matches(clause, extras, environment) for clause in re.split(r'\s+and\s+', alternative)):
+            return True
+    return False
+
+
+def parse_dependency(requirement, extras=()):
+    """
+    Parse a dependency as listed in the metadata of a package ('Requires-Dist').
+    :param requirement: the dependency, e.g. 'six (>=1.5); python_version < "3"'
+    :type requirement: str
+    :param extras: the extras of the package requiring the dependency
+    :type extras: list of str
+    :return: tuple of (name, version specifier, extras) or None if the dependency does not apply
+    :rtype: tuple of (str, VersionSpecifier, list of str) or None
+    """
+    if ';' in requirement:
+        requirement, marker = requirement.split(';', 1)
+        if not marker_matches(marker, extras):
+            return None
+    if '@' in requirement:
+        # direct reference, only use the name
+        requirement = requirement.split('@', 1)[0]
+    name, ver_spec, dep_extras = VersionSpecifier.parse_requirement(requirement)
+    if not name:
+        return None
+    return name, ver_spec, dep_extras
+
+
+def get_requires(package, site_packages=SITE_PACKAGES_FOLDER):
     """
     get require of the package
     :param package: package name
     :type package: str
+    :param site_packages: folder containing the site-packages
+    :type site_packages: str
     :return: a list of requires package
     :rtype: list
     """
-    if os.path.exists(index_file):
-        with open(index_file) as f:
-            index=json.load(f)
-            try:
-                return index[package]
-            except KeyError:# no such package in index file
-                raise PipError("Cannot find packages in index file. Try to using 'pip dev update-index' to update index file")
-
-    else:
-        raise PipError("Cannot find index file. Try to using 'pip dev update-index' to update index file")
+    requires = PackageConfigHandler(site_packages=site_packages).get_dependencies(package)
+    if requires is None:
+        raise PipError("Cannot find dependencies of package {}".format(package))
+    return sorted(requires)
 
-def get_req_by(package, index_file=PIP_INDEX_FILE):
+def get_req_by(package, site_packages=SITE_PACKAGES_FOLDER):
     """
     get the packages that require this package
     :param package: package name
     :type package: str
+    :param site_packages: folder containing the site-packages
+    :type site_packages: str
     :return: a list of packages that require this package
     :rtype: list
     """
-    if os.path.exists(index_file):
-
-        with open(index_file) as f:
-            index=json.load(f)
-            required_by=[]
-            for pkg, req in index.items():
-                if package in req:
-                    required_by.append(pkg)
-    else:
-
-        raise PipError("Cannot find index file. Try to using 'pip dev update-index' to update index file")
-
-    return required_by 
-
+    return PackageConfigHandler(site_packages=site_packages).get_required_by(package)
 
 
-
-
-def print_info(package, pip_info_file=PIP_INFO_FILE, site_packages=SITE_PACKAGES_FOLDER):
-    info_file = pip_info_file % package
-    if os.path.exists(info_file):
-        with open(info_file) as f:
-            info = json.load(f)
+def print_info(package, site_packages=SITE_PACKAGES_FOLDER):
+    config = PackageConfigHandler(site_packages=site_packages)
+    info = config.get_package_info(package)
+    if info is not None:
         print('Name: {}'.format(info['name']))
-        print('Version: {}'.format(info['version']))
-        print('Summary: {}'.format(info['summary']))
-        print('Home-page: {}'.format(info['project_urls']['Homepage']))
-        print('Author: {}'.format(info['author']))
-        print('Author-email: {}'.format(info['author_email']))
-        print('License: {}'.format(info['license']))
+        print('Version: {}'.format(info.get('version', '')))
+        print('Summary: {}'.format(info.get('summary', '')))
+        print('Home-page: {}'.format((info.get('project_urls') or {}).get('Homepage', info.get('home_page', ''))))
+        print('Author: {}'.format(info.get('author', '')))
+        print('Author-email: {}'.format(info.get('author_email', '')))
+        print('License: {}'.format(info.get('license', '')))
         print('Location: {}'.format(site_packages))
        
-        requires = get_requires(package)
-        required_by = get_req_by(package)
+        requires = sorted(config.get_dependencies(package) or [])
+        required_by = config.get_required_by(package)
         print('requires: {}'.format(', '.join(requires)))
         print('required-by: {}'.format(', '.join(required_by)))
-    else: #no info_file
+    else: #not installed
         print(_stash.text_color('Package not found: {}'.format(package), 'yellow'))
         
 
 
-def download_info(pkg_name, pip_info_file=PIP_INFO_FILE, site_packages=SITE_PACKAGES_FOLDER):
-    info_file = pip_info_file % pkg_name
-    r=requests.get('https://pypi.python.org/pypi/{}/json'.format(pkg_name))
+def download_info(pkg_name, site_packages=SITE_PACKAGES_FOLDER, index_url=DEFAULT_INDEX_URL):
+    r=requests.get('{}/{}/json'.format(index_url, pkg_name))
     info=r.json()['info']
-    info_folder = os.path.split(info_file)[0]
-    if not os.path.exists(info_folder):
-        os.mkdir(info_folder)
-    with open(info_file, 'w') as f:
-        json.dump(info, f)
-    update_req_index()
-
-def update_req_index(pip_info_file=PIP_INFO_FILE, site_packages=SITE_PACKAGES_FOLDER, index_file=PIP_INDEX_FILE):
+    PackageConfigHandler(site_packages=site_packages).set_package_info(pkg_name, info)
+
+def update_req_index(site_packages=SITE_PACKAGES_FOLDER):
     '''
-    update package requires index file 
+    rebuild the dependency index of the installed packages.
+    The index is updated on every install and uninstall, so this is only required
+    if the database has been modified externally.
     '''
-    repository = get_repository('pypi', site_packages=site_packages)
-    info_list = repository.list()
-
-    req_index={} # a dict of {package:requires_list}  type:dict of {str:list of str}
-    for package, info in info_list:
-        info_file = pip_info_file % package
-        if os.path.exists(info_file):
-            # load info
-            with open(info_file) as f:
-                info=json.load(f)
-            # filte requires 
-            requires = []
-            try:
-                for req in info['requires_dist']:
-                    if not ';' in req:
-                        #Remove package version
-                        requires.append(req.split(' ')[0])
-            except TypeError:# some package may have no require
-                pass
-            req_index[package]=requires
-
-        else: # info file not exists
-            print(_stash.text_color('Info file of Package {} not found'.format(package), 'yellow'))
-
+    PackageConfigHandler(site_packages=site_packages).rebuild_index()
 
-    with open(index_file, 'w') as f:
-        json.dump(req_index,f)
 
 def fake_module(new_module):
     """
@@ -503,79 +579,219 @@ class CIConfigParer(ConfigParser):
 
 class PackageConfigHandler(object):
     """
-    Manager class for packages files for tracking installation of modules
+    Manager class for the database of installed packages.
+    The packages installed into a site-packages folder are tracked in a
+    sqlite database ('.pypi_packages.db'), together with an index of their
+    dependencies, so that the packages requiring a package can be found
+    without reading the information of all packages. The database is only
+    opened when it is first used and each change only updates the rows of
+    one package. The old '.pypi_packages' file is imported once.
     """
 
+    _SCHEMA = '''
+    CREATE TABLE IF NOT EXISTS packages (
+        key TEXT PRIMARY KEY,
+        name TEXT NOT NULL,
+        url TEXT,
+        version TEXT,
+        summary TEXT,
+        files TEXT,
+        dependency TEXT,
+        info TEXT
+    );
+    CREATE TABLE IF NOT EXISTS dependencies (
+        package TEXT NOT NULL,
+        dependency TEXT NOT NULL,
+        PRIMARY KEY (package, dependency)
+    );
+    CREATE INDEX IF NOT EXISTS dependencies_by_dependency ON dependencies (dependency);
+    '''
+
+    _COLUMNS = ('url', 'version', 'summary', 'files', 'dependency')
+
     def __init__(self, site_packages=SITE_PACKAGES_FOLDER, verbose=False):
         self.verbose = verbose
         self.site_packages = site_packages
+        self.package_db = os.path.join(site_packages, '.pypi_packages.db')
         self.package_cfg = os.path.join(site_packages, '.pypi_packages')
+        self._connection = None
+
+    @property
+    def connection(self):
+        """the connection to the database, opened on first use."""
+        if self._connection is None:
+            exists = os.path.isfile(self.package_db)
+            if not exists and self.verbose:
+                print('Creating package database...')
+            connection = sqlite3.connect(self.package_db)
+            with connection:
+                connection.executescript(self._SCHEMA)
+                if not exists:
+                    self._import_package_cfg(connection)
+            self._connection = connection
+        return self._connection
+
+    def close(self):
+        if self._connection is not None:
+            self._connection.close()
+            self._connection = None
+
+    def _import_package_cfg(self, connection):
+        """imports the packages of the old '.pypi_packages' file and their info files."""
         if not os.path.isfile(self.package_cfg):
-            if self.verbose:
-                print('Creating package file...')
-            with open(self.package_cfg, 'w') as outs:
-                outs.close()
-        self.parser = CIConfigParer()
-        self.parser.read(self.package_cfg)
+            return
+        if self.verbose:
+            print('Importing package file...')
+        parser = CIConfigParer()
+        parser.read(self.package_cfg)
+        for section_name in parser.sections():
+            pkg_info = {}
+            info_file = PIP_INFO_FILE % section_name
+            if os.path.isfile(info_file):
+                try:
+                    with open(info_file) as f:
+                        pkg_info = json.load(f)
+                except ValueError:
+                    pass
+            pkg_info.update(parser.items(section_name))
+            pkg_info['name'] = section_name
+            self._store(connection, pkg_info)
+
+    def _store(self, connection, pkg_info):
+        key = normalize_name(pkg_info['name'])
+        values = [pkg_info.get(column) for column in self._COLUMNS]
+        connection.execute(
+            'INSERT OR REPLACE INTO packages (key, name, url, version, summary, files, dependency, info) '
+            'VALUES (?, ?, ?, ?, ?, ?, ?, ?)',
+            [key, pkg_info['name']] + values + [json.dumps(pkg_info)],
+        )
+        connection.execute('DELETE FROM dependencies WHERE package = ?', (key, ))
+        dependencies = set(normalize_name(dep.strip()) for dep in (pkg_info.get('dependency') or '').split(',') if dep.strip())
+        connection.executemany(
+            'INSERT INTO dependencies (package, dependency) VALUES (?, ?)',
+            [(key, dependency) for dependency in sorted(dependencies)],
+        )
 
-    def save(self):
-        with open(self.package_cfg, 'w') as outs:
-            self.parser.write(outs)
+    def _query(self, sql, *args):
+        return self.connection.execute(sql, args).fetchall()
 
     def add_module(self, pkg_info):
         """
 
-        :param pkg_info: A dict that has name, url, version, summary
+        :param pkg_info: A dict that has name, url, version, summary, files, dependency and optionally other information
         :return:
         """
-        if not self.parser.has_section(pkg_info['name']):
-            self.parser.add_section(pkg_info['name'])
-        self.parser.set(pkg_info['name'], 'url', pkg_info['url'])
-        self.parser.set(pkg_info['name'], 'version', pkg_info['version'])
-        self.parser.set(pkg_info['name'], 'summary', pkg_info['summary'])
-        self.parser.set(pkg_info['name'], 'files', pkg_info['files'])
-        self.parser.set(pkg_info['name'], 'dependency', pkg_info['dependency'])
-        self.save()
+        with self.connection:
+            self._store(self.connection, pkg_info)
 
     def list_modules(self):
-        return [module for module in self.parser.sections()]
+        return [row[0] for row in self._query('SELECT name FROM packages ORDER BY key')]
 
     def module_exists(self, name):
-        return self.parser.has_section(name)
+        return bool(self._query('SELECT 1 FROM packages WHERE key = ?', normalize_name(name)))
+
+    def _info_from_row(self, row):
+        return dict((column, value) for column, value in zip(self._COLUMNS, row) if value is not None)
 
     def get_info(self, name):
-        if self.parser.has_section(name):
-            tbl = {}
-            for opt, value in self.parser.items(name):
-                tbl[opt] = value
-            return tbl
+        rows = self._query(
+            'SELECT url, version, summary, files, dependency FROM packages WHERE key = ?',
+            normalize_name(name),
+        )
+        if rows:
+            return self._info_from_row(rows[0])
+
+    def list_info(self):
+        """
+        Return the names and information of all packages.
+        :return: list of (name, info)
+        :rtype: list of (str, dict)
+        """
+        rows = self._query('SELECT name, url, version, summary, files, dependency FROM packages ORDER BY key')
+        return [(row[0], self._info_from_row(row[1:])) for row in rows]
+
+    def get_package_info(self, name):
+        """
+        Return all information stored about a package, e.g. the information from PyPI.
+        :param name: name of package
+        :type name: str
+        :return: the information or None if the package is not installed
+        :rtype: dict or None
+        """
+        rows = self._query('SELECT info FROM packages WHERE key = ?', normalize_name(name))
+        if rows:
+            return json.loads(rows[0][0]) if rows[0][0] else {}
+
+    def set_package_info(self, name, info):
+        """
+        Update the information stored about a package, keeping what pip recorded about its installation.
+        :param name: name of package
+        :type name: str
+        :param info: the new information
+        :type info: dict
+        """
+        pkg_info = self.get_package_info(name)
+        if pkg_info is None:
+            return
+        pkg_info.update(info)
+        pkg_info.update(self.get_info(name))
+        pkg_info['name'] = self._query('SELECT name FROM packages WHERE key = ?', normalize_name(name))[0][0]
+        self.add_module(pkg_info)
 
     def remove_module(self, name):
-        self.parser.remove_section(name)
-        self.save()
+        key = normalize_name(name)
+        with self.connection:
+            self.connection.execute('DELETE FROM packages WHERE key = ?', (key, ))
+            self.connection.execute('DELETE FROM dependencies WHERE package = ?', (key, ))
 
     def get_files_installed(self, section_name):
-        if self.parser.has_option(section_name, 'files'):
-            files = self.parser.get(section_name, 'files').strip()
-            return files.split(',')
+        info = self.get_info(section_name)
+        if info is not None and 'files' in info:
+            return info['files'].strip().split(',')
         else:
             return None
 
     def get_dependencies(self, section_name):
-        if self.parser.has_option(section_name, 'dependency'):
-            dependencies = self.parser.get(section_name, 'dependency').strip()
+        info = self.get_info(section_name)
+        if info is not None and 'dependency' in info:
+            dependencies = info['dependency'].strip()
             return set(dependencies.split(',')) if dependencies != '' else set()
         else:
             return None
 
+    def get_required_by(self, name):
+        """
+        Return the installed packages requiring a package.
+        :param name: name of package
+        :type name: str
+        :return: the names of the packages
+        :rtype: list of str
+        """
+        return [
+            row[0] for row in self._query(
+                'SELECT packages.name FROM dependencies JOIN packages ON packages.key = dependencies.package '
+                'WHERE dependencies.dependency = ? ORDER BY packages.key',
+                normalize_name(name),
+            )
+        ]
+
+    def rebuild_index(self):
+        """rebuilds the dependency index from the information stored about the packages."""
+        with self.connection:
+            self.connection.execute('DELETE FROM dependencies')
+            for name, in self._query('SELECT name FROM packages'):
+                pkg_info = self.get_package_info(name)
+                pkg_info.update(self.get_info(name))
+                pkg_info['name'] = name
+                self._store(self.connection, pkg_info)
+
     def get_all_dependencies(self, exclude_module=()):
+        excluded = set(normalize_name(name) for name in exclude_module)
         all_dependencies = set()
-        for section_name in self.parser.sections():
-            if section_name not in exclude_module and self.parser.has_option(section_name, 'dependency'):
-                dependencies = self.parser.get(section_name, 'dependency').strip()
-                if dependencies != '':
-                    for dep in dependencies.split(','):
-                        all_dependencies.add(dep)
+        for key, dependencies in self._query('SELECT key, dependency FROM packages WHERE dependency IS NOT NULL'):
+            if key not in excluded and dependencies.strip() != '':
+                for dep in dependencies.strip().split(','):
+                    all_dependencies.add(dep)
         return all_dependencies
 
 
@@ -944,6 +1160,355 @@ if __name__ == "__main__":
 # archive_file_installer = ArchiveFileInstaller()
 
 
+class PackageCache(object):
+    """
+    A content-addressed cache of downloaded archives.
+    Archives are stored as '<cache_dir>/<sha256[:2]>/<sha256>/<filename>',
+    so reinstalls and dependencies shared by several packages are taken from
+    the cache instead of being downloaded again.
+    :param cache_dir: directory of the cache
+    :type cache_dir: str
+    :param session: the session used for downloads, a new one if None
+    :type session: requests.Session or None
+    :param verbose: enable additional output
+    :type verbose: bool
+    """
+
+    def __init__(self, cache_dir=PIP_CACHE_DIR, session=None, verbose=False):
+        self.cache_dir = cache_dir
+        self.session = session
+        self.verbose = verbose
+
+    def path(self, digest, filename):
+        """
+        Return the path of an archive in the cache.
+        :param digest: sha256 hexdigest of the archive
+        :type digest: str
+        :param filename: name of the archive
+        :type filename: str
+        :return: the path of the archive
+        :rtype: str
+        """
+        return os.path.join(self.cache_dir, digest[:2], digest, filename)
+
+    def lookup(self, download):
+        """
+        Return the path of a cached archive or None if it is not cached.
+        :param download: the file as listed by the index (with 'url', 'filename' and 'digests')
+        :type download: dict
+        :return: the path of the archive or None
+        :rtype: str or None
+        """
+        digest = (download.get('digests') or {}).get('sha256')
+        if digest:
+            path = self.path(digest.lower(), download['filename'])
+            if os.path.isfile(path):
+                return path
+        return None
+
+    def fetch_all(self, downloads, parallel=PARALLEL_DOWNLOADS):
+        """
+        Make sure that all archives are cached, downloading the missing ones in parallel.
+        Downloaded archives are verified against the sha256 digest of the index.
+        :param downloads: the files as listed by the index
+        :type downloads: list of dict
+        :param parallel: number of parallel downloads
+        :type parallel: int
+        :return: the paths of the archives, in the order of downloads
+        :rtype: list of str
+        """
+        paths = [self.lookup(download) for download in downloads]
+        jobs = []
+        targets = {}
+        for i, (download, path) in enumerate(zip(downloads, paths)):
+            if path is not None:
+                print('Using cached {}'.format(download['filename']))
+                continue
+            print('Downloading {}'.format(download['filename']))
+            tmp_dir = os.path.join(self.cache_dir, 'tmp')
+            if not os.path.exists(tmp_dir):
+                os.makedirs(tmp_dir)
+            tmp_path = os.path.join(tmp_dir, uuid.uuid4().hex + '-' + download['filename'])
+            jobs.append((download['url'], tmp_path))
+            targets[tmp_path] = i
+
+        errors = {}
+
+        def callback(url, tmp_path, error):
+            # called from the download threads, do not print here
+            if error is not None:
+                errors[tmp_path] = error
+
+        if jobs:
+            downloader = Downloader(session=self.session)
+            downloader.download_all(jobs, parallel=parallel, callback=callback)
+
+        failed = []
+        for url, tmp_path in jobs:
+            download = downloads[targets[tmp_path]]
+            if tmp_path not in errors:
+                digest = hash_file(tmp_path, ['SHA256'])[0]
+                expected = (download.get('digests') or {}).get('sha256')
+                if expected and expected.lower() != digest:
+                    errors[tmp_path] = 'sha256 mismatch'
+            if tmp_path in errors:
+                failed.append('{} ({})'.format(url, errors[tmp_path]))
+                for p in (tmp_path, tmp_path + STATE_SUFFIX):
+                    if os.path.exists(p):
+                        os.remove(p)
+                continue
+            path = self.path(digest, download['filename'])
+            if os.path.exists(path):
+                os.remove(tmp_path)
+            else:
+                if not os.path.exists(os.path.dirname(path)):
+                    os.makedirs(os.path.dirname(path))
+                shutil.move(tmp_path, path)
+            paths[targets[tmp_path]] = path
+
+        if failed:
+            raise PipError('failed to download: {}'.format(', '.join(failed)))
+        return paths
+
+
+class Release(object):
+    """
+    A release of a package chosen by the DependencyResolver.
+    :param name: name of package
+    :type name: str
+    :param version: the chosen version
+    :type version: str
+    :param pkg_info: information about the release, as stored in the package config
+    :type pkg_info: dict
+    :param download: the file to install, as listed by the index
+    :type download: dict
+    :param extras: extras to install
+    :type extras: list of str
+    :param required_by: name of the first package requiring this one, None if requested directly
+    :type required_by: str or None
+    """
+
+    def __init__(self, name, version, pkg_info, download, extras=[], required_by=None):
+        self.name = name
+        self.version = version
+        self.pkg_info = pkg_info
+        self.download = download
+        self.extras = extras
+        self.required_by = required_by
+
+
+class _ResolverNode(object):
+    """A package in the dependency graph walked by the DependencyResolver."""
+
+    def __init__(self, name):
+        self.name = name
+        self.specs = []  # list of (requirer, VersionSpecifier)
+        self.extras = set()
+        self.required_by = []
+        self.dependencies = []  # normalized names
+
+
+class DependencyResolver(object):
+    """
+    Resolve the dependencies of PyPI packages before anything is installed.
+    The dependency graph is walked one level at a time, fetching the metadata
+    of all new packages of a level concurrently. For each package, the newest
+    version matching the requirements of all packages depending on it is
+    chosen. If a new requirement rules out a version chosen before, the
+    package is resolved again, until the chosen versions do not change anymore.
+    :param repository: the repository used to query the index
+    :type repository: PyPIRepository
+    :param flags: (distribution) options
+    :type flags: int
+    :param installed: names of the packages already installed
+    :type installed: list of str
+    :param threads: number of concurrent metadata requests
+    :type threads: int
+    """
+
+    def __init__(self, repository, flags=DEFAULT_FLAGS, installed=[], threads=METADATA_THREADS):
+        self.repository = repository
+        self.flags = flags
+        self.installed = set(normalize_name(name) for name in installed)
+        self.bundled = set(normalize_name(name) for name in BUNDLED_MODULES)
+        self.threads = threads
+        self._packages = {}  # normalized name -> package data
+        self._release_info = {}  # (normalized name, version) -> release info
+        self._chosen = {}  # normalized name -> (version, extras, dependencies)
+        self._blocklist = {}  # name -> result of repository.apply_blocklist()
+
+    def _fetch(self, func, keys):
+        """calls func for all keys concurrently; returns a dict of key -> result."""
+        keys = list(keys)
+        if len(keys) <= 1:
+            return dict((key, func(key)) for key in keys)
+        pool = ThreadPool(min(self.threads, len(keys)))
+        try:
+            return dict(zip(keys, pool.map(func, keys)))
+        finally:
+            pool.terminate()
+            pool.join()
+
+    def _apply_blocklist(self, name, ver_spec, extras):
+        """applies the blocklist to a dependency, only once for each name."""
+        if name not in self._blocklist:
+            self._blocklist[name] = self.repository.apply_blocklist(name, ver_spec, extras, self.flags)
+        result = self._blocklist[name]
+        if result is not None and result[0] == name:
+            # not blocklisted, keep the requirement of this dependant
+            return name, ver_spec, extras
+        return result
+
+    def _walk(self, requirements, required_by):
+        """walks the dependency graph using the versions chosen so far; returns the nodes in the order found."""
+        nodes = OrderedDict()
+        queue = [(None, name, ver_spec, extras) for name, ver_spec, extras in requirements]
+        i = 0
+        while i < len(queue):
+            requirer, name, ver_spec, extras = queue[i]
+            i += 1
+            name = PACKAGE_NAME_FIXER.get(name, name)
+            key = normalize_name(name)
+            if requirer is not None:
+                if key == 'setuptools' or key in self.installed or key in self.bundled:
+                    continue
+                requirement = self._apply_blocklist(name, ver_spec, extras)
+                if requirement is None:
+                    continue
+                name, ver_spec, extras = requirement
+                key = normalize_name(name)
+                if key in self.installed:
+                    continue
+            node = nodes.get(key)
+            if node is None:
+                if key in self._packages:
+                    name = self._packages[key]['info']['name']
+                node = nodes[key] = _ResolverNode(name)
+                if key in self._chosen and self._chosen[key][2] is not None:
+                    for dep_name, dep_spec, dep_extras in self._chosen[key][2]:
+                        queue.append((key, dep_name, dep_spec, dep_extras))
+            if ver_spec is not None:
+                node.specs.append((requirer, ver_spec))
+            node.extras.update(extras)
+            node.required_by.append(nodes[requirer].name if requirer is not None else required_by)
+            if requirer is not None and key not in nodes[requirer].dependencies:
+                nodes[requirer].dependencies.append(key)
+        return nodes
+
+    def _choose(self, key, node):
+        """chooses the version of a package; returns True if the choice changed."""
+        ver_spec = VersionSpecifier(())
+        for requirer, spec in node.specs:
+            ver_spec.specs.extend(spec.specs)
+        try:
+            version = self.repository._determin_hit(self._packages[key], ver_spec, flags=self.flags)
+        except PipError:
+            raise PipError(
+                'No version of {} matches the requirements of: {}'.format(
+                    node.name,
+                    ', '.join(sorted(set(str(name) for name in node.required_by))),
+                )
+            )
+        extras = frozenset(node.extras)
+        chosen = self._chosen.get(key)
+        if chosen is not None and chosen[:2] == (version, extras):
+            return False
+        self._chosen[key] = (version, extras, None)
+        return True
+
+    def _release_data_or_none(self, name_version):
+        try:
+            return self.repository._release_data(*name_version)
+        except PipError:
+            return None
+
+    def _dependencies(self, key):
+        """returns the dependencies of the chosen release of a package."""
+        version, extras, dependencies = self._chosen[key]
+        pkg_data = self._packages[key]
+        if version == self.repository._package_latest_release(pkg_data):
+            info = pkg_data['info']
+        else:
+            info = self._release_info.get((key, version)) or {}
+        dependencies = []
+        for requirement in info.get('requires_dist') or []:
+            dependency = parse_dependency(requirement, extras)
+            if dependency is not None:
+                dependencies.append(dependency)
+        return dependencies
+
+    def resolve(self, requirements, required_by=None):
+        """
+        Resolve the requirements and all their dependencies.
+        :param requirements: list of (name, version specifier, extras)
+        :type requirements: list of tuple
+        :param required_by: name of the package requiring the requirements, if any
+        :type required_by: str or None
+        :return: the releases to install, dependencies before the packages requiring them
+        :rtype: list of Release
+        """
+        for i in range(MAX_RESOLVE_ROUNDS):
+            nodes = self._walk(requirements, required_by)
+            missing = [key for key in nodes if key not in self._packages]
+            names = dict((key, nodes[key].name) for key in missing)
+            self._packages.update(self._fetch(lambda key: self.repository._package_data(names[key]), missing))
+            changed = bool(missing)
+            for key, node in nodes.items():
+                changed = self._choose(key, node) or changed
+            # the metadata of older releases is not part of the package data
+            needed = []
+            for key in nodes:
+                version, extras, dependencies = self._chosen[key]
+                if dependencies is None and version != self.repository._package_latest_release(self._packages[key]) \
+                and (key, version) not in self._release_info:
+                    needed.append((self._packages[key]['info']['name'], version))
+            for (name, version), data in self._fetch(self._release_data_or_none, needed).items():
+                self._release_info[(normalize_name(name), version)] = data and data['info']
+            for key in nodes:
+                version, extras, dependencies = self._chosen[key]
+                if dependencies is None:
+                    self._chosen[key] = (version, extras, self._dependencies(key))
+            if not changed:
+                break
+        else:
+            raise PipError('Could not resolve the dependencies, the chosen versions keep changing')
+        return [self._release(key, nodes[key]) for key in self._topological_order(nodes, requirements)]
+
+    def _topological_order(self, nodes, requirements):
+        """returns the keys of the nodes, dependencies before the packages requiring them."""
+        order = []
+        done = set()
+        for name, ver_spec, extras in requirements:
+            stack = [(normalize_name(PACKAGE_NAME_FIXER.get(name, name)), False)]
+            while stack:
+                key, expanded = stack.pop()
+                if expanded:
+                    order.append(key)
+                    continue
+                if key in done or key not in nodes:
+                    continue
+                done.add(key)
+                stack.append((key, True))
+                for dep in reversed(nodes[key].dependencies):
+                    stack.append((dep, False))
+        return order
+
+    def _release(self, key, node):
+        """creates the Release of a resolved package."""
+        version, extras, dependencies = self._chosen[key]
+        pkg_data = self._packages[key]
+        if version == self.repository._package_latest_release(pkg_data):
+            info = pkg_data['info']
+        else:
+            info = self._release_info.get((key, version)) or pkg_data['info']
+        pkg_info = dict(info)
+        pkg_info['url'] = 'pypi'
+        pkg_info['version'] = version
+        downloads = self.repository._package_downloads(pkg_data, version)
+        download = self.repository._select_download(node.name, downloads, version, flags=self.flags)
+        return Release(node.name, version, pkg_info, download, extras=sorted(extras), required_by=node.required_by[0])
+
+
 class PackageRepository(object):
     """
     A Package Repository is a manager class to perform various actions
@@ -951,9 +1516,17 @@ class PackageRepository(object):
     This is a base class providing basic layout of a Repository.
     """
 
-    def __init__(self, site_packages=SITE_PACKAGES_FOLDER, verbose=False):
+    def __init__(
+        self,
+        site_packages=SITE_PACKAGES_FOLDER,
+        verbose=False,
+        index_url=DEFAULT_INDEX_URL,
+        cache_dir=PIP_CACHE_DIR,
+    ):
         self.site_packages = site_packages
         self.verbose = verbose
+        self.index_url = index_url.rstrip('/')
+        self.cache_dir = cache_dir
         self.config = PackageConfigHandler(site_packages=self.site_packages, verbose=self.verbose)
         self.installer = ArchiveFileInstaller(site_packages=self.site_packages, verbose=self.verbose)
 
@@ -969,7 +1542,12 @@ class PackageRepository(object):
     def _install(self, pkg_name, pkg_info, archive_filename, dependency_flags=DEFAULT_FLAGS, extras=[]):
         if archive_filename.endswith(".whl"):
             print("Installing wheel: {}...".format(os.path.basename(archive_filename)))
-            wheel = Wheel(archive_filename, verbose=self.verbose, extras=extras)
+            wheel = Wheel(
+                archive_filename,
+                verbose=self.verbose,
+                extras=extras,
+                zip_import=(dependency_flags & FLAG_ZIP_IMPORT > 0),
+            )
             files_installed, dependencies = wheel.install(self.site_packages)
         else:
             files_installed, dependencies = self.installer.run(pkg_name, archive_filename, extras=extras)
@@ -984,6 +1562,8 @@ class PackageRepository(object):
         self.config.add_module(pkg_info)
         print('Package installed: {}'.format(pkg_name))
 
+        installed = set(normalize_name(name) for name in sys.modules['setuptools']._installed_requirements_)
+        missing = []
         for dep_name, ver_spec, extras in name_versions:
             
             if dep_name.strip().startswith("#") or len(dep_name.strip()) == 0:
@@ -998,7 +1578,7 @@ class PackageRepository(object):
 
             # If this dependency is installed before, skipping
             # TODO: should we NOT skip if extras are specified?
-            if dep_name in sys.modules['setuptools']._installed_requirements_:
+            if normalize_name(dep_name) in installed:
                 print('Dependency already installed: {}'.format(dep_name))
                 continue
 
@@ -1006,32 +1586,48 @@ class PackageRepository(object):
                 print('Dependency already bundled in distribution: {}'.format(dep_name))
                 continue
 
-            print(
-                'Installing dependency: {} (required by: {})'.format(
-                    '{}{}'.format(dep_name,
-                                  ver_spec if ver_spec else ''),
-                    pkg_name
+            missing.append((dep_name, ver_spec, extras))
+
+        if missing:
+            # packages installed from PyPI usually have their dependencies
+            # resolved and installed before, so this only happens for other
+            # repositories and for packages without dependency metadata.
+            if isinstance(self, PyPIRepository):
+                repository = self
+            else:
+                repository = PyPIRepository(
+                    site_packages=self.site_packages,
+                    verbose=self.verbose,
+                    index_url=self.index_url,
+                    cache_dir=self.cache_dir,
                 )
-            )
-            repository = get_repository(dep_name, verbose=self.verbose)
-            try:
-                repository.install(dep_name, ver_spec, flags=dependency_flags, extras=extras)
-            except PackageAlreadyInstalled:
-                # well, it is already installed...
-                # TODO: maybe update package if required?
-                pass
+            repository.install_requirements(missing, flags=dependency_flags, required_by=pkg_name)
 
     def search(self, name_fragment):
         raise PipError('search only available for PyPI packages')
 
     def list(self):
-        modules = self.config.list_modules()
-        return [(module, self.config.get_info(module)) for module in modules]
+        return self.config.list_info()
 
-    def remove(self, pkg_name):
+    def remove(self, pkg_name, force=False):
+        """
+        removes a package and the dependencies no other package requires.
+        A package required by other installed packages is only removed if force is True.
+        """
         if self.config.module_exists(pkg_name):
             dependencies = self.config.get_dependencies(pkg_name)
-            other_dependencies = self.config.get_all_dependencies(exclude_module=(pkg_name, ))
+            required_by = self.config.get_required_by(pkg_name)
+            if required_by:
+                if not force:
+                    raise PipError(
+                        '{} is required by: {} (use --force to remove it anyway)'.format(pkg_name, ', '.join(required_by))
+                    )
+                print(
+                    _stash.text_color(
+                        'Warning: {} is required by: {}'.format(pkg_name, ', '.join(required_by)),
+                        'yellow',
+                    )
+                )
             files_installed = self.config.get_files_installed(pkg_name)
 
             if files_installed:
@@ -1056,7 +1652,7 @@ class PackageRepository(object):
             if dependencies:
                 for dependency in dependencies:
                     # If not other packages depend on it, it may be subject to removal
-                    if dependency not in other_dependencies:
+                    if not self.config.get_required_by(dependency):
                         # Only remove the module if it exists in the registry. Otherwise
                         # it is possibly a builtin module.
                         # For backwards compatibility, we do not remove any entries
@@ -1092,6 +1688,9 @@ class PyPIRepository(PackageRepository):
         # DO NOT USE self.pypi, it's there just for search, it's obsolete/legacy
         self.pypi = xmlrpclib.ServerProxy('https://pypi.python.org/pypi')
         self.standard_package_names = {}
+        self.session = make_session(METADATA_THREADS)
+        self.cache = PackageCache(cache_dir=self.cache_dir, session=self.session, verbose=self.verbose)
+        self._package_data_cache = {}
     
     def _check_blocklist(self, pkg_name):
         """
@@ -1123,8 +1722,7 @@ class PyPIRepository(PackageRepository):
     def get_standard_package_name(self, pkg_name):
         if pkg_name not in self.standard_package_names:
             try:
-                r = requests.get('https://pypi.python.org/pypi/{}/json'.format(pkg_name))
-                self.standard_package_names[pkg_name] = r.json()['info']['name']
+                self.standard_package_names[pkg_name] = self._package_data(pkg_name)['info']['name']
             except:
                 return pkg_name
 
@@ -1142,13 +1740,24 @@ class PyPIRepository(PackageRepository):
         hits = sorted(hits, key=lambda pkg: pkg['_pypi_ordering'], reverse=True)
         return hits
 
-    def _package_data(self, pkg_name):
-        r = requests.get('https://pypi.python.org/pypi/{}/json'.format(pkg_name))
+    def _get_json(self, url):
+        try:
+            r = self.session.get(url)
+        except requests.RequestException as e:
+            raise PipError('Failed to fetch {}: {}'.format(url, e))
         if not r.status_code == requests.codes.ok:
             raise PipError('Failed to fetch package release urls')
-
         return r.json()
 
+    def _package_data(self, pkg_name):
+        # the data is cached, as the resolver and the name lookup both need it
+        if pkg_name not in self._package_data_cache:
+            self._package_data_cache[pkg_name] = self._get_json('{}/{}/json'.format(self.index_url, pkg_name))
+        return self._package_data_cache[pkg_name]
+
+    def _release_data(self, pkg_name, release):
+        return self._get_json('{}/{}/{}/json'.format(self.index_url, pkg_name, release))
+
     def _package_releases(self, pkg_data):
         return pkg_data['releases'].keys()
 
@@ -1181,7 +1790,32 @@ class PyPIRepository(PackageRepository):
             print("Using {n}=={v}...".format(n=pkg_name, v=hit))
 
         downloads = self._package_downloads(pkg_data, hit)
+        target = self._select_download(pkg_name, downloads, hit, flags=flags)
+
+        pkg_info = self._package_info(pkg_data)
+        pkg_info['url'] = 'pypi'
+
+        print('Downloading package ...')
 
+        archive = self.cache.fetch_all([target])[0]
+        archive_filename = os.path.join(os.getenv('TMPDIR'), target['filename'])
+        shutil.copy(archive, archive_filename)
+        return archive_filename, pkg_info
+
+    def _select_download(self, pkg_name, downloads, hit, flags=DEFAULT_FLAGS):
+        """
+        Choose the file of a release to install.
+        :param pkg_name: name of package
+        :type pkg_name: str
+        :param downloads: the files of the release
+        :type downloads: list of dict
+        :param hit: the release
+        :type hit: str
+        :param flags: (distribution) options
+        :type flags: int
+        :return: the file to download
+        :rtype: dict
+        """
         if not downloads:
             raise PipError('No download available for {}: {}'.format(pkg_name, hit))
 
@@ -1226,23 +1860,22 @@ class PyPIRepository(PackageRepository):
                 if source is not None and (flags & FLAG_DIST_ALLOW_SRC == 0):
                     print("However, a source distribution is available. Maybe try with '--no-binary :all:'?")
             raise PipError("No allowed distribution found for '{}': {}!".format(pkg_name, hit))
+        return target
 
-        pkg_info = self._package_info(pkg_data)
-        pkg_info['url'] = 'pypi'
-
-        print('Downloading package ...')
-
-        worker = _stash('wget {} -o $TMPDIR/{}'.format(target['url'], target['filename']))
-
-        if worker.state.return_value != 0:
-            raise PipError('failed to download package from {}'.format(target['url']))
-
-        return os.path.join(os.getenv('TMPDIR'), target['filename']), pkg_info
-
-    def install(self, pkg_name, ver_spec, flags=DEFAULT_FLAGS, pip_info_file=PIP_INFO_FILE, extras=[]):
-        pkg_name = self.get_standard_package_name(pkg_name)
-        
-        # check if package is blocklisted
+    def apply_blocklist(self, pkg_name, ver_spec, extras=[], flags=DEFAULT_FLAGS):
+        """
+        Check a requirement against the blocklist, printing warnings.
+        :param pkg_name: name of package
+        :type pkg_name: str
+        :param ver_spec: the version specification
+        :type ver_spec: VersionSpecifier or None
+        :param extras: extras to install
+        :type extras: list of str
+        :param flags: (distribution) options
+        :type flags: int
+        :return: the (name, version specifier, extras) to install instead or None if nothing should be installed
+        :rtype: tuple of (str, VersionSpecifier, list of str) or None
+        """
         # we only do this for PyPI installs, since non-PyPI installs
         # may have the same pkg name for a different package.
         # TODO: should this be changed?
@@ -1269,8 +1902,8 @@ class PyPIRepository(PackageRepository):
                     )
                 print("Reason: " + reason)
                 pkg_name = alt
-                # use an empty VersionSpecifier to mark any version as acceptable
-                ver_spec = _stash.libversion.VersionSpecifier()
+                # any version is acceptable
+                ver_spec = None
                 # do not use extras. We can not be sure that the package provide the same extras.
                 extras = []
             else:
@@ -1284,22 +1917,66 @@ class PyPIRepository(PackageRepository):
                     )
                 print("This probably means that the dependency can not be installed, but pythonista ships with the package preinstalled.")
                 print("Reason for blocklisting: " + reason)
-                return
+                return None
+        return pkg_name, ver_spec, extras
+
+    def install(self, pkg_name, ver_spec, flags=DEFAULT_FLAGS, extras=[]):
+        pkg_name = self.get_standard_package_name(pkg_name)
+        
+        # check if package is blocklisted
+        requirement = self.apply_blocklist(pkg_name, ver_spec, extras, flags=flags)
+        if requirement is None:
+            return
+        pkg_name, ver_spec, extras = requirement
         
         if not self.config.module_exists(pkg_name):
-            archive_filename, pkg_info = self.download(pkg_name, ver_spec, flags=flags)
-            self._install(pkg_name, pkg_info, archive_filename, dependency_flags=flags, extras=extras)
-            # save json file of info
-            info_file = pip_info_file % pkg_name
-            info_folder = os.path.split(info_file)[0]
-            if not os.path.exists(info_folder):
-                os.mkdir(info_folder)
-            with open(info_file, 'w') as f:
-                json.dump(pkg_info, f)
+            self.install_requirements([(pkg_name, ver_spec, extras)], flags=flags)
         else:
             # todo: maybe update package?
             raise PackageAlreadyInstalled('Package already installed')
 
+    def install_requirements(self, requirements, flags=DEFAULT_FLAGS, required_by=None):
+        """
+        Install packages and all their dependencies.
+        The dependencies are resolved before anything is installed. Then all
+        archives are downloaded in parallel (or taken from the cache) and the
+        packages are installed, dependencies before the packages requiring them.
+        :param requirements: list of (name, version specifier, extras)
+        :type requirements: list of tuple
+        :param flags: (distribution) options
+        :type flags: int
+        :param required_by: name of the package requiring the requirements, if any
+        :type required_by: str or None
+        """
+        print('Querying PyPI ... ')
+        if hasattr(sys.modules.get('setuptools'), '_installed_requirements_'):
+            installed = sys.modules['setuptools']._installed_requirements_
+        else:
+            installed = self.config.list_modules()
+        resolver = DependencyResolver(self, flags=flags, installed=installed)
+        releases = resolver.resolve(requirements, required_by=required_by)
+        if self.verbose:
+            print('Resolved: {}'.format(', '.join('{}=={}'.format(r.name, r.version) for r in releases)))
+
+        print('Downloading package ...')
+        archives = self.cache.fetch_all([release.download for release in releases])
+
+        for release, archive in zip(releases, archives):
+            if release.required_by is not None:
+                print(
+                    'Installing dependency: {}=={} (required by: {})'.format(
+                        release.name,
+                        release.version,
+                        release.required_by,
+                    )
+                )
+            if not archive.endswith('.whl'):
+                # the installer removes the archive, so install a copy
+                archive_filename = os.path.join(os.getenv('TMPDIR'), release.download['filename'])
+                shutil.copy(archive, archive_filename)
+                archive = archive_filename
+            self._install(release.name, release.pkg_info, archive, dependency_flags=flags, extras=release.extras)
+
     def update(self, pkg_name):
         pkg_name = self.get_standard_package_name(pkg_name)
         if self.config.module_exists(pkg_name):
@@ -1308,7 +1985,8 @@ class PyPIRepository(PackageRepository):
             current = self.config.get_info(pkg_name)
             if not current['version'] == hit:
                 print('Updating {}'.format(pkg_name))
-                self.remove(pkg_name)
+                # the package is installed again right away
+                self.remove(pkg_name, force=True)
                 self.install(pkg_name, VersionSpecifier((('==', hit), )))
             else:
                 print('Package already up-to-date.')
@@ -1518,7 +2196,13 @@ class LocalRepository(PackageRepository):
 # pypi_repository = PyPIRepository()
 
 
-def get_repository(pkg_name, site_packages=SITE_PACKAGES_FOLDER, verbose=False):
+def get_repository(
+    pkg_name,
+    site_packages=SITE_PACKAGES_FOLDER,
+    verbose=False,
+    index_url=DEFAULT_INDEX_URL,
+    cache_dir=PIP_CACHE_DIR,
+):
     """
     The corresponding repository based on the given package name.
     :param pkg_name: It can be one of the four following options:
@@ -1530,26 +2214,31 @@ def get_repository(pkg_name, site_packages=SITE_PACKAGES_FOLDER, verbose=False):
     :type site_packages: str
     :param verbose: enable additional output
     :type verbose: bool
+    :param index_url: base url of the PyPI JSON API
+    :type index_url: str
+    :param cache_dir: directory of the download cache
+    :type cache_dir: str
     """
+    kwargs = dict(site_packages=site_packages, verbose=verbose, index_url=index_url, cache_dir=cache_dir)
 
     if pkg_name.startswith('http://') \
     or pkg_name.startswith('https://') \
     or pkg_name.startswith('ftp://'):  # remote archive file
         print('Working on URL repository ...')
-        return UrlRepository(site_packages=site_packages, verbose=verbose)
+        return UrlRepository(**kwargs)
 
     # local archive file
     elif os.path.isfile(pkg_name) and \
     (pkg_name.endswith('.zip') or pkg_name.endswith('.gz') or pkg_name.endswith('.bz2')):
         print('Working on Local repository ...')
-        return LocalRepository(site_packages=site_packages, verbose=verbose)
+        return LocalRepository(**kwargs)
 
     elif '/' in pkg_name:  # github, e.g. selectel/pyte
         print('Working on GitHub repository ...')
-        return GitHubRepository(site_packages=site_packages, verbose=verbose)
+        return GitHubRepository(**kwargs)
 
     else:  # PyPI
-        return PyPIRepository(site_packages=site_packages, verbose=verbose)
+        return PyPIRepository(**kwargs)
 
 
 if __name__ == '__main__':
@@ -1557,6 +2246,13 @@ if __name__ == '__main__':
     ap = argparse.ArgumentParser()
 
     ap.add_argument('--verbose', action='store_true', help='be more chatty')
+    ap.add_argument(
+        '-i',
+        '--index-url',
+        default=DEFAULT_INDEX_URL,
+        help='base url of the package index (PyPI JSON API)',
+    )
+    ap.add_argument('--cache-dir', default=PIP_CACHE_DIR, help='directory of the download cache')
     ap.add_argument(
         "-6",
         action='store_const',
@@ -1606,6 +2302,12 @@ if __name__ == '__main__':
         dest="preferbinary",
     )
     install_parser.add_argument("--ignore-blocklist", action="store_true", help="Ignore blocklist", dest="ignoreblocklist")
+    install_parser.add_argument(
+        "--zip-import",
+        action="store_true",
+        help="Keep pure python wheels as archives and import them using zipimport",
+        dest="zipimport",
+    )
 
     download_parser = subparsers.add_parser('download', help='download packages')
     download_parser.add_argument(
@@ -1632,6 +2334,12 @@ if __name__ == '__main__':
         metavar="package",
         help='packages to uninstall',
     )
+    remove_parser.add_argument(
+        '-f',
+        '--force',
+        action='store_true',
+        help='remove packages even if other packages require them',
+    )
 
     update_parser = subparsers.add_parser('update', help='update an installed package')
     update_parser.add_argument('packages', nargs="+", help='the package name')
@@ -1648,7 +2356,13 @@ if __name__ == '__main__':
 
     try:
         if ns.sub_command == 'list':
-            repository = get_repository('pypi', site_packages=ns.site_packages, verbose=ns.verbose)
+            repository = get_repository(
+                'pypi',
+                site_packages=ns.site_packages,
+                verbose=ns.verbose,
+                index_url=ns.index_url,
+                cache_dir=ns.cache_dir,
+            )
             info_list = repository.list()
             for module, info in info_list:
                 print('{} ({}) - {}'.format(module, info.get('version', '???'), info.get('summary', '')))
@@ -1693,8 +2407,17 @@ if __name__ == '__main__':
             if ns.ignoreblocklist:
                 flags = flags | FLAG_IGNORE_BLOCKLIST
 
+            if ns.zipimport:
+                flags = flags | FLAG_ZIP_IMPORT
+
             for requirement in ns.requirements:
-                repository = get_repository(requirement, site_packages=site_packages, verbose=ns.verbose)
+                repository = get_repository(
+                    requirement,
+                    site_packages=site_packages,
+                    verbose=ns.verbose,
+                    index_url=ns.index_url,
+                    cache_dir=ns.cache_dir,
+                )
                 NO_OVERWRITE = ns.no_overwrite
 
                 pkg_name, ver_spec, extras = VersionSpecifier.parse_requirement(requirement)
@@ -1705,11 +2428,16 @@ if __name__ == '__main__':
                     # start with what we have installed (i.e. in the config file)
                     sys.modules['setuptools']._installed_requirements_ = repository.config.list_modules()
                     repository.install(pkg_name, ver_spec, flags=flags, extras=extras)
-                    update_req_index() 
 
         elif ns.sub_command == 'download':
             for requirement in ns.requirements:
-                repository = get_repository(requirement, site_packages=ns.site_packages, verbose=ns.verbose)
+                repository = get_repository(
+                    requirement,
+                    site_packages=ns.site_packages,
+                    verbose=ns.verbose,
+                    index_url=ns.index_url,
+                    cache_dir=ns.cache_dir,
+                )
                 try:
                     pkg_name, ver_spec, extras = VersionSpecifier.parse_requirement(requirement)
                 except ValueError as e:
@@ -1719,27 +2447,50 @@ if __name__ == '__main__':
                 shutil.move(archive_filename, directory)
 
         elif ns.sub_command == 'search':
-            repository = get_repository('pypi', site_packages=ns.site_packages, verbose=ns.verbose)
+            repository = get_repository(
+                'pypi',
+                site_packages=ns.site_packages,
+                verbose=ns.verbose,
+                index_url=ns.index_url,
+                cache_dir=ns.cache_dir,
+            )
             search_hits = repository.search(ns.term)
             search_hits = sorted(search_hits, key=lambda pkg: pkg['_pypi_ordering'], reverse=True)
             for hit in search_hits:
                 print('{} {} - {}'.format(hit['name'], hit['version'], hit['summary']))
 
         elif ns.sub_command == 'versions':
-            repository = get_repository(ns.package_name, site_packages=ns.site_packages, verbose=ns.verbose)
+            repository = get_repository(
+                ns.package_name,
+                site_packages=ns.site_packages,
+                verbose=ns.verbose,
+                index_url=ns.index_url,
+                cache_dir=ns.cache_dir,
+            )
             version_hits = repository.versions(ns.package_name)
             for hit in version_hits:
                 print('{} - {}'.format(ns.package_name, hit))
 
         elif ns.sub_command == 'uninstall':
             for package_name in ns.packages:
-                repository = get_repository('pypi', site_packages=ns.site_packages, verbose=ns.verbose)
-                repository.remove(package_name)
-                update_req_index() 
+                repository = get_repository(
+                    'pypi',
+                    site_packages=ns.site_packages,
+                    verbose=ns.verbose,
+                    index_url=ns.index_url,
+                    cache_dir=ns.cache_dir,
+                )
+                repository.remove(package_name, force=ns.force)
 
         elif ns.sub_command == 'update':
             for package_name in ns.packages:
-                repository = get_repository(package_name, site_packages=ns.site_packages, verbose=ns.verbose)
+                repository = get_repository(
+                    package_name,
+                    site_packages=ns.site_packages,
+                    verbose=ns.verbose,
+                    index_url=ns.index_url,
+                    cache_dir=ns.cache_dir,
+                )
 
                 with save_current_sys_modules():
                     fake_setuptools_modules()
@@ -1750,12 +2501,12 @@ if __name__ == '__main__':
 
         elif ns.sub_command == 'show':
             if ns.forcedownload:
-                download_info(ns.package, site_packages=ns.site_packages)
+                download_info(ns.package, site_packages=ns.site_packages, index_url=ns.index_url)
             print_info(ns.package, site_packages=ns.site_packages)
 
         elif ns.sub_command=='dev':
             if ns.opt=='update-index':
-                update_req_index()
+                update_req_index(site_packages=ns.site_packages)
                 print('index file updated')
             else:
                 raise PipError('unknow dev option: {}'.format(ns.opt))
@@ -2,102 +2,30 @@
 '''
 Get sha1 hash of a file or string.
 
-usage: sha1sum.py [-h] [-c] [file [file ...]]
+usage: sha1sum.py [-h] [-c] [-a {md5,sha1,sha256}] [-j JOBS] [file [file ...]]
 
 positional arguments:
-  file         String or file to hash.
+  file                  String or file to hash.
 
 optional arguments:
-  -h, --help   show this help message and exit
-  -c, --check  Check a file with sha1 hashes and file names for a match.
-               format:
-               sha1_hash filename
-               sha1_hash filename
-               etc.
+  -h, --help            show this help message and exit
+  -c, --check           Check a file with sha1 hashes and file names for a match.
+                        format:
+                        sha1_hash filename
+                        sha1_hash filename
+                        etc.
+                        Lines in the format 'SHA1 (filename) = hash' are
+                        checked with the algorithm they name.
+  -a, --also {md5,sha1,sha256}
+                        also compute this digest in the same pass (may be
+                        repeated); the digests are then printed as
+                        'SHA1 (filename) = hash'
+  -j JOBS, --jobs JOBS  number of files hashed in parallel (default: number
+                        of cpus)
 '''
-from __future__ import print_function
-
-import argparse
-import os
-import re
 import sys
 
-import six
-
-from Crypto.Hash import SHA
-
-
-def get_hash(fileobj):
-    h = SHA.new()
-    chunk_size = 8192
-    while True:
-        chunk = fileobj.read(chunk_size)
-        if len(chunk) == 0:
-            break
-        h.update(chunk)
-    return h.hexdigest()
-
-
-def check_list(fileobj):
-    correct = True
-    for line in fileobj:
-        match = re.match(r'(\w+)[ \t]+(.+)', line)
-        try:
-            with open(match.group(2), 'rb') as f1:
-                if match.group(1) == get_hash(f1):
-                    print(match.group(2) + ': Pass')
-                else:
-                    print(match.group(2) + ': Fail')
-                    correct = False
-        except Exception:
-            print('Invalid format.')
-            correct = False
-    return correct
-
-
-def make_file(txt):
-    f = six.BytesIO()
-    if isinstance(txt, six.binary_type):
-        f.write(txt)
-    else:
-        f.write(txt.encode("utf-8"))
-    f.seek(0)
-    return f
-
-
-ap = argparse.ArgumentParser()
-ap.add_argument(
-    '-c',
-    '--check',
-    action='store_true',
-    default=False,
-    help='''Check a file with sha1 hashes and file names for a match. format: hash filename'''
-)
-ap.add_argument('file', action='store', nargs='*', help='String or file to hash.')
-args = ap.parse_args(sys.argv[1:])
-
-if args.check:
-    if args.file:
-        s = True
-        for arg in args.file:
-            if os.path.isfile(arg):
-                s = s and check_list(open(arg))
-    else:
-        s = check_list(make_file(sys.stdin.read()))
-    if s:
-        sys.exit(0)
-    else:
-        sys.exit(1)
+from stashutils.hashing import main
 
-else:
-    if args.file:
-        for arg in args.file:
-            if os.path.isfile(arg):
-                with open(arg, 'rb') as f:
-                    print(get_hash(f) + ' ' + arg)
-            elif arg == "-":
-                print(get_hash(make_file(sys.stdin.read())))
-            else:
-                print(get_hash(make_file(arg)))
-    else:
-        print(get_hash(make_file(sys.stdin.read())))
+if __name__ == "__main__":
+    main("sha1", sys.argv[1:])
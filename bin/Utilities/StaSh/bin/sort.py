@@ -2,37 +2,277 @@
 """Sort standard input or given files to standard output"""
 from __future__ import print_function
 import os
+import io
+import re
 import sys
-import fileinput
+import heapq
+import tempfile
 import argparse
 
+_stash = globals()['_stash']
+
+# estimated memory used by a line in addition to its characters
+LINE_OVERHEAD = 64
+
+_NUMBER = re.compile(r'^\s*([-+]?(?:\d+\.?\d*|\.\d+))')
+_KEYDEF = re.compile(r'^(\d+)([nr]*)(?:,(\d+)([nr]*))?$')
+_SIZE = re.compile(r'^(\d+)([kKmMgG]?)$')
+
+
+class Reversed(object):
+    """
+    Wrapper inverting the order of a sort key.
+    """
+    __slots__ = ('value', )
+
+    def __init__(self, value):
+        self.value = value
+
+    def __lt__(self, other):
+        return other.value < self.value
+
+    def __gt__(self, other):
+        return other.value > self.value
+
+    def __eq__(self, other):
+        return self.value == other.value
+
+    def __ne__(self, other):
+        return self.value != other.value
+
+
+def numeric_value(s):
+    """
+    Return the number at the start of s, or 0 if there is none.
+    """
+    m = _NUMBER.match(s)
+    return float(m.group(1)) if m else 0.0
+
+
+def parse_keydef(keydef, numeric, reverse):
+    """
+    Parse a key definition of the form F1[,F2] with optional n and r flags.
+    Fields are numbered from 1. The flags of a key replace the global ones.
+    """
+    m = _KEYDEF.match(keydef)
+    if m is None or int(m.group(1)) < 1:
+        raise ValueError('invalid key definition: {}'.format(keydef))
+    start = int(m.group(1)) - 1
+    end = int(m.group(3)) if m.group(3) else None
+    flags = (m.group(2) or '') + (m.group(4) or '')
+    if flags:
+        numeric = 'n' in flags
+        reverse = 'r' in flags
+    return start, end, numeric, reverse
+
+
+def parse_size(size):
+    """
+    Parse a memory size with an optional K, M or G suffix.
+    """
+    m = _SIZE.match(size)
+    if m is None:
+        raise ValueError('invalid buffer size: {}'.format(size))
+    return int(m.group(1)) * 1024 ** ' kmg'.index(m.group(2).lower() or ' ')
+
+
+def make_keyfunc(keys, separator, numeric):
+    """
+    Return a function computing the sort key of a line.
+    The key is computed once per line, so that the fields are not split
+    again for every comparison.
+    """
+    if not keys:
+        if numeric:
+            return lambda line: (numeric_value(line), )
+        return lambda line: (line.rstrip('\n'), )
+
+    join_with = separator if separator is not None else ' '
+
+    def keyfunc(line):
+        fields = line.rstrip('\n').split(separator)
+        key = []
+        for start, end, key_numeric, key_reverse in keys:
+            value = join_with.join(fields[start:end])
+            if key_numeric:
+                value = numeric_value(value)
+            if key_reverse:
+                value = Reversed(value)
+            key.append(value)
+        return tuple(key)
+
+    return keyfunc
+
+
+def decorate(lines, keyfunc, unique, reverse, start=0):
+    """
+    Yield a sortable item for every line.
+    Unless only unique keys are wanted, lines with equal keys are sorted by the whole line.
+    Otherwise they keep their input order, numbered from start, so that the first one is kept.
+    """
+    for seq, line in enumerate(lines, start):
+        if not line.endswith('\n'):
+            line += '\n'
+        key = keyfunc(line)
+        if unique:
+            yield (Reversed(key) if reverse else key, seq, line)
+        else:
+            item = (key + (line, ), line)
+            yield Reversed(item) if reverse else item
+
+
+def write_run(items):
+    """
+    Write a sorted run of items to a temporary file and return its path.
+    """
+    fd, path = tempfile.mkstemp(prefix='stash_sort_', suffix='.txt')
+    with io.open(fd, 'w', encoding='utf-8') as outs:
+        for item in items:
+            outs.write(item_line(item))
+    return path
+
+
+def read_run(path, keyfunc, unique, reverse, start):
+    """
+    Yield the items of a sorted run written by write_run.
+    start is the number of lines read before the run, the lines of the run
+    are numbered from there so that equal keys keep their input order.
+    """
+    with io.open(path, 'r', encoding='utf-8') as ins:
+        for item in decorate(ins, keyfunc, unique, reverse, start):
+            yield item
+
+
+def item_line(item):
+    """
+    Return the line of a sortable item.
+    """
+    if isinstance(item, Reversed):
+        item = item.value
+    return item[-1]
+
+
+def item_key(item):
+    """
+    Return the key of a sortable item.
+    """
+    if isinstance(item, Reversed):
+        item = item.value
+    key = item[0]
+    return key.value if isinstance(key, Reversed) else key
+
+
+def sort_lines(lines, keyfunc, unique=False, reverse=False, buffer_size=16 * 1024 * 1024):
+    """
+    Sort lines and yield them in order.
+    Once the lines read exceed buffer_size, they are sorted and spilled to
+    a temporary file. All runs are merged at the end, so that the input
+    does not need to fit into memory.
+    """
+    runs = []
+    starts = []
+    items = []
+    size = 0
+    count = 0
+    try:
+        for item in decorate(lines, keyfunc, unique, reverse):
+            items.append(item)
+            size += len(item_line(item)) + LINE_OVERHEAD
+            if size >= buffer_size:
+                items.sort()
+                runs.append(write_run(items))
+                starts.append(count)
+                count += len(items)
+                items = []
+                size = 0
+
+        items.sort()
+        if runs:
+            merged = heapq.merge(
+                iter(items),
+                *[read_run(path, keyfunc, unique, reverse, start) for path, start in zip(runs, starts)]
+            )
+        else:
+            merged = iter(items)
+
+        prev_key = None
+        for item in merged:
+            if unique:
+                key = item_key(item)
+                if key == prev_key:
+                    continue
+                prev_key = key
+            yield item_line(item)
+
+    finally:
+        for path in runs:
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+
 
 def main(args):
     ap = argparse.ArgumentParser()
     ap.add_argument('files', nargs='*', help='files to sort')
     ap.add_argument('-r', '--reverse', action='store_true', default=False, help='reverse the result of comparisons')
+    ap.add_argument('-n', '--numeric-sort', action='store_true', default=False, help='compare according to numerical value')
+    ap.add_argument(
+        '-u',
+        '--unique',
+        action='store_true',
+        default=False,
+        help='output only the first of lines with an equal key',
+    )
+    ap.add_argument(
+        '-t',
+        '--field-separator',
+        default=None,
+        help='use SEP instead of blanks to separate fields',
+        metavar='SEP',
+    )
+    ap.add_argument(
+        '-k',
+        '--key',
+        action='append',
+        default=[],
+        help='sort via a key; KEYDEF is F1[,F2] with optional flags n and r, fields start at 1',
+        metavar='KEYDEF',
+    )
+    ap.add_argument(
+        '-S',
+        '--buffer-size',
+        default='16M',
+        help='memory to use before sorted runs are written to temporary files (default: 16M)',
+        metavar='SIZE',
+    )
     ns = ap.parse_args(args)
 
-    def _print(lines):
-        if lines is not None:
-            lines = sorted(lines)
-            if ns.reverse:
-                lines = lines[::-1]
-            print(''.join(lines))
-
-    fileinput.close()  # in case it is not closed
     try:
-        lines = None
-        for line in fileinput.input(ns.files, openhook=fileinput.hook_encoded("utf-8")):
-            if fileinput.isfirstline():
-                _print(lines)
-                lines = []
-            lines.append(line)
+        keys = [parse_keydef(keydef, ns.numeric_sort, False) for keydef in ns.key]
+        buffer_size = parse_size(ns.buffer_size)
+    except ValueError as e:
+        print('sort: {}'.format(e), file=sys.stderr)
+        sys.exit(2)
+    keyfunc = make_keyfunc(keys, ns.field_separator, ns.numeric_sort)
 
-        _print(lines)
+    errors = []
 
-    finally:
-        fileinput.close()
+    def read_lines():
+        for reader, filename, error in _stash.libcore.input_readers(ns.files):
+            if reader is None:
+                print('sort: {}'.format(error), file=sys.stderr)
+                errors.append(error)
+                continue
+            with reader:
+                for batch in reader.line_batches():
+                    for line in batch:
+                        yield line
+
+    for line in sort_lines(read_lines(), keyfunc, unique=ns.unique, reverse=ns.reverse, buffer_size=buffer_size):
+        sys.stdout.write(line)
+    if errors:
+        sys.exit(2)
 
 
 if __name__ == '__main__':
@@ -22,6 +22,11 @@ def main(args):
         'ipython_style_history_search': _stash.runtime.history,
         "enable_styles": _stash,
         "colored_errors": _stash.runtime,
+        "concurrent_pipes": _stash.runtime,
+        "pipe_buffer_size": _stash.runtime,
+        "code_cache_size": _stash.runtime.code_cache,
+        "persistent_code_cache": _stash.runtime.code_cache,
+        "parse_cache_size": _stash.runtime.parser,
     }
 
     if ns.list:
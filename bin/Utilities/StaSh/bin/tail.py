@@ -5,19 +5,173 @@
 from __future__ import print_function
 
 import argparse
-import time
+import codecs
+import io
+import os
+import stat
 import sys
-import fileinput
+import time
+from collections import deque
+
+# size of the blocks read from files
+BLOCK_SIZE = 64 * 1024
+# shortest interval between checks for new data when following a file
+MIN_SLEEP_INTERVAL = 0.05
+
+
+def is_regular_file(f):
+    """
+    Return True if f is a regular file, which can be read from the end.
+    """
+    try:
+        return stat.S_ISREG(os.fstat(f.fileno()).st_mode)
+    except (AttributeError, OSError, ValueError, io.UnsupportedOperation):
+        return False
+
 
+def last_lines_offset(f, count, size):
+    """
+    Return the offset of the last count lines of a file.
+    The file is read backwards in blocks, so only the blocks containing
+    these lines are read.
+    """
+    if count == 0:
+        return size
+    end = size
+    if size > 0:
+        # a newline at the very end of the file does not start another line
+        f.seek(size - 1)
+        if f.read(1) == b'\n':
+            end -= 1
+    pos = end
+    while pos > 0:
+        start = max(0, pos - BLOCK_SIZE)
+        f.seek(start)
+        block = f.read(pos - start)
+        idx = len(block)
+        while True:
+            idx = block.rfind(b'\n', 0, idx)
+            if idx == -1:
+                break
+            count -= 1
+            if count == 0:
+                return start + idx + 1
+        pos = start
+    return 0
 
-def tail_f(f, wait_sec):
+
+def skip_lines_offset(f, count):
+    """
+    Return the offset after the first count lines of a file.
+    """
+    pos = 0
+    f.seek(0)
+    while count > 0:
+        block = f.read(BLOCK_SIZE)
+        if not block:
+            break
+        idx = -1
+        while count > 0:
+            idx = block.find(b'\n', idx + 1)
+            if idx == -1:
+                break
+            count -= 1
+        if count == 0:
+            return pos + idx + 1
+        pos += len(block)
+    return pos
+
+
+def copy_from(f, offset):
+    """
+    Write the contents of a binary file from offset to the end to stdout.
+    """
+    decoder = codecs.getincrementaldecoder('utf-8')('replace')
+    f.seek(offset)
     while True:
-        l = f.readline()
-        if l:
-            yield l
-        else:
-            # print('!!READ NOTHING!!')
-            time.sleep(wait_sec)
+        data = f.read(BLOCK_SIZE)
+        if not data:
+            break
+        sys.stdout.write(decoder.decode(data))
+    sys.stdout.write(decoder.decode(b'', True))
+
+
+def tail_file(f, count, use_bytes, from_start):
+    """
+    Print the tail of a regular file opened in binary mode.
+    """
+    size = os.fstat(f.fileno()).st_size
+    if use_bytes:
+        offset = min(count - 1, size) if from_start else size - count
+    elif from_start:
+        offset = skip_lines_offset(f, count - 1)
+    else:
+        offset = last_lines_offset(f, count, size)
+    copy_from(f, max(offset, 0))
+
+
+def tail_stream(f, count, use_bytes, from_start):
+    """
+    Print the tail of a text stream which can only be read forwards, e.g. stdin.
+    """
+    if use_bytes:
+        data = f.read()
+        sys.stdout.write(data[count - 1:] if from_start else data[len(data) - count:])
+        return
+    lines = iter(f.readline, '')
+    if from_start:
+        for _ in zip(range(count - 1), lines):
+            pass
+        for line in lines:
+            sys.stdout.write(line)
+    elif count > 0:
+        for line in deque(lines, maxlen=count):
+            sys.stdout.write(line)
+
+
+def follow(f, path, max_interval):
+    """
+    Yield data as it is appended to a file.
+    While nothing new is found, the interval between checks grows from
+    MIN_SLEEP_INTERVAL up to max_interval.
+    If the file is truncated it is read again from the start. If the path
+    refers to another file (e.g. after log rotation), the new file is opened.
+    :param f: the file, in binary mode if path is given, otherwise in text mode
+    :param path: path of the file or None for streams
+    :param max_interval: longest interval between checks, in seconds
+    """
+    decoder = codecs.getincrementaldecoder('utf-8')('replace') if path is not None else None
+    interval = MIN_SLEEP_INTERVAL
+    try:
+        while True:
+            data = f.read(BLOCK_SIZE) if path is not None else f.readline()
+            if data:
+                interval = MIN_SLEEP_INTERVAL
+                yield decoder.decode(data) if decoder is not None else data
+                continue
+
+            if path is not None:
+                st = os.fstat(f.fileno())
+                if st.st_size < f.tell():
+                    print('tail: {}: file truncated'.format(path), file=sys.stderr)
+                    f.seek(0)
+                    continue
+                try:
+                    new_st = os.stat(path)
+                except OSError:
+                    # the file may be re-created in a moment
+                    new_st = None
+                if new_st is not None and (new_st.st_ino, new_st.st_dev) != (st.st_ino, st.st_dev):
+                    print("tail: '{}' has been replaced; following new file".format(path), file=sys.stderr)
+                    f.close()
+                    f = io.open(path, 'rb')
+                    continue
+
+            time.sleep(interval)
+            interval = min(interval * 2, max_interval)
+    finally:
+        if path is not None:
+            f.close()
 
 
 _first_file = True
@@ -57,7 +211,7 @@ def main(args):
         "--sleep-interval",
         type=float,
         default=1.0,
-        help="with -f, sleep for approximately N seconds (default 1.0) between iterations."
+        help="with -f, sleep for at most N seconds (default 1.0) between checks for new data."
     )
     p.add_argument("files", action="store", nargs="*", help="files to print")
     ns = p.parse_args(args)
@@ -84,41 +238,35 @@ def main(args):
         else:
             from_start = False
         count = abs(int(ns.lines))  # '-n -3' is equivalent to '-n 3'
+    if from_start:
+        # '+0' is equivalent to '+1'
+        count = max(count, 1)
 
     try:
         for i, fname in enumerate(ns.files):
             if ns.verbose or (len(ns.files) > 1 and not ns.quiet):
                 write_header(fname if fname != '-' else 'standard input')
 
+            follow_it = ns.follow and i == len(ns.files) - 1
+            if fname == '-':
+                f, path = sys.stdin, None
+            else:
+                f = io.open(fname, 'rb')
+                # only regular files can be read backwards and followed through rotation
+                path = fname if is_regular_file(f) else None
+                if path is None:
+                    f = io.TextIOWrapper(f, encoding='utf-8', errors='replace')
+
             try:
-                if fname == '-':
-                    f = sys.stdin
+                if path is not None:
+                    tail_file(f, count, use_bytes, from_start)
                 else:
-                    f = open(fname)
-
-                buf = []
-                j = -1
-                while True:
-                    j += 1
-                    if use_bytes:
-                        l = f.read(1)
-                    else:
-                        l = f.readline()
-                    if not l:
-                        break
-
-                    buf.append(l)
-                    if from_start:
-                        if j >= count - 1: break
-                    elif len(buf) > count:
-                        del buf[0]
-
-                for item in buf:
-                    print(item, end='')
-
-                if i == len(ns.files) - 1 and ns.follow:
-                    for l in tail_f(f, ns.sleep_interval):
-                        print(l, end='')
+                    tail_stream(f, count, use_bytes, from_start)
+
+                if follow_it:
+                    sys.stdout.flush()
+                    for data in follow(f, path, ns.sleep_interval):
+                        sys.stdout.write(data)
                         sys.stdout.flush()
             finally:
                 if fname != '-':
@@ -127,8 +275,6 @@ def main(args):
     except Exception as e:
         print('tail :%s' % str(e))
         status = 1
-    finally:
-        fileinput.close()
 
     sys.exit(status)
 
@@ -14,8 +14,15 @@ Examples:
         
     List Contents of gzip:
         tar -tzf test.tar.gz
-        
-usage: tar.py [-h] [-c] [-v] [-t] [-j] [-z] [-x] [-f FILE] [files [files ...]]
+
+    Stream a gzip compressed backup to a mounted directory:
+        tar -cz your_directory | tar -xC /mnt/backup
+
+Archives are read and written as streams, so '-' (stdin/stdout) or files on
+mounted filesystems can be used. When reading, the compression is detected.
+gzip compression uses one thread per cpu.
+
+usage: tar.py [-h] [-c] [-v] [-t] [-j] [-z] [-x] [-f FILE] [--threads N] [files [files ...]]
 
 positional arguments:
   files                 Create: Files/Dirs to add to archive. Extract:
@@ -29,50 +36,59 @@ optional arguments:
   -j, --bz2             Compress as bz2 format
   -z, --gzip            Compress as gzip format
   -x, --extract         Extract an archive.
-  -f FILE, --file FILE  Archive filename.
+  -f FILE, --file FILE  Archive filename, '-' for stdin/stdout (default).
+  --threads N           Number of threads used for gzip compression.
 '''
 from __future__ import print_function
 import argparse
 import os
+import sys
 import tarfile
 
+from stashutils.archives import ParallelGzipWriter, binary_stdin, binary_stdout, default_threads
+
 
 def output_print(msg):
     if args.verbose:
-        print(msg)
+        print(msg, file=log_file())
+
+
+def log_file():
+    """messages go to stderr while the archive is written to stdout."""
+    return sys.stderr if args.file == '-' and args.create else sys.stdout
 
 
-class MyFileObject(tarfile.ExFileObject):
-    def read(self, size, *args):
-        if self.position == self.size:
-            output_print("Extracting: %s" % self.name)
-        return tarfile.ExFileObject.read(self, size, *args)
+def open_archive(filename, mode):
+    """returns a binary file object for filename, which may be '-'."""
+    if filename == '-':
+        return binary_stdin() if mode == 'rb' else binary_stdout()
+    return open(filename, mode)
 
 
 def extract_members(members, extract):
     for tarinfo in members:
-        for path in extract:
-            if tarinfo.name == path or tarinfo.name.startswith(path):
-                yield tarinfo
+        if extract and not any(tarinfo.name == path or tarinfo.name.startswith(path) for path in extract):
+            continue
+        output_print('Extracting: %s' % tarinfo.name)
+        yield tarinfo
+
+
+def read_tar(filename):
+    """opens an archive for reading as a stream, detecting the compression."""
+    f = open_archive(filename, 'rb')
+    output_print('Reading archive.')
+    return f, tarfile.open(fileobj=f, mode="r|*")
 
 
 def extract_all(filename, members=None, directory=''):
-    if args.gzip:
-        output_print('Reading gzip file.')
-        tar = tarfile.open(filename, "r:gz")
-    elif args.bz2:
-        output_print('Reading bz2 file.')
-        tar = tarfile.open(filename, "r:bz2")
-    else:
-        output_print('Reading tar file.')
-        tar = tarfile.open(filename, "r:")
-    output_print('Extracting files.')
-    # check for specific file extraction
-    if members:
-        tar.extractall(path=directory, members=extract_members(tar, members))
-    else:
-        tar.extractall(path=directory)
-    tar.close()
+    f, tar = read_tar(filename)
+    try:
+        output_print('Extracting files.')
+        tar.extractall(path=directory or '.', members=extract_members(tar, members))
+    finally:
+        tar.close()
+        if filename != '-':
+            f.close()
     print('Archive extracted.')
 
 
@@ -82,32 +98,41 @@ def create_tar(filename, files):
         output_print('Adding: %s' % tarinfo.name)
         return tarinfo
 
-    if args.gzip:
-        output_print('Creating gzip file.')
-        tar = tarfile.open(filename, "w:gz")
-    elif args.bz2:
-        output_print('Creating bz2 file.')
-        tar = tarfile.open(filename, "w:bz2")
-    else:
-        output_print('Creating tar file.')
-        tar = tarfile.open(filename, "w")
-
-    for name in files:
-        output_print('Adding %s' % name)
-        tar.add(name, filter=tar_filter)
-    tar.close()
-    print('Archive Created.')
+    f = open_archive(filename, 'wb')
+    gz = None
+    try:
+        if args.gzip:
+            output_print('Creating gzip file.')
+            gz = ParallelGzipWriter(f, threads=args.threads)
+            tar = tarfile.open(fileobj=gz, mode="w|")
+        elif args.bz2:
+            output_print('Creating bz2 file.')
+            tar = tarfile.open(fileobj=f, mode="w|bz2")
+        else:
+            output_print('Creating tar file.')
+            tar = tarfile.open(fileobj=f, mode="w|")
+
+        for name in files:
+            tar.add(name, filter=tar_filter)
+        tar.close()
+        if gz is not None:
+            gz.close()
+    finally:
+        if filename != '-':
+            f.close()
+        else:
+            f.flush()
+    print('Archive Created.', file=log_file())
 
 
 def list_tar(filename):
-    if args.gzip:
-        tar = tarfile.open(filename, "r:gz")
-    elif args.bz2:
-        tar = tarfile.open(filename, "r:bz2")
-    else:
-        tar = tarfile.open(filename, "r:")
-    tar.list()
-    tar.close()
+    f, tar = read_tar(filename)
+    try:
+        tar.list()
+    finally:
+        tar.close()
+        if filename != '-':
+            f.close()
 
 
 if __name__ == '__main__':
@@ -118,7 +143,14 @@ if __name__ == '__main__':
     ap.add_argument('-j', '--bz2', action='store_true', default=False, help='Compress as bz2 format')
     ap.add_argument('-z', '--gzip', action='store_true', default=False, help='Compress as gzip format')
     ap.add_argument('-x', '--extract', action='store_true', default=False, help='Extract an archive.')
-    ap.add_argument('-f', '--file', action='store', help='Archive filename.')
+    ap.add_argument('-f', '--file', action='store', default='-', help="Archive filename, '-' for stdin/stdout.")
+    ap.add_argument(
+        '--threads',
+        action='store',
+        type=int,
+        default=default_threads(),
+        help='Number of threads used for gzip compression.'
+    )
     ap.add_argument(
         '-C',
         '--directory',
@@ -134,7 +166,6 @@ if __name__ == '__main__':
         help='Create: Files/Dirs to add to archive.\nExtract: Specific Files/Dirs to extract, default: all',
     )
     args = ap.parse_args()
-    tarfile.TarFile.fileobject = MyFileObject
     if args.list:
         list_tar(os.path.expanduser(args.file))
     elif args.create:
@@ -4,9 +4,10 @@ from __future__ import print_function
 
 import os
 import sys
-import fileinput
 import argparse
 
+_stash = globals()['_stash']
+
 
 def main(args):
     ap = argparse.ArgumentParser()
@@ -14,26 +15,27 @@ def main(args):
     ns = ap.parse_args(args)
 
     def _print(lines):
-        if lines is not None:
+        if lines:
             print(''.join(lines))
 
-    fileinput.close()  # in case it is not closed
-    try:
-        prev_line = None
-        lines = None
-        for line in fileinput.input(ns.files, openhook=fileinput.hook_encoded("utf-8")):
-            if fileinput.isfirstline():
-                _print(lines)
-                lines = []
-                prev_line = None
-            if prev_line is None or line != prev_line:
-                lines.append(line)
-            prev_line = line
-
+    status = 0
+
+    for reader, filename, error in _stash.libcore.input_readers(ns.files):
+        if reader is None:
+            print('uniq: %s' % str(error), file=sys.stderr)
+            status = 1
+            continue
+        with reader:
+            prev_line = None
+            lines = []
+            for batch in reader.line_batches():
+                for line in batch:
+                    if line != prev_line:
+                        lines.append(line)
+                    prev_line = line
         _print(lines)
 
-    finally:
-        fileinput.close()
+    sys.exit(status)
 
 
 if __name__ == '__main__':
@@ -27,34 +27,18 @@ def main(args):
             print('%6d %8d %8d %s' % res)
 
     results = []
-    nl_count = 0
-    wd_count = 0
-    bt_count = 0
-    filename_old = None
-    for infields in _stash.libcore.input_stream(ns.files):
-        if filename_old is None:
-            filename_old = infields[1]
-
-        if infields[0] is None:
-            _, filename, e = infields
-            print('%s: %s' % (filename, repr(e)))
-            filename_old = None
-        else:
-            line, filename, lineno = infields
-            if filename != filename_old:
-                results.append((nl_count, wd_count, bt_count, filename_old))
-                nl_count = 0
-                wd_count = 0
-                bt_count = 0
-                filename_old = filename
-
-            nl_count += 1
-            # TODO: This is not a very accurate for words
-            wd_count += len(line.split())
-            bt_count += len(line)
-
-    # last file
-    results.append((nl_count, wd_count, bt_count, filename_old))
+    for reader, filename, error in _stash.libcore.input_readers(ns.files):
+        if reader is None:
+            print('%s: %s' % (filename, repr(error)))
+            continue
+        with reader:
+            try:
+                # counted on blocks of bytes, words are only counted if needed
+                nl_count, wd_count, bt_count = reader.count(words=not ns.lines)
+            except IOError as e:
+                print('%s: %s' % (filename, repr(e)))
+                continue
+        results.append((nl_count, wd_count, bt_count, filename))
 
     tot_nl_count = 0
     tot_wd_count = 0
@@ -3,11 +3,16 @@
 """
 from __future__ import print_function
 
+import os
 import sys
 import argparse
+import threading
 
+from six.moves.urllib.parse import urlparse
 from six.moves.urllib.request import urlopen
 
+from stashutils.download import Downloader, STATE_SUFFIX, make_session
+
 try:
     import console
 except ImportError:
@@ -36,50 +41,104 @@ def get_status_string(downloaded, total):
     return status
 
 
+def make_progress(single):
+    """Return a progress callback for the download engine."""
+    lock = threading.Lock()
+    shown = {}
+
+    def progress(url, downloaded, total):
+        with lock:
+            # only redraw the bar every 1% (or 256 KiB without a size)
+            step = (total // 100) if total else 256 * 1024
+            if downloaded - shown.get(url, -step) < step and downloaded != total:
+                return
+            shown[url] = downloaded
+            if single:
+                print('\r' + get_status_string(downloaded, total) + " " * 10, end="")
+
+    return progress
+
+
+def download_urllib(url, output_file):
+    """Download urls which are not http(s), e.g. ftp://, with urllib."""
+    u = urlopen(url)
+    meta = u.info()
+    try:
+        if _stash.PY3:
+            file_size = int(meta["Content-Length"])
+        else:
+            file_size = int(meta.getheaders("Content-Length")[0])
+    except (IndexError, ValueError, TypeError):
+        file_size = 0
+
+    print("Save as: {} ".format(output_file), end="")
+    print("({} bytes)".format(file_size if file_size else "???"))
+
+    with open(output_file, 'wb') as f:
+        file_size_dl = 0.0
+        block_sz = 8192
+        while True:
+            buf = u.read(block_sz)
+            if not buf:
+                break
+            file_size_dl += len(buf)
+            f.write(buf)
+            status = get_status_string(file_size_dl, file_size)
+            print('\r' + status + " " * 10, end="")
+        print("")
+
+
+def read_url_list(path):
+    """Return the urls listed in a file, one per line."""
+    with open(path, 'r') as f:
+        return [line.strip() for line in f if line.strip() and not line.startswith('#')]
+
+
 def main(args):
     ap = argparse.ArgumentParser()
     ap.add_argument('-o', '--output-file', nargs='?', help='save content as file')
+    ap.add_argument('-c', '--continue', dest='resume', action='store_true', help='resume a partially downloaded file')
+    ap.add_argument('-i', '--input-file', help='download the urls listed in a file')
+    ap.add_argument('-j', '--jobs', type=int, default=4, help='number of files downloaded at once with -i (default 4)')
+    ap.add_argument(
+        '-s',
+        '--segments',
+        type=int,
+        default=4,
+        help='number of parallel connections used for large files (default 4)'
+    )
+    ap.add_argument('--chunk-size', type=int, default=64 * 1024, help='number of bytes read at a time')
     ap.add_argument('url', nargs='?', help='the url to read from (default to clipboard)')
 
     ns = ap.parse_args(args)
+
+    if ns.input_file:
+        sys.exit(download_list(ns))
+
     url = ns.url or _stash.libdist.clipboard_get()
     output_file = ns.output_file or url.split('/')[-1]
 
     if console is not None:
         console.show_activity()
 
+    existed = os.path.exists(output_file)
     try:
 
         print('Opening: %s\n' % url)
-        u = urlopen(url)
-
-        meta = u.info()
-        try:
-            if _stash.PY3:
-                file_size = int(meta["Content-Length"])
-            else:
-                file_size = int(meta.getheaders("Content-Length")[0])
-        except (IndexError, ValueError, TypeError):
-            file_size = 0
-
-        print("Save as: {} ".format(output_file), end="")
-        print("({} bytes)".format(file_size if file_size else "???"))
-
-        with open(output_file, 'wb') as f:
-            file_size_dl = 0.0
-            block_sz = 8192
-            while True:
-                buf = u.read(block_sz)
-                if not buf:
-                    break
-                file_size_dl += len(buf)
-                f.write(buf)
-                status = get_status_string(file_size_dl, file_size)
-                print('\r' + status + " " * 10, end="")
-            print("")
+        if urlparse(url).scheme not in ('http', 'https'):
+            download_urllib(url, output_file)
+        else:
+            print("Save as: {} ".format(output_file))
+            downloader = Downloader(segments=ns.segments, chunk_size=ns.chunk_size, progress=make_progress(True))
+            download = downloader.download(url, output_file, resume=ns.resume)
+            print('\r' + get_status_string(download.size or os.path.getsize(output_file), download.size) + " " * 10)
 
     except Exception as e:
-        print('Invalid url: %s' % url)
+        print('')
+        print('Invalid url: %s (%s)' % (url, e))
+        # remove incomplete files which can not be resumed
+        if not existed and os.path.exists(output_file) and not os.path.exists(output_file + STATE_SUFFIX):
+            os.remove(output_file)
         sys.exit(1)
 
     finally:
@@ -89,5 +148,23 @@ def main(args):
     sys.exit(0)
 
 
+def download_list(ns):
+    """Download all urls listed in ns.input_file, reusing connections."""
+    urls = read_url_list(ns.input_file)
+    jobs = [(url, url.split('/')[-1] or 'index.html') for url in urls]
+
+    def report(url, path, error):
+        if error is None:
+            print('Saved: {} -> {}'.format(url, path))
+        else:
+            print('Invalid url: {} ({})'.format(url, error))
+
+    pool_size = max(ns.jobs, 1) * max(ns.segments, 1)
+    downloader = Downloader(session=make_session(pool_size), segments=ns.segments, chunk_size=ns.chunk_size)
+    failed = downloader.download_all(jobs, resume=ns.resume, parallel=ns.jobs, callback=report)
+    print('{} of {} files downloaded.'.format(len(jobs) - failed, len(jobs)))
+    return 1 if failed else 0
+
+
 if __name__ == '__main__':
     main(sys.argv[1:])
@@ -5,40 +5,60 @@ from __future__ import print_function
 import os
 import sys
 import argparse
-import zipfile
+
+from stashutils.archives import binary_stdout, default_threads, ParallelZipWriter
 
 
 def main(args):
     ap = argparse.ArgumentParser()
-    ap.add_argument('zipfile', help='')
+    ap.add_argument('zipfile', help="the archive to create, '-' for stdout")
     ap.add_argument('list', nargs='+', help='')
     ap.add_argument('-v', '--verbose', action='store_true', help='be more chatty')
+    ap.add_argument('--threads', type=int, default=default_threads(), help='number of threads used for compression')
     ns = ap.parse_args(args)
 
-    relroot = os.path.abspath(os.path.dirname(ns.zipfile))
+    if ns.zipfile == '-':
+        relroot = os.getcwd()
+        out = binary_stdout()
+    else:
+        relroot = os.path.abspath(os.path.dirname(ns.zipfile))
+        out = open(ns.zipfile, "wb")
+    # the archive is written as a stream, so stdout or a file on a mounted
+    # filesystem can be used. The members are compressed on a pool of threads.
+    try:
+        with ParallelZipWriter(out, threads=ns.threads) as outs:
+            add_files(outs, ns, relroot)
+    finally:
+        if ns.zipfile != '-':
+            out.close()
+        else:
+            out.flush()
+
+
+def add_files(outs, ns, relroot):
+    """adds the files and directories listed in ns.list to the ParallelZipWriter outs."""
+    log = sys.stderr if ns.zipfile == '-' else sys.stdout
+    for path in ns.list:
+        if os.path.isfile(path):
+            if ns.verbose:
+                print(path, file=log)
+            arcname = os.path.relpath(path, relroot)
+            outs.write(path, arcname)
 
-    with zipfile.ZipFile(ns.zipfile, "w", zipfile.ZIP_DEFLATED) as outs:
-        for path in ns.list:
-            if os.path.isfile(path):
+        elif os.path.isdir(path):
+            for root, dirs, files in os.walk(path):
+                this_relroot = os.path.relpath(root, relroot)
+                # add directory (needed for empty dirs)
+                outs.write(root, arcname=this_relroot)
                 if ns.verbose:
-                    print(path)
-                arcname = os.path.relpath(path, relroot)
-                outs.write(path, arcname=arcname)
-
-            elif os.path.isdir(path):
-                for root, dirs, files in os.walk(path):
-                    this_relroot = os.path.relpath(root, relroot)
-                    # add directory (needed for empty dirs)
-                    outs.write(root, arcname=this_relroot)
-                    if ns.verbose:
-                        print(this_relroot)
-                    for f in files:
-                        filename = os.path.join(root, f)
-                        if os.path.isfile(filename):  # regular files only
-                            if ns.verbose:
-                                print(filename)
-                            arcname = os.path.join(this_relroot, f)
-                            outs.write(filename, arcname=arcname)
+                    print(this_relroot, file=log)
+                for f in files:
+                    filename = os.path.join(root, f)
+                    if os.path.isfile(filename):  # regular files only
+                        if ns.verbose:
+                            print(filename, file=log)
+                        arcname = os.path.join(this_relroot, f)
+                        outs.write(filename, arcname)
 
 
 if __name__ == '__main__':
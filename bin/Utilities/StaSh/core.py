@@ -58,6 +58,11 @@ py_traceback=0
 py_pdb=0
 input_encoding_utf8=1
 thread_type=ctypes
+concurrent_pipes=0
+pipe_buffer_size=65536
+code_cache_size=128
+persistent_code_cache=0
+parse_cache_size=256
 
 [display]
 TEXT_FONT_SIZE={font_size}
@@ -136,7 +141,7 @@ class StaSh(object):
         self.ui = ShUI(self, debug=(_DEBUG_UI in debug), debug_terminal=(_DEBUG_TERMINAL in debug))
         self.renderer = ShSequentialRenderer(self, self.main_screen, self.terminal, debug=_DEBUG_RENDERER in debug)
 
-        parser = ShParser(debug=_DEBUG_PARSER in debug)
+        parser = ShParser(debug=_DEBUG_PARSER in debug, cache_size=self.config.getint('system', 'parse_cache_size'))
         expander = ShExpander(self, debug=_DEBUG_EXPANDER in debug)
         self.runtime = ShRuntime(self, parser, expander, no_historyfile=no_historyfile, debug=_DEBUG_RUNTIME in debug)
         self.completer = ShCompleter(self, debug=_DEBUG_COMPLETER in debug)
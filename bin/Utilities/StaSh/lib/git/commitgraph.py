@@ -0,0 +1,238 @@
+# -*- coding: utf-8 -*-
+"""
+The commit graph used by gitutils for ancestry queries.
+A repository only needs a 'repo' with controldir() and object_store.
+Only the parents and the type_name of the objects of the object store are
+used, so this module does not depend on dulwich.
+"""
+import os
+import bisect
+import heapq
+
+# name of the commit-graph file in the git directory
+COMMIT_GRAPH_FILE = 'stash_commit_graph'
+COMMIT_GRAPH_HEADER = b'stash-commit-graph 1'
+
+# flags used when walking the commit graph
+_PARENT1 = 1
+_PARENT2 = 2
+_STALE = 4
+
+
+class CommitGraph(object):
+    '''The parents and generation numbers of the commits of a repository.
+    The generation number of a commit is one more than the largest generation
+    number of its parents, so a commit can only be an ancestor of commits with
+    a larger generation number. Walks of the history process commits by
+    decreasing generation number and stop as soon as the result is known.
+    The graph is stored in the git directory and new commits are added when
+    they are first seen, so each commit is only read from the object store once.
+    '''
+
+    def __init__(self, object_store, path=None):
+        self.object_store = object_store
+        self.path = path
+        self._commits = {}  # sha -> (parents, generation)
+        self._sorted = None  # sorted list of shas, for prefix lookups
+        if path is not None and os.path.exists(path):
+            try:
+                self._load()
+            except (IOError, ValueError, IndexError):
+                # corrupt file, rebuild the graph
+                self._commits = {}
+
+    def _load(self):
+        with open(self.path, 'rb') as f:
+            lines = f.read().splitlines()
+        if not lines or lines[0] != COMMIT_GRAPH_HEADER:
+            raise ValueError('unknown commit-graph format')
+        rows = [line.split(b' ') for line in lines[1:]]
+        shas = [row[0] for row in rows]
+        for row in rows:
+            self._commits[row[0]] = (tuple(shas[int(i)] for i in row[2:]), int(row[1]))
+        self._sorted = shas
+
+    def save(self):
+        '''write the graph to its file; the shas are sorted and parents stored by their index.'''
+        if self.path is None:
+            return
+        shas = self.shas()
+        index = dict((sha, i) for i, sha in enumerate(shas))
+        lines = [COMMIT_GRAPH_HEADER]
+        for sha in shas:
+            parents, generation = self._commits[sha]
+            lines.append(b' '.join([sha, str(generation).encode('ascii')] + [str(index[p]).encode('ascii') for p in parents]))
+        tmp = self.path + '.tmp'
+        with open(tmp, 'wb') as f:
+            f.write(b'\n'.join(lines) + b'\n')
+        if os.path.exists(self.path):
+            os.remove(self.path)
+        os.rename(tmp, self.path)
+
+    def __contains__(self, sha):
+        return sha in self._commits
+
+    def __len__(self):
+        return len(self._commits)
+
+    def shas(self):
+        '''return the sorted list of the shas of all commits in the graph'''
+        if self._sorted is None:
+            self._sorted = sorted(self._commits)
+        return self._sorted
+
+    def parents(self, sha):
+        return self._commits[sha][0]
+
+    def generation(self, sha):
+        return self._commits[sha][1]
+
+    def _peel(self, sha):
+        '''return the sha of the commit sha refers to, or None if it is no commit'''
+        if sha in self._commits:
+            return sha
+        try:
+            obj = self.object_store[sha]
+            while obj.type_name == b'tag':
+                obj = self.object_store[obj.object[1]]
+        except KeyError:
+            return None
+        return obj.id if obj.type_name == b'commit' else None
+
+    def add(self, shas, save=True):
+        '''add the commits shas refer to (tags are peeled) and all their
+        ancestors to the graph. return the list of commit shas.'''
+        tips = [self._peel(sha) for sha in shas]
+        added = []
+        stack = [sha for sha in tips if sha is not None and sha not in self._commits]
+        pending = {}
+        while stack:
+            sha = stack[-1]
+            if sha in self._commits:
+                stack.pop()
+                continue
+            if sha not in pending:
+                try:
+                    pending[sha] = tuple(self.object_store[sha].parents)
+                except KeyError:
+                    # parents missing in a shallow clone
+                    pending[sha] = ()
+            missing = [p for p in pending[sha] if p not in self._commits]
+            if missing:
+                stack.extend(missing)
+                continue
+            stack.pop()
+            parents = pending.pop(sha)
+            generation = 1 + max([self._commits[p][1] for p in parents] or [0])
+            self._commits[sha] = (parents, generation)
+            added.append(sha)
+        if added:
+            self._sorted = None
+            if save:
+                self.save()
+        return tips
+
+    def find_prefix(self, prefix):
+        '''return the shas of the commits starting with prefix'''
+        shas = self.shas()
+        if shas and isinstance(shas[0], bytes) and not isinstance(prefix, bytes):
+            prefix = prefix.encode('ascii')
+        i = bisect.bisect_left(shas, prefix)
+        found = []
+        while i < len(shas) and shas[i].startswith(prefix):
+            found.append(shas[i])
+            i += 1
+        return found
+
+    def _paint(self, sha1, sha2, done):
+        '''walk the ancestors of sha1 and sha2 by decreasing generation, flagging
+        each commit with _PARENT1 and/or _PARENT2. done(sha, flags) is called for
+        each commit and returns the flags to pass on to its parents. the walk
+        stops when only commits flagged _STALE are left.'''
+        flags = {}
+        queue = []
+        counter = [0]  # commits in the queue not flagged _STALE
+
+        def push(sha, f):
+            old = flags.get(sha)
+            if old is None:
+                flags[sha] = f
+                heapq.heappush(queue, (-self.generation(sha), sha))
+                if not f & _STALE:
+                    counter[0] += 1
+            elif old | f != old:
+                flags[sha] = old | f
+                if not old & _STALE and f & _STALE:
+                    counter[0] -= 1
+
+        push(sha1, _PARENT1)
+        push(sha2, _PARENT2)
+        while counter[0] > 0:
+            _, sha = heapq.heappop(queue)
+            f = flags[sha]
+            if not f & _STALE:
+                counter[0] -= 1
+            f = done(sha, f)
+            for parent in self.parents(sha):
+                push(parent, f)
+
+    def merge_bases(self, sha1, sha2):
+        '''return the best common ancestors of two commits, by decreasing generation'''
+        if sha1 == sha2:
+            return [sha1]
+        bases = []
+
+        def done(sha, f):
+            if f & (_PARENT1 | _PARENT2) == _PARENT1 | _PARENT2 and not f & _STALE:
+                # all descendants were walked before, so no better common ancestor exists
+                bases.append(sha)
+                f |= _STALE
+            return f
+
+        self._paint(sha1, sha2, done)
+        return bases
+
+    def count_between(self, sha1, sha2):
+        '''return the number of commits reachable from sha1 but not from sha2 and vice versa'''
+        counts = [0, 0]
+
+        def done(sha, f):
+            if f & (_PARENT1 | _PARENT2) == _PARENT1 | _PARENT2:
+                # ancestors of a common commit are common as well
+                return f | _STALE
+            counts[0 if f & _PARENT1 else 1] += 1
+            return f
+
+        self._paint(sha1, sha2, done)
+        return tuple(counts)
+
+    def is_ancestor(self, sha1, sha2):
+        '''return true if sha1 is an ancestor of sha2 (or the same commit)'''
+        generation = self.generation(sha1)
+        stack = [sha2]
+        seen = set(stack)
+        while stack:
+            sha = stack.pop()
+            if sha == sha1:
+                return True
+            for parent in self.parents(sha):
+                # parents with a lower generation number can not have sha1 as ancestor
+                if parent not in seen and self.generation(parent) >= generation:
+                    seen.add(parent)
+                    stack.append(parent)
+        return False
+
+
+_commit_graphs = {}
+
+
+def get_commit_graph(repo, shas=[]):
+    '''return the CommitGraph of a repository, with the commits shas refer to added.
+    graphs are kept in memory, so only new commits are read on later calls.'''
+    path = os.path.join(repo.repo.controldir(), COMMIT_GRAPH_FILE)
+    graph = _commit_graphs.get(path)
+    if graph is None:
+        graph = _commit_graphs[path] = CommitGraph(repo.repo.object_store, path)
+    if shas:
+        graph.add(shas)
+    return graph
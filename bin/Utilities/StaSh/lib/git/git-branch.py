@@ -166,15 +166,16 @@ def branch_list(result):
         for key, value in iteritems(repo.branches):
             dispval = value[0:N]  #todo, --abbrev=n
             commitmsg = (repo[value].message if result.verbose else '').strip()
-            tracking = get_remote_tracking_branch(repo, key)
+            tracking = get_remote_tracking_branch(repo, key) if result.verbose else None
             trackmsg = ''
-            diffmsg = trackingsha = ''
-            if tracking:
+            if tracking and tracking in repo.remote_branches:
                 trackingsha = repo.remote_branches[tracking]
                 ahead, behind = count_commits_between(repo, value, trackingsha)
-                diffmsg = '+{}/-{} compare to'.format(ahead, behind) if result.verbose else ''
-                trackmsg = '[{} {} {}]'.format(diffmsg, tracking, trackingsha[0:N])
-            print(' '.join([('* ' if repo.active_branch == key else '') + key, dispval, commitmsg]))
+                trackmsg = '[+{}/-{} compare to {} {}]'.format(ahead, behind, tracking, trackingsha[0:N])
+            fields = [('* ' if repo.active_branch == key else '') + key, dispval]
+            if trackmsg:
+                fields.append(trackmsg)
+            print(' '.join(fields + [commitmsg]))
     if result.remotes or result.all:
         for key, value in iteritems(repo.remote_branches):
             dispval = value[0:N]  #todo, --abbrev=n
@@ -3,9 +3,10 @@ import sys
 import os
 import dulwich
 from dulwich import porcelain
-from dulwich.walk import Walker
 from gittle import Gittle
 
+from git.commitgraph import get_commit_graph
+
 
 class GitError(Exception):
     def __init__(self, arg):
@@ -34,6 +35,15 @@ def any_one(iterable):
     return any(it) and not any(it)
 
 
+def _graph_of_commits(repo, sha1, sha2):
+    graph = get_commit_graph(repo)
+    commits = graph.add([sha1, sha2])
+    for sha, commit in zip((sha1, sha2), commits):
+        if commit is None:
+            raise GitError('{} is not a commit'.format(sha))
+    return (graph, ) + tuple(commits)
+
+
 def find_revision_sha(repo, rev):
     '''rev may refer to the following ways to "spell" a commit object:
     <sha1>  full or abbreviated sha, only if unique
@@ -57,7 +67,12 @@ def find_revision_sha(repo, rev):
     if returnval:
         return returnval
     else:
-        shalist = [sha for sha in o if sha.startswith(rev) and isinstance(o[sha], dulwich.objects.Commit)]
+        # abbreviated sha, look it up in the sorted shas of the commit graph
+        graph = get_commit_graph(repo, list(repo.repo.get_refs().values()))
+        shalist = [sha for sha in graph.find_prefix(rev) if sha in o]
+        if not shalist:
+            # commits not reachable from any ref are not in the graph
+            shalist = [sha for sha in o if sha.startswith(rev) and isinstance(o[sha], dulwich.objects.Commit)]
         if len(shalist) == 1:
             return (shalist[0])
         elif len(shalist) > 1:
@@ -74,39 +89,26 @@ ancestor', i.e. a 'merge base'.  Note that there can be more than one
 merge base for a pair of commits.'''
     sha1 = find_revision_sha(repo, rev1)
     sha2 = find_revision_sha(repo, rev2)
-
-    sha2_ancestors, _ = repo.repo.object_store._collect_ancestors([sha2], [])
-    merge_bases = []
-    queue = [sha1]
-    seen = []
-
-    while queue:
-        elt = queue.pop()
-        if elt not in seen:  #prevent circular
-            seen.append(elt)
-            if elt in sha2_ancestors:
-                merge_bases.append(elt)
-            elif repo[elt].parents:
-                queue.extend(repo[elt].parents)
-    return merge_bases
+    graph, sha1, sha2 = _graph_of_commits(repo, sha1, sha2)
+    return graph.merge_bases(sha1, sha2)
 
 
 def count_commits_between(repo, rev1, rev2):
-    '''find common ancestor. then count ancestor->sha1, and ancestor->sha2 '''
+    '''count the commits reachable from rev1 but not from rev2, and vice versa'''
     sha1 = find_revision_sha(repo, rev1)
     sha2 = find_revision_sha(repo, rev2)
     if sha1 == sha2:
         return (0, 0)
-    sha1_ahead = sum(1 for _ in Walker(repo.repo.object_store, [sha1], [sha2]))
-    sha1_behind = sum(1 for _ in Walker(repo.repo.object_store, [sha2], [sha1]))
-    return (sha1_ahead, sha1_behind)
+    graph, sha1, sha2 = _graph_of_commits(repo, sha1, sha2)
+    return graph.count_between(sha1, sha2)
 
 
 def is_ancestor(repo, rev1, rev2):
     '''return true if rev1 is an ancestor of rev2'''
     sha1 = find_revision_sha(repo, rev1)
     sha2 = find_revision_sha(repo, rev2)
-    return True if sha1 in merge_base(repo, sha1, sha2) else False
+    graph, sha1, sha2 = _graph_of_commits(repo, sha1, sha2)
+    return graph.is_ancestor(sha1, sha2)
 
 
 def can_ff(repo, oldrev, newrev):
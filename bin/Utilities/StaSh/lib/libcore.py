@@ -1,6 +1,7 @@
 # -*- coding: utf-8 -*-
+import codecs
 import os
-import fileinput
+import sys
 
 try:
     unicode
@@ -45,27 +46,164 @@ def get_lan_ip():
         return ''
 
 
+# number of bytes read at a time by BlockReader
+BLOCK_SIZE = 1024 * 1024
+
+
+class BlockReader(object):
+    """
+    Reads a file in large blocks of bytes, which is much faster than reading
+    it line by line. Text is only decoded when it is asked for, a block at a
+    time. Interactive streams (like the console) are read line by line, so
+    that the input is processed as soon as it is entered.
+    :param fileobj: the file to read, binary or text (text is handled as utf-8)
+    :param name: the name of the file
+    :type name: str
+    :param block_size: the number of bytes read at a time
+    :type block_size: int
+    :param close: whether fileobj is closed with the reader
+    :type close: bool
+    """
+
+    def __init__(self, fileobj, name='', block_size=BLOCK_SIZE, close=True):
+        self.fileobj = fileobj
+        self.name = name
+        self.block_size = block_size
+        self._close = close
+        try:
+            self.interactive = fileobj.isatty()
+        except (AttributeError, ValueError):
+            self.interactive = False
+
+    def close(self):
+        if self._close:
+            self.fileobj.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, exc_tb):
+        self.close()
+
+    def raw_blocks(self):
+        """yields the blocks as they are read, bytes or text."""
+        read = self.fileobj.readline if self.interactive else lambda: self.fileobj.read(self.block_size)
+        while True:
+            data = read()
+            if not data:
+                return
+            yield data
+
+    def blocks(self):
+        """yields the content in blocks of bytes."""
+        for data in self.raw_blocks():
+            if isinstance(data, unicode):
+                data = data.encode('utf-8')
+            yield data
+
+    def text_blocks(self):
+        """yields the content in blocks of text; characters are never split between blocks."""
+        decoder = codecs.getincrementaldecoder('utf-8')('replace')
+        for data in self.raw_blocks():
+            if not isinstance(data, unicode):
+                data = decoder.decode(data)
+            if data:
+                yield data
+        rest = decoder.decode(b'', True)
+        if rest:
+            yield rest
+
+    def line_batches(self, decode=True):
+        """
+        yields the lines of the content in lists, one list for each block.
+        The lines keep their newline. They are text if decode is True and
+        bytes otherwise.
+        """
+        rest = None
+        newline = None
+        for block in (self.text_blocks() if decode else self.blocks()):
+            if newline is None:
+                newline = block[:0] + (u'\n' if decode else b'\n')
+            if rest:
+                block = rest + block
+            lines = block.split(newline)
+            rest = lines.pop()
+            if lines:
+                yield [line + newline for line in lines]
+        if rest:
+            yield [rest]
+
+    def lines(self, decode=True):
+        """yields the lines of the content, see line_batches()."""
+        for batch in self.line_batches(decode):
+            for line in batch:
+                yield line
+
+    def count(self, words=True):
+        """
+        returns the number of newlines, words and bytes of the content.
+        Counting is done on the blocks of bytes; words are sequences of
+        non-whitespace characters and are not counted if words is False.
+        """
+        nl_count = wd_count = bt_count = 0
+        in_word = False
+        for block in self.blocks():
+            bt_count += len(block)
+            nl_count += block.count(b'\n')
+            if words:
+                wd_count += len(block.split())
+                if in_word and not block[:1].isspace():
+                    # the word continues from the previous block
+                    wd_count -= 1
+                in_word = not block[-1:].isspace()
+        return nl_count, wd_count, bt_count
+
+
+def open_input(filename):
+    """returns a BlockReader for the file filename; '-' is stdin."""
+    if filename == '-':
+        return BlockReader(sys.stdin, '<stdin>', close=False)
+    return BlockReader(open(filename, 'rb'), filename)
+
+
+def input_readers(files=()):
+    """
+    Yields (reader, filename, error) for each file, or for stdin if there
+    are no files. If a file can not be opened, reader is None and error
+    the exception; errors do not stop the other files from being read.
+    """
+    if not files:
+        yield BlockReader(sys.stdin, close=False), '', None
+        return
+    for filename in files:
+        try:
+            reader = open_input(filename)
+        except IOError as e:
+            yield None, filename, e
+        else:
+            yield reader, filename, None
+
+
 def input_stream(files=()):
     """ Handles input files similar to fileinput.
     The advantage of this function is it recovers from errors if one
-    file is invalid and proceed with the next file
+    file is invalid and proceed with the next file.
+    Yields (line, filename, line number), or (None, filename, error) if
+    a file could not be read. The files are read in blocks, see BlockReader.
     """
-    fileinput.close()
-    try:
-        if not files:
-            for line in fileinput.input(files):
-                yield line, '', fileinput.filelineno()
-
-        else:
-            while files:
-                thefile = files.pop(0)
-                try:
-                    for line in fileinput.input(thefile):
-                        yield line, fileinput.filename(), fileinput.filelineno()
-                except IOError as e:
-                    yield None, fileinput.filename(), e
-    finally:
-        fileinput.close()
+    for reader, filename, error in input_readers(files):
+        if reader is None:
+            yield None, filename, error
+            continue
+        with reader:
+            lineno = 0
+            try:
+                for batch in reader.line_batches():
+                    for line in batch:
+                        lineno += 1
+                        yield line, reader.name, lineno
+            except IOError as e:
+                yield None, reader.name, e
 
 
 def sizeof_fmt(num):
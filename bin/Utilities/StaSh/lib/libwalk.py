@@ -0,0 +1,185 @@
+# -*- coding: utf-8 -*-
+"""
+Directory tree walking shared by commands like find and du.
+The walk is built on scandir, so the type and stat result of every entry
+are only looked up once, and directories can be scanned ahead by a pool
+of threads while the results are consumed in a stable order.
+"""
+import os
+import stat
+from multiprocessing.pool import ThreadPool
+
+try:
+    from os import scandir
+except ImportError:
+    try:
+        from scandir import scandir
+    except ImportError:
+        scandir = None
+
+
+class _DirEntry(object):
+    """
+    Minimal replacement for os.DirEntry where scandir is not available.
+    Stat results are cached like the real DirEntry does.
+    """
+
+    def __init__(self, dirpath, name):
+        self.name = name
+        self.path = os.path.join(dirpath, name)
+        self._stat = None
+        self._lstat = None
+
+    def __repr__(self):
+        return '<DirEntry {!r}>'.format(self.name)
+
+    def stat(self, follow_symlinks=True):
+        if follow_symlinks:
+            if self._stat is None:
+                if self.is_symlink():
+                    self._stat = os.stat(self.path)
+                else:
+                    self._stat = self.stat(follow_symlinks=False)
+            return self._stat
+        if self._lstat is None:
+            self._lstat = os.lstat(self.path)
+        return self._lstat
+
+    def is_symlink(self):
+        return stat.S_ISLNK(self.stat(follow_symlinks=False).st_mode)
+
+    def is_dir(self, follow_symlinks=True):
+        try:
+            return stat.S_ISDIR(self.stat(follow_symlinks=follow_symlinks).st_mode)
+        except OSError:
+            return False
+
+    def is_file(self, follow_symlinks=True):
+        try:
+            return stat.S_ISREG(self.stat(follow_symlinks=follow_symlinks).st_mode)
+        except OSError:
+            return False
+
+
+def scan_dir(path):
+    """
+    Return the entries of a directory, sorted by name.
+    :param path: path of the directory
+    :type path: str
+    :return: (subdirectory entries, other entries)
+    :rtype: tuple of (list, list)
+    """
+    if scandir is not None:
+        it = scandir(path)
+        try:
+            entries = list(it)
+        finally:
+            # the iterator has no close() before python 3.6
+            if hasattr(it, 'close'):
+                it.close()
+    else:
+        entries = [_DirEntry(path, name) for name in os.listdir(path)]
+    entries.sort(key=lambda e: e.name)
+    dirs = []
+    nondirs = []
+    for entry in entries:
+        if entry.is_dir():
+            dirs.append(entry)
+        else:
+            nondirs.append(entry)
+    return dirs, nondirs
+
+
+class TreeWalker(object):
+    """
+    Walk directory trees like os.walk, yielding DirEntry objects instead of names.
+    If jobs is greater than 1, the subdirectories of a directory are scanned
+    by a pool of threads as soon as it is reached, so that the walk does not
+    wait on the filesystem for every single directory. The order of the
+    results does not depend on the number of jobs.
+    :param jobs: number of threads scanning directories
+    :type jobs: int
+    :param follow_symlinks: whether to descend into symlinks to directories
+    :type follow_symlinks: bool
+    :param onerror: called with the OSError if a directory can not be scanned
+    :type onerror: callable or None
+    :param dir_filter: called with the DirEntry of each subdirectory, a false
+        result excludes the directory from the results and the walk
+    :type dir_filter: callable or None
+    """
+
+    def __init__(self, jobs=1, follow_symlinks=False, onerror=None, dir_filter=None):
+        self.jobs = jobs
+        self.follow_symlinks = follow_symlinks
+        self.onerror = onerror
+        self.dir_filter = dir_filter
+        self._pool = None
+
+    def walk(self, top, topdown=True, maxdepth=None):
+        """
+        Walk the tree below top.
+        Yields (dirpath, depth, dirs, nondirs) for every directory, with the
+        depth of top being 0. Like os.walk, removing entries from dirs when
+        walking top down prevents the walk from descending into them.
+        :param top: the directory to walk
+        :type top: str
+        :param topdown: yield a directory before its subdirectories
+        :type topdown: bool
+        :param maxdepth: do not descend into directories deeper than this
+        :type maxdepth: int or None
+        """
+        if self.jobs > 1:
+            self._pool = ThreadPool(self.jobs)
+        try:
+            for result in self._walk(top, 0, self._submit(top), topdown, maxdepth):
+                yield result
+        finally:
+            if self._pool is not None:
+                self._pool.terminate()
+                self._pool = None
+
+    def _scan(self, path):
+        try:
+            return scan_dir(path)
+        except OSError as e:
+            return e
+
+    def _submit(self, path):
+        """
+        Start scanning a directory, return a callable returning the result.
+        """
+        if self._pool is not None:
+            return self._pool.apply_async(self._scan, (path, )).get
+        return lambda: self._scan(path)
+
+    def _walk(self, path, depth, pending, topdown, maxdepth):
+        result = pending()
+        if isinstance(result, OSError):
+            if self.onerror is not None:
+                self.onerror(result)
+            return
+        dirs, nondirs = result
+        if self.dir_filter is not None:
+            dirs = [d for d in dirs if self.dir_filter(d)]
+
+        if topdown:
+            yield path, depth, dirs, nondirs
+
+        if maxdepth is None or depth < maxdepth:
+            walk_into = [d for d in dirs if self.follow_symlinks or not d.is_symlink()]
+            # start scanning all subdirectories before descending into the first one
+            scans = [self._submit(d.path) for d in walk_into]
+            for d, scan in zip(walk_into, scans):
+                for sub in self._walk(d.path, depth + 1, scan, topdown, maxdepth):
+                    yield sub
+
+        if not topdown:
+            yield path, depth, dirs, nondirs
+
+
+def walk(top, topdown=True, maxdepth=None, jobs=1, follow_symlinks=False, onerror=None, dir_filter=None):
+    """
+    Shortcut for TreeWalker(...).walk(top, topdown, maxdepth).
+    """
+    walker = TreeWalker(jobs=jobs, follow_symlinks=follow_symlinks, onerror=onerror, dir_filter=dir_filter)
+    return walker.walk(top, topdown=topdown, maxdepth=maxdepth)
@@ -0,0 +1,453 @@
+# -*- coding: utf-8 -*-
+"""
+Streaming helpers for the archive commands ('tar' and 'zip').
+Data is deflated in blocks on a pool of threads (zlib releases the GIL
+while compressing), the compressed blocks are written in order. Like pigz,
+each block uses the end of the previous block as its dictionary and is
+ended with a sync flush, so the blocks form a single deflate stream.
+The writers only write to their file objects and never seek, so they can
+write to pipes or to files opened through a FSI.
+"""
+import io
+import multiprocessing
+import os
+import stat
+import struct
+import sys
+import time
+import zipfile
+import zlib
+from collections import deque
+from multiprocessing.pool import ThreadPool
+
+import six
+
+# size of the blocks compressed by each worker
+DEFAULT_BLOCK_SIZE = 1024 * 1024
+# size of the dictionary passed from one block to the next
+DICT_SIZE = 32 * 1024
+# size of the blocks files are read in
+COPY_BLOCK_SIZE = 64 * 1024
+
+_DATA_DESCRIPTOR_SIGNATURE = b"PK\x07\x08"
+
+
+def default_threads():
+    """returns the default number of compression threads."""
+    try:
+        return multiprocessing.cpu_count()
+    except NotImplementedError:
+        return 1
+
+
+class TextAsBinary(object):
+    """
+    Binary access to a text stream without a binary buffer, e.g. the
+    StringIO connecting the commands of a pipe. Bytes are mapped 1:1 to
+    characters (latin-1), so the data passes the pipe unchanged.
+    """
+
+    def __init__(self, stream):
+        self.stream = stream
+
+    def read(self, size=-1):
+        data = self.stream.read(size)
+        if isinstance(data, six.text_type):
+            data = data.encode("latin-1")
+        return data
+
+    def write(self, data):
+        self.stream.write(data.decode("latin-1"))
+        return len(data)
+
+    def flush(self):
+        self.stream.flush()
+
+
+def _binary(stream):
+    """returns a binary stream for a standard stream."""
+    if hasattr(stream, "buffer"):
+        return stream.buffer
+    if isinstance(stream, io.TextIOBase):
+        return TextAsBinary(stream)
+    return stream
+
+
+def binary_stdin():
+    """returns a binary stream reading from stdin."""
+    return _binary(sys.stdin)
+
+
+def binary_stdout():
+    """returns a binary stream writing to stdout."""
+    return _binary(sys.stdout)
+
+
+def _deflate_block(data, dictionary, last, level):
+    """compresses a block into raw deflate data."""
+    if dictionary and six.PY3:
+        c = zlib.compressobj(level, zlib.DEFLATED, -zlib.MAX_WBITS, zlib.DEF_MEM_LEVEL, zlib.Z_DEFAULT_STRATEGY, dictionary)
+    else:
+        c = zlib.compressobj(level, zlib.DEFLATED, -zlib.MAX_WBITS)
+    return c.compress(data) + c.flush(zlib.Z_FINISH if last else zlib.Z_SYNC_FLUSH)
+
+
+class ParallelDeflateWriter(object):
+    """
+    A file-like object writing the raw deflate stream of the data written
+    to it to fileobj.
+    :param fileobj: the file object to write the compressed data to
+    :param level: the compression level
+    :type level: int
+    :param block_size: the size of the blocks compressed by a thread
+    :type block_size: int
+    :param pool: the ThreadPool to use; if None, a pool with 'threads' threads is created
+    :type pool: multiprocessing.pool.ThreadPool or None
+    :param threads: the number of threads of the pool, defaults to the number of cpus
+    :type threads: int or None
+    """
+
+    def __init__(self, fileobj, level=6, block_size=DEFAULT_BLOCK_SIZE, pool=None, threads=None):
+        self.fileobj = fileobj
+        self.level = level
+        self.block_size = block_size
+        self.threads = threads or default_threads()
+        self._own_pool = pool is None
+        self._pool = pool if pool is not None else ThreadPool(self.threads)
+        self._buf = []
+        self._buffered = 0
+        self._dictionary = b""
+        # compressed blocks which have not been written yet
+        self._pending = deque()
+        self.crc = 0
+        self.size = 0
+        self.compressed_size = 0
+        self.closed = False
+
+    def write(self, data):
+        if self.closed:
+            raise ValueError("write to closed file")
+        if not data:
+            return 0
+        data = bytes(data)
+        self.crc = zlib.crc32(data, self.crc) & 0xffffffff
+        self.size += len(data)
+        self._buf.append(data)
+        self._buffered += len(data)
+        if self._buffered >= self.block_size:
+            buf = b"".join(self._buf)
+            start = 0
+            while len(buf) - start >= self.block_size:
+                self._submit(buf[start:start + self.block_size], False)
+                start += self.block_size
+            self._buf = [buf[start:]] if start < len(buf) else []
+            self._buffered = len(buf) - start
+        return len(data)
+
+    def _submit(self, block, last):
+        """hands a block to the pool, writing finished blocks while too many are pending."""
+        result = self._pool.apply_async(_deflate_block, (block, self._dictionary, last, self.level))
+        self._dictionary = block[-DICT_SIZE:]
+        self._pending.append(result)
+        while len(self._pending) > 2 * self.threads:
+            self._write_next()
+
+    def _write_next(self):
+        data = self._pending.popleft().get()
+        self.fileobj.write(data)
+        self.compressed_size += len(data)
+
+    def flush(self):
+        pass
+
+    def tell(self):
+        return self.size
+
+    def close(self):
+        """compresses the remaining data and ends the deflate stream. fileobj is not closed."""
+        if self.closed:
+            return
+        self.closed = True
+        try:
+            self._submit(b"".join(self._buf), True)
+            self._buf = []
+            while self._pending:
+                self._write_next()
+        finally:
+            if self._own_pool:
+                self._pool.close()
+                self._pool.join()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, exc_tb):
+        self.close()
+
+
+class ParallelGzipWriter(ParallelDeflateWriter):
+    """
+    A ParallelDeflateWriter writing a gzip file.
+    If close_fileobj is True, fileobj is closed when this file is closed.
+    """
+
+    def __init__(self, fileobj, close_fileobj=False, mtime=None, **kwargs):
+        ParallelDeflateWriter.__init__(self, fileobj, **kwargs)
+        self.close_fileobj = close_fileobj
+        if mtime is None:
+            mtime = time.time()
+        xfl = 2 if self.level == 9 else (4 if self.level == 1 else 0)
+        self.fileobj.write(b"\x1f\x8b\x08\x00" + struct.pack("<LBB", int(mtime) & 0xffffffff, xfl, 255))
+
+    def close(self):
+        if self.closed:
+            return
+        try:
+            ParallelDeflateWriter.close(self)
+            self.fileobj.write(struct.pack("<LL", self.crc, self.size & 0xffffffff))
+        finally:
+            if self.close_fileobj:
+                self.fileobj.close()
+
+
+class ZipArchiveWriter(object):
+    """
+    Writes a zip archive to fileobj. The local headers and the data of the
+    members are written with write(), add() records a written member and
+    close() writes the central directory of the recorded members. fileobj
+    is never read or seeked and is not closed.
+    """
+
+    def __init__(self, fileobj):
+        self.fileobj = fileobj
+        # number of bytes written, the offset of the next member
+        self.offset = 0
+        # (zinfo, header offset) of the members
+        self._members = []
+        self.closed = False
+
+    def write(self, data):
+        self.fileobj.write(data)
+        self.offset += len(data)
+        return len(data)
+
+    def add(self, zinfo, header_offset):
+        """records a member whose local header was written at header_offset."""
+        if self.closed:
+            raise ValueError("write to closed archive")
+        self._members.append((zinfo, header_offset))
+
+    def close(self, comment=b""):
+        """writes the central directory and the archive comment."""
+        if self.closed:
+            return
+        self.closed = True
+        start = self.offset
+        for zinfo, header_offset in self._members:
+            self._write_central_header(zinfo, header_offset)
+        self._write_end(len(self._members), start, self.offset - start, comment)
+
+    def _write_central_header(self, zinfo, header_offset):
+        """writes the central directory header of a member."""
+        values = []
+        file_size, compress_size = zinfo.file_size, zinfo.compress_size
+        if file_size > zipfile.ZIP64_LIMIT or compress_size > zipfile.ZIP64_LIMIT:
+            values += [file_size, compress_size]
+            file_size = compress_size = 0xffffffff
+        if header_offset > zipfile.ZIP64_LIMIT:
+            values.append(header_offset)
+            header_offset = 0xffffffff
+        extra = _strip_zip64_extra(zinfo.extra)
+        extract_version = zinfo.extract_version
+        if values:
+            extra = struct.pack("<HH" + "Q" * len(values), 1, 8 * len(values), *values) + extra
+            extract_version = max(extract_version, 45)
+        name = encode_filename(zinfo)
+        comment = zinfo.comment
+        self.write(
+            struct.pack(
+                "<4s4B4HL2L5H2L",
+                b"PK\x01\x02",
+                zinfo.create_version,
+                zinfo.create_system,
+                extract_version,
+                0,
+                zinfo.flag_bits,
+                zinfo.compress_type,
+                _dos_time(zinfo.date_time),
+                _dos_date(zinfo.date_time),
+                zinfo.CRC,
+                compress_size,
+                file_size,
+                len(name),
+                len(extra),
+                len(comment),
+                0,
+                zinfo.internal_attr,
+                zinfo.external_attr,
+                header_offset,
+            ) + name + extra + comment
+        )
+
+    def _write_end(self, count, start, size, comment):
+        """writes the end of central directory record(s)."""
+        if count >= 0xffff or start > zipfile.ZIP64_LIMIT or size > zipfile.ZIP64_LIMIT:
+            end64 = self.offset
+            self.write(struct.pack("<4sQ2H2L4Q", b"PK\x06\x06", 44, 45, 45, 0, 0, count, count, size, start))
+            self.write(struct.pack("<4sLQL", b"PK\x06\x07", 0, end64, 1))
+            count = min(count, 0xffff)
+            start = min(start, 0xffffffff)
+            size = min(size, 0xffffffff)
+        self.write(struct.pack("<4s4H2LH", b"PK\x05\x06", 0, 0, count, count, size, start, len(comment)) + comment)
+
+
+class ParallelZipWriter(object):
+    """
+    Writes a zip archive to fileobj, compressing the members with a
+    ParallelDeflateWriter. The sizes and the checksum of a member follow
+    its data in a data descriptor and the central directory is written by
+    close(), so fileobj is never read or seeked. fileobj is not closed.
+    :param fileobj: the file object to write the archive to
+    :param level: the compression level
+    :type level: int
+    :param block_size: the size of the blocks compressed by a thread
+    :type block_size: int
+    :param pool: the ThreadPool to use; if None, a pool with 'threads' threads is created
+    :type pool: multiprocessing.pool.ThreadPool or None
+    :param threads: the number of threads of the pool, defaults to the number of cpus
+    :type threads: int or None
+    """
+
+    def __init__(self, fileobj, level=6, block_size=DEFAULT_BLOCK_SIZE, pool=None, threads=None):
+        self._out = ZipArchiveWriter(fileobj)
+        self.level = level
+        self.block_size = block_size
+        self.threads = threads or default_threads()
+        self._own_pool = pool is None
+        self._pool = pool if pool is not None else ThreadPool(self.threads)
+        self.closed = False
+
+    def write(self, path, arcname=None):
+        """adds the file or directory at path to the archive as arcname."""
+        if self.closed:
+            raise ValueError("write to closed archive")
+        st = os.stat(path)
+        isdir = stat.S_ISDIR(st.st_mode)
+        if arcname is None:
+            arcname = path
+        arcname = os.path.normpath(os.path.splitdrive(arcname)[1]).replace(os.sep, "/").lstrip("/")
+        if isdir:
+            arcname += "/"
+        date_time = time.localtime(st.st_mtime)[:6]
+        if date_time[0] < 1980:
+            date_time = (1980, 1, 1, 0, 0, 0)
+        zinfo = zipfile.ZipInfo(arcname, date_time)
+        zinfo.external_attr = (st.st_mode & 0xFFFF) << 16
+        zinfo.CRC = 0
+        if isdir:
+            zinfo.external_attr |= 0x10
+            zinfo.compress_type = zipfile.ZIP_STORED
+        else:
+            zinfo.compress_type = zipfile.ZIP_DEFLATED
+            zinfo.flag_bits |= 0x08
+        if isinstance(zinfo.filename, six.text_type):
+            try:
+                zinfo.filename.encode("ascii")
+            except UnicodeEncodeError:
+                zinfo.flag_bits |= 0x800
+        name = encode_filename(zinfo)
+        zip64 = not isdir and st.st_size > zipfile.ZIP64_LIMIT
+        if zip64:
+            # the sizes are stored in the data descriptor, the extra field only marks the member as zip64
+            extra = struct.pack("<HHQQ", 1, 16, 0, 0)
+            zinfo.extract_version = 45
+        else:
+            extra = b""
+        offset = self._out.offset
+        self._out.write(
+            struct.pack(
+                "<4s2B4HL2L2H",
+                b"PK\x03\x04",
+                zinfo.extract_version,
+                0,
+                zinfo.flag_bits,
+                zinfo.compress_type,
+                _dos_time(date_time),
+                _dos_date(date_time),
+                0,
+                0,
+                0,
+                len(name),
+                len(extra),
+            ) + name + extra
+        )
+        if not isdir:
+            writer = ParallelDeflateWriter(
+                self._out,
+                level=self.level,
+                block_size=self.block_size,
+                pool=self._pool,
+                threads=self.threads,
+            )
+            with open(path, "rb") as src:
+                while True:
+                    data = src.read(COPY_BLOCK_SIZE)
+                    if not data:
+                        break
+                    writer.write(data)
+            writer.close()
+            zinfo.CRC = writer.crc
+            zinfo.file_size = writer.size
+            zinfo.compress_size = writer.compressed_size
+            if writer.size > zipfile.ZIP64_LIMIT and not zip64:
+                raise zipfile.LargeZipFile("File grew beyond the zip64 limit while it was added")
+            fmt = "<4sLQQ" if zip64 else "<4sLLL"
+            self._out.write(struct.pack(fmt, _DATA_DESCRIPTOR_SIGNATURE, zinfo.CRC, zinfo.compress_size, zinfo.file_size))
+        self._out.add(zinfo, offset)
+
+    def close(self):
+        """writes the central directory of the members written so far."""
+        if self.closed:
+            return
+        self.closed = True
+        try:
+            self._out.close()
+        finally:
+            if self._own_pool:
+                self._pool.close()
+                self._pool.join()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, exc_tb):
+        self.close()
+
+
+def encode_filename(zinfo):
+    """returns the name of a member as stored in the archive."""
+    name = zinfo.filename
+    if isinstance(name, six.binary_type):
+        return name
+    # names without the utf-8 flag are read as cp437, which includes ascii
+    return name.encode("utf-8" if zinfo.flag_bits & 0x800 else "cp437")
+
+
+def _strip_zip64_extra(extra):
+    """removes the zip64 field from the extra data of a member."""
+    fields = []
+    pos = 0
+    while pos + 4 <= len(extra):
+        field_id, size = struct.unpack("<HH", extra[pos:pos + 4])
+        if field_id != 1:
+            fields.append(extra[pos:pos + 4 + size])
+        pos += 4 + size
+    return b"".join(fields)
+
+
+def _dos_time(date_time):
+    return date_time[3] << 11 | date_time[4] << 5 | date_time[5] // 2
+
+
+def _dos_date(date_time):
+    return (date_time[0] - 1980) << 9 | date_time[1] << 5 | date_time[2]
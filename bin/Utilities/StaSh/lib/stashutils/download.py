@@ -0,0 +1,398 @@
+# -*- coding: utf-8 -*-
+"""
+The download engine shared by 'wget' and 'curl'.
+Files are downloaded with a pooled requests.Session, so downloads of
+several URLs from the same host reuse their connections. If the server
+supports byte ranges, large files are split into segments which are
+downloaded in parallel, and interrupted downloads are resumed.
+While a file is downloaded, its state is kept in '<file>.stash-dl'. A
+download is resumed only if the validator (ETag or Last-Modified) of the
+file on the server did not change.
+"""
+import json
+import os
+import threading
+import time
+
+import requests
+
+# number of bytes read from a response at a time
+DEFAULT_CHUNK_SIZE = 64 * 1024
+# number of parallel segments a file is split into
+DEFAULT_SEGMENTS = 4
+# files smaller than this are not split
+MIN_SEGMENT_SIZE = 1024 * 1024
+# the state of a download is saved after this many bytes
+SAVE_INTERVAL = 1024 * 1024
+# the segments are joined with this timeout, so that a killed job is not blocked
+JOIN_INTERVAL = 0.1
+# time given to the other segments to stop when a download is interrupted
+STOP_TIMEOUT = 2.0
+
+STATE_SUFFIX = ".stash-dl"
+
+
+class DownloadError(Exception):
+    """raised when a download failed."""
+    pass
+
+
+def make_session(pool_size=DEFAULT_SEGMENTS):
+    """returns a requests.Session keeping up to pool_size connections per host."""
+    session = requests.Session()
+    adapter = requests.adapters.HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size)
+    session.mount("http://", adapter)
+    session.mount("https://", adapter)
+    return session
+
+
+def get_validator(response):
+    """returns the ETag or Last-Modified header of a response or None."""
+    etag = response.headers.get("ETag")
+    if etag and not etag.startswith("W/"):
+        # weak ETags can not be used for ranges
+        return etag
+    return response.headers.get("Last-Modified")
+
+
+def parse_content_range(value):
+    """parses 'bytes start-end/total' and returns (start, end, total); total may be None."""
+    try:
+        unit, spec = value.split(" ", 1)
+        span, total = spec.split("/", 1)
+        start, end = span.split("-", 1)
+        return int(start), int(end), (None if total.strip() == "*" else int(total))
+    except (AttributeError, ValueError):
+        raise DownloadError("Invalid Content-Range: {v}".format(v=value))
+
+
+def _replace(src, dst):
+    """renames src to dst, replacing dst."""
+    if hasattr(os, "replace"):
+        os.replace(src, dst)
+    else:
+        # py2; os.rename() replaces dst except on windows
+        if os.name == "nt" and os.path.exists(dst):
+            os.remove(dst)
+        os.rename(src, dst)
+
+
+class Download(object):
+    """
+    The state of the download of a file.
+    ranges is the list of [next byte, last byte] which are still missing;
+    last byte is None while the size is unknown.
+    """
+
+    def __init__(self, url, path, size=None, validator=None, ranges=None):
+        self.url = url
+        self.path = path
+        self.size = size
+        self.validator = validator
+        self.ranges = ranges if ranges is not None else [[0, None]]
+        self.lock = threading.Lock()
+
+    @property
+    def state_path(self):
+        return self.path + STATE_SUFFIX
+
+    @property
+    def remaining(self):
+        if self.size is None:
+            return None
+        return sum(end - pos + 1 for pos, end in self.ranges if end is not None)
+
+    @property
+    def downloaded(self):
+        if self.size is None:
+            return self.ranges[0][0]
+        return self.size - self.remaining
+
+    @classmethod
+    def load(cls, url, path):
+        """returns the saved state of an interrupted download of url to path or None."""
+        try:
+            with open(path + STATE_SUFFIX, "r") as f:
+                state = json.load(f)
+        except (IOError, OSError, ValueError):
+            return None
+        if state.get("url") != url or not os.path.exists(path):
+            return None
+        return cls(url, path, state.get("size"), state.get("validator"), state.get("ranges"))
+
+    def save(self):
+        """saves the state, so that the download can be resumed."""
+        # the segments save the state concurrently, so it is written while
+        # the lock is held and replaces the old state as a whole
+        tmp = self.state_path + ".tmp"
+        with self.lock:
+            state = {"url": self.url, "size": self.size, "validator": self.validator, "ranges": self.ranges}
+            with open(tmp, "w") as f:
+                json.dump(state, f)
+            _replace(tmp, self.state_path)
+
+    def finish(self):
+        """removes the saved state."""
+        if os.path.exists(self.state_path):
+            os.remove(self.state_path)
+
+
+class Downloader(object):
+    """
+    Downloads files, optionally in parallel segments.
+    :param session: the session to use, a new pooled session if None
+    :type session: requests.Session or None
+    :param segments: maximum number of segments a file is split into
+    :type segments: int
+    :param chunk_size: number of bytes read from a response at a time
+    :type chunk_size: int
+    :param headers: additional headers sent with each request
+    :type headers: dict or None
+    :param progress: callable called with (url, downloaded bytes, total bytes or None)
+    :type progress: callable or None
+    :param allow_redirects: whether redirects are followed
+    :type allow_redirects: bool
+    """
+
+    def __init__(
+        self,
+        session=None,
+        segments=DEFAULT_SEGMENTS,
+        chunk_size=DEFAULT_CHUNK_SIZE,
+        min_segment_size=MIN_SEGMENT_SIZE,
+        headers=None,
+        progress=None,
+        allow_redirects=True,
+    ):
+        self.session = session if session is not None else make_session(max(segments, 1))
+        self.segments = max(segments, 1)
+        self.chunk_size = chunk_size
+        self.min_segment_size = min_segment_size
+        self.headers = headers or {}
+        self.progress = progress
+        self.allow_redirects = allow_redirects
+
+    def _request(self, url, headers=None):
+        h = dict(self.headers)
+        h.update(headers or {})
+        try:
+            return self.session.get(url, headers=h, stream=True, allow_redirects=self.allow_redirects)
+        except requests.RequestException as e:
+            raise DownloadError(str(e))
+
+    def download(self, url, path, resume=False):
+        """
+        downloads url to path and returns the Download.
+        If resume is True and a previous download of url to path was
+        interrupted, only the missing parts are downloaded.
+        """
+        download = Download.load(url, path) if resume else None
+        if download is not None:
+            if download.size is not None and download.remaining == 0:
+                download.finish()
+                return download
+            response = self._resume(download)
+        elif resume and os.path.exists(path):
+            # a partial file without a saved state, like 'wget -c'
+            offset = os.path.getsize(path)
+            download = Download(url, path, ranges=[[offset, None]])
+            response = self._request(url, {"Range": "bytes={o}-".format(o=offset)})
+            if response.status_code == 416:
+                # the file is complete already
+                response.close()
+                download.size = offset
+                download.ranges = []
+                return download
+            if response.status_code == 206:
+                start, end, total = parse_content_range(response.headers.get("Content-Range"))
+                if start != offset:
+                    response.close()
+                    raise DownloadError("The server sent an unexpected range")
+                download.size = total
+                download.validator = get_validator(response)
+                if total is not None:
+                    download.ranges = [[offset, total - 1]]
+            else:
+                download = None
+        else:
+            response = None
+        if download is None:
+            response = self._start(url, path, response)
+            download = response.download
+        try:
+            self._run(download, response)
+        except BaseException:
+            if download.validator is not None:
+                download.save()
+            raise
+        download.finish()
+        return download
+
+    def _start(self, url, path, response=None):
+        """starts a new download of url to path; returns the response for the first segment."""
+        if response is None or response.status_code != 200:
+            if response is not None:
+                response.close()
+            response = self._request(url)
+        if response.status_code != 200:
+            response.close()
+            raise DownloadError("{c} {r}".format(c=response.status_code, r=response.reason))
+        size = response.headers.get("Content-Length")
+        size = int(size) if size is not None and size.isdigit() else None
+        if response.headers.get("Content-Encoding", "identity") != "identity":
+            # the length is the one of the encoded content
+            size = None
+        download = Download(url, path, size, get_validator(response))
+        ranges_supported = response.headers.get("Accept-Ranges", "").lower() == "bytes"
+        try:
+            with open(path, "wb") as f:
+                if size is not None:
+                    f.truncate(size)
+        except (IOError, OSError) as e:
+            response.close()
+            raise DownloadError(str(e))
+        if size is None:
+            download.ranges = [[0, None]]
+        elif size == 0:
+            download.ranges = []
+        elif ranges_supported and download.validator is not None:
+            n = max(1, min(self.segments, size // self.min_segment_size))
+            step = size // n
+            download.ranges = [[i * step, (i + 1) * step - 1] for i in range(n)]
+            download.ranges[-1][1] = size - 1
+        else:
+            # the download can not be resumed, so its state is not saved
+            download.validator = None
+            download.ranges = [[0, size - 1]]
+        if download.validator is not None:
+            # without the state, the preallocated file would look complete
+            try:
+                download.save()
+            except (IOError, OSError) as e:
+                response.close()
+                raise DownloadError(str(e))
+        response.download = download
+        return response
+
+    def _resume(self, download):
+        """returns a response for the first missing range of download, validating it."""
+        return self._range_request(download, download.ranges[0])
+
+    def _range_request(self, download, rng):
+        """requests a missing range of a download, raising DownloadError if the file changed."""
+        pos, end = rng
+        headers = {"Range": "bytes={s}-{e}".format(s=pos, e="" if end is None else end)}
+        if download.validator is not None:
+            headers["If-Range"] = download.validator
+        response = self._request(download.url, headers)
+        if response.status_code != 206:
+            response.close()
+            raise DownloadError(
+                "The file changed on the server, can not resume ({c} {r})".format(c=response.status_code, r=response.reason)
+            )
+        start, last, total = parse_content_range(response.headers.get("Content-Range"))
+        if start != pos or (download.size is not None and total is not None and total != download.size):
+            response.close()
+            raise DownloadError("The server sent an unexpected range")
+        return response
+
+    def _run(self, download, first_response):
+        """downloads the missing ranges, the first one using first_response."""
+        ranges = list(download.ranges)
+        if not ranges:
+            first_response.close()
+            return
+        errors = []
+        threads = []
+        for rng in ranges[1:]:
+            thr = threading.Thread(target=self._segment, args=(download, rng, None, errors))
+            thr.daemon = True
+            thr.start()
+            threads.append(thr)
+        try:
+            self._segment(download, ranges[0], first_response, errors)
+            for thr in threads:
+                while thr.is_alive():
+                    thr.join(JOIN_INTERVAL)
+        except BaseException:
+            # interrupted, e.g. the job was killed: stop the other segments
+            errors.append(DownloadError("The download was interrupted"))
+            deadline = time.time() + STOP_TIMEOUT
+            for thr in threads:
+                thr.join(max(0, deadline - time.time()))
+            raise
+        if errors:
+            raise errors[0]
+
+    def _segment(self, download, rng, response, errors):
+        """downloads a range, writing it at its offset."""
+        try:
+            if response is None:
+                response = self._range_request(download, rng)
+            unsaved = 0
+            with response, open(download.path, "r+b") as f:
+                f.seek(rng[0])
+                for chunk in response.iter_content(self.chunk_size):
+                    if errors:
+                        # another segment failed
+                        return
+                    if rng[1] is not None:
+                        chunk = chunk[:rng[1] - rng[0] + 1]
+                    f.write(chunk)
+                    with download.lock:
+                        rng[0] += len(chunk)
+                    unsaved += len(chunk)
+                    if unsaved >= SAVE_INTERVAL and download.validator is not None:
+                        f.flush()
+                        download.save()
+                        unsaved = 0
+                    if self.progress is not None:
+                        self.progress(download.url, download.downloaded, download.size)
+                    if rng[1] is not None and rng[0] > rng[1]:
+                        break
+            if rng[1] is not None and rng[0] <= rng[1]:
+                raise DownloadError("Connection closed before the download was complete")
+            with download.lock:
+                if rng in download.ranges:
+                    download.ranges.remove(rng)
+        except Exception as e:
+            if not isinstance(e, DownloadError):
+                e = DownloadError(str(e))
+            errors.append(e)
+
+    def download_all(self, jobs, resume=False, parallel=DEFAULT_SEGMENTS, callback=None):
+        """
+        downloads a list of (url, path) tuples using up to 'parallel' threads,
+        reusing the connections of the session.
+        callback(url, path, error) is called after each download; error is None on success.
+        Returns the number of failed downloads.
+        """
+        todo = list(reversed(jobs))
+        lock = threading.Lock()
+        failed = [0]
+
+        def worker():
+            while True:
+                with lock:
+                    if not todo:
+                        return
+                    url, path = todo.pop()
+                try:
+                    self.download(url, path, resume=resume)
+                except Exception as e:
+                    # every job has to be reported, whatever went wrong
+                    error = e if isinstance(e, DownloadError) else DownloadError(str(e))
+                else:
+                    error = None
+                with lock:
+                    if error is not None:
+                        failed[0] += 1
+                    if callback is not None:
+                        callback(url, path, error)
+
+        threads = [threading.Thread(target=worker) for i in range(max(1, min(parallel, len(jobs))))]
+        for thr in threads:
+            thr.start()
+        for thr in threads:
+            thr.join()
+        return failed[0]
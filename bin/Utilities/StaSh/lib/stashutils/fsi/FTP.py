@@ -1,9 +1,13 @@
 # -*- coding: utf-8 -*-
 """Interface to FTP-servers."""
+import calendar
 import ftplib
-import tempfile
+import io
 import os
+import socket
 import stat
+import threading
+import time
 
 from stashutils.core import get_stash
 
@@ -13,6 +17,45 @@ from stashutils.fsi.errors import AlreadyExists
 
 _stash = get_stash()
 
+# maximum number of files transferred at the same time
+POOL_SIZE = 4
+# seconds for which the facts of a directory listing are used by stat()
+FACTS_TTL = 10
+# size of the blocks read from and written to data connections
+BLOCK_SIZE = 64 * 1024
+# how often a broken download is resumed before giving up
+MAX_RETRIES = 3
+
+
+def parse_facts(line):
+    """
+	parses a line of a MLSD or MLST response.
+	returns a tuple (name, facts), where facts is a dict with lowercase keys.
+	"""
+    factstring, _, name = line.rstrip("\r\n").partition(" ")
+    facts = {}
+    for fact in factstring.split(";"):
+        if "=" in fact:
+            key, _, value = fact.partition("=")
+            facts[key.lower()] = value
+    return name, facts
+
+
+def stat_from_facts(facts):
+    """returns a stat result for the facts of a MLSD or MLST response."""
+    if facts.get("type", "file").lower() in ("dir", "cdir", "pdir"):
+        type_, size = stat.S_IFDIR, 1
+    else:
+        type_, size = stat.S_IFREG, int(facts.get("size", 0))
+    mtime = None
+    modify = facts.get("modify")
+    if modify:
+        try:
+            mtime = calendar.timegm(time.strptime(modify[:14], "%Y%m%d%H%M%S"))
+        except ValueError:
+            pass
+    return make_stat(size=size, mode=calc_mode(type=type_), mtime=mtime, ctime=mtime)
+
 
 class FTPFSI(BaseFSI):
     """
@@ -22,11 +65,22 @@ Due to this, the protocol is not completly unified.
 This means, that this FSI may not work on all FTP-servers.
 """
 
+    max_transfers = POOL_SIZE
+
     def __init__(self, logger=None):
         self.logger = logger
         self.path = "/"
         self.ftp = None
         self.host = None
+        # idle connections for file transfers
+        self._pool = []
+        self._pool_lock = threading.Lock()
+        self._pool_slots = threading.Semaphore(POOL_SIZE)
+        # abspath -> (expiration time, stat result) from directory listings,
+        # guarded by _facts_lock as transfers run in several threads
+        self._facts = {}
+        self._facts_lock = threading.Lock()
+        self._has_mlsd = True
 
     def abspath(self, name):
         """returns the absolute path of name"""
@@ -71,6 +125,9 @@ This means, that this FSI may not work on all FTP-servers.
         self.host = host
         self.port = port
         self.user = user
+        self._pswd = pswd
+        self._secure = secure
+        self._debug = debug
         try:
             port = int(port)
         except:
@@ -108,14 +165,64 @@ This means, that this FSI may not work on all FTP-servers.
                 return True
 
     def close(self):
-        if self.ftp is not None:
-            try:
-                self.ftp.quit()
-            except:
-                try:
-                    self.ftp.close()
-                except:
-                    pass
+        with self._pool_lock:
+            connections = self._pool + [self.ftp]
+            self._pool = []
+        for ftp in connections:
+            if ftp is not None:
+                _close_connection(ftp)
+
+    def _new_connection(self):
+        """opens and logs in another control connection to the server."""
+        ftp = ftplib.FTP_TLS() if self._secure else ftplib.FTP()
+        ftp.set_debuglevel(self._debug)
+        ftp.connect(self.host, int(self.port))
+        if self._secure:
+            ftp.prot_p()
+        ftp.login(self.user, self._pswd)
+        return ftp
+
+    def _acquire(self):
+        """
+		returns a connection for a file transfer.
+		At most POOL_SIZE connections are used at the same time, so this
+		blocks until a transfer has finished if all are in use.
+		"""
+        self._pool_slots.acquire()
+        try:
+            with self._pool_lock:
+                if self._pool:
+                    return self._pool.pop()
+            ftp = self._new_connection()
+            ftp.voidcmd("TYPE I")
+            return ftp
+        except Exception as e:
+            self._pool_slots.release()
+            raise OperationFailure(str(e))
+
+    def _release(self, ftp, reusable=True):
+        """returns a connection acquired with _acquire() to the pool."""
+        if reusable:
+            with self._pool_lock:
+                self._pool.append(ftp)
+        else:
+            _close_connection(ftp)
+        self._pool_slots.release()
+
+    def _get_facts(self, ap):
+        """returns the stat result of ap from a recent listing or None."""
+        with self._facts_lock:
+            entry = self._facts.get(ap)
+        if entry is None or entry[0] < time.time():
+            return None
+        return entry[1]
+
+    def _invalidate(self, ap):
+        """forgets the facts about ap and its contents."""
+        prefix = ap.rstrip("/") + "/"
+        with self._facts_lock:
+            for key in [k for k in self._facts if k == ap or k.startswith(prefix)]:
+                del self._facts[key]
 
     def repr(self):
         raw = "FTP-Session for {u} on {h}:{p}"
@@ -133,6 +240,7 @@ This means, that this FSI may not work on all FTP-servers.
 
     def mkdir(self, name):
         ap = self.abspath(name)
+        self._invalidate(ap)
         try:
             self.ftp.mkd(ap)
         except Exception as e:
@@ -148,6 +256,16 @@ This means, that this FSI may not work on all FTP-servers.
 
     def listdir(self, path="."):
         ap = self.abspath(path)
+        if self._has_mlsd:
+            try:
+                return self._mlsd(ap)
+            except ftplib.error_perm as e:
+                if not str(e).startswith("50"):
+                    raise OperationFailure(str(e))
+                # 500/502: the server does not know MLSD
+                self._has_mlsd = False
+            except Exception as e:
+                raise OperationFailure(str(e))
         try:
             content = self.ftp.nlst(ap)
             ret = [e.split("/")[-1] for e in content]
@@ -155,8 +273,29 @@ This means, that this FSI may not work on all FTP-servers.
         except Exception as e:
             raise OperationFailure(str(e))
 
+    def _mlsd(self, ap):
+        """
+		lists ap using MLSD, which returns the names and the facts of the
+		entries in a single transfer. The facts are kept for stat().
+		"""
+        lines = []
+        self.ftp.retrlines("MLSD " + ap, lines.append)
+        names = []
+        entries = {}
+        expires = time.time() + FACTS_TTL
+        for line in lines:
+            name, facts = parse_facts(line)
+            if name in ("", ".", "..") or facts.get("type", "").lower() in ("cdir", "pdir"):
+                continue
+            names.append(name)
+            entries[os.path.join(ap, name)] = (expires, stat_from_facts(facts))
+        with self._facts_lock:
+            self._facts.update(entries)
+        return names
+
     def remove(self, name):
         ap = self.abspath(name)
+        self._invalidate(ap)
         # we dont know wether target is a server or a file, so try both
         try:
             self.ftp.delete(ap)
@@ -175,24 +314,64 @@ This means, that this FSI may not work on all FTP-servers.
         ap = self.abspath(name)
         self.log("Opening '{p}' with mode '{m}'...\n".format(p=ap, m=mode))
         if mode in ("r", "rb"):
-            try:
-                tf = tempfile.TemporaryFile()
-                self.ftp.retrbinary("RETR " + ap, tf.write, 4096)
-                tf.seek(0)
-            except Exception as e:
-                self.log('Error during open("{p}","r"): {e}\n'.format(p=ap, e=e.message))
-                raise OperationFailure(e.message)
-            return tf
-        elif "w" in mode:
-            return FTP_Upload(self.ftp, ap, mode, ap)
+            return io.BufferedReader(FTP_Download(self, ap), buffer_size=BLOCK_SIZE)
+        elif ("w" in mode) or ("a" in mode):
+            self._invalidate(ap)
+            return FTP_Upload(self, ap, mode, ap)
         else:
             raise OperationFailure("Mode not supported!")
 
+    def read_range(self, name, offset, size):
+        ap = self.abspath(name)
+        chunks = []
+        remaining = size
+        ftp = self._acquire()
+        reusable = True
+        try:
+            try:
+                conn = ftp.transfercmd("RETR " + ap, rest=offset or None)
+            except ftplib.error_perm as e:
+                if not (offset and str(e).startswith("50")):
+                    raise
+                # the server does not support REST, skip to offset instead
+                conn = ftp.transfercmd("RETR " + ap)
+                skip = offset
+                while skip > 0:
+                    data = conn.recv(min(skip, BLOCK_SIZE))
+                    if not data:
+                        break
+                    skip -= len(data)
+            try:
+                while remaining > 0:
+                    data = conn.recv(min(remaining, BLOCK_SIZE))
+                    if not data:
+                        break
+                    chunks.append(data)
+                    remaining -= len(data)
+            finally:
+                conn.close()
+            try:
+                ftp.voidresp()
+            except (ftplib.error_temp, ftplib.error_reply):
+                # the transfer was aborted because the range ended before the
+                # file. Some servers send another reply, so the connection
+                # is not reused.
+                reusable = False
+        except Exception as e:
+            reusable = False
+            raise OperationFailure(str(e))
+        finally:
+            self._release(ftp, reusable)
+        return b"".join(chunks)
+
     def get_path(self):
         return self.ftp.pwd()
 
     def isdir(self, name):
         ap = self.abspath(name)
+        st = self._get_facts(ap)
+        if st is not None:
+            return stat.S_ISDIR(st.st_mode)
         op = self.get_path()
         try:
             self.ftp.cwd(ap)
@@ -229,9 +408,36 @@ This means, that this FSI may not work on all FTP-servers.
             self.ftp.cwd(op)
         return (1, stat.S_IFDIR)
 
+    def isfile(self, name):
+        try:
+            return stat.S_ISREG(self.stat(name).st_mode)
+        except OperationFailure:
+            return False
+
+    def _mlst(self, ap):
+        """returns the stat result of ap using MLST or None if MLST is not supported."""
+        try:
+            resp = self.ftp.sendcmd("MLST " + ap)
+        except ftplib.error_perm as e:
+            if str(e).startswith("50"):
+                return None
+            raise OperationFailure("NotFound!")
+        for line in resp.splitlines()[1:-1]:
+            name, facts = parse_facts(line.lstrip(" "))
+            if facts:
+                return stat_from_facts(facts)
+        return None
+
     def stat(self, name):
         ap = self.abspath(name)
         self.log("stat: {p}\n".format(p=ap))
+        st = self._get_facts(ap)
+        if st is not None:
+            return st
+        if self._has_mlsd:
+            st = self._mlst(ap)
+            if st is not None:
+                return st
         op = self.path
         try:
             size, type = self._get_total_size_and_type(ap)
@@ -245,41 +451,176 @@ This means, that this FSI may not work on all FTP-servers.
         return make_stat(size=size, mode=m)
 
 
+class FTP_Download(io.RawIOBase):
+    """
+	utility class used for FTP-downloads.
+	the file is streamed from a data connection of a pooled control
+	connection. Seeking or a broken connection restart the transfer at the
+	current position using REST.
+	"""
+
+    def __init__(self, fsi, path):
+        io.RawIOBase.__init__(self)
+        self.fsi = fsi
+        self.name = path
+        self.ftp = fsi._acquire()
+        self.conn = None
+        self.pos = 0
+        self.eof = False
+
+    def readable(self):
+        return True
+
+    def seekable(self):
+        return True
+
+    def tell(self):
+        return self.pos
+
+    def seek(self, offset, whence=os.SEEK_SET):
+        if whence == os.SEEK_CUR:
+            offset += self.pos
+        elif whence == os.SEEK_END:
+            offset += self.fsi.stat(self.name).st_size
+        if offset < 0:
+            raise IOError("Invalid seek position")
+        if offset != self.pos:
+            self._abort()
+            self.pos = offset
+            self.eof = False
+        return self.pos
+
+    def _start(self):
+        """opens the data connection at the current position."""
+        if self.ftp is None:
+            self.ftp = self.fsi._acquire()
+        try:
+            self.conn = self.ftp.transfercmd("RETR " + self.name, rest=self.pos or None)
+        except ftplib.all_errors as e:
+            raise OperationFailure(str(e))
+
+    def _finish(self):
+        """closes the data connection after the transfer completed."""
+        conn, self.conn = self.conn, None
+        _unwrap(conn)
+        conn.close()
+        self.ftp.voidresp()
+
+    def _abort(self):
+        """
+		closes the data connection before the transfer completed.
+		servers answer this differently, so the control connection is not reused.
+		"""
+        if self.conn is None:
+            return
+        conn, self.conn = self.conn, None
+        try:
+            conn.close()
+        finally:
+            self.fsi._release(self.ftp, False)
+            self.ftp = None
+
+    def readinto(self, b):
+        if self.eof:
+            return 0
+        retries = 0
+        while True:
+            try:
+                if self.conn is None:
+                    self._start()
+                n = self.conn.recv_into(b)
+                if n == 0:
+                    self._finish()
+                    self.eof = True
+                self.pos += n
+                return n
+            except (socket.error, EOFError, ftplib.error_temp) as e:
+                if retries >= MAX_RETRIES:
+                    raise OperationFailure(str(e))
+                retries += 1
+                self.fsi.log("Transfer of '{p}' broke, resuming at {o}...\n".format(p=self.name, o=self.pos))
+                if self.conn is not None:
+                    self._abort()
+                elif self.ftp is not None:
+                    self.fsi._release(self.ftp, False)
+                    self.ftp = None
+
+    def close(self):
+        if self.closed:
+            return
+        try:
+            if self.conn is not None:
+                self._abort()
+            elif self.ftp is not None:
+                self.fsi._release(self.ftp)
+                self.ftp = None
+        finally:
+            io.RawIOBase.close(self)
+
+
 class FTP_Upload(object):
-    """utility class used for FTP-uploads.
-this class creates a tempfile, which is uploaded to the server when closed."""
+    """
+	utility class used for FTP-uploads.
+	the data is sent to the server while it is written, using a pooled
+	control connection. Files opened in append mode are appended to using APPE.
+	"""
 
-    def __init__(self, ftp, path, mode, name):
-        self.ftp = ftp
+    def __init__(self, fsi, path, mode, name):
+        self.fsi = fsi
         self.path = path
         self.mode = mode
         self.closed = False
         self.name = name
-        self.tf = tempfile.TemporaryFile()
+        self.pos = 0
+        self.ftp = None
+        self.conn = None
+        self.ftp = fsi._acquire()
+        command = ("APPE " if "a" in mode else "STOR ") + path
+        try:
+            self.conn = self.ftp.transfercmd(command)
+        except Exception as e:
+            self.fsi._release(self.ftp, False)
+            self.ftp = None
+            raise OperationFailure(str(e))
 
     def write(self, data):
-        self.tf.write(data)
+        try:
+            self.conn.sendall(data)
+        except socket.error as e:
+            raise OperationFailure(str(e))
+        self.pos += len(data)
 
     def flush(self):
         pass
 
     def tell(self):
-        return self.tf.tell()
+        return self.pos
 
     def seek(self, offset, whence=os.SEEK_SET):
-        self.tf.seek(offset, whence)
+        if whence == os.SEEK_CUR:
+            offset += self.pos
+        if whence == os.SEEK_END or offset != self.pos:
+            raise IOError("Uploads can not seek")
+        return self.pos
 
     def close(self):
         if self.closed:
             return
         self.closed = True
-        self.tf.seek(0)
+        if self.ftp is None:
+            return
+        reusable = True
         try:
-            self.ftp.storbinary("STOR " + self.path, self.tf, 4096)
+            _unwrap(self.conn)
+            self.conn.close()
+            self.ftp.voidresp()
         except Exception as e:
-            raise OperationFailure(e.message)
+            reusable = False
+            raise OperationFailure(str(e))
         finally:
-            self.tf.close()
+            self.fsi._release(self.ftp, reusable)
+            self.ftp = None
+            self.fsi._invalidate(self.path)
 
     def __enter__(self):
         return self
@@ -289,3 +630,23 @@ this class creates a tempfile, which is uploaded to the server when closed."""
 
     def __del__(self):
         self.close()
+
+
+def _unwrap(conn):
+    """shuts down the TLS layer of a data connection, like ftplib does."""
+    if hasattr(conn, "unwrap"):
+        try:
+            conn.unwrap()
+        except (socket.error, ValueError):
+            pass
+
+
+def _close_connection(ftp):
+    """closes a control connection, politely if possible."""
+    try:
+        ftp.quit()
+    except:
+        try:
+            ftp.close()
+        except:
+            pass
@@ -15,6 +15,11 @@ Other FSIs should subclass this.
 This class currently only serves as a documentation, but this may change.
 """
 
+    # the number of files which may be open at the same time by different
+    # threads. FSIs which are thread-safe should raise this. A copy within
+    # one FSI keeps two files open.
+    max_transfers = 1
+
     def __init__(self, logger=None):
         """
 		called on __init__().
@@ -65,6 +70,20 @@ This should return a list of strings.
 		"""
         raise OperationFailure("NotImplemented")
 
+    def read_range(self, name, offset, size):
+        """
+		this should return at most size bytes of the file name,
+		starting at offset.
+		The default implementation opens the file and seeks to offset,
+		FSIs which can request a part of a file should override this.
+		"""
+        f = self.open(name, "rb")
+        try:
+            f.seek(offset)
+            return f.read(size)
+        finally:
+            f.close()
+
     def mkdir(self, name):
         """this should create a dir."""
         raise OperationFailure("NotImplemented")
@@ -180,7 +199,8 @@ def make_stat(
         mtime = time.time()
     if ctime is None:
         ctime = time.time()
-    if os.stat_float_times():
+    # os.stat_float_times() was removed in python 3.7, times are always floats since then
+    if getattr(os, "stat_float_times", lambda: True)():
         ctime = float(ctime)
         mtime = float(mtime)
         atime = float(atime)
@@ -0,0 +1,376 @@
+# -*- coding: utf-8 -*-
+"""
+A caching FSI, which can be put in front of any other FSI.
+Remote FSIs (e.g. FTP or Dropbox) need one or more round trips for every
+stat(), isdir() or listdir() and download a whole file for every open().
+This FSI keeps the results of these lookups for a few seconds and keeps
+the blocks of files read in a bounded on-disk cache, so that commands like
+'ls -l', 'find' or repeated 'cat's only pay the network latency once.
+"""
+import io
+import os
+import posixpath
+import shutil
+import stat
+import tempfile
+import threading
+import time
+from collections import OrderedDict
+
+import six
+
+from stashutils.fsi.base import BaseFSI
+from stashutils.fsi.errors import OperationFailure, IsDir
+
+# seconds for which stat results and directory listings are reused
+DEFAULT_TTL = 30
+# size of the blocks files are read and cached in
+DEFAULT_BLOCK_SIZE = 256 * 1024
+# maximum size of all cached blocks
+DEFAULT_CACHE_SIZE = 64 * 1024 * 1024
+
+
+class BlockCache(object):
+    """
+    A bounded on-disk cache of file blocks.
+    The least recently used blocks are removed once the total size of the
+    cached blocks exceeds max_size.
+    :param max_size: maximum size of all cached blocks in bytes
+    :type max_size: int
+    :param cache_dir: directory to store the blocks in, a temporary directory is used if None
+    :type cache_dir: str or None
+    """
+
+    def __init__(self, max_size=DEFAULT_CACHE_SIZE, cache_dir=None):
+        self.max_size = max_size
+        self.size = 0
+        self._cache_dir = cache_dir
+        self._owns_dir = cache_dir is None
+        # key -> (file name, size), the most recently used block goes last
+        self._blocks = OrderedDict()
+        self._next_id = 0
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._blocks)
+
+    def _get_dir(self):
+        if self._cache_dir is None:
+            self._cache_dir = tempfile.mkdtemp(prefix="stash_fsi_cache_")
+        return self._cache_dir
+
+    def get(self, key):
+        """returns the data of a cached block or None."""
+        with self._lock:
+            entry = self._blocks.pop(key, None)
+            if entry is None:
+                return None
+            self._blocks[key] = entry
+        try:
+            with io.open(entry[0], "rb") as f:
+                return f.read()
+        except (IOError, OSError):
+            self.discard(lambda k: k == key)
+            return None
+
+    def put(self, key, data):
+        """stores the data of a block, evicting old blocks if required."""
+        if len(data) > self.max_size:
+            return
+        with self._lock:
+            filename = os.path.join(self._get_dir(), "{}.blk".format(self._next_id))
+            self._next_id += 1
+        try:
+            with io.open(filename, "wb") as f:
+                f.write(data)
+        except (IOError, OSError):
+            # the block is just not cached
+            return
+        with self._lock:
+            old = self._blocks.pop(key, None)
+            if old is not None:
+                self._remove(old)
+            self._blocks[key] = (filename, len(data))
+            self.size += len(data)
+            while self.size > self.max_size:
+                _, entry = self._blocks.popitem(last=False)
+                self._remove(entry)
+
+    def discard(self, predicate):
+        """removes all blocks whose key matches predicate."""
+        with self._lock:
+            for key in [k for k in self._blocks if predicate(k)]:
+                self._remove(self._blocks.pop(key))
+
+    def clear(self):
+        """removes all blocks and the cache directory, if it was created by this cache."""
+        with self._lock:
+            self._blocks.clear()
+            self.size = 0
+            if self._owns_dir and self._cache_dir is not None:
+                shutil.rmtree(self._cache_dir, ignore_errors=True)
+                self._cache_dir = None
+
+    def _remove(self, entry):
+        filename, size = entry
+        self.size -= size
+        try:
+            os.remove(filename)
+        except OSError:
+            pass
+
+
+class CachedFileReader(io.RawIOBase):
+    """
+    A read-only file reading the blocks of a file through the block cache.
+    Only the blocks which are actually read are fetched from the FSI.
+    """
+
+    def __init__(self, cfsi, path, st):
+        io.RawIOBase.__init__(self)
+        self.name = path
+        self._cfsi = cfsi
+        self._size = st.st_size
+        self._version = (st.st_size, st.st_mtime)
+        self._pos = 0
+
+    def readable(self):
+        return True
+
+    def seekable(self):
+        return True
+
+    def tell(self):
+        return self._pos
+
+    def seek(self, offset, whence=os.SEEK_SET):
+        if whence == os.SEEK_CUR:
+            offset += self._pos
+        elif whence == os.SEEK_END:
+            offset += self._size
+        if offset < 0:
+            raise IOError("Invalid seek position")
+        self._pos = offset
+        return self._pos
+
+    def readinto(self, b):
+        if self._pos >= self._size:
+            return 0
+        data = self._cfsi.read_block(self.name, self._version, self._pos // self._cfsi.block_size)
+        start = self._pos % self._cfsi.block_size
+        n = min(len(b), len(data) - start)
+        if n <= 0:
+            return 0
+        b[:n] = data[start:start + n]
+        self._pos += n
+        return n
+
+
+class _InvalidatingFile(object):
+    """wraps a file opened for writing and invalidates the cache when it is closed."""
+
+    def __init__(self, f, callback):
+        self._f = f
+        self._callback = callback
+
+    def __getattr__(self, name):
+        return getattr(self._f, name)
+
+    def close(self):
+        try:
+            self._f.close()
+        finally:
+            self._callback()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, exc_tb):
+        self.close()
+
+
+class CachingFSI(BaseFSI):
+    """
+    A FSI caching the results of another FSI.
+    stat() results (including failures) and directory listings are reused
+    for ttl seconds. Files opened for reading are read in blocks of
+    block_size bytes using read_range() of the wrapped FSI. The blocks are
+    kept in a BlockCache and are valid as long as the size and mtime
+    reported by stat() do not change.
+    Changes made through this FSI invalidate the affected entries.
+    :param fsi: the FSI to wrap
+    :type fsi: BaseFSI
+    """
+
+    def __init__(
+        self,
+        fsi,
+        logger=None,
+        ttl=DEFAULT_TTL,
+        block_size=DEFAULT_BLOCK_SIZE,
+        max_cache_size=DEFAULT_CACHE_SIZE,
+        cache_dir=None,
+    ):
+        self.logger = logger
+        self.fsi = fsi
+        self.ttl = ttl
+        self.block_size = block_size
+        self.blocks = BlockCache(max_cache_size, cache_dir=cache_dir)
+        self.path = "/"
+        # abspath -> (expiration time, stat result or OperationFailure)
+        self._stats = {}
+        # abspath -> (expiration time, list of names)
+        self._listings = {}
+        self._lock = threading.Lock()
+
+    def abspath(self, name):
+        """returns the normalized absolute path of name, used as the cache key."""
+        return posixpath.normpath(posixpath.join(self.path, name))
+
+    def _get_cached(self, cache, key):
+        with self._lock:
+            entry = cache.get(key)
+        if entry is None or entry[0] < time.time():
+            return None
+        return entry[1]
+
+    def _set_cached(self, cache, key, value):
+        with self._lock:
+            cache[key] = (time.time() + self.ttl, value)
+
+    def invalidate(self, name=None):
+        """
+        forgets everything known about name, its contents and its parent's listing.
+        If name is None, the whole cache is cleared.
+        """
+        if name is None:
+            with self._lock:
+                self._stats.clear()
+                self._listings.clear()
+            self.blocks.discard(lambda key: True)
+            return
+        ap = self.abspath(name)
+        prefix = ap.rstrip("/") + "/"
+
+        def affected(path):
+            return path == ap or path.startswith(prefix)
+
+        with self._lock:
+            for cache in (self._stats, self._listings):
+                for key in [k for k in cache if affected(k)]:
+                    del cache[key]
+            self._listings.pop(posixpath.dirname(ap), None)
+        self.blocks.discard(lambda key: affected(key[0]))
+
+    def connect(self, *args):
+        res = self.fsi.connect(*args)
+        if res is True:
+            self.path = self.fsi.get_path()
+        return res
+
+    def repr(self):
+        return "{r} [cached]".format(r=self.fsi.repr())
+
+    def listdir(self, path="."):
+        ap = self.abspath(path)
+        names = self._get_cached(self._listings, ap)
+        if names is None:
+            names = self.fsi.listdir(ap)
+            self._set_cached(self._listings, ap, list(names))
+        return list(names)
+
+    def cd(self, name):
+        ap = self.abspath(name)
+        self.fsi.cd(ap)
+        self.path = ap
+
+    def get_path(self):
+        return self.fsi.get_path()
+
+    def remove(self, name):
+        try:
+            self.fsi.remove(self.abspath(name))
+        finally:
+            self.invalidate(name)
+
+    def mkdir(self, name):
+        try:
+            self.fsi.mkdir(self.abspath(name))
+        finally:
+            self.invalidate(name)
+
+    def open(self, name, mode="r", buffering=0):
+        ap = self.abspath(name)
+        if ("w" in mode) or ("a" in mode) or ("+" in mode):
+            self.invalidate(ap)
+            return _InvalidatingFile(self.fsi.open(ap, mode, buffering), lambda: self.invalidate(ap))
+        st = self.stat(ap)
+        if stat.S_ISDIR(st.st_mode):
+            raise IsDir()
+        f = io.BufferedReader(CachedFileReader(self, ap, st), buffer_size=self.block_size)
+        if "b" in mode or six.PY2:
+            return f
+        return io.TextIOWrapper(f)
+
+    def close(self):
+        try:
+            self.fsi.close()
+        finally:
+            self.invalidate()
+            self.blocks.clear()
+
+    def isdir(self, name):
+        try:
+            return stat.S_ISDIR(self.stat(name).st_mode)
+        except OperationFailure:
+            return False
+
+    def isfile(self, name):
+        try:
+            return stat.S_ISREG(self.stat(name).st_mode)
+        except OperationFailure:
+            return False
+
+    def stat(self, name):
+        ap = self.abspath(name)
+        st = self._get_cached(self._stats, ap)
+        if st is None:
+            try:
+                st = self.fsi.stat(ap)
+            except OperationFailure as e:
+                st = e
+            self._set_cached(self._stats, ap, st)
+            # blocks read before the file changed are outdated
+            if not isinstance(st, OperationFailure):
+                version = (st.st_size, st.st_mtime)
+                self.blocks.discard(lambda key: key[0] == ap and key[1] != version)
+        if isinstance(st, OperationFailure):
+            raise st
+        return st
+
+    def read_range(self, name, offset, size):
+        ap = self.abspath(name)
+        st = self.stat(ap)
+        version = (st.st_size, st.st_mtime)
+        chunks = []
+        end = min(offset + size, st.st_size)
+        while offset < end:
+            index = offset // self.block_size
+            data = self.read_block(ap, version, index)
+            start = offset - index * self.block_size
+            chunk = data[start:start + end - offset]
+            if not chunk:
+                break
+            chunks.append(chunk)
+            offset += len(chunk)
+        return b"".join(chunks)
+
+    def read_block(self, ap, version, index):
+        """returns a block of a file, reading it from the wrapped FSI if it is not cached."""
+        key = (ap, version, index)
+        data = self.blocks.get(key)
+        if data is None:
+            self.log("Reading block {i} of '{p}'...\n".format(i=index, p=ap))
+            data = self.fsi.read_range(ap, index * self.block_size, self.block_size)
+            self.blocks.put(key, data)
+        return data
@@ -17,6 +17,8 @@ _stash = get_stash()
 class LocalFSI(BaseFSI):
     """A FSI for the local filesystem."""
 
+    max_transfers = 4
+
     def __init__(self, logger=None):
         self.logger = logger
         self.path = os.getcwd()
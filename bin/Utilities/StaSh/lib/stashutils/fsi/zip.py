@@ -2,22 +2,38 @@
 """The FSI for zipfiles"""
 import zipfile
 import os
+import posixpath
 import tempfile
-import time
 import shutil
 import datetime
 import stat
+import struct
+import warnings
 
 from io import BytesIO
 
+from stashutils.archives import ZipArchiveWriter
 from stashutils.fsi import base
 from stashutils.fsi import errors
 
 # TODO: check filename bug when writing
 
+# size of the chunks in which members are copied when the archive is rewritten
+COPY_CHUNK_SIZE = 64 * 1024
+# flag bit indicating that a data descriptor follows the compressed data
+_FLAG_DATA_DESCRIPTOR = 0x08
+_DATA_DESCRIPTOR_SIGNATURE = b"PK\x07\x08"
+
 
 class ZipfileFSI(base.BaseFSI):
-    """FSI for zipfiles"""
+    """
+    FSI for zipfiles.
+    The directory tree of the archive is indexed when it is opened, so
+    lookups do not scan the list of members.
+    Removed or replaced members stay in the archive until it is closed
+    (i.e. unmounted), then the archive is rewritten once, copying the
+    compressed data of the remaining members without recompressing it.
+    """
 
     def __init__(self, logger):
         base.BaseFSI.__init__(self, logger)
@@ -25,52 +41,100 @@ class ZipfileFSI(base.BaseFSI):
         self.path = "/"
         self.zf = None
         self.is_new = True
-        self.dirs = ["/"]  # list of dirs with no files in them
+        self._reset_index()
         self.log("Warning: The ZipfileFSI has some unfixed bugs!\n")
         # ^^^ These bugs are beyond my abilities (and they seem to be case
         # dependent)
 
+    def _reset_index(self):
+        """clears the directory index."""
+        # name -> ZipInfo of the current version of each file
+        self._files = {}
+        # dirname -> ZipInfo of directory entries stored in the archive
+        self._dir_infos = {}
+        # dirname -> set of the names of its files and subdirectories.
+        # The root is "", all other paths do not start with a "/".
+        self._children = {"": set()}
+        # header offsets of the members to drop when the archive is closed
+        self._dropped = set()
+
+    def _add_dir(self, path):
+        """adds a directory and its parents to the index."""
+        if path in self._children:
+            return
+        parent, name = posixpath.split(path)
+        self._add_dir(parent)
+        self._children[parent].add(name)
+        self._children[path] = set()
+
+    def _index(self, zipinfo):
+        """adds a member of the archive to the index."""
+        name = zipinfo.filename
+        if name.endswith("/"):
+            path = name.rstrip("/")
+            self._add_dir(path)
+            self._dir_infos[path] = zipinfo
+            return
+        parent, basename = posixpath.split(name)
+        self._add_dir(parent)
+        old = self._files.get(name)
+        if old is not None:
+            # the member has been replaced, only the latest version is kept
+            self._dropped.add(old.header_offset)
+        self._files[name] = zipinfo
+        self._children[parent].add(basename)
+
+    def _unindex(self, path):
+        """removes a file or a directory with all its contents from the index."""
+        parent, basename = posixpath.split(path)
+        if path in self._files:
+            self._dropped.add(self._files.pop(path).header_offset)
+        elif path in self._children and path != "":
+            for child in list(self._children[path]):
+                self._unindex(posixpath.join(path, child))
+            del self._children[path]
+            zipinfo = self._dir_infos.pop(path, None)
+            if zipinfo is not None:
+                self._dropped.add(zipinfo.header_offset)
+        else:
+            raise errors.OperationFailure("Not found!")
+        self._children[parent].discard(basename)
+
     def abspath(self, path):
         """returns the absolute path for path."""
-        p = os.path.join(self.path, path)
+        p = posixpath.normpath(posixpath.join(self.path, path))
         while p.startswith("/"):
             p = p[1:]
-        return p
-
-    def _getdirs(self):
-        """returns a list of all dirs"""
-        dirs = ["/"] + self.dirs
-        for name in self.zf.namelist():
-            dirpath = os.path.dirname(name)
-            if dirpath not in dirs:
-                dirs.append(dirpath)
-        return dirs
-
-    def _update(self, remove=[]):
-        """create a new zipfile with some changes"""
-        nzfp = os.path.join(tempfile.gettempdir(), "tempzip_{t}.zip".format(t=time.time()))
-        op = self.zf.fp.name
-        pswd = self.zf.pwd
+        return p if p != "." else ""
+
+    def _compact(self):
+        """
+        rewrites the archive without the dropped members.
+        The local header and the compressed data of each remaining member
+        are copied as they are, the central directory is written by a
+        ZipArchiveWriter.
+        """
+        op = self.zf.filename
         comment = self.zf.comment
-        nzf = zipfile.ZipFile(nzfp, "w", self.zf.compression, True)
-        infos = self.zf.infolist()
-        for zipinfo in infos:
-            add = True
-            for rm in remove:
-                if zipinfo.filename.startswith(rm):
-                    add = False
-                    break
-            if not add:
-                continue
-            ofo = self.zf.open(zipinfo)
-            nzf.writestr(zipinfo, ofo.read())
+        keep = list(self._files.values()) + list(self._dir_infos.values())
+        keep.sort(key=lambda zi: zi.header_offset)
         self.zf.close()
-        os.remove(op)
-        nzf.close()
-        shutil.copy(nzfp, op)
-        self.zf = zipfile.ZipFile(op, "a", zipfile.ZIP_DEFLATED, True)
-        self.zf.setpassword(pswd)
-        self.zf.comment = comment
+        fd, nzfp = tempfile.mkstemp(prefix="tempzip_", suffix=".zip", dir=os.path.dirname(op))
+        os.close(fd)
+        try:
+            with open(op, "rb") as src, open(nzfp, "wb") as dest:
+                writer = ZipArchiveWriter(dest)
+                for zipinfo in keep:
+                    offset = writer.offset
+                    _copy_member(src, writer, zipinfo)
+                    writer.add(zipinfo, offset)
+                writer.close(comment)
+            shutil.move(nzfp, op)
+        except Exception:
+            if os.path.exists(nzfp):
+                os.remove(nzfp)
+            raise
+        self._dropped.clear()
 
     def connect(self, *args):
         """open the zipfile"""
@@ -87,61 +151,61 @@ class ZipfileFSI(base.BaseFSI):
                 return e.message
             if len(args) == 2:
                 self.zf.setpassword(args[1])
-            return True
         else:
             try:
                 self.zf = zipfile.ZipFile(ap, "w", zipfile.ZIP_DEFLATED, True)
                 self.is_new = True
             except Exception as e:
                 return e.message
-            return True
+        self._reset_index()
+        for zipinfo in self.zf.infolist():
+            self._index(zipinfo)
+        return True
 
     def repr(self):
         """returns a string representing this fsi"""
         template = "{inz} Zipfile at '{p}'"
         inz = "New" if self.is_new else "Open"
-        return template.format(inz=inz, p=self.zf.fp.name)
+        return template.format(inz=inz, p=self.zf.filename)
 
     def listdir(self, path="."):
         ap = self.abspath(path)
-        dirlist = self._getdirs()
-        namelist = self.zf.namelist()
-        names = dirlist + namelist
-        content = []
-        for name in names:
-            dirname = os.path.dirname(name)
-            if dirname == ap:
-                content.append(name.replace(dirname, ""))
-        return content
+        if ap not in self._children:
+            raise errors.OperationFailure("Dir does not exists!")
+        return sorted(self._children[ap])
 
     def cd(self, path):
         np = self.abspath(path)
-        dirs = self._getdirs()
-        if np not in dirs:
+        if np not in self._children:
             raise errors.OperationFailure("Dir does not exists!")
-        self.path = np
+        self.path = "/" + np
 
     def get_path(self):
         return self.path
 
     def remove(self, path):
         ap = self.abspath(path)
-        self._update(remove=[ap])
+        self._unindex(ap)
 
     def mkdir(self, name):
         ap = self.abspath(name)
-        self.dirs.append(ap)
+        if ap in self._children or ap in self._files:
+            raise errors.AlreadyExists("Already exists!")
+        self._add_dir(ap)
 
     def close(self):
-        self.zf.close()
+        if self._dropped:
+            self._compact()
+        else:
+            self.zf.close()
 
     def isdir(self, name):
         ap = self.abspath(name)
-        return ((ap in self._getdirs()) and not self.isfile(name))
+        return ap in self._children
 
     def isfile(self, name):
         ap = self.abspath(name)
-        return (ap in self.zf.namelist())
+        return ap in self._files
 
     def stat(self, name):
         ap = self.abspath(name)
@@ -155,7 +219,7 @@ class ZipfileFSI(base.BaseFSI):
             size = 1
             mtime = None
         else:
-            zipinfo = self.zf.getinfo(ap)
+            zipinfo = self._files[ap]
             size = zipinfo.file_size
             timestamp = zipinfo.date_time
             dt = datetime.datetime(*timestamp)
@@ -169,20 +233,42 @@ class ZipfileFSI(base.BaseFSI):
         ap = self.abspath(name)
         self.log("open {ap} with mode {m}\n".format(ap=ap, m=mode))
         if "r" in mode:
-            try:
-                reader = ZipReader(self, ap, mode, buffering)
-            except:
+            if ap not in self._files:
                 raise errors.OperationFailure("Not found!")
-            else:
-                return reader
+            return ZipReader(self, self._files[ap], mode, buffering)
         elif "w" in mode:
-            if ap in self.zf.namelist():
-                self._update(remove=[ap])
+            if ap in self._children:
+                raise errors.IsDir()
+            # an existing member is replaced when the new one is written
             return ZipWriter(self, ap, mode, buffering)
         else:
             raise errors.OperationFailure("Unsupported mode!")
 
 
+def _copy_member(src, dest, zipinfo):
+    """
+    copies the local header, the compressed data and the data descriptor
+    of a member from one archive file to another.
+    """
+    src.seek(zipinfo.header_offset)
+    header = src.read(zipfile.sizeFileHeader)
+    fields = struct.unpack(zipfile.structFileHeader, header)
+    flags, fname_len, extra_len = fields[3], fields[10], fields[11]
+    length = zipfile.sizeFileHeader + fname_len + extra_len + zipinfo.compress_size
+    if flags & _FLAG_DATA_DESCRIPTOR:
+        src.seek(zipinfo.header_offset + length)
+        has_signature = src.read(4) == _DATA_DESCRIPTOR_SIGNATURE
+        is_zip64 = max(zipinfo.file_size, zipinfo.compress_size) > zipfile.ZIP64_LIMIT
+        length += (4 if has_signature else 0) + 4 + (16 if is_zip64 else 8)
+    src.seek(zipinfo.header_offset)
+    while length > 0:
+        data = src.read(min(length, COPY_CHUNK_SIZE))
+        if not data:
+            raise errors.OperationFailure("Truncated member: {n}".format(n=zipinfo.filename))
+        dest.write(data)
+        length -= len(data)
+
+
 class ZipWriter(object):
     """utility class used for writing to a ZipFile."""
 
@@ -202,7 +288,11 @@ class ZipWriter(object):
         self.closed = True
         content = self.sio.getvalue()
         self.sio.close()
-        self.root.zf.writestr(self.fp, content)
+        with warnings.catch_warnings():
+            # replacing a member is handled by the index
+            warnings.simplefilter("ignore")
+            self.root.zf.writestr(self.fp, content)
+        self.root._index(self.root.zf.getinfo(self.fp))
 
     def __getattr__(self, name):
         return getattr(self.sio, name)
@@ -220,13 +310,13 @@ class ZipWriter(object):
 class ZipReader(ZipWriter):
     """utility class for reading a file from a zip."""
 
-    def __init__(self, root, fp, mode, buffering):
+    def __init__(self, root, zipinfo, mode, buffering):
         self.root = root
-        self.fp = fp
-        self.name = fp
+        self.fp = zipinfo.filename
+        self.name = zipinfo.filename
         self.buffering = buffering
         self.mode = mode
-        self.sio = BytesIO(self.root.zf.read(fp))
+        self.sio = BytesIO(self.root.zf.read(zipinfo))
         self.closed = False
 
     def close(self):
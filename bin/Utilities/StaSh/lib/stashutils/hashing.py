@@ -0,0 +1,268 @@
+# -*- coding: utf-8 -*-
+"""
+The engine of the checksum commands ('md5sum', 'sha1sum' and 'sha256sum').
+Each file is read only once, even if several digests are computed. Files
+are read in large blocks (or mapped into memory) and hashed concurrently
+on a pool of threads; hashlib releases the GIL while hashing, so this
+scales with the number of cores and the speed of the storage.
+"""
+from __future__ import print_function
+
+import argparse
+import hashlib
+import mmap
+import os
+import re
+import sys
+from collections import OrderedDict
+from multiprocessing.pool import ThreadPool
+
+import six
+
+from stashutils.archives import default_threads
+
+# size of the blocks files are read in
+READ_SIZE = 1024 * 1024
+# files at least this large are mapped into memory instead of being read
+MMAP_THRESHOLD = 4 * READ_SIZE
+
+# name used in the tagged output format -> hashlib name
+ALGORITHMS = OrderedDict([
+    ("MD5", "md5"),
+    ("SHA1", "sha1"),
+    ("SHA256", "sha256"),
+])
+
+# 'MD5 (file) = hash'
+_TAGGED_RE = re.compile(r'^(\w+) \((.+)\) = ([0-9a-fA-F]+)$')
+# 'hash  file' or 'hash *file'
+_PLAIN_RE = re.compile(r'^([0-9a-fA-F]+)[ \t]+\*?(.+)$')
+
+
+def new_hashers(algorithms):
+    """returns a list of new hash objects for a list of algorithm names."""
+    return [hashlib.new(ALGORITHMS.get(a.upper(), a)) for a in algorithms]
+
+
+def _update(hashers, data):
+    for h in hashers:
+        h.update(data)
+
+
+def hash_fileobj(fileobj, algorithms):
+    """returns the hexdigests of the data read from fileobj, one for each algorithm."""
+    hashers = new_hashers(algorithms)
+    while True:
+        data = fileobj.read(READ_SIZE)
+        if not data:
+            break
+        if isinstance(data, six.text_type):
+            data = data.encode("utf-8")
+        _update(hashers, data)
+    return [h.hexdigest() for h in hashers]
+
+
+def hash_file(path, algorithms):
+    """returns the hexdigests of the file at path, one for each algorithm."""
+    with open(path, "rb") as f:
+        size = os.fstat(f.fileno()).st_size
+        if size < MMAP_THRESHOLD or not six.PY3:
+            return hash_fileobj(f, algorithms)
+        hashers = new_hashers(algorithms)
+        try:
+            mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        except (mmap.error, ValueError, OSError):
+            # e.g. a special file
+            return hash_fileobj(f, algorithms)
+        try:
+            with memoryview(mm) as view:
+                # hash block by block, so that every digest is updated while
+                # the block is still in the cache
+                for start in range(0, len(view), READ_SIZE):
+                    _update(hashers, view[start:start + READ_SIZE])
+        finally:
+            mm.close()
+        return [h.hexdigest() for h in hashers]
+
+
+def _hash_job(job):
+    """hashes a (path, algorithms) job; returns (path, digests, error)."""
+    path, algorithms = job
+    try:
+        return path, hash_file(path, algorithms), None
+    except (IOError, OSError) as e:
+        return path, None, e
+
+
+def hash_files(jobs, threads=None):
+    """
+    hashes a list of (path, algorithms) jobs concurrently.
+    Yields (path, digests, error) in the order of the jobs, as soon as a
+    file and all the files before it are hashed; digests is None and
+    error the exception if a file could not be read.
+    """
+    jobs = list(jobs)
+    threads = max(1, min(threads or default_threads(), len(jobs)))
+    if threads == 1:
+        for job in jobs:
+            yield _hash_job(job)
+        return
+    pool = ThreadPool(threads)
+    try:
+        for result in pool.imap(_hash_job, jobs):
+            yield result
+    finally:
+        pool.terminate()
+        pool.join()
+
+
+def parse_check_line(line, default_algorithm):
+    """
+    parses a line of a checksum list, either 'hash  file' or 'MD5 (file) = hash'.
+    Returns (algorithm, expected hash, filename) or None if the line is invalid.
+    """
+    line = line.rstrip("\r\n")
+    match = _TAGGED_RE.match(line)
+    if match is not None and match.group(1).upper() in ALGORITHMS:
+        return match.group(1).upper(), match.group(3).lower(), match.group(2)
+    match = _PLAIN_RE.match(line)
+    if match is not None:
+        return default_algorithm.upper(), match.group(1).lower(), match.group(2)
+    return None
+
+
+def check_list(lines, default_algorithm, threads=None):
+    """
+    verifies the lines of a checksum list, printing the result of each line.
+    The files are hashed concurrently, each one only once with all the
+    algorithms listed for it. Returns True if all files passed.
+    """
+    entries = [parse_check_line(line, default_algorithm) for line in lines if line.strip() != ""]
+    # filename -> algorithms listed for it, in the order of the list
+    wanted = OrderedDict()
+    for entry in entries:
+        if entry is not None:
+            algorithms = wanted.setdefault(entry[2], [])
+            if entry[0] not in algorithms:
+                algorithms.append(entry[0])
+    correct = True
+    results = {}
+    i = 0
+    for name, digests, error in hash_files(wanted.items(), threads):
+        results[name] = digests
+        # report the lines whose files are hashed, keeping the order of the list
+        while i < len(entries) and (entries[i] is None or entries[i][2] in results):
+            correct = _report(entries[i], results, wanted) and correct
+            i += 1
+    for entry in entries[i:]:
+        correct = _report(entry, results, wanted) and correct
+    return correct
+
+
+def _report(entry, results, wanted):
+    """prints the result of a line of a checksum list; returns True if it passed."""
+    if entry is None:
+        print('Invalid format.')
+        return False
+    algorithm, expected, name = entry
+    digests = results.get(name)
+    if digests is not None and digests[wanted[name].index(algorithm)] == expected:
+        print(name + ': Pass')
+        return True
+    print(name + ': Fail')
+    return False
+
+
+def _stdin():
+    """returns sys.stdin, binary if possible."""
+    return getattr(sys.stdin, "buffer", sys.stdin)
+
+
+def _print_digests(algorithms, digests, name=None):
+    """prints the digests of name, in the tagged format if there are several."""
+    if len(algorithms) == 1:
+        print(digests[0] if name is None else digests[0] + ' ' + name)
+    else:
+        for algorithm, digest in zip(algorithms, digests):
+            print("{a} ({n}) = {d}".format(a=algorithm, n="-" if name is None else name, d=digest))
+
+
+def _hash_args(args, algorithms, threads):
+    """prints the digests of the files or strings in args; returns True on success."""
+    success = True
+    i = 0
+    while i < len(args):
+        # hash consecutive files together
+        j = i
+        while j < len(args) and os.path.isfile(args[j]):
+            j += 1
+        for path, digests, error in hash_files([(p, algorithms) for p in args[i:j]], threads):
+            if error is not None:
+                print("{p}: {e}".format(p=path, e=error), file=sys.stderr)
+                success = False
+            else:
+                _print_digests(algorithms, digests, path)
+        if j < len(args):
+            if args[j] == "-":
+                _print_digests(algorithms, hash_fileobj(_stdin(), algorithms))
+            else:
+                # TODO: should we realy do this? It does not seem like normal md5sum behavior
+                _print_digests(algorithms, hash_fileobj(six.BytesIO(args[j].encode("utf-8")), algorithms))
+            j += 1
+        i = j
+    return success
+
+
+def main(algorithm, args):
+    """the command line interface of the checksum command for algorithm (e.g. 'md5')."""
+    name = algorithm.lower()
+    ap = argparse.ArgumentParser(prog=name + "sum")
+    ap.add_argument(
+        '-c',
+        '--check',
+        action='store_true',
+        default=False,
+        help='''Check a file with {a} hashes and file names for a match. format: hash filename'''.format(a=name)
+    )
+    ap.add_argument(
+        '-a',
+        '--also',
+        action='append',
+        default=[],
+        choices=[a.lower() for a in ALGORITHMS],
+        help='also compute this digest in the same pass (may be repeated)'
+    )
+    ap.add_argument(
+        '-j',
+        '--jobs',
+        type=int,
+        default=default_threads(),
+        help='number of files hashed in parallel (default: number of cpus)'
+    )
+    ap.add_argument('file', action='store', nargs='*', help='String or file to hash.')
+    ns = ap.parse_args(args)
+    threads = max(1, ns.jobs)
+
+    if ns.check:
+        s = True
+        if ns.file:
+            for arg in ns.file:
+                if os.path.isfile(arg):
+                    with open(arg, "r") as f:
+                        s = check_list(f.readlines(), name, threads) and s
+                else:
+                    print("{p}: no such file".format(p=arg), file=sys.stderr)
+                    s = False
+        else:
+            s = check_list(sys.stdin.read().splitlines(), name, threads)
+    else:
+        algorithms = [name.upper()]
+        for a in ns.also:
+            if a.upper() not in algorithms:
+                algorithms.append(a.upper())
+        if ns.file:
+            s = _hash_args(ns.file, algorithms, threads)
+        else:
+            _print_digests(algorithms, hash_fileobj(_stdin(), algorithms))
+            s = True
+    sys.exit(0 if s else 1)
@@ -20,6 +20,11 @@ class MountError(Exception):
     pass
 
 
+def _split_path(path):
+    """returns the components of an absolute path."""
+    return [c for c in path.split("/") if c]
+
+
 # the manager
 
 
@@ -28,8 +33,27 @@ class MountManager(object):
 	this class keeps track of the FSIs and their position in the filesystem.
 	"""
 
+    # maximum number of resolved paths to remember
+    RESOLVE_CACHE_SIZE = 1024
+
     def __init__(self):
         self.path2fs = {}
+        # trie of the path components of the mountpoints.
+        # Each node is a list of [children, mountpoint or None].
+        self._trie = [{}, None]
+        # path -> result of get_fsi()
+        self._resolved = {}
+
+    def _update_index(self):
+        """rebuilds the mountpoint trie and forgets all resolved paths."""
+        trie = [{}, None]
+        for p in self.path2fs:
+            node = trie
+            for c in _split_path(p):
+                node = node[0].setdefault(c, [{}, None])
+            node[1] = p
+        self._trie = trie
+        self._resolved = {}
 
     def check_patches_enabled(self):
         """checks wether all required patches are enabled."""
@@ -51,17 +75,37 @@ class MountManager(object):
 		otherwise, return (None, path).
 		fsi is a FSI which should be used for the action.
 		relpath is a path which should be used as the path for FSI actions.
+		If mountpoints are nested, the deepest one containing path is used.
 		"""
         path = os.path.abspath(path)
-        i = None
-        for p in self.path2fs:
-            if path.startswith(p):
-                i, readonly = self.path2fs[p]
-                relpath = path.replace(p, "", 1)
-                if not relpath.startswith("/"):
-                    relpath = "/" + relpath
-                return (i, relpath, readonly)
-        return (None, path, False)
+        if not self.path2fs:
+            # nothing mounted, this is the case for almost all calls
+            return (None, path, False)
+        resolved = self._resolved
+        res = resolved.get(path)
+        if res is None:
+            res = self._resolve(path)
+            if len(resolved) >= self.RESOLVE_CACHE_SIZE:
+                resolved.clear()
+            resolved[path] = res
+        return res
+
+    def _resolve(self, path):
+        """looks up the deepest mountpoint containing path in the trie."""
+        components = _split_path(path)
+        node = self._trie
+        mountpoint, depth = node[1], 0
+        for i, c in enumerate(components):
+            node = node[0].get(c)
+            if node is None:
+                break
+            if node[1] is not None:
+                mountpoint, depth = node[1], i + 1
+        if mountpoint is None:
+            return (None, path, False)
+        fsi, readonly = self.path2fs[mountpoint]
+        relpath = "/" + "/".join(components[depth:])
+        return (fsi, relpath, readonly)
 
     def mount_fsi(self, path, fsi, readonly=False):
         """mounts a fsi to a path."""
@@ -75,6 +119,7 @@ class MountManager(object):
         elif not (os.path.exists(path) and os.path.isdir(path)):
             raise MountError("Path does not exists.")
         self.path2fs[path] = (fsi, readonly)
+        self._update_index()
 
     def unmount_fsi(self, path, force=False):
         """unmounts a fsi."""
@@ -88,6 +133,7 @@ class MountManager(object):
             except OperationFailure as e:
                 raise MountError(e.message)
         del self.path2fs[path]  # todo: close files
+        self._update_index()
 
     def get_mounts(self):
         """
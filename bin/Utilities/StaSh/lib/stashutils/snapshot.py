@@ -0,0 +1,136 @@
+# -*- coding: utf-8 -*-
+"""
+Snapshots of a directory tree, used to find out what changed in it.
+A snapshot records the mtime of each directory together with its entries.
+When the tree is scanned again, only directories whose mtime changed are
+listed again; the entries of the other directories are taken from the
+previous snapshot and only stat()ed. Modifying a file does not change the
+mtime of its directory, so files are always stat()ed.
+"""
+import os
+import stat
+
+
+class ChangeSet(object):
+    """
+    The changes between two snapshots.
+    All paths are relative to the root of the snapshots and use '/'.
+    :ivar added_dirs: directories which were created, parents first
+    :ivar added: files which were created
+    :ivar modified: files whose size or mtime changed
+    :ivar removed: files and directories which were removed, children first
+    """
+
+    def __init__(self):
+        self.added_dirs = []
+        self.added = []
+        self.modified = []
+        self.removed = []
+
+    def __bool__(self):
+        return bool(self.added_dirs or self.added or self.modified or self.removed)
+
+    __nonzero__ = __bool__
+
+    def __len__(self):
+        return len(self.added_dirs) + len(self.added) + len(self.modified) + len(self.removed)
+
+    def __repr__(self):
+        return "<ChangeSet added_dirs={d} added={a} modified={m} removed={r}>".format(
+            d=self.added_dirs,
+            a=self.added,
+            m=self.modified,
+            r=self.removed,
+        )
+
+
+class TreeSnapshot(object):
+    """
+    A snapshot of the directory tree at path.
+    :param path: the root of the tree
+    :type path: str
+    :param prev: a previous snapshot of the same tree, whose listings are
+        reused for directories which did not change
+    :type prev: TreeSnapshot or None
+    """
+
+    def __init__(self, path, prev=None):
+        self.path = path
+        # relpath -> (mtime, {name: (is_dir, size, mtime)})
+        self.dirs = {}
+        self.listed = 0
+        self._scan("", prev.dirs if prev is not None else {})
+
+    def _scan(self, relpath, prev_dirs):
+        """records the directory relpath and its subdirectories."""
+        ap = os.path.join(self.path, relpath) if relpath else self.path
+        try:
+            dir_mtime = os.stat(ap).st_mtime
+        except OSError:
+            return
+        prev = prev_dirs.get(relpath)
+        if prev is not None and prev[0] == dir_mtime:
+            names = list(prev[1])
+        else:
+            try:
+                names = os.listdir(ap)
+            except OSError:
+                names = []
+            self.listed += 1
+        entries = {}
+        for name in names:
+            try:
+                st = os.stat(os.path.join(ap, name))
+            except OSError:
+                # removed since the directory was listed
+                continue
+            is_dir = stat.S_ISDIR(st.st_mode)
+            entries[name] = (is_dir, st.st_size, st.st_mtime)
+        self.dirs[relpath] = (dir_mtime, entries)
+        for name, (is_dir, size, mtime) in entries.items():
+            if is_dir:
+                self._scan(_join(relpath, name), prev_dirs)
+
+    def rescan(self):
+        """returns a new snapshot of the tree, reusing unchanged listings of this one."""
+        return TreeSnapshot(self.path, prev=self)
+
+    def compare(self, new):
+        """returns the ChangeSet leading from this snapshot to new."""
+        changes = ChangeSet()
+        self._compare_dir("", new, changes)
+        return changes
+
+    def _compare_dir(self, relpath, new, changes):
+        old_entries = self.dirs.get(relpath, (None, {}))[1]
+        new_entries = new.dirs.get(relpath, (None, {}))[1]
+        for name in sorted(set(old_entries) | set(new_entries)):
+            path = _join(relpath, name)
+            old = old_entries.get(name)
+            cur = new_entries.get(name)
+            if old is not None and cur is not None and old[0] != cur[0]:
+                # a file was replaced by a directory or vice versa
+                self._removed(path, old, changes)
+                old = None
+            if cur is None:
+                self._removed(path, old, changes)
+            elif cur[0]:
+                if old is None:
+                    changes.added_dirs.append(path)
+                self._compare_dir(path, new, changes)
+            elif old is None:
+                changes.added.append(path)
+            elif old[1:] != cur[1:]:
+                changes.modified.append(path)
+
+    def _removed(self, path, entry, changes):
+        """records the removal of path and, if it is a directory, its contents."""
+        if entry[0]:
+            for name, child in sorted(self.dirs.get(path, (None, {}))[1].items()):
+                self._removed(_join(path, name), child, changes)
+        changes.removed.append(path)
+
+
+def _join(relpath, name):
+    """joins a relative path and a name using '/'."""
+    return relpath + "/" + name if relpath else name
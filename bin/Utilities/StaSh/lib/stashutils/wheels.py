@@ -1,8 +1,10 @@
 # -*- coding: utf-8 -*-
 """functions and classes related to wheels."""
 import os
+import sys
 import shutil
-import tempfile
+import base64
+import hashlib
 import json
 import re
 import zipfile
@@ -20,6 +22,13 @@ except ImportError:
     VersionSpecifier = None
 
 
+# size of the blocks written when installing a file
+COPY_BUFSIZE = 64 * 1024
+
+# suffixes of files which can not be imported from a zipfile
+EXTENSION_SUFFIXES = (".so", ".pyd", ".dylib", ".dll")
+
+
 class WheelError(Exception):
     """Error related to a wheel."""
     pass
@@ -119,6 +128,7 @@ def wheel_is_compatible(filename):
 class BaseHandler(object):
     """
     Baseclass for installation handlers.
+    Handlers read the wheel directly from the opened zipfile.
     """
     name = "<name not set>"
 
@@ -126,89 +136,182 @@ class BaseHandler(object):
         self.wheel = wheel
         self.verbose = verbose
 
-    def copytree(self, packagepath, src, dest, remove=False):
-        """
-        Copies a package directory tree.
-        :param packagepath: relative path of the (sub-)package, e.g. 'package/subpackage/'
-        :type packagepath: str
-        :param src: path to the actual source of the root package
-        :type src: str
-        :param dest: path to copy to
-        :type dest: str
-        :return: the path to which the directories have been copied.
-        :trype: str
-        """
-        if self.verbose:
-            print("Copying {s} -> {d}".format(s=src, d=dest))
-        if os.path.isfile(src):
-            if os.path.isdir(dest):
-                dest = os.path.join(dest, os.path.basename(src))
-            if os.path.exists(dest) and remove:
-                os.remove(dest)
-            shutil.copy(src, dest)
-            return dest
-        else:
-            target = os.path.join(
-                dest,
-                # os.path.basename(os.path.normpath(src)),
-                packagepath,
-            )
-            if os.path.exists(target) and remove:
-                shutil.rmtree(target)
-            shutil.copytree(src, target)
-            return target
-
     @property
     def distinfo_name(self):
         """the name of the *.dist-info directory."""
-        data = parse_wheel_name(self.wheel.filename)
-        return "{pkg}-{v}.dist-info".format(
-            pkg=data["distribution"],
-            v=data["version"],
-        )
+        return self.wheel.distinfo_name
+
+    def read_distinfo(self, zf, name):
+        """
+        Read a file of the *.dist-info directory.
+        :param zf: the zipfile of the wheel
+        :type zf: zipfile.ZipFile
+        :param name: name of the file, e.g. 'METADATA'
+        :type name: str
+        :return: the content of the file or None if it does not exist
+        :rtype: str or None
+        """
+        try:
+            data = zf.read(self.distinfo_name + "/" + name)
+        except KeyError:
+            return None
+        return data.decode("utf-8")
 
 
 class TopLevelHandler(BaseHandler):
-    """Handler for 'top_level.txt'"""
+    """
+    Handler for 'top_level.txt'.
+    The top level packages and the *.dist-info directory are streamed from
+    the zipfile to their final location, without extracting the wheel first.
+    Each file written is recorded for the 'RECORD' file.
+    """
     name = "top_level.txt installer"
 
-    def handle_install(self, src, dest):
-        tltxtp = os.path.join(src, self.distinfo_name, "top_level.txt")
-        files_installed = []
-        if not os.path.exists(tltxtp):
-            files = os.listdir(src)
-            fin = [file_name for file_name in files if file_name != self.distinfo_name]
+    def _members(self, zf):
+        """returns a list of (ZipInfo, path relative to site-packages) of the files in the wheel."""
+        data_prefix = self.wheel.data_name + "/"
+        members = []
+        for info in zf.infolist():
+            name = info.filename
+            if name.startswith(data_prefix):
+                scheme, _, path = name[len(data_prefix):].partition("/")
+                if scheme in ("purelib", "platlib") and path:
+                    members.append((info, path))
+                # other schemes (scripts, headers, data) are not supported
+            else:
+                members.append((info, name))
+        return members
+
+    def _remove(self, path):
+        if os.path.isdir(path) and not os.path.islink(path):
+            shutil.rmtree(path)
+        elif os.path.lexists(path):
+            os.remove(path)
+
+    def handle_install(self, zf, dest):
+        if self.wheel.zip_import:
+            return self.install_archive(dest)
+        members = self._members(zf)
+        paths = set(path.rstrip("/") for info, path in members)
+        toplevel = set(path.split("/")[0] for path in paths)
+        content = self.read_distinfo(zf, "top_level.txt")
+        if content is None:
+            fin = sorted(name for name in toplevel if name != self.distinfo_name)
             print('No top_level.txt, try to fix this.', fin)
         else:
-            with open(tltxtp, "r") as f:
-                fin = f.readlines()
-        for pkg_name in fin:
-            pure = pkg_name.replace("\r", "").replace("\n", "")
-            sp = os.path.join(src, pure)
-            if os.path.exists(sp):
-                p = self.copytree(pure, sp, dest, remove=True)
-            elif os.path.exists(sp + ".py"):
-                dp = os.path.join(dest, pure + ".py")
-                p = self.copytree(pure, sp + ".py", dp, remove=True)
+            fin = [line.strip() for line in content.splitlines() if line.strip()]
+        targets = []
+        for pure in fin:
+            if pure in paths or any(path.startswith(pure + "/") for path in paths):
+                targets.append(pure)
+            elif pure + ".py" in paths:
+                targets.append(pure + ".py")
             else:
                 raise WheelError("top_level.txt entry '{e}' not found in toplevel directory!".format(e=pure))
+        targets.append(self.distinfo_name)
+
+        files_installed = []
+        for target in targets:
+            p = os.path.join(dest, *target.split("/"))
+            if self.verbose:
+                print("Installing {t} -> {d}".format(t=target, d=p))
+            self._remove(p)
             files_installed.append(p)
+        root = os.path.join(os.path.normpath(dest), "")
+        for info, path in members:
+            if not any(path == target or path.startswith(target + "/") for target in targets):
+                continue
+            p = os.path.normpath(os.path.join(dest, *path.split("/")))
+            if not p.startswith(root):
+                raise WheelError("Invalid path in wheel: '{p}'!".format(p=info.filename))
+            if path.endswith("/"):
+                if not os.path.isdir(p):
+                    os.makedirs(p)
+                continue
+            parent = os.path.dirname(p)
+            if not os.path.isdir(parent):
+                os.makedirs(parent)
+            digest, size = self.stream(zf, info, p)
+            self.wheel.record.append((path, digest, size))
         return files_installed
 
+    def stream(self, zf, info, path):
+        """
+        Write a member of the zipfile to path.
+        :return: tuple of (digest as written to 'RECORD', size)
+        :rtype: tuple of (str, int)
+        """
+        h = hashlib.sha256()
+        size = 0
+        fin = zf.open(info)
+        try:
+            with open(path, "wb") as fout:
+                while True:
+                    data = fin.read(COPY_BUFSIZE)
+                    if not data:
+                        break
+                    h.update(data)
+                    fout.write(data)
+                    size += len(data)
+        finally:
+            fin.close()
+        digest = base64.urlsafe_b64encode(h.digest()).rstrip(b"=").decode("ascii")
+        return "sha256=" + digest, size
+
+    def install_archive(self, dest):
+        """
+        Install the wheel as an archive imported with zipimport.
+        The wheel is copied into dest and added to sys.path by a '.pth' file.
+        """
+        p = os.path.join(dest, self.wheel.filename)
+        if self.verbose:
+            print("Copying {s} -> {d}".format(s=self.wheel.path, d=p))
+        if os.path.abspath(self.wheel.path) != os.path.abspath(p):
+            shutil.copyfile(self.wheel.path, p)
+        pthp = os.path.join(dest, self.wheel.distribution + ".pth")
+        with open(pthp, "w") as fout:
+            fout.write(u"{f}\n".format(f=self.wheel.filename))
+        if p not in sys.path:
+            sys.path.append(p)
+        return [p, pthp]
+
+
+class RecordHandler(BaseHandler):
+    """Handler generating the 'RECORD' file of the installed files."""
+    name = "RECORD generator"
+
+    def handle_install(self, zf, dest):
+        if self.wheel.zip_import or not self.wheel.record:
+            return
+        recordp = self.distinfo_name + "/RECORD"
+        lines = []
+        for path, digest, size in self.wheel.record + [(recordp, "", "")]:
+            if path == recordp and digest:
+                # the RECORD of the wheel is replaced
+                continue
+            if "," in path or '"' in path:
+                path = '"' + path.replace('"', '""') + '"'
+            lines.append(u"{p},{d},{s}\n".format(p=path, d=digest, s=size))
+        with open(os.path.join(dest, self.distinfo_name, "RECORD"), "w", encoding="utf-8") as fout:
+            fout.writelines(lines)
+
 
 class ConsoleScriptsHandler(BaseHandler):
     """Handler for 'console_scripts'."""
     name = "console_scripts installer"
 
-    def handle_install(self, src, dest):
-        eptxtp = os.path.join(src, self.distinfo_name, "entry_points.txt")
-        if not os.path.exists(eptxtp):
+    def handle_install(self, zf, dest):
+        content = self.read_distinfo(zf, "entry_points.txt")
+        if content is None:
             if self.verbose:
                 print("No entry_points.txt found, skipping.")
             return
         parser = configparser.ConfigParser()
         try:
-            parser.read(eptxtp)
+            if six.PY3:
+                parser.read_string(content)
+            else:
+                parser.readfp(six.StringIO(content))
         except configparser.MissingSectionHeaderError:
             # print message and return
             if self.verbose:
@@ -226,10 +329,9 @@ class ConsoleScriptsHandler(BaseHandler):
 
         files_installed = []
 
-        mdp = os.path.join(src, self.distinfo_name, "metadata.json")
-        if os.path.exists(mdp):
-            with open(mdp, "r") as fin:
-                desc = json.load(fin).get("summary", "???")
+        metadata = self.read_distinfo(zf, "metadata.json")
+        if metadata is not None:
+            desc = json.loads(metadata).get("summary", "???")
         else:
             desc = "???"
 
@@ -262,27 +364,24 @@ class WheelInfoHandler(BaseHandler):
     supported_major_versions = [1]
     supported_versions = ["1.0"]
 
-    def handle_install(self, src, dest):
-        wtxtp = os.path.join(src, self.distinfo_name, "WHEEL")
-        with open(wtxtp, "r") as fin:
-            for line in fin:
-                line = line.replace("\r", "").replace("\n", "")
-                ki = line.find(":")
-                key = line[:ki]
-                value = line[ki + 2:]
-
-                if key.lower() == "wheel-version":
-                    major, minor = value.split(".")
-                    major, minor = int(major), int(minor)
-                    if major not in self.supported_major_versions:
-                        raise WheelError("Wheel major version is incompatible!")
-                    if value not in self.supported_versions:
-                        print("WARNING: unsupported minor version: " + str(value))
-                    self.wheel.version = (major, minor)
-
-                elif key.lower() == "generator":
-                    if self.verbose:
-                        print("Wheel generated by: " + value)
+    def handle_install(self, zf, dest):
+        for line in (self.read_distinfo(zf, "WHEEL") or "").splitlines():
+            ki = line.find(":")
+            key = line[:ki]
+            value = line[ki + 2:]
+
+            if key.lower() == "wheel-version":
+                major, minor = value.split(".")
+                major, minor = int(major), int(minor)
+                if major not in self.supported_major_versions:
+                    raise WheelError("Wheel major version is incompatible!")
+                if value not in self.supported_versions:
+                    print("WARNING: unsupported minor version: " + str(value))
+                self.wheel.version = (major, minor)
+
+            elif key.lower() == "generator":
+                if self.verbose:
+                    print("Wheel generated by: " + value)
         return []
 
 
@@ -292,14 +391,14 @@ class DependencyHandler(BaseHandler):
     """
     name = "dependency handler"
 
-    def handle_install(self, src, dest):
-        metajsonp = os.path.join(src, self.distinfo_name, "metadata.json")
-        metadatap = os.path.join(src, self.distinfo_name, "METADATA")
-        if not os.path.exists(metajsonp):
-            if os.path.exists(metadatap):
+    def handle_install(self, zf, dest):
+        metajson = self.read_distinfo(zf, "metadata.json")
+        if metajson is None:
+            metadata = self.read_distinfo(zf, "METADATA")
+            if metadata is not None:
                 if self.verbose:
                     print("Reading 'METADATA' file...")
-                dependencies = self.read_dependencies_from_METADATA(metadatap)
+                dependencies = self.read_dependencies_from_METADATA(metadata)
             else:
                 if self.verbose:
                     print("Warning: could find neither 'metadata.json' nor `METADATA`, can not detect dependencies!")
@@ -307,8 +406,7 @@ class DependencyHandler(BaseHandler):
         else:
             if self.verbose:
                 print("Reading 'metadata.json' file...")
-            with open(metajsonp, "r") as fin:
-                content = json.load(fin)
+            content = json.loads(metajson)
             dependencies = []
             for ds in content.get("run_requires", []):
                 ex = ds.get("extra", None)
@@ -325,46 +423,46 @@ class DependencyHandler(BaseHandler):
                     dependencies += dep
         self.wheel.dependencies += dependencies
 
-    def read_dependencies_from_METADATA(self, p):
-        """read dependencies from distinfo/METADATA"""
+    def read_dependencies_from_METADATA(self, content):
+        """read dependencies from the content of distinfo/METADATA"""
         dependencies = []
-        with open(p, "r", encoding='utf-8') as fin:
-            for line in fin:
-                line = line.replace("\n", "")
-                if line.startswith("Requires-Dist: "):
-                    t = line[len("Requires-Dist: "):]
-                    if ";" in t:
-                        es = t[t.find(";") + 1:].replace('"', "").replace("'", "")
-                        t = t[:t.find(";")].strip()
-                        if VersionSpecifier is None:
-                            # libversion not found
-                            print(
-                                "Warning: could not import libversion.VersionSpecifier! Ignoring version and extra dependencies."
-                            )
-                            rq, v, extras = "<libversion not found>", "???", []
-                        else:
-                            rq, v, extras = VersionSpecifier.parse_requirement(es)
-                        if rq == "python_version":
-                            # handle python version dependencies
-                            if not v.match(platform.python_version()):
-                                # dependency NOT required
-                                continue
-                        elif rq == "extra":
-                            # handle extra dependencies
-                            matched = any([v.match(e) for e in self.wheel.extras])
-                            if not matched:
-                                # dependency NOT required
-                                continue
-                            else:
-                                if self.verbose:
-                                    print("Adding dependencies for extras...")
+        for line in content.splitlines():
+            line = line.replace("\n", "")
+            if line.startswith("Requires-Dist: "):
+                t = line[len("Requires-Dist: "):]
+                if ";" in t:
+                    es = t[t.find(";") + 1:].replace('"', "").replace("'", "")
+                    t = t[:t.find(";")].strip()
+                    if VersionSpecifier is None:
+                        # libversion not found
+                        print(
+                            "Warning: could not import libversion.VersionSpecifier! Ignoring version and extra dependencies."
+                        )
+                        rq, v, extras = "<libversion not found>", "???", []
+                    else:
+                        rq, v, extras = VersionSpecifier.parse_requirement(es)
+                    if rq == "python_version":
+                        # handle python version dependencies
+                        if not v.match(platform.python_version()):
+                            # dependency NOT required
+                            continue
+                    elif rq == "extra":
+                        # handle extra dependencies
+                        matched = any([v.match(e) for e in self.wheel.extras])
+                        if not matched:
+                            # dependency NOT required
+                            continue
                         else:
-                            # unknown requirement for dependency
-                            # warn user and register the dependency
-                            print("Warning: unknown dependency requirement: '{}'".format(rq))
-                            print("Warning: Adding dependency '{}', ignoring requirements for dependency.".format(t))
-                            # do not do anything here- As long as we dont use 'continue', 'break', ... the dependency will be added.
-                    dependencies.append(t)
+                            if self.verbose:
+                                print("Adding dependencies for extras...")
+                    else:
+                        # unknown requirement for dependency
+                        # warn user and register the dependency
+                        print("Warning: unknown dependency requirement: '{}'".format(rq))
+                        print("Warning: Adding dependency '{}', ignoring requirements for dependency.".format(t))
+                        # do not do anything here- As long as we dont use 'continue', 'break', ...
+                        # the dependency will be added.
+                dependencies.append(t)
         return dependencies
 
 
@@ -373,14 +471,20 @@ DEFAULT_HANDLERS = [
     WheelInfoHandler,
     DependencyHandler,
     TopLevelHandler,
+    RecordHandler,
     ConsoleScriptsHandler,
 ]
 
 
 class Wheel(object):
-    """class for installing python wheels."""
+    """
+    class for installing python wheels.
+    The files are written directly from the archive to their final location.
+    If zip_import is True and the wheel is pure python, the wheel itself is
+    installed and imported using zipimport.
+    """
 
-    def __init__(self, path, handlers=DEFAULT_HANDLERS, extras=[], verbose=False):
+    def __init__(self, path, handlers=DEFAULT_HANDLERS, extras=[], verbose=False, zip_import=False):
         self.path = path
         self.extras = extras
         self.verbose = verbose
@@ -388,55 +492,77 @@ class Wheel(object):
         self.handlers = [handler(self, self.verbose) for handler in handlers]
         self.version = None  # to be set by handler
         self.dependencies = []  # to be set by handler
+        self.record = []  # (path, digest, size) of the files written, to be set by handler
+        self.zip_import = zip_import
 
         if not wheel_is_compatible(self.filename):
             raise WheelError("Incompatible wheel: {p}!".format(p=self.filename))
+        info = parse_wheel_name(self.filename)
+        self.distribution = info["distribution"]
+        self.data_name = "{d}-{v}.data".format(d=info["distribution"], v=info["version"])
+        self.distinfo_name = "{d}-{v}.dist-info".format(d=info["distribution"], v=info["version"])
 
     def install(self, targetdir):
         """
         Install the wheel into the target directory.
         Return (files_installed, dependencies)
         """
-        if self.verbose:
-            print("Extracting wheel..")
-        tp = self.extract_into_temppath()
-        if self.verbose:
-            print("Extraction finished, running handlers...")
-        try:
-            files_installed = []
+        files_installed = []
+        with zipfile.ZipFile(self.path, mode="r") as zf:
+            self.distinfo_name = self.find_distinfo(zf)
+            if self.zip_import and not self.is_zip_importable(zf):
+                print("{f} is not pure python, installing it normally.".format(f=self.filename))
+                self.zip_import = False
             for handler in self.handlers:
                 if hasattr(handler, "handle_install"):
                     if self.verbose:
                         print("Running handler '{h}'...".format(h=getattr(handler, "name", "<unknown>")))
-                    tfi = handler.handle_install(tp, targetdir)
+                    tfi = handler.handle_install(zf, targetdir)
                     if tfi is not None:
                         files_installed += tfi
-        finally:
-            if self.verbose:
-                print("Cleaning up...")
-            if os.path.exists(tp):
-                shutil.rmtree(tp)
         return (files_installed, self.dependencies)
 
-    def extract_into_temppath(self):
+    def find_distinfo(self, zf):
         """
-        Extract the wheel into a temporary directory.
-        Return the path of the temporary directory.
+        Return the name of the *.dist-info directory in the wheel.
+        Some wheels do not normalize the name like their filename does.
         """
-        p = os.path.join(tempfile.gettempdir(), "wheel_tmp", self.filename)
-        if not os.path.exists(p):
-            os.makedirs(p)
-
-        with zipfile.ZipFile(self.path, mode="r") as zf:
-            zf.extractall(p)
-
-        return p
+        names = set(name.split("/")[0] for name in zf.namelist())
+        if self.distinfo_name in names:
+            return self.distinfo_name
+        for name in sorted(names):
+            if name.endswith(".dist-info") and name.lower() == self.distinfo_name.lower():
+                return name
+        candidates = sorted(name for name in names if name.endswith(".dist-info"))
+        if len(candidates) == 1:
+            return candidates[0]
+        raise WheelError("Could not find the .dist-info directory of {f}!".format(f=self.filename))
+
+    def is_zip_importable(self, zf):
+        """
+        Check whether the wheel can be imported from the archive.
+        This requires a pure python wheel without extension modules or .data directory.
+        """
+        try:
+            content = zf.read(self.distinfo_name + "/WHEEL").decode("utf-8")
+        except KeyError:
+            return False
+        purelib = False
+        for line in content.splitlines():
+            key, _, value = line.partition(":")
+            if key.strip().lower() == "root-is-purelib":
+                purelib = value.strip().lower() == "true"
+        if not purelib:
+            return False
+        for name in zf.namelist():
+            if name.startswith(self.data_name + "/") or name.endswith(EXTENSION_SUFFIXES):
+                return False
+        return True
 
 
 if __name__ == "__main__":
     # test script
     import argparse
-    import sys
     parser = argparse.ArgumentParser(description="Wheel debug installer")
     parser.add_argument("path", help="path to .whl", action="store")
     parser.add_argument("-q", help="be less verbose", action="store_false", dest="verbose")
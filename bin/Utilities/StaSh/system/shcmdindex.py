@@ -0,0 +1,140 @@
+# -*- coding: utf-8 -*-
+"""
+Index of the commands found in the BIN_PATH directories
+"""
+import os
+import threading
+
+# extensions of executable scripts, in order of precedence
+SCRIPT_EXTENSIONS = ('.py', '.sh')
+
+
+class ShDirectoryIndex(object):
+    """
+    The commands found in a single directory at the time of its last modification.
+    :param path: absolute path of the directory
+    :type path: str
+    :param mtime: modification time of the directory when it was scanned
+    :type mtime: float
+    """
+
+    def __init__(self, path, mtime):
+        self.path = path
+        self.mtime = mtime
+        # command name (with or without extension) -> file name
+        self.commands = {}
+        # names of subdirectories
+        self.directories = set()
+        # file names of all scripts, used for completion
+        self.script_names = []
+
+        script_commands = {}
+        for f in os.listdir(path):
+            if os.path.isdir(os.path.join(path, f)):
+                self.directories.add(f)
+                continue
+            self.commands[f] = f
+            stem, ext = os.path.splitext(f)
+            if ext in SCRIPT_EXTENSIONS:
+                self.script_names.append(f)
+                if stem not in script_commands or ext == SCRIPT_EXTENSIONS[0]:
+                    script_commands[stem] = f
+        # an exact name match takes precedence over a match with extension
+        for stem, f in script_commands.items():
+            self.commands.setdefault(stem, f)
+
+    def find(self, name):
+        """
+        Return the file name for a command or None if there is none.
+        """
+        return self.commands.get(name)
+
+    def is_directory(self, name):
+        """
+        Return True if the command name refers to a subdirectory.
+        """
+        for ext in ('', ) + SCRIPT_EXTENSIONS:
+            if name + ext in self.directories:
+                return True
+        return False
+
+
+class ShCommandIndex(object):
+    """
+    This class caches the commands of the BIN_PATH directories, so that
+    looking up a command or completing a command name does not need to
+    list the directories every time.
+    A directory is scanned again once its modification time changes,
+    i.e. when a file is added, removed or renamed.
+    """
+
+    def __init__(self):
+        self._directories = {}
+        self._lock = threading.Lock()
+
+    def clear(self):
+        """
+        Forget all scanned directories.
+        """
+        with self._lock:
+            self._directories.clear()
+
+    def get_directory(self, path):
+        """
+        Return the index of a directory, scanning it if it changed.
+        :param path: path of the directory
+        :type path: str
+        :return: the directory index or None if the directory does not exist
+        :rtype: ShDirectoryIndex or None
+        """
+        path = os.path.abspath(os.path.expanduser(path))
+        try:
+            mtime = os.stat(path).st_mtime
+        except OSError:
+            return None
+        index = self._directories.get(path)
+        if index is None or index.mtime != mtime:
+            try:
+                index = ShDirectoryIndex(path, mtime)
+            except OSError:
+                # not a directory or not readable
+                return None
+            with self._lock:
+                self._directories[path] = index
+        return index
+
+    def find(self, paths, name):
+        """
+        Find a command in a list of directories.
+        :param paths: directories to search, in order
+        :type paths: list of str
+        :param name: name of the command
+        :type name: str
+        :return: (path of the script or None, whether a directory matched)
+        :rtype: tuple
+        """
+        dir_match_found = False
+        for path in paths:
+            index = self.get_directory(path)
+            if index is None:
+                continue
+            f = index.find(name)
+            if f is not None:
+                return os.path.join(index.path, f), dir_match_found
+            if index.is_directory(name):
+                dir_match_found = True
+        return None, dir_match_found
+
+    def get_script_names(self, paths):
+        """
+        Return the file names of all scripts in a list of directories.
+        :param paths: directories to search
+        :type paths: list of str
+        :rtype: list of str
+        """
+        all_names = []
+        for path in paths:
+            index = self.get_directory(path)
+            if index is not None:
+                all_names.extend(index.script_names)
+        return all_names
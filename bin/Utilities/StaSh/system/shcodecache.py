@@ -0,0 +1,177 @@
+# -*- coding: utf-8 -*-
+"""
+Cache for the compiled code of python scripts run by StaSh
+"""
+import os
+import io
+import hashlib
+import logging
+import marshal
+import threading
+from collections import OrderedDict
+
+try:
+    from importlib.util import MAGIC_NUMBER
+except ImportError:
+    import imp
+    MAGIC_NUMBER = imp.get_magic()
+
+from .shcommon import _STASH_ROOT, _STASH_CODE_CACHE_DIR
+
+
+class ShCodeCache(object):
+    """
+    This class caches the code objects of the python scripts run by StaSh,
+    so that commands executed many times, e.g. from a .sh script or xargs,
+    are only read and compiled once.
+    Entries are keyed by the absolute path of the script and are only valid
+    while the mtime, ctime and size of the file do not change. The least
+    recently used entries are dropped once more than code_cache_size are
+    cached.
+    If persistent_code_cache is set, the compiled code is also stored on disk
+    so that it survives a restart of StaSh. The same limit applies to the
+    files on disk, the least recently used ones are removed.
+    :param stash: the StaSh core
+    :type stash: StaSh
+    """
+
+    def __init__(self, stash, cache_dir=None):
+        self.stash = stash
+        self.logger = logging.getLogger('StaSh.CodeCache')
+        self.code_cache_size = stash.config.getint('system', 'code_cache_size')
+        self.persistent_code_cache = stash.config.getint('system', 'persistent_code_cache')
+        self.cache_dir = cache_dir or os.path.join(_STASH_ROOT, _STASH_CODE_CACHE_DIR)
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._entries)
+
+    def clear(self):
+        """
+        Remove all entries from the memory cache.
+        """
+        with self._lock:
+            self._entries.clear()
+
+    def get_code(self, filename):
+        """
+        Return the code object for a python script, compiling it if needed.
+        :param filename: path of the script
+        :type filename: str
+        :return: the compiled code
+        :rtype: code
+        """
+        path = os.path.abspath(filename)
+        if self.code_cache_size <= 0:
+            return self.compile(path)
+
+        st = os.stat(path)
+        # the ctime also changes when the mtime of an edited file is restored
+        stamp = (st.st_mtime, st.st_ctime, st.st_size)
+        with self._lock:
+            entry = self._entries.pop(path, None)
+            if entry is not None and entry[0] == stamp:
+                self._entries[path] = entry  # most recently used goes last
+                return entry[1]
+
+        code = None
+        if self.persistent_code_cache:
+            code = self._load(path, stamp)
+        if code is None:
+            code = self.compile(path)
+            if self.persistent_code_cache:
+                self._dump(path, stamp, code)
+
+        with self._lock:
+            self._entries[path] = (stamp, code)
+            while len(self._entries) > self.code_cache_size:
+                self._entries.popitem(last=False)
+        return code
+
+    @staticmethod
+    def compile(path):
+        """
+        Read and compile a python script.
+        :param path: path of the script
+        :type path: str
+        :return: the compiled code
+        :rtype: code
+        """
+        with io.open(path, "rb") as f:
+            content = f.read()
+        return compile(content, path, "exec", dont_inherit=True)
+
+    def _get_cache_path(self, path):
+        """
+        Return the path of the on-disk cache file for a script.
+        """
+        name = hashlib.sha1(path.encode('utf-8')).hexdigest()
+        return os.path.join(self.cache_dir, name + '.stashc')
+
+    def _load(self, path, stamp):
+        """
+        Load the compiled code of a script from disk.
+        Return None if it is missing or outdated.
+        """
+        cache_path = self._get_cache_path(path)
+        try:
+            with io.open(cache_path, "rb") as f:
+                magic, cached_path, cached_stamp, code = marshal.loads(f.read())
+        except (IOError, OSError, EOFError, ValueError, TypeError):
+            return None
+        if magic != MAGIC_NUMBER or cached_path != path or tuple(cached_stamp) != stamp:
+            return None
+        try:
+            # the mtime of the cache file marks when it was last used
+            os.utime(cache_path, None)
+        except (IOError, OSError):
+            pass
+        return code
+
+    def _dump(self, path, stamp, code):
+        """
+        Store the compiled code of a script on disk.
+        Failing to do so is not an error, the script is just compiled again.
+        """
+        cache_path = self._get_cache_path(path)
+        tmp_path = '{}.{}.tmp'.format(cache_path, threading.current_thread().ident)
+        try:
+            if not os.path.isdir(self.cache_dir):
+                os.makedirs(self.cache_dir)
+            with io.open(tmp_path, "wb") as f:
+                f.write(marshal.dumps((MAGIC_NUMBER, path, stamp, code)))
+            # write to a temporary file first so that readers never see a partial file
+            if os.path.exists(cache_path):
+                os.remove(cache_path)
+            os.rename(tmp_path, cache_path)
+        except (IOError, OSError) as e:
+            self.logger.debug('could not write code cache for %s: %s' % (path, e))
+            return
+        self._evict()
+
+    def _evict(self):
+        """
+        Remove the least recently used files from the on-disk cache, so that
+        at most code_cache_size are kept.
+        """
+        try:
+            names = [name for name in os.listdir(self.cache_dir) if name.endswith('.stashc')]
+        except (IOError, OSError):
+            return
+        if len(names) <= self.code_cache_size:
+            return
+        files = []
+        for name in names:
+            path = os.path.join(self.cache_dir, name)
+            try:
+                files.append((os.path.getmtime(path), path))
+            except (IOError, OSError):
+                # removed by another thread
+                pass
+        files.sort()
+        for mtime, path in files[:len(files) - self.code_cache_size]:
+            try:
+                os.remove(path)
+            except (IOError, OSError):
+                pass
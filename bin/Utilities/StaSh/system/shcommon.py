@@ -55,6 +55,7 @@ K_CC, K_CD, K_HUP, K_HDN, K_LEFT, K_RIGHT, K_CU, K_TAB, K_HIST, K_CZ, K_KB = ran
 _STASH_ROOT = os.path.realpath(os.path.abspath(os.path.dirname(os.path.dirname(__file__))))
 _STASH_CONFIG_FILES = ('.stash_config', 'stash.cfg')
 _STASH_HISTORY_FILE = '.stash_history'
+_STASH_CODE_CACHE_DIR = '.stash_code_cache'
 
 # directory for stash extensions
 _STASH_EXTENSION_PATH = os.path.abspath(os.path.join(os.getenv("HOME"), "Documents", "stash_extensions"), )
@@ -231,13 +232,20 @@ class ShBadSubstitution(Exception):
 
 
 class ShSyntaxError(Exception):
-    pass
+    def __init__(self, msg, loc=0, pstr=''):
+        super(ShSyntaxError, self).__init__(msg)
+        self.loc = loc  # position of the error in pstr
+        self.pstr = pstr
 
 
 class ShInternalError(Exception):
     pass
 
 
+class ShBrokenPipe(IOError):
+    pass
+
+
 class Control(object):
     """
         pyte.control
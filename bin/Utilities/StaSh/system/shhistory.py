@@ -3,20 +3,168 @@
 StaSh input history
 """
 from io import open
+from collections import deque
 import json
+import os
 
 from .shcommon import ShEventNotFound
 
 
+class ShHistoryBuffer(object):
+    """
+    A single history, stored in a ring buffer of fixed capacity.
+    Every entry gets a sequence number, the entry with sequence number n
+    is stored in slot n % capacity. The entries are indexed by their
+    prefixes and by their trigrams (substrings of length 3), so that
+    prefix and substring searches do not need to scan the whole history.
+    :param maxsize: maximum number of entries
+    :type maxsize: int
+    :param entries: initial entries, oldest first
+    :type entries: iterable of str
+    """
+
+    # prefixes up to this length are indexed
+    PREFIX_LENGTH = 8
+    # length of the substrings indexed for substring search
+    NGRAM_LENGTH = 3
+
+    def __init__(self, maxsize, entries=()):
+        self.capacity = max(0, maxsize)
+        self._slots = [None] * self.capacity
+        # sequence number of the oldest entry and of the next one to add
+        self._start = 0
+        self._end = 0
+        # prefix/ngram -> sequence numbers of the entries containing it, oldest first
+        self._prefixes = {}
+        self._ngrams = {}
+        for entry in entries:
+            self.append(entry)
+
+    def __len__(self):
+        return self._end - self._start
+
+    def __iter__(self):
+        """
+        Iterate over the entries, oldest first.
+        """
+        for seq in range(self._start, self._end):
+            yield self._slots[seq % self.capacity]
+
+    def __repr__(self):
+        return repr(list(self))
+
+    def _keys(self, entry):
+        """
+        Return the prefix and ngram index keys of an entry.
+        """
+        prefixes = [entry[:i] for i in range(1, min(len(entry), self.PREFIX_LENGTH) + 1)]
+        n = self.NGRAM_LENGTH
+        ngrams = set(entry[i:i + n] for i in range(len(entry) - n + 1))
+        return prefixes, ngrams
+
+    def append(self, entry):
+        """
+        Add an entry, dropping the oldest one if the buffer is full.
+        """
+        if self.capacity == 0:
+            return
+        if len(self) == self.capacity:
+            self._drop_oldest()
+        seq = self._end
+        self._slots[seq % self.capacity] = entry
+        self._end += 1
+        prefixes, ngrams = self._keys(entry)
+        for prefix in prefixes:
+            self._prefixes.setdefault(prefix, deque()).append(seq)
+        for ngram in ngrams:
+            self._ngrams.setdefault(ngram, deque()).append(seq)
+
+    def _drop_oldest(self):
+        seq = self._start
+        entry = self._slots[seq % self.capacity]
+        self._slots[seq % self.capacity] = None
+        self._start += 1
+        # the oldest entry is always the first one in the index deques
+        prefixes, ngrams = self._keys(entry)
+        for index, keys in ((self._prefixes, prefixes), (self._ngrams, ngrams)):
+            for key in keys:
+                seqs = index[key]
+                seqs.popleft()
+                if not seqs:
+                    del index[key]
+
+    def get(self, idx):
+        """
+        Return an entry by its position, the oldest entry being 0.
+        """
+        if not 0 <= idx < len(self):
+            raise IndexError(idx)
+        return self._slots[(self._start + idx) % self.capacity]
+
+    def get_newest(self, idx):
+        """
+        Return an entry by its position, the newest entry being 0.
+        """
+        if not 0 <= idx < len(self):
+            raise IndexError(idx)
+        return self._slots[(self._end - 1 - idx) % self.capacity]
+
+    def find_prefix(self, prefix):
+        """
+        Find the newest entry starting with prefix.
+        :return: position of the entry, the newest being 0, or -1 if none matches
+        :rtype: int
+        """
+        if not prefix:
+            return 0 if len(self) else -1
+        seqs = self._prefixes.get(prefix[:self.PREFIX_LENGTH], ())
+        for seq in reversed(seqs):
+            if self._slots[seq % self.capacity].startswith(prefix):
+                return self._end - 1 - seq
+        return -1
+
+    def find_substring(self, substring, start=0):
+        """
+        Find the newest entry containing substring, starting at a position.
+        :param start: position to start searching from, the newest entry being 0
+        :type start: int
+        :return: position of the entry, the newest being 0, or -1 if none matches
+        :rtype: int
+        """
+        last_seq = self._end - 1 - start
+        n = self.NGRAM_LENGTH
+        if len(substring) >= n:
+            candidates = None
+            for i in range(len(substring) - n + 1):
+                seqs = self._ngrams.get(substring[i:i + n])
+                if seqs is None:
+                    return -1
+                if candidates is None or len(seqs) < len(candidates):
+                    candidates = seqs
+        else:
+            candidates = range(self._start, self._end)
+        for seq in reversed(candidates):
+            if seq <= last_seq and substring in self._slots[seq % self.capacity]:
+                return self._end - 1 - seq
+        return -1
+
+
 class ShHistory(object):
     """
     This class is responsible for input history.
+    The history is saved as an append-only log, so saving only writes the
+    entries added since the last save. The log is compacted by rewriting
+    it once it has grown much larger than the history itself.
     :param stash: the StaSh core
     :type stash: StaSh
     """
 
     ENCODING = "utf-8"
     DEFAULT = "_default"
+    # first line of the log format, used to recognize it when loading
+    LOG_HEADER = {"stash_history": 2}
+    # the log is compacted when it has more records than this factor times the number of entries
+    COMPACTION_FACTOR = 2
 
     def __init__(self, stash):
         self.stash = stash
@@ -28,6 +176,11 @@ class ShHistory(object):
         self.maxsize = self.stash.config.getint("history", "maxsize")
         self.templine = ""
         self.idx = -1
+        # state of the log file, see save()
+        self._log_path = None
+        self._log_records = 0
+        self._unsaved = []
+        self._needs_compaction = True
 
     @classmethod
     def load(cls, path, stash):
@@ -41,14 +194,46 @@ class ShHistory(object):
         :rtype: ShHistory
         """
         shh = cls(stash)
+        with open(path, "r", encoding=cls.ENCODING) as fin:
+            content = fin.read()
+        lines = content.splitlines()
         try:
-            with open(path, "r", encoding=cls.ENCODING) as fin:
-                h = json.loads(u"" + fin.read())
+            header = json.loads(lines[0]) if lines else None
         except ValueError:
-            h = {"StaSh.runtime": cls.load_old_format(path)}
-        shh._histories = h
+            header = None
+        if header == cls.LOG_HEADER:
+            histories = cls._replay_log(lines[1:])
+            shh._log_path = path
+            shh._log_records = len(lines) - 1
+            shh._needs_compaction = False
+        else:
+            try:
+                histories = json.loads(u"" + content)
+            except ValueError:
+                histories = None
+            if not isinstance(histories, dict):
+                histories = {"StaSh.runtime": cls.load_old_format(path)}
+        shh._histories = dict((name, ShHistoryBuffer(shh.maxsize, entries)) for name, entries in histories.items())
+        if shh._log_path is not None and shh._log_records > cls.COMPACTION_FACTOR * max(1, shh._n_entries()):
+            shh._needs_compaction = True
         return shh
 
+    @classmethod
+    def _replay_log(cls, lines):
+        """
+        Return the histories recorded by the lines of a log.
+        :rtype: dict of str -> list of str
+        """
+        histories = {}
+        for line in lines:
+            try:
+                name, entry = json.loads(line)
+            except ValueError:
+                # e.g. a partially written last line
+                continue
+            histories.setdefault(name, []).append(entry)
+        return histories
+
     @classmethod
     def load_old_format(cls, path):
         """
@@ -65,12 +250,47 @@ class ShHistory(object):
     def save(self, path):
         """
         Save the history to a path.
+        The entries added since the last save are appended to the log. The
+        whole log is rewritten if it was not loaded from or saved to path
+        before, if entries were removed or if it grew too large.
         :param path: path to save to.
         :type path: str
         """
-        with open(path, "w", encoding=self.ENCODING) as fout:
-            s = json.dumps(self._histories)
-            fout.write(u"" + s)  # ensure unicode
+        if self._log_records + len(self._unsaved) > self.COMPACTION_FACTOR * max(1, self._n_entries()):
+            self._needs_compaction = True
+        if self._needs_compaction or path != self._log_path or not os.path.exists(path):
+            records = [(name, entry) for name, history in self._histories.items() for entry in history]
+            mode = "w"
+            self._log_records = 0
+        else:
+            records = self._unsaved
+            mode = "a"
+        with open(path, mode, encoding=self.ENCODING) as fout:
+            if mode == "w":
+                fout.write(u"" + json.dumps(self.LOG_HEADER) + u"\n")
+            for record in records:
+                fout.write(u"" + json.dumps(record) + u"\n")  # ensure unicode
+        self._log_path = path
+        self._log_records += len(records)
+        self._unsaved = []
+        self._needs_compaction = False
+
+    def _n_entries(self):
+        return sum(len(history) for history in self._histories.values())
+
+    def _get_history(self):
+        """
+        Return the buffer of the current history, creating it if needed.
+        :rtype: ShHistoryBuffer
+        """
+        history = self._histories.get(self._current)
+        if history is None:
+            history = self._histories[self._current] = ShHistoryBuffer(self.maxsize)
+        elif history.capacity != max(0, self.maxsize):
+            # maxsize changed, keep the newest entries
+            history = self._histories[self._current] = ShHistoryBuffer(self.maxsize, history)
+            self._needs_compaction = True
+        return history
 
     def clear(self, target=None):
         """
@@ -82,12 +302,16 @@ class ShHistory(object):
             target = self._current
         if target in self._histories:
             del self._histories[target]
+            self._unsaved = [record for record in self._unsaved if record[0] != target]
+            self._needs_compaction = True
 
     def clear_all(self):
         """
         Clear all histories.
         """
         self._histories = {}
+        self._unsaved = []
+        self._needs_compaction = True
 
     def swap(self, target):
         """
@@ -105,10 +329,9 @@ class ShHistory(object):
         :param always: always add this line, regardless of config
         :type always: bool
         """
-        if self._current not in self._histories:
-            self._histories[self._current] = []
+        history = self._get_history()
         stripped = line.strip()
-        last_line = (self._histories[self._current][-1] if len(self._histories[self._current]) > 0 else None)
+        last_line = (history.get_newest(0) if len(history) > 0 else None)
         if not always:
             # check if this line should be added
             if stripped == last_line and not self.allow_double:
@@ -117,10 +340,9 @@ class ShHistory(object):
             if line.startswith(" ") and self.hide_whitespace:
                 # hide lines starting with a whitespace
                 return
-        self._histories[self._current].append(stripped)
-        # ensure maxsize
-        while len(self._histories[self._current]) > max(0, self.maxsize):
-            self._histories[self._current].pop(0)
+        # the ring buffer drops the oldest entry once maxsize is reached
+        history.append(stripped)
+        self._unsaved.append((self._current, stripped))
 
         # reset index
         self.reset_idx()
@@ -131,9 +353,7 @@ class ShHistory(object):
         :return: list of current history entries
         :rtype: list of str
         """
-        if self._current not in self._histories:
-            self._histories[self._current] = []
-        return self._histories[self._current][::-1]
+        return list(self._get_history())[::-1]
 
     def search(self, tok):
         """
@@ -143,23 +363,47 @@ class ShHistory(object):
         :return: last entry in history matching the search
         :rtype: str
         """
-        history = self.getlist()
+        history = self._get_history()
         search_string = tok[1:]
         if search_string == '':
             return ''
         if search_string == '!':
-            return history[0]
+            try:
+                return history.get_newest(0)
+            except IndexError:
+                raise ShEventNotFound(tok)
         try:
             idx = int(search_string)
+            if idx < 0:
+                idx += len(history)
             try:
-                return history[::-1][idx]
+                return history.get(idx)
             except IndexError:
                 raise ShEventNotFound(tok)
         except ValueError:
-            for entry in history:
-                if entry.startswith(search_string):
-                    return entry
-            raise ShEventNotFound(tok)
+            idx = history.find_prefix(search_string)
+            if idx == -1:
+                raise ShEventNotFound(tok)
+            return history.get_newest(idx)
+
+    def reverse_search(self, substring, start=0):
+        """
+        Incremental reverse search (like Ctrl-R in other shells).
+        Search the newest entry containing substring, beginning at the
+        entry at position start (the newest being 0). To find the next
+        older match, search again with start set to the returned index + 1.
+        :param substring: text to search for
+        :type substring: str
+        :param start: position to start searching from
+        :type start: int
+        :return: (index, entry) or (-1, None) if no entry matches
+        :rtype: tuple of (int, str)
+        """
+        history = self._get_history()
+        idx = history.find_substring(substring, start)
+        if idx == -1:
+            return -1, None
+        return idx, history.get_newest(idx)
 
     def reset_idx(self):
         """
@@ -172,7 +416,7 @@ class ShHistory(object):
         Move upwards in the history.
         """
         # Save the unfinished line user is typing before showing entries from history
-        history = self.getlist()
+        history = self._get_history()
         if self.idx == -1:
             self.templine = self.stash.mini_buffer.modifiable_string.rstrip()
 
@@ -181,15 +425,14 @@ class ShHistory(object):
             self.idx = len(history) - 1
 
         else:
-            entry = history[self.idx]
+            entry = history.get_newest(self.idx)
             # If move up away from an unfinished input line, try search history for
             # a line starts with the unfinished line
             if self.idx == 0 and self.ipython_style_history_search:
-                for idx, hs in enumerate(history):
-                    if hs.startswith(self.templine):
-                        entry = hs
-                        self.idx = idx
-                        break
+                idx = history.find_prefix(self.templine)
+                if idx != -1:
+                    entry = history.get_newest(idx)
+                    self.idx = idx
 
             self.stash.mini_buffer.feed(None, entry)
 
@@ -197,7 +440,7 @@ class ShHistory(object):
         """
         Move downwqrds in the history
         """
-        history = self.getlist()
+        history = self._get_history()
         self.idx -= 1
         if self.idx < -1:
             self.idx = -1
@@ -206,6 +449,6 @@ class ShHistory(object):
             if self.idx == -1:
                 entry = self.templine
             else:
-                entry = history[self.idx]
+                entry = history.get_newest(self.idx)
 
             self.stash.mini_buffer.feed(None, entry)
@@ -1,8 +1,17 @@
 # coding: utf-8
+import errno
+import io
 import logging
-import time
+import threading
 from collections import deque
 
+from .shcommon import ShBrokenPipe
+
+# Blocked readers and writers wake up at this interval (in seconds). A thread
+# waiting on a condition without timeout never runs bytecode, so the
+# KeyboardInterrupt raised in it when a job is killed would not be delivered.
+_WAIT_TIMEOUT = 0.1
+
 
 class ShIO(object):
     """
@@ -17,18 +26,74 @@ class ShIO(object):
         self.debug = debug
         self.logger = logging.getLogger('StaSh.IO')
         self.tell_pos = 0
-        # The input buffer, push from the Left end, read from the right end
+        # The input buffer holds the pushed strings as whole chunks,
+        # push to the right end, read from the left end
         self._buffer = deque()
+        self._size = 0
+        # Readers wait on this condition and are woken up as soon as
+        # new input is pushed, instead of polling the buffer
+        self._cond = threading.Condition()
         self.chunk_size = 4096
-        # When buffer is empty, hold back for certain before read again
-        # This is to lower the cpu usage of the reading thread so it does
-        # not affect the UI thread by noticeable amount
-        self.holdback = 0.2
 
         self.encoding = 'utf8'
 
     def push(self, s):
-        self._buffer.extendleft(s)
+        if not s:
+            return
+        with self._cond:
+            self._buffer.append(s)
+            self._size += len(s)
+            self._cond.notify_all()
+
+    def peek(self):
+        """
+        Return the buffered input without removing it.
+        """
+        with self._cond:
+            return ''.join(self._buffer)
+
+    def _take(self, size):
+        """
+        Remove and return up to size characters from the buffer.
+        Must be called with the condition held.
+        """
+        ret = []
+        while self._buffer and size > 0:
+            chunk = self._buffer.popleft()
+            if len(chunk) > size:
+                self._buffer.appendleft(chunk[size:])
+                chunk = chunk[:size]
+            ret.append(chunk)
+            size -= len(chunk)
+            self._size -= len(chunk)
+        return ''.join(ret)
+
+    def _find(self, chars):
+        """
+        Return the number of buffered characters up to and including the
+        first occurrence of any of the given characters, or -1 if none of
+        them is buffered yet.
+        Must be called with the condition held.
+        """
+        offset = 0
+        for chunk in self._buffer:
+            positions = [p for p in (chunk.find(c) for c in chars) if p != -1]
+            if positions:
+                return offset + min(positions) + 1
+            offset += len(chunk)
+        return -1
+
+    def _wait_for(self, chars):
+        """
+        Block until any of the given characters is buffered and return
+        the number of characters up to and including it.
+        Must be called with the condition held.
+        """
+        while True:
+            end = self._find(chars)
+            if end != -1:
+                return end
+            self._cond.wait(_WAIT_TIMEOUT)
 
     # Following methods to provide file like object interface
     @property
@@ -62,34 +127,22 @@ class ShIO(object):
     def read(self, size=-1):
         size = size if size != 0 else 1
 
-        if size == -1:
-            return ''.join(self._buffer.pop() for _ in len(self._buffer))
-
-        else:
-            ret = []
-            while len(ret) < size:
-                try:
-                    ret.append(self._buffer.pop())
-                except IndexError:
-                    # Wait briefly when the buffer is empty to avoid taxing the CPU
-                    time.sleep(self.holdback)
+        with self._cond:
+            if size == -1:
+                return self._take(self._size)
 
-            return ''.join(ret)
+            else:
+                while self._size < size:
+                    self._cond.wait(_WAIT_TIMEOUT)
+                return self._take(size)
 
     def readline(self, size=-1):
-        ret = []
-        while True:
-            try:
-                ret.append(self._buffer.pop())
-                if ret[-1] in ['\n', '\0']:
-                    break
-            except IndexError:
-                time.sleep(self.holdback)
+        with self._cond:
+            line = self._take(self._wait_for('\n\0'))
 
-        if ret[-1] == '\0':
-            del ret[-1]
+        if line[-1] == '\0':
+            line = line[:-1]
 
-        line = ''.join(ret)
         # localized history for running scripts
         # TODO: Adding to history for read as well?
         self.stash.runtime.history.add(line)
@@ -97,16 +150,8 @@ class ShIO(object):
         return line
 
     def readlines(self, size=-1):
-        ret = []
-        while True:
-            try:
-                ret.append(self._buffer.pop())
-                if ret[-1] == '\0':
-                    break
-            except IndexError:
-                time.sleep(self.holdback)
-
-        ret = ''.join(ret[:-1])  # do not include the EOF
+        with self._cond:
+            ret = self._take(self._wait_for('\0'))[:-1]  # do not include the EOF
 
         if size != -1:
             ret = ret[:size]
@@ -123,15 +168,17 @@ class ShIO(object):
         With this method, MiniBuffer sends out its reading after every
         single char.
         The caller is responsible for break out this reading explicitly.
+        Everything pushed in the meantime is yielded as one chunk.
         """
         # TODO: Currently not supported by ShMiniBuffer
         try:
             self.stash.mini_buffer.cbreak = True
             while True:
-                try:
-                    yield self._buffer.pop()
-                except IndexError:
-                    time.sleep(self.holdback)
+                with self._cond:
+                    while not self._size:
+                        self._cond.wait(_WAIT_TIMEOUT)
+                    chunk = self._take(self._size)
+                yield chunk
 
         finally:
             self.stash.mini_buffer.cbreak = False
@@ -145,16 +192,13 @@ class ShIO(object):
         user command when a program is running at the same time.
         :return: str:
         """
-        ret = []
         while True:
-            try:
-                ret.append(self._buffer.pop())
-                if ret[-1] == '\n':
-                    yield ''.join(ret)
-                    ret = []
-            except IndexError:
-                self._buffer.extend(ret)
-                break
+            with self._cond:
+                end = self._find('\n')
+                if end == -1:
+                    break
+                line = self._take(end)
+            yield line
 
     def write(self, s, no_wait=False):
         if len(s) == 0:  # skip empty string
@@ -171,3 +215,180 @@ class ShIO(object):
 
     def flush(self):
         pass
+
+
+class ShPipe(io.IOBase):
+    """
+    A bounded, blocking pipe connecting two commands of a pipe sequence which
+    run at the same time. The writer blocks while the pipe holds ``maxsize``
+    characters and the reader blocks until data or EOF is available, so memory
+    use is bounded by the buffer size instead of the amount of data piped.
+
+    The writing side signals EOF with ``close()``. The reading side calls
+    ``close_reader()`` when it stops reading, e.g. ``head``, after which any
+    further write raises ``ShBrokenPipe``.
+    """
+
+    def __init__(self, maxsize=65536):
+        super(ShPipe, self).__init__()
+        self.maxsize = max(1, maxsize)
+        self.encoding = 'utf8'
+        self._chunks = deque()
+        self._size = 0
+        # number of leading chunks known to contain no newline
+        self._scanned = 0
+        self._cond = threading.Condition()
+        self._write_closed = False
+        self._read_closed = False
+
+    def __repr__(self):
+        return '<ShPipe size={} eof={}>'.format(self._size, self._write_closed)
+
+    @property
+    def closed(self):
+        return self._write_closed and self._read_closed
+
+    def isatty(self):
+        return False
+
+    def readable(self):
+        return True
+
+    def writable(self):
+        return True
+
+    def seekable(self):
+        return False
+
+    def flush(self):
+        pass
+
+    def close(self):
+        """
+        Close the writing end. Readers get EOF once the buffer is drained.
+        """
+        with self._cond:
+            self._write_closed = True
+            self._cond.notify_all()
+
+    def close_reader(self):
+        """
+        Close the reading end. Buffered data is discarded and blocked or
+        future writers get a broken pipe error.
+        """
+        with self._cond:
+            self._read_closed = True
+            self._chunks.clear()
+            self._size = 0
+            self._scanned = 0
+            self._cond.notify_all()
+
+    def write(self, s):
+        if self._write_closed:
+            raise ValueError('I/O operation on closed pipe')
+        n = len(s)
+        idx = 0
+        with self._cond:
+            while idx < n:
+                while self._size >= self.maxsize and not self._read_closed:
+                    self._cond.wait(_WAIT_TIMEOUT)
+                if self._read_closed:
+                    raise ShBrokenPipe(errno.EPIPE, 'Broken pipe')
+                chunk = s[idx:idx + self.maxsize - self._size]
+                self._chunks.append(chunk)
+                self._size += len(chunk)
+                idx += len(chunk)
+                self._cond.notify_all()
+        return n
+
+    def writelines(self, lines):
+        for line in lines:
+            self.write(line)
+
+    def _take(self, size):
+        """
+        Remove and return up to size characters from the buffer.
+        Must be called with the condition held.
+        """
+        ret = []
+        while self._chunks and size > 0:
+            chunk = self._chunks.popleft()
+            if len(chunk) > size:
+                self._chunks.appendleft(chunk[size:])
+                chunk = chunk[:size]
+            ret.append(chunk)
+            size -= len(chunk)
+            self._size -= len(chunk)
+        self._scanned = 0
+        self._cond.notify_all()
+        return ret[0][:0].join(ret) if ret else ''
+
+    def _newline_end(self):
+        """
+        Return the number of buffered characters up to and including the
+        first newline, or -1 if there is no complete line yet.
+        Must be called with the condition held.
+        """
+        offset = 0
+        for i, chunk in enumerate(self._chunks):
+            if i >= self._scanned:
+                pos = chunk.find('\n' if isinstance(chunk, type(u'')) else b'\n')
+                if pos != -1:
+                    return offset + pos + 1
+                self._scanned = i + 1
+            offset += len(chunk)
+        return -1
+
+    def read(self, size=-1):
+        with self._cond:
+            if size is None or size < 0:
+                # keep draining so that a writer blocked on a full pipe can go on
+                ret = []
+                while True:
+                    if self._size:
+                        ret.append(self._take(self._size))
+                    elif self._write_closed or self._read_closed:
+                        break
+                    else:
+                        self._cond.wait(_WAIT_TIMEOUT)
+                return ret[0][:0].join(ret) if ret else ''
+            while self._size == 0 and not self._write_closed and not self._read_closed:
+                self._cond.wait(_WAIT_TIMEOUT)
+            return self._take(size)
+
+    def readline(self, size=-1):
+        with self._cond:
+            while True:
+                end = self._newline_end()
+                if end != -1:
+                    break
+                if self._write_closed or self._read_closed:
+                    end = self._size
+                    break
+                if size is not None and 0 <= size <= self._size:
+                    break
+                self._cond.wait(_WAIT_TIMEOUT)
+            if size is not None and size >= 0:
+                end = size if end == -1 else min(end, size)
+            return self._take(end)
+
+    def readlines(self, hint=-1):
+        lines = []
+        total = 0
+        for line in self:
+            lines.append(line)
+            total += len(line)
+            if 0 < hint <= total:
+                break
+        return lines
+
+    def __iter__(self):
+        return self
+
+    def __next__(self):
+        line = self.readline()
+        if not line:
+            raise StopIteration
+        return line
+
+    next = __next__
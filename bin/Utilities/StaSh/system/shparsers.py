@@ -1,16 +1,17 @@
 # coding: utf-8
 
 import os
+import re
+import copy
 import string
 import glob
 import logging
 import threading
+from collections import OrderedDict
 
 from six import StringIO
 
-import pyparsing as pp
-
-from .shcommon import ShSingleExpansionRequired, ShBadSubstitution, ShInternalError
+from .shcommon import ShSingleExpansionRequired, ShBadSubstitution, ShInternalError, ShSyntaxError
 
 _GRAMMAR = r"""
 -----------------------------------------------------------------------------
@@ -45,6 +46,17 @@ uq_word          : (WORD_CHARS)+ | '&3'
 """
 
 _WORD_CHARS = string.digits + string.ascii_letters + r'''!#$%()*+,-./:=?@[]^_{}~'''
+_PRINTABLES = ''.join(chr(c) for c in range(33, 127))
+# characters skipped between tokens
+_WHITESPACE = ' \t\n\r'
+
+_UQ_WORD_RE = re.compile('[%s]+' % re.escape(_WORD_CHARS))
+# inside double quotes, everything but backslashes and backquotes is plain text
+_UQ_WORD_IN_DQ_RE = re.compile('[%s]+' % re.escape(' ' + _PRINTABLES.replace('`', '').replace('\\', '')))
+_QUOTED_RES = dict((q, re.compile(r'%s(?:\\.|[^%s\n\r\\])*%s' % (q, q, q))) for q in '`"\'')
+_ESCAPED_OCT_RE = re.compile(r'\\[0-7]{1,3}')
+_ESCAPED_HEX_RE = re.compile(r'\\x[0-9a-fA-F]{2}')
+_ASSIGN_RE = re.compile(r'[A-Za-z_][A-Za-z0-9_]*=')
 
 
 class ShAssignment(object):
@@ -150,195 +162,265 @@ class ShToken(object):
         return ret
 
 
-# noinspection PyProtectedMember
+class ShParsedCommand(object):
+    """
+    A simple command as found by the parser. The words are in the same
+    order as the tokens of the command.
+    """
+    __slots__ = ('cmd_prefix', 'cmd_word', 'args', 'io_redirect')
+
+    def __init__(self):
+        self.cmd_prefix = []  # the assignment words
+        self.cmd_word = ''
+        self.args = []
+        self.io_redirect = []  # [operator, filename] if any
+
+    def __repr__(self):
+        return 'ShParsedCommand(%r, %r, %r, %r)' % (self.cmd_prefix, self.cmd_word, self.args, self.io_redirect)
+
+
+def _skip(s, pos):
+    """returns the position of the next token, skipping whitespace and comments."""
+    n = len(s)
+    while pos < n:
+        c = s[pos]
+        if c in _WHITESPACE:
+            pos += 1
+        elif c == '#':
+            end = s.find('\n', pos)
+            pos = n if end == -1 else end
+        else:
+            break
+    return pos
+
+
+def _scan_escaped(s, pos):
+    """
+    returns (end, ttype) of the escape sequence starting at s[pos] ('\\') or None.
+    The longest of the escape forms wins, ties go to a single escaped character.
+    """
+    m = _ESCAPED_HEX_RE.match(s, pos)
+    if m is not None:
+        return m.end(), ShToken._ESCAPED_HEX
+    m = _ESCAPED_OCT_RE.match(s, pos)
+    if m is not None and m.end() > pos + 2:
+        return m.end(), ShToken._ESCAPED_OCT
+    if pos + 1 < len(s) and (s[pos + 1] in _PRINTABLES or s[pos + 1] == ' '):
+        return pos + 2, ShToken._ESCAPED
+    return None
+
+
+def _scan_part(s, pos):
+    """returns (end, ttype) of the word part starting at s[pos] or None."""
+    c = s[pos]
+    if c == '\\':
+        return _scan_escaped(s, pos)
+    elif c in _QUOTED_RES:
+        m = _QUOTED_RES[c].match(s, pos)
+        if m is None:
+            return None
+        return m.end(), ShToken._BQ_WORD if c == '`' else (ShToken._DQ_WORD if c == '"' else ShToken._SQ_WORD)
+    elif c == '&':
+        # &3 is the file descriptor of Pythonista's interactive prompt
+        return (pos + 2, ShToken._UQ_WORD) if s.startswith('&3', pos) else None
+    m = _UQ_WORD_RE.match(s, pos)
+    return (m.end(), ShToken._UQ_WORD) if m is not None else None
+
+
+def _scan_word(s, pos):
+    """returns the end of the word starting at s[pos] and its parts; the end is pos if there is none."""
+    parts = []
+    n = len(s)
+    while pos < n:
+        part = _scan_part(s, pos)
+        if part is None:
+            break
+        end, ttype = part
+        parts.append(ShToken(s[pos:end], pos, ttype))
+        pos = end
+    return pos, parts
+
+
 class ShParser(object):
     """
     Parse the command line input to provide basic semantic analysis.
     The results will be further expanded by `ShExpander`.
+    The parser is a hand written single pass implementation of the grammar
+    above. The results of the most recently parsed lines are cached, as the
+    same lines are parsed over and over again, e.g. by scripts and by the
+    completer.
+    :param cache_size: number of lines whose parse results are cached
+    :type cache_size: int
     """
-    _NEXT_WORD_CMD = '_NEXT_WORD_CMD'
-    _NEXT_WORD_VAL = '_NEXT_WORD_VAL'  # rhs of assignment
-    _NEXT_WORD_FILE = '_NEXT_WORD_FILE'
 
-    def __init__(self, debug=False):
+    def __init__(self, debug=False, cache_size=256):
 
         self.debug = debug
         self.logger = logging.getLogger('StaSh.Parser')
-
-        escaped = pp.Combine("\\" + pp.Word(pp.printables + ' ', exact=1)).setParseAction(self.escaped_action)
-        escaped_oct = pp.Combine("\\" + pp.Word('01234567', max=3)).setParseAction(self.escaped_oct_action)
-        escaped_hex = pp.Combine("\\x" + pp.Word('0123456789abcdefABCDEF', exact=2)).setParseAction(self.escaped_hex_action)
-        # Some special uq_word is needed, e.g. &3 for file descriptor of Pythonista interactive prompt
-        uq_word = (pp.Literal('&3') | pp.Word(_WORD_CHARS)).setParseAction(self.uq_word_action)
-        bq_word = pp.QuotedString('`', escChar='\\', unquoteResults=False).setParseAction(self.bq_word_action)
-        dq_word = pp.QuotedString('"', escChar='\\', unquoteResults=False).setParseAction(self.dq_word_action)
-        sq_word = pp.QuotedString("'", escChar='\\', unquoteResults=False).setParseAction(self.sq_word_action)
-        # The ^ operator means longest match (as opposed to | which means first match)
-        word = pp.Combine(pp.OneOrMore(escaped ^ escaped_oct ^ escaped_hex
-                                       ^ uq_word ^ bq_word ^ dq_word ^ sq_word))\
-            .setParseAction(self.word_action)
-
-        identifier = pp.Word(pp.alphas + '_', pp.alphas + pp.nums + '_').setParseAction(self.identifier_action)
-        assign_op = pp.Literal('=').setParseAction(self.assign_op_action)
-        assignment_word = pp.Combine(identifier + assign_op + word).setParseAction(self.assignment_word_action)
-
-        punctuator = pp.oneOf('; &').setParseAction(self.punctuator_action)
-        pipe_op = pp.Literal('|').setParseAction(self.pipe_op_action)
-        io_redirect_op = pp.oneOf('>> >').setParseAction(self.io_redirect_op_action)
-        io_redirect = (io_redirect_op + word)('io_redirect')
-
-        # The optional ' ' is a workaround to a possible bug in pyparsing.
-        # The position of cmd_word after cmd_prefix is always reported 1 character ahead
-        # of the correct value.
-        cmd_prefix = (pp.OneOrMore(assignment_word) + pp.Optional(' '))('cmd_prefix')
-        cmd_suffix = (pp.OneOrMore(word)('args') + pp.Optional(io_redirect)) ^ io_redirect
-
-        modifier = pp.oneOf('! \\')
-        cmd_word = (pp.Combine(pp.Optional(modifier) + word) ^ word)('cmd_word').setParseAction(self.cmd_word_action)
-
-        simple_command = \
-            (cmd_prefix + pp.Optional(cmd_word) + pp.Optional(cmd_suffix)) \
-            | (cmd_word + pp.Optional(cmd_suffix))
-        simple_command = pp.Group(simple_command)
-
-        pipe_sequence = simple_command + pp.ZeroOrMore(pipe_op + simple_command)
-        pipe_sequence = pp.Group(pipe_sequence)
-
-        complete_command = pp.Optional(pipe_sequence + pp.ZeroOrMore(punctuator + pipe_sequence) + pp.Optional(punctuator))
-
-        # --- special parser for inside double quotes
-        uq_word_in_dq = pp.Word(pp.printables.replace('`', ' ').replace('\\', ''))\
-            .setParseAction(self.uq_word_action)
-        word_in_dq = pp.Combine(pp.OneOrMore(escaped ^ escaped_oct ^ escaped_hex ^ bq_word ^ uq_word_in_dq))
-        # ---
-
-        self.parser = complete_command.parseWithTabs().ignore(pp.pythonStyleComment)
-        self.parser_within_dq = word_in_dq.leaveWhitespace()
-        self.next_word_type = ShParser._NEXT_WORD_CMD
-        self.tokens = []
-        self.parts = []
+        self.parse_cache_size = cache_size
+        self._cache = OrderedDict()
+        self._cache_lock = threading.Lock()
 
     def parse(self, line):
+        """
+        Parse a command line.
+        Returns the list of tokens and the list of pipe sequences separated
+        by punctuators. A pipe sequence is a list of ShParsedCommand separated
+        by '|'. The tokens are copies, so they can be modified by the caller.
+        Raises ShSyntaxError if the line can not be parsed.
+        """
         if self.debug:
             self.logger.debug('line: %s' % repr(line))
-        self.next_word_type = ShParser._NEXT_WORD_CMD
-        self.tokens = []
-        self.parts = []
-        parsed = self.parser.parseString(line, parseAll=True)
-        return self.tokens, parsed
+        with self._cache_lock:
+            entry = self._cache.pop(line, None)
+            if entry is not None:
+                self._cache[line] = entry  # most recently used goes last
+        if entry is None:
+            entry = self._parse(line)
+            cache_size = int(self.parse_cache_size)
+            if cache_size > 0:
+                with self._cache_lock:
+                    self._cache[line] = entry
+                    while len(self._cache) > cache_size:
+                        self._cache.popitem(last=False)
+        tokens, parsed = entry
+        return [copy.copy(t) for t in tokens], parsed
 
     def parse_within_dq(self, s):
         """ Take the input string as if it is inside a pair of double quotes
         """
-        self.parts = []
-        parsed = self.parser_within_dq.parseString(s, parseAll=True)
-        return self.parts, parsed
-
-    def identifier_action(self, s, pos, toks):
-        """ This function is only needed for debug """
-        if self.debug:
-            self.logger.debug('identifier: %d, %s' % (pos, toks[0]))
-
-    def assign_op_action(self, s, pos, toks):
-        if self.debug:
-            self.logger.debug(toks[0])
-        self.next_word_type = ShParser._NEXT_WORD_VAL
-
-    def assignment_word_action(self, s, pos, toks):
-        if self.debug:
-            self.logger.debug(toks[0])
-        self.add_token(toks[0], pos, ShToken._ASSIGN_WORD, self.parts)
-        self.parts = []
-        self.next_word_type = ShParser._NEXT_WORD_CMD
-
-    def escaped_action(self, s, pos, toks):
-        if self.debug:
-            self.logger.debug(toks[0])
-        self.add_part(toks[0], pos, ShToken._ESCAPED)
-
-    def escaped_oct_action(self, s, pos, toks):
-        if self.debug:
-            self.logger.debug(toks[0])
-        self.add_part(toks[0], pos, ShToken._ESCAPED_OCT)
-
-    def escaped_hex_action(self, s, pos, toks):
-        if self.debug:
-            self.logger.debug(toks[0])
-        self.add_part(toks[0], pos, ShToken._ESCAPED_HEX)
-
-    def uq_word_action(self, s, pos, toks):
-        if self.debug:
-            self.logger.debug(toks[0])
-        self.add_part(toks[0], pos, ShToken._UQ_WORD)
-
-    def bq_word_action(self, s, pos, toks):
-        if self.debug:
-            self.logger.debug(toks[0])
-        self.add_part(toks[0], pos, ShToken._BQ_WORD)
-
-    def dq_word_action(self, s, pos, toks):
-        if self.debug:
-            self.logger.debug(toks[0])
-        self.add_part(toks[0], pos, ShToken._DQ_WORD)
-
-    def sq_word_action(self, s, pos, toks):
-        if self.debug:
-            self.logger.debug(toks[0])
-        self.add_part(toks[0], pos, ShToken._SQ_WORD)
-
-    def word_action(self, s, pos, toks):
-        if self.debug:
-            self.logger.debug(toks[0])
-
-        if self.next_word_type == ShParser._NEXT_WORD_VAL:
-            self.parts = ShToken(toks[0], pos, ShToken._WORD, self.parts)
-            self.next_word_type = ShParser._NEXT_WORD_CMD
-            # self.parts will be reset in assignment_word_action
-
-        elif self.next_word_type == ShParser._NEXT_WORD_CMD:
-            pass  # handled by cmd_word_action
-
-        else:
-            if self.next_word_type == ShParser._NEXT_WORD_FILE:
-                ttype = ShToken._FILE
+        # tabs are expanded, like in the original pyparsing implementation
+        s = s.expandtabs()
+        parts = []
+        pos = 0
+        n = len(s)
+        while pos < n:
+            c = s[pos]
+            if c == '\\':
+                part = _scan_escaped(s, pos)
+            elif c == '`':
+                m = _QUOTED_RES[c].match(s, pos)
+                part = (m.end(), ShToken._BQ_WORD) if m is not None else None
             else:
-                ttype = ShToken._WORD
-            self.add_token(toks[0], pos, ttype, self.parts)
-            self.parts = []  # reset parts
-            self.next_word_type = None
-
-    def cmd_word_action(self, s, pos, toks):
-        if self.debug:
-            self.logger.debug(toks[0])
-        # toks[0] is the whole cmd_word while parts do not include leading modifier if any
-        self.add_token(toks[0], pos, ShToken._CMD, self.parts)
-        self.next_word_type = None
-        self.parts = []
-
-    def punctuator_action(self, s, pos, toks):
-        if self.tokens[-1].ttype != ShToken._PUNCTUATOR and self.tokens[-1].spos != pos:
-            if self.debug:
-                self.logger.debug(toks[0])
-            self.add_token(toks[0], pos, ShToken._PUNCTUATOR)
-            self.next_word_type = ShParser._NEXT_WORD_CMD
-
-    def pipe_op_action(self, s, pos, toks):
-        if self.debug:
-            self.logger.debug(toks[0])
-        self.add_token(toks[0], pos, ShToken._PIPE_OP)
-        self.next_word_type = ShParser._NEXT_WORD_CMD
-
-    def io_redirect_op_action(self, s, pos, toks):
+                m = _UQ_WORD_IN_DQ_RE.match(s, pos)
+                part = (m.end(), ShToken._UQ_WORD) if m is not None else None
+            if part is None:
+                break
+            end, ttype = part
+            parts.append(ShToken(s[pos:end], pos, ttype))
+            pos = end
+        # trailing whitespace is ignored
+        while parts and pos < n and s[pos] in _WHITESPACE:
+            pos += 1
+        if not parts or pos < n:
+            if not parts and s.startswith('\\'):
+                pos += 1  # the character following the backslash is invalid
+            raise ShSyntaxError('syntax error at char %d' % pos, pos, s)
+        return parts, [s]
+
+    def _parse(self, line):
+        """parses a line; returns the tokens and the pipe sequences."""
+        tokens = []
+        parsed = []
+        pos = 0
+        result = self._pipe_sequence(line, pos, tokens)
+        if result is not None:
+            pos, pseq = result
+            parsed.append(pseq)
+            while True:
+                p = _skip(line, pos)
+                punctuator = line[p:p + 1]
+                if punctuator not in (';', '&'):
+                    break
+                tokens.append(ShToken(punctuator, p, ShToken._PUNCTUATOR))
+                pos = p + 1
+                parsed.append(punctuator)
+                result = self._pipe_sequence(line, pos, tokens)
+                if result is None:
+                    # a trailing punctuator
+                    break
+                pos, pseq = result
+                parsed.append(pseq)
+        pos = _skip(line, pos)
+        if pos < len(line):
+            raise ShSyntaxError('syntax error at char %d' % pos, pos, line)
         if self.debug:
-            self.logger.debug(toks[0])
-        self.add_token(toks[0], pos, ShToken._IO_REDIRECT_OP)
-        self.next_word_type = ShParser._NEXT_WORD_FILE
-
-    def add_token(self, tok, pos, ttype, parts=None):
-        self.tokens.append(ShToken(tok, pos, ttype, parts))
+            self.logger.debug('tokens: %s' % tokens)
+        return tokens, parsed
 
-    def add_part(self, tok, pos, ttype):
-        self.parts.append(ShToken(tok, pos, ttype))
+    def _pipe_sequence(self, s, pos, tokens):
+        """parses simple commands separated by '|'; returns (end, pipe sequence) or None."""
+        result = self._simple_command(s, pos, tokens)
+        if result is None:
+            return None
+        pos, cmd = result
+        pseq = [cmd]
+        while True:
+            p = _skip(s, pos)
+            if not s.startswith('|', p):
+                break
+            ntokens = len(tokens)
+            tokens.append(ShToken('|', p, ShToken._PIPE_OP))
+            result = self._simple_command(s, p + 1, tokens)
+            if result is None:
+                del tokens[ntokens:]
+                break
+            pos, cmd = result
+            pseq.extend(['|', cmd])
+        return pos, pseq
+
+    def _simple_command(self, s, pos, tokens):
+        """parses a simple command; returns (end, ShParsedCommand) or None."""
+        cmd = ShParsedCommand()
+        p = _skip(s, pos)
+
+        # cmd_prefix
+        while True:
+            m = _ASSIGN_RE.match(s, p)
+            if m is None:
+                break
+            end, parts = _scan_word(s, m.end())
+            if not parts:
+                break
+            value = ShToken(s[m.end():end], m.end(), ShToken._WORD, parts)
+            tokens.append(ShToken(s[p:end], p, ShToken._ASSIGN_WORD, value))
+            cmd.cmd_prefix.append(s[p:end])
+            pos = end
+            p = _skip(s, pos)
+
+        # cmd_word, the parts of a word with a leading modifier do not include it
+        end, parts = _scan_word(s, p)
+        if s[p:p + 1] in ('!', '\\'):
+            mend, mparts = _scan_word(s, p + 1)
+            if mparts and mend >= end:
+                end, parts = mend, mparts
+        if parts:
+            tokens.append(ShToken(s[p:end], p, ShToken._CMD, parts))
+            cmd.cmd_word = s[p:end]
+            pos = end
+            p = _skip(s, pos)
+        elif not cmd.cmd_prefix:
+            return None
+
+        # cmd_suffix
+        while True:
+            end, parts = _scan_word(s, p)
+            if not parts:
+                break
+            tokens.append(ShToken(s[p:end], p, ShToken._WORD, parts))
+            cmd.args.append(s[p:end])
+            pos = end
+            p = _skip(s, pos)
+        op = '>>' if s.startswith('>>', p) else ('>' if s.startswith('>', p) else None)
+        if op is not None:
+            q = _skip(s, p + len(op))
+            end, parts = _scan_word(s, q)
+            if parts:
+                tokens.append(ShToken(op, p, ShToken._IO_REDIRECT_OP))
+                tokens.append(ShToken(s[q:end], q, ShToken._FILE, parts))
+                cmd.io_redirect = [op, s[q:end]]
+                pos = end
+        return pos, cmd
 
 
 # noinspection PyProtectedMember
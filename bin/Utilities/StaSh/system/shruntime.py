@@ -15,8 +15,6 @@ try:
 except NameError:
     from io import IOBase as file
 
-import pyparsing as pp
-
 # Detecting environments
 try:
     from objc_util import on_main_thread
@@ -24,13 +22,16 @@ except ImportError:
     from .dummyobjc_util import on_main_thread
 
 from .shcommon import ShBadSubstitution, ShInternalError, ShIsDirectory, \
-    ShFileNotFound, ShEventNotFound, ShNotExecutable
+    ShFileNotFound, ShEventNotFound, ShNotExecutable, ShBrokenPipe, ShSyntaxError
 # noinspection PyProtectedMember
 from .shcommon import _STASH_ROOT, _STASH_HISTORY_FILE, _SYS_STDOUT, _SYS_STDERR
 from .shcommon import is_binary_file, _STASH_EXTENSION_BIN_PATH
+from .shio import ShPipe
 from .shparsers import ShPipeSequence
-from .shthreads import ShBaseThread, ShTracedThread, ShCtypesThread, ShState, ShWorkerRegistry
+from .shthreads import ShBaseThread, ShTracedThread, ShCtypesThread, ShState, ShWorkerRegistry, ShArgvWrapper
 from .shhistory import ShHistory
+from .shcodecache import ShCodeCache
+from .shcmdindex import ShCommandIndex
 
 # Default .stashrc file
 _DEFAULT_RC = r"""BIN_PATH=~/Documents/bin:{bin_ext}:$BIN_PATH
@@ -95,6 +96,10 @@ class ShRuntime(object):
                          'thread_type'),
               ShCtypesThread)
         self.colored_errors = config.getboolean("style", "colored_errors")
+        self.concurrent_pipes = config.getint('system', 'concurrent_pipes')
+        self.pipe_buffer_size = config.getint('system', 'pipe_buffer_size')
+        self.code_cache = ShCodeCache(self.stash)
+        self.command_index = ShCommandIndex()
 
         # load history from last session
         if not no_historyfile:
@@ -154,16 +159,11 @@ class ShRuntime(object):
 
         # Match for commands in current dir and BIN_PATH
         # Effectively, current dir is always the first in BIN_PATH
-        for path in ['.'] + current_state.environ_get('BIN_PATH').split(':'):
-            path = os.path.abspath(os.path.expanduser(path))
-            if os.path.exists(path):
-                for f in os.listdir(path):
-                    if f == filename or f == filename + '.py' or f == filename + '.sh':
-                        if os.path.isdir(f):
-                            dir_match_found = True
-                        else:
-                            return os.path.join(path, f)
-        if dir_match_found:
+        paths = ['.'] + current_state.environ_get('BIN_PATH').split(':')
+        script_file, bin_dir_match_found = self.command_index.find(paths, filename)
+        if script_file is not None:
+            return script_file
+        if dir_match_found or bin_dir_match_found:
             raise ShIsDirectory('%s: is a directory' % filename)
         else:
             raise ShFileNotFound('%s: command not found' % filename)
@@ -171,14 +171,8 @@ class ShRuntime(object):
     def get_all_script_names(self):
         """ This function used for completer, whitespaces in names are escaped"""
         _, current_state = self.get_current_worker_and_state()
-        all_names = []
-        for path in ['.'] + current_state.environ_get('BIN_PATH').split(':'):
-            path = os.path.expanduser(path)
-            if os.path.exists(path):
-                for f in os.listdir(path):
-                    if not os.path.isdir(f) and (f.endswith('.py') or f.endswith('.sh')):
-                        all_names.append(f.replace(' ', '\\ '))
-        return all_names
+        paths = ['.'] + current_state.environ_get('BIN_PATH').split(':')
+        return [f.replace(' ', '\\ ') for f in self.command_index.get_script_names(paths)]
 
     def run(
             self,
@@ -294,9 +288,9 @@ class ShRuntime(object):
                             if is_top:
                                 self.history.swap("StaSh.runtime")
 
-            except pp.ParseException as e:
+            except ShSyntaxError as e:
                 if self.debug:
-                    self.logger.debug('ParseException: %s\n' % repr(e))
+                    self.logger.debug('ShSyntaxError: %s\n' % repr(e))
                 msg = 'syntax error: at char %d: %s\n' % (e.loc, e.pstr)
                 self.write_error_message(final_errs, msg)
 
@@ -389,10 +383,19 @@ class ShRuntime(object):
         if self.debug:
             self.logger.debug(str(pipe_sequence))
 
-        _, current_state = self.get_current_worker_and_state()
-
         n_simple_commands = len(pipe_sequence.lst)
 
+        if self.concurrent_pipes and n_simple_commands > 1:
+            self.run_concurrent_pipe_sequence(
+                pipe_sequence,
+                final_ins=final_ins,
+                final_outs=final_outs,
+                final_errs=final_errs,
+            )
+            return
+
+        _, current_state = self.get_current_worker_and_state()
+
         prev_outs = None
         for idx, simple_command in enumerate(pipe_sequence.lst):
 
@@ -418,15 +421,7 @@ class ShRuntime(object):
             errs = current_state.sys_stderr__
 
             if simple_command.io_redirect:
-                # Truncate file or append to file
-                mode = 'w' if simple_command.io_redirect.operator == '>' else 'a'
-                # For simplicity, stdout redirect works for stderr as well.
-                # Note this is different from a real shell.
-                if simple_command.io_redirect.filename == '&3':
-                    outs = _SYS_STDOUT
-                    errs = _SYS_STDERR
-                else:
-                    errs = outs = open(simple_command.io_redirect.filename, mode)
+                outs, errs = self.open_io_redirect(simple_command.io_redirect)
 
             elif idx < n_simple_commands - 1:  # before the last piped command
                 outs = StringIO()
@@ -447,22 +442,7 @@ class ShRuntime(object):
                     if self.debug:
                         self.logger.debug('script is %s\n' % script_file)
 
-                    if self.input_encoding_utf8:
-                        # Python 2 is not fully unicode compatible. Some modules (e.g. runpy)
-                        # insist for ASCII arguments. The encoding here helps eliminates possible
-                        # errors caused by unicode arguments.
-                        simple_command_args = [arg.encode('utf-8') for arg in simple_command.args]
-                    else:
-                        simple_command_args = simple_command.args
-
-                    if script_file.endswith('.py'):
-                        self.exec_py_file(script_file, simple_command_args, ins, outs, errs)
-
-                    elif is_binary_file(script_file):
-                        raise ShNotExecutable(script_file)
-
-                    else:
-                        self.exec_sh_file(script_file, simple_command_args, ins, outs, errs)
+                    self.exec_simple_command(script_file, simple_command, ins, outs, errs)
 
                 else:
                     current_state.return_value = 0
@@ -502,6 +482,210 @@ class ShRuntime(object):
                 if isinstance(ins, StringIO):  # release the string buffer
                     ins.close()
 
+    def run_concurrent_pipe_sequence(self, pipe_sequence, final_ins=None, final_outs=None, final_errs=None):
+        """
+        Run all simple commands of a pipe sequence at the same time.
+        Every command but the last one runs in its own worker thread and writes
+        into a bounded ShPipe read by the next command. The last command runs in
+        the current worker, so its return value becomes the one of the sequence.
+        When a command stops reading (e.g. head), its upstream pipe is closed and
+        the commands before it are stopped by a broken pipe.
+        """
+        current_worker, current_state = self.get_current_worker_and_state()
+        n_simple_commands = len(pipe_sequence.lst)
+
+        # Resolve all commands before starting any of them
+        script_files = []
+        try:
+            for simple_command in pipe_sequence.lst:
+                if simple_command.cmd_word != '':
+                    script_file = self.find_script_file(simple_command.cmd_word)
+                    if self.debug:
+                        self.logger.debug('script is %s\n' % script_file)
+                else:
+                    script_file = None
+                script_files.append(script_file)
+
+        except ShFileNotFound as e:
+            err_msg = '%s\n' % e.args[0]
+            if self.debug:
+                self.logger.debug(err_msg)
+            self.write_error_message(final_errs, err_msg)
+            current_state.return_value = 127
+            return
+
+        except Exception as e:
+            err_msg = '%s\n' % e.args[0]
+            if self.debug:
+                self.logger.debug(err_msg)
+            self.write_error_message(final_errs, err_msg)
+            return
+
+        # The commands swap these globals while they run, restore them once all are done
+        saved_sys_argv = sys.argv
+        saved_sys_path = sys.path
+        saved_os_environ = os.environ
+        if not isinstance(sys.argv, ShArgvWrapper):
+            sys.argv = ShArgvWrapper(saved_sys_argv)
+
+        workers = []
+        ins = final_ins or current_state.sys_stdin__
+        outs = errs = None
+        try:
+            for idx, simple_command in enumerate(pipe_sequence.lst):
+                temporary_environ = {}
+                for assignment in simple_command.assignments:
+                    temporary_environ[assignment.identifier] = assignment.value
+
+                outs = current_state.sys_stdout__
+                errs = current_state.sys_stderr__
+                if simple_command.io_redirect:
+                    outs, errs = self.open_io_redirect(simple_command.io_redirect)
+                elif idx < n_simple_commands - 1:
+                    outs = ShPipe(self.pipe_buffer_size)
+                else:
+                    if final_outs:
+                        outs = final_outs
+                    if final_errs:
+                        errs = final_errs
+
+                if self.debug:
+                    self.logger.debug('io %s %s\n' % (ins, outs))
+
+                if idx == n_simple_commands - 1:
+                    break
+
+                worker = self.ShThread(
+                    self.worker_registry,
+                    current_worker,
+                    simple_command,
+                    target=functools.partial(
+                        self._run_pipe_stage,
+                        script_files[idx],
+                        simple_command,
+                        temporary_environ,
+                        ins,
+                        outs,
+                        errs,
+                        final_errs,
+                    ),
+                    is_background=True,
+                )
+                workers.append(worker)
+                worker.start()
+
+                # If the output has gone to a file, the next command reads nothing
+                ins = outs if isinstance(outs, ShPipe) else StringIO()
+
+            current_state.temporary_environ = temporary_environ
+            if script_files[-1] is not None:
+                self.exec_simple_command(script_files[-1], simple_command, ins, outs, errs)
+            else:
+                current_state.return_value = 0
+
+        except Exception as e:
+            err_msg = '%s\n' % e.args[0]
+            if self.debug:
+                self.logger.debug(err_msg)
+            self.write_error_message(final_errs, err_msg)
+
+        except KeyboardInterrupt:
+            for worker in workers:
+                worker.kill()
+            raise
+
+        finally:
+            self._close_pipe_stage_io(ins, outs)
+            try:
+                for worker in workers:
+                    # Join with a timeout so that a kill can still reach this thread
+                    while worker.is_alive():
+                        worker.join(0.1)
+            except KeyboardInterrupt:
+                for worker in workers:
+                    worker.kill()
+                raise
+            finally:
+                sys.argv = saved_sys_argv
+                sys.path = saved_sys_path
+                os.environ = saved_os_environ
+
+    def _run_pipe_stage(self, script_file, simple_command, temporary_environ, ins, outs, errs, final_errs):
+        """
+        Target of the worker threads running the upstream commands of a concurrent pipe sequence.
+        """
+        current_worker, current_state = self.get_current_worker_and_state()
+        current_state.temporary_environ = temporary_environ
+        try:
+            if script_file is not None:
+                self.exec_simple_command(script_file, simple_command, ins, outs, errs)
+            else:
+                current_state.return_value = 0
+
+        except KeyboardInterrupt:
+            current_state.return_value = 130
+
+        except Exception as e:
+            err_msg = '%s\n' % e.args[0]
+            if self.debug:
+                self.logger.debug(err_msg)
+            self.write_error_message(final_errs, err_msg)
+
+        finally:
+            self._close_pipe_stage_io(ins, outs)
+            current_worker.cleanup()
+
+    @staticmethod
+    def _close_pipe_stage_io(ins, outs):
+        """
+        Signal EOF downstream and stop the upstream writer once a command of a concurrent pipe sequence is done.
+        """
+        if isinstance(ins, ShPipe):
+            ins.close_reader()
+        elif isinstance(ins, StringIO):
+            ins.close()
+        if isinstance(outs, file) and not isinstance(outs, StringIO):
+            outs.close()
+
+    def open_io_redirect(self, io_redirect):
+        """
+        Open the target of an io redirect.
+        :param io_redirect: the redirect of a simple command
+        :type io_redirect: ShIORedirect
+        :return: (outs, errs)
+        :rtype: tuple
+        """
+        # Truncate file or append to file
+        mode = 'w' if io_redirect.operator == '>' else 'a'
+        # For simplicity, stdout redirect works for stderr as well.
+        # Note this is different from a real shell.
+        if io_redirect.filename == '&3':
+            return _SYS_STDOUT, _SYS_STDERR
+        else:
+            outs = open(io_redirect.filename, mode)
+            return outs, outs
+
+    def exec_simple_command(self, script_file, simple_command, ins=None, outs=None, errs=None):
+        """
+        Execute the script file of a simple command with its arguments.
+        """
+        if self.input_encoding_utf8:
+            # Python 2 is not fully unicode compatible. Some modules (e.g. runpy)
+            # insist for ASCII arguments. The encoding here helps eliminates possible
+            # errors caused by unicode arguments.
+            simple_command_args = [arg.encode('utf-8') for arg in simple_command.args]
+        else:
+            simple_command_args = simple_command.args
+
+        if script_file.endswith('.py'):
+            self.exec_py_file(script_file, simple_command_args, ins, outs, errs)
+
+        elif is_binary_file(script_file):
+            raise ShNotExecutable(script_file)
+
+        else:
+            self.exec_sh_file(script_file, simple_command_args, ins, outs, errs)
+
     def exec_py_file(self, filename, args=None, ins=None, outs=None, errs=None):
 
         _, current_state = self.get_current_worker_and_state()
@@ -521,12 +705,17 @@ class ShRuntime(object):
         namespace['__file__'] = os.path.abspath(file_path)
         namespace['_stash'] = self.stash
 
-        saved_sys_argv = sys.argv[:]
         # First argument is the script name
         argv = [os.path.basename(filename)] + (args or [])
 
         argv = self.encode_argv(argv)
-        sys.argv = argv
+        # Concurrent commands each see their own argv through the wrapper
+        saved_state_argv = current_state.sys_argv
+        current_state.sys_argv = argv
+        saved_sys_argv = sys.argv
+        if not isinstance(sys.argv, ShArgvWrapper):
+            saved_sys_argv = sys.argv[:]
+            sys.argv = argv
 
         # Set current os environ to the threading environ
         saved_os_environ = os.environ
@@ -540,16 +729,18 @@ class ShRuntime(object):
         self.handle_PYTHONPATH()  # Make sure PYTHONPATH is honored
 
         try:
-            with io.open(file_path, "rb", newline=None) as f:
-                content = f.read()
-                code = compile(content, file_path, "exec", dont_inherit=True)
-                exec (code, namespace, namespace)
+            code = self.code_cache.get_code(file_path)
+            exec (code, namespace, namespace)
 
             current_state.return_value = 0
 
         except SystemExit as e:
             current_state.return_value = e.code
 
+        except ShBrokenPipe:
+            # The reader of a concurrent pipe went away (e.g. head), stop quietly
+            current_state.return_value = 141
+
         except Exception as e:
             current_state.return_value = 1
 
@@ -569,6 +760,7 @@ class ShRuntime(object):
             # This means the vars cannot be changed inside a python script. It can only be
             # done through shell command, e.g. NEW_VAR=42
             sys.argv = saved_sys_argv
+            current_state.sys_argv = saved_state_argv
             sys.path = saved_sys_path
             os.environ = saved_os_environ
 
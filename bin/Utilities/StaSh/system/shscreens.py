@@ -81,11 +81,147 @@ class ShChar(_Char):
 
 
 DEFAULT_CHAR = ShChar(data=' ', fg='default', bg='default')
-DEFAULT_LINE = itertools.repeat(DEFAULT_CHAR)
 
 
-def take(n, iterable):
-    return list(itertools.islice(iterable, n))
+def _style_of(char):
+    """
+    Return the style of a character, i.e. all its fields except the data.
+    :param ShChar char: the character
+    :rtype: tuple
+    """
+    return tuple(char[1:])
+
+
+def _make_char(data, style):
+    """
+    Create a ShChar with the given data and style.
+    :param str data: The character or a run of characters
+    :param tuple style: A style as returned by _style_of
+    :rtype: ShChar
+    """
+    return _Char.__new__(ShChar, data, *style)
+
+
+DEFAULT_STYLE = _style_of(DEFAULT_CHAR)
+
+
+class ShLine(object):
+    """
+    A single line of the screen. The characters are stored as one string,
+    which ends with the newline character unless it is the last line of
+    the screen. The styles of the characters are stored as a list of
+    [style, length] runs, so that consecutive characters with the same style
+    share a single entry.
+    Appended characters are collected in a list and only joined when the
+    text is read, so that writing a long line in small pieces does not copy
+    the whole line every time.
+    :param str text: The characters of the line
+    :param list runs: The style runs covering the text
+    """
+    __slots__ = ('_text', '_pieces', '_length', 'runs')
+
+    def __init__(self, text='', runs=None):
+        self.text = text
+        self.runs = runs if runs is not None else []
+
+    def __len__(self):
+        return self._length
+
+    @property
+    def text(self):
+        if self._pieces:
+            self._pieces.insert(0, self._text)
+            self._text = ''.join(self._pieces)
+            self._pieces = []
+        return self._text
+
+    @text.setter
+    def text(self, text):
+        self._text = text
+        self._pieces = []
+        self._length = len(text)
+
+    def add_run(self, style, n):
+        """
+        Add a style run of n characters to the end of the runs.
+        """
+        if n == 0:
+            return
+        if self.runs and self.runs[-1][0] == style:
+            self.runs[-1][1] += n
+        else:
+            self.runs.append([style, n])
+
+    def append(self, s, style):
+        """
+        Append characters with the given style to the line.
+        """
+        self._pieces.append(s)
+        self._length += len(s)
+        self.add_run(style, len(s))
+
+    def slice_runs(self, start, end):
+        """
+        Return the style runs of the characters between start and end.
+        :rtype: list
+        """
+        result = []
+        pos = 0
+        for style, n in self.runs:
+            s, e = max(start, pos), min(end, pos + n)
+            if s < e:
+                result.append([style, e - s])
+            pos += n
+            if pos >= end:
+                break
+        return result
+
+    def style_runs(self, start=0):
+        """
+        Yield (text, style) tuples for the characters from start onwards.
+        """
+        pos = 0
+        for style, n in self.runs:
+            if pos + n > start:
+                yield self.text[max(start, pos):pos + n], style
+            pos += n
+
+    def chars(self, start=0):
+        """
+        Yield the characters from start onwards as ShChar.
+        """
+        for text, style in self.style_runs(start):
+            for c in text:
+                yield _make_char(c, style)
+
+
+def _split_lines(text, runs):
+    """
+    Split text with its style runs into a list of ShLine. The last line is
+    the text after the last newline, which may be empty.
+    :param str text: The text to split
+    :param list runs: The style runs covering the text
+    :rtype: [ShLine]
+    """
+    lines = []
+    run_iter = iter(runs)
+    style, remaining = None, 0
+    pieces = text.split('\n')
+    for idx, piece in enumerate(pieces):
+        if idx < len(pieces) - 1:
+            piece += '\n'
+        line = ShLine(piece)
+        needed = len(piece)
+        while needed > 0:
+            if remaining == 0:
+                style, remaining = next(run_iter)
+                continue
+            n = min(needed, remaining)
+            line.add_run(style, n)
+            needed -= n
+            remaining -= n
+        lines.append(line)
+    return lines
 
 
 # noinspection PyAttributeOutsideInit
@@ -94,6 +230,9 @@ class ShSequentialScreen(object):
     The sequential type in-memory screen. Running scripts can only
     add characters at the end of the screen buffer, no backspace or
     cursor movement is possible. Hence it is sequential.
+    The screen is stored as a sequence of lines, each holding its text as
+    a string and the styles as runs. Positions (cursor, bounds, ranges)
+    are still expressed as offsets from the start of the screen buffer.
     :param int nlines_max: The maximum number of lines to be stored.
     """
 
@@ -104,7 +243,8 @@ class ShSequentialScreen(object):
         self.debug = debug
         self.logger = logging.getLogger('StaSh.Screen')
 
-        self._buffer = deque()  # buffer to hold chars
+        self._lines = deque()  # buffer to hold the lines
+        self._length = 0  # total number of characters in all lines
         self.lock = threading.Lock()
 
         self.attrs = ShChar(' ')
@@ -117,8 +257,10 @@ class ShSequentialScreen(object):
         *args is needed because dispatch from stream always call handlers
         with at least one parameter (even it is a dummy 0).
         """
-        # Empty the buffer
-        self._buffer.clear()
+        # Empty the buffer, there is always at least one (possibly empty) line
+        self._lines.clear()
+        self._lines.append(ShLine())
+        self._length = 0
 
         # The cursor position
         self.cursor_xs = self.cursor_xe = 0
@@ -137,7 +279,13 @@ class ShSequentialScreen(object):
         # relative to start of the Screen's buffer.
         self.intact_right_bound = 0
 
-        self.nlines = 0
+    @property
+    def nlines(self):
+        """
+        The number of newline characters on the screen.
+        :rtype: int
+        """
+        return len(self._lines) - 1
 
     @property
     def cursor_x(self):
@@ -161,14 +309,32 @@ class ShSequentialScreen(object):
         """
         :rtype: str
         """
-        return ''.join(c.data for c in self._buffer)
+        return ''.join(line.text for line in self._lines)
 
     @property
     def text_length(self):
         """
         :rtype: int
         """
-        return len(self._buffer)
+        return self._length
+
+    @property
+    def renderable_runs(self):
+        """
+        Trailing characters that need to be re-rendered, grouped by style.
+        Only the lines from the intact right bound onwards are visited.
+        Note this returns a list of ShChar whose data is a run of characters
+        sharing the same style.
+        :rtype: [ShChar]
+        """
+        _, rbound = self.get_bounds()
+        runs = []
+        for text, style in self._iter_style_runs(rbound):
+            if runs and runs[-1][1] == style:
+                runs[-1][0] += text
+            else:
+                runs.append([text, style])
+        return [_make_char(text, style) for text, style in runs]
 
     @property
     def renderable_chars(self):
@@ -179,7 +345,7 @@ class ShSequentialScreen(object):
         :rtype: [ShChar]
         """
         _, rbound = self.get_bounds()
-        return [self._buffer[x] for x in xrange(rbound, len(self._buffer))]
+        return list(self._iter_chars(rbound))
 
     @property
     def x_modifiable(self):
@@ -189,12 +355,8 @@ class ShSequentialScreen(object):
         :rtype: int
         """
         # The position is either the x_drawend or last LF location plus one,
-        # whichever is larger.
-        for idx in xrange(self.text_length - 1, self.x_drawend - 1, -1):
-            if self._buffer[idx].data == '\n':
-                return idx + 1
-        else:
-            return self.x_drawend
+        # whichever is larger. The last LF is right before the last line.
+        return max(self.x_drawend, self._length - len(self._lines[-1]))
 
     @property
     def modifiable_range(self):
@@ -211,7 +373,7 @@ class ShSequentialScreen(object):
         A string represents the characters that are in the modifiable range.
         :rtype: str
         """
-        return ''.join(self._buffer[idx].data for idx in xrange(*self.modifiable_range))
+        return self._get_text(*self.modifiable_range)
 
     @modifiable_string.setter
     def modifiable_string(self, s):
@@ -235,20 +397,6 @@ class ShSequentialScreen(object):
             if locked:
                 self.lock.release()
 
-    @contextmanager
-    def buffer_rotate(self, n):
-        """
-        This method is used for when operations like replacing, insertion, deletion
-        are needed in the middle of the character buffer.
-        :param n:
-        :return:
-        """
-        self._buffer.rotate(n)
-        try:
-            yield
-        finally:
-            self._buffer.rotate(-n)
-
     def get_bounds(self):
         """
         Get the left and right intact bounds of the screen buffer.
@@ -265,7 +413,127 @@ class ShSequentialScreen(object):
         Mark everything as rendered.
         """
         self.intact_left_bound = 0
-        self.intact_right_bound = len(self._buffer)
+        self.intact_right_bound = self._length
+
+    def _invalidate(self, x):
+        """
+        Mark everything from the given location onwards as to be re-rendered.
+        """
+        if x < self.intact_right_bound:
+            self.intact_right_bound = x
+
+    def _locate(self, x):
+        """
+        Find the line containing the given location. The search starts from
+        the last line, since almost all changes happen at the end of the screen.
+        A newline character belongs to the line it ends.
+        :param int x: location relative to the beginning of screen buffer
+        :return: index of the line and the column of the location in it
+        :rtype: (int, int)
+        """
+        pos = self._length
+        idx = len(self._lines)
+        for line in reversed(self._lines):
+            idx -= 1
+            pos -= len(line)
+            if pos <= x:
+                return idx, x - pos
+        return 0, 0
+
+    def _char_at(self, x):
+        """
+        Return the character at the given location or an empty string
+        if the location is at the end of the buffer.
+        :rtype: str
+        """
+        idx, column = self._locate(x)
+        return self._lines[idx].text[column:column + 1]
+
+    def _get_text(self, start, end):
+        """
+        Return the characters between start and end as a string.
+        :rtype: str
+        """
+        idx, column = self._locate(start)
+        text = ''.join(line.text for line in itertools.islice(self._lines, idx, None))
+        return text[column:column + end - start]
+
+    def _iter_style_runs(self, start=0):
+        """
+        Yield (text, style) tuples for the characters from start onwards.
+        """
+        idx, column = self._locate(start)
+        for line in itertools.islice(self._lines, idx, None):
+            for run in line.style_runs(column):
+                yield run
+            column = 0
+
+    def _iter_chars(self, start=0):
+        """
+        Yield the characters from start onwards as ShChar.
+        """
+        idx, column = self._locate(start)
+        for line in itertools.islice(self._lines, idx, None):
+            for char in line.chars(column):
+                yield char
+            column = 0
+
+    def _append(self, s, style):
+        """
+        Add characters with the given style to the right end of the buffer.
+        Only the last line and the new lines are touched.
+        """
+        if not s:
+            return
+        pieces = s.split('\n')
+        if len(pieces) == 1:
+            self._lines[-1].append(s, style)
+        else:
+            self._lines[-1].append(pieces[0] + '\n', style)
+            for piece in itertools.islice(pieces, 1, len(pieces) - 1):
+                self._lines.append(ShLine(piece + '\n', [[style, len(piece) + 1]]))
+            last = ShLine()
+            last.append(pieces[-1], style)
+            self._lines.append(last)
+        self._length += len(s)
+
+    def _splice(self, start, end, s, style):
+        """
+        Replace the characters between start and end with the given string.
+        Only the lines touched by the range are rebuilt.
+        :param int start: start of the range to be replaced
+        :param int end: end of the range to be replaced
+        :param str s: the new characters
+        :param tuple style: the style of the new characters
+        """
+        start = max(0, min(start, self._length))
+        end = max(start, min(end, self._length))
+        if start == end == self._length:
+            self._append(s, style)
+            return
+
+        idx_first, column_start = self._locate(start)
+        idx_last, column_end = self._locate(end)
+        first, last = self._lines[idx_first], self._lines[idx_last]
+        text = first.text[:column_start] + s + last.text[column_end:]
+        runs = first.slice_runs(0, column_start) + [[style, len(s)]] + last.slice_runs(column_end, len(last.text))
+        new_lines = _split_lines(text, runs)
+        if idx_last < len(self._lines) - 1:
+            # the text ends with the newline of the last replaced line,
+            # so the trailing piece is always empty
+            new_lines.pop()
+
+        # rotate the buffer so the replaced lines are at the right end
+        rotate_n = len(self._lines) - idx_last - 1
+        self._lines.rotate(rotate_n)
+        try:
+            for _ in xrange(idx_last - idx_first + 1):
+                self._lines.pop()
+            self._lines.extend(new_lines)
+        finally:
+            self._lines.rotate(-rotate_n)
+
+        self._length += len(s) - (end - start)
 
     # noinspection PyProtectedMember
     def replace_in_range(self, rng, s, relative_to_x_modifiable=False, set_drawend=False):
@@ -280,25 +548,17 @@ class ShSequentialScreen(object):
         :return:
         """
         if rng is None:
-            rng = (len(self._buffer), len(self._buffer))
+            rng = (self._length, self._length)
 
         elif relative_to_x_modifiable:  # Convert to absolute location if necessary
             rng = rng[0] + self.x_modifiable, rng[1] + self.x_modifiable
 
         # Update the right bound if necessary
-        if rng[0] < self.intact_right_bound:
-            self.intact_right_bound = rng[0]
-
-        rotate_n = max(len(self._buffer) - rng[1], 0)
-        self._buffer.rotate(rotate_n)  # rotate buffer first so deletion is possible
-        try:
-            if rng[0] != rng[1]:  # delete chars if necessary
-                self._pop_chars(rng[1] - rng[0])
-            # The newly inserted chars are always of default properties
-            self._buffer.extend(DEFAULT_CHAR._replace(data=c) for c in s)
+        self._invalidate(rng[0])
 
-        finally:
-            self._buffer.rotate(-rotate_n)
+        # The newly inserted chars are always of default properties
+        self._splice(rng[0], rng[1], s, DEFAULT_STYLE)
+        self._invalidate(self._length)
 
         # Update cursor to the end of this replacement
         self.cursor_x = rng[0] + len(s)
@@ -307,148 +567,101 @@ class ShSequentialScreen(object):
         if set_drawend:
             self.x_drawend = self.cursor_xs
 
-        nlf = s.count('\n')
-        if nlf > 0:  # ensure max number of lines is kept
-            self.nlines += nlf
+        if '\n' in s:  # ensure max number of lines is kept
             self._ensure_nlines_max()
 
-    def _pop_chars(self, n=1):
-        """
-        Remove number of given characters form the right END of the buffer
-        :param n:
-        :return:
-        """
-        for _ in xrange(n):
-            self._buffer.pop()
-        if self.text_length < self.intact_right_bound:
-            self.intact_right_bound = self.text_length
-
     def _ensure_nlines_max(self):
         """
         Keep number of lines under control
         """
-        char_count = line_count = 0
-        for _ in xrange(self.nlines_max, self.nlines):
+        char_count = 0
+        while len(self._lines) - 1 > self.nlines_max:
             # Remove the top line
-            for idx in xrange(self.text_length):
-                char_count += 1
-                if self._buffer.popleft().data == '\n':
-                    line_count += 1
-                    break
+            char_count += len(self._lines.popleft())
 
         if char_count > 0:
+            self._length -= char_count
             self.intact_left_bound += char_count
             self.intact_right_bound -= char_count
             self.cursor_xs -= char_count
             self.cursor_xe -= char_count
             self.x_drawend -= char_count
 
-        if line_count > 0:
-            self.nlines -= line_count
-
-    def _rfind_nth_nl(self, from_x=None, n=1, default=None):
-        if from_x is None:
-            from_x = self.cursor_xs
-        for idx in xrange(from_x, -1, -1):
-            try:  # try for when from_x is equal to buffer length (i.e. at the end of the buffer)
-                if self._buffer[idx].data == '\n':
-                    n -= 1
-                    if n == 0:
-                        return idx
-            except IndexError:
-                pass
-        else:
-            return default
-
-    def _find_nth_nl(self, from_x=None, n=1, default=None):
-        if from_x is None:
-            from_x = self.cursor_xs
-        for idx in xrange(from_x, self.text_length):
-            try:
-                if self._buffer[idx].data == '\n':
-                    n -= 1
-                    if n == 0:
-                        return idx
-            except IndexError:
-                pass
-        else:
-            return default
-
     # noinspection PyProtectedMember
-    def draw(self, c):
+    def draw(self, s):
         """
-        Add given char to the right end of the buffer and update the last draw
+        Add given chars to the right end of the buffer and update the last draw
         location. This method should ONLY be called by ShStream.
-        :param str c: A new character to draw
-        """
-
-        if self.cursor_xs == self.text_length:  # cursor is at the end
-            if self.text_length < self.intact_right_bound:
-                self.intact_right_bound = self.text_length
-            self._buffer.append(self.attrs._replace(data=c))
-            self.cursor_x = self.x_drawend = self.text_length
-
-        else:  # cursor is in the middle
-            # First rotate the text is that to the right of cursor
-            with self.buffer_rotate(self.text_length - self.cursor_xs - 1):
-                # Remove the character at the cursor and append new character
-                # This is effectively character REPLACING operation
-                c_poped = self._buffer.pop()
-                self._buffer.append(self.attrs._replace(data=c))
-                # The replacing must be within a single line, so the newline
-                # character cannot be replaced and instead a new char is inserted
-                # right before the newline.
-                # Also when the new character is a newline, it is effectively an
-                # insertion NOT replacement (i.e. it pushes everything following
-                # it to the next line).
-                if c == '\n' or c_poped.data == '\n':
-                    self._buffer.append(c_poped)
-                # Update the cursor and drawing end
-                self.cursor_x = self.x_drawend = self.cursor_xs + 1
-                # Update the intact right bound
-                if self.x_drawend < self.intact_right_bound:
-                    self.intact_right_bound = self.x_drawend
-
-        # Count the number of lines
-        if c == '\n':
-            self.nlines += 1
+        :param str s: New characters to draw
+        """
+        style = _style_of(self.attrs)
+
+        idx = 0
+        while idx < len(s) and self.cursor_xs < self._length:  # cursor is in the middle
+            c = s[idx]
+            x = self.cursor_xs
+            # The replacing must be within a single line, so the newline
+            # character cannot be replaced and instead a new char is inserted
+            # right before the newline.
+            # Also when the new character is a newline, it is effectively an
+            # insertion NOT replacement (i.e. it pushes everything following
+            # it to the next line).
+            if c == '\n' or self._char_at(x) == '\n':
+                self._splice(x, x, c, style)
+            else:
+                self._splice(x, x + 1, c, style)
+            # Update the cursor and drawing end
+            self.cursor_x = self.x_drawend = x + 1
+            # Update the intact right bound
+            self._invalidate(x)
+            idx += 1
+
+        if idx < len(s):  # cursor is at the end
+            self._invalidate(self._length)
+            self._append(s[idx:], style)
+            self.cursor_x = self.x_drawend = self._length
+
+        if '\n' in s:
             self._ensure_nlines_max()
 
     def backspace(self):
         """
         Move cursor back one character. Do not cross lines.
         """
-        cursor_xs = self.cursor_xs - 1
-        try:
-            if self._buffer[cursor_xs] != '\n':
-                self.cursor_x = cursor_xs
-        except IndexError:
-            self.cursor_x = 0
+        if self.cursor_xs > 0 and self._char_at(self.cursor_xs - 1) != '\n':
+            self.cursor_x = self.cursor_xs - 1
 
     def carriage_return(self):
         """
         Process \r to move cursor to the beginning of the current line.
         """
-        self.cursor_x = self._rfind_nth_nl(default=-1) + 1
+        _, column = self._locate(self.cursor_xs)
+        self.cursor_x = self.cursor_xs - column
+
+    def _line_range(self, x):
+        """
+        Return the range of the line containing the given location,
+        excluding its newline character.
+        :rtype: (int, int)
+        """
+        idx, column = self._locate(x)
+        text = self._lines[idx].text
+        start = x - column
+        return start, start + len(text) - (1 if text.endswith('\n') else 0)
 
     def delete_characters(self, count=0):
         """
         Delete n characters from cursor including cursor within the current line.
         :param count: If count is 0, delete till the next newline.
         """
-        if self.cursor_xs == self.text_length or self._buffer[self.cursor_xs] == '\n':
+        _, line_end = self._line_range(self.cursor_xs)
+        if self.cursor_xs >= line_end:  # at the end of buffer or on a newline
             return
         if count == 0:  # delete till the next newline
-            count = self.text_length
-        with self.buffer_rotate(-self.cursor_xs):
-            for _ in xrange(min(count, self.text_length - self.cursor_xs)):
-                c = self._buffer.popleft()
-                if c.data == '\n':  # do not delete newline
-                    self._buffer.appendleft(c)
-                    break
-            self.x_drawend = self.cursor_xs
-            if self.x_drawend < self.intact_right_bound:
-                self.intact_right_bound = self.x_drawend
+            count = line_end - self.cursor_xs
+        self._splice(self.cursor_xs, min(self.cursor_xs + count, line_end), '', DEFAULT_STYLE)
+        self.x_drawend = self.cursor_xs
+        self._invalidate(self.x_drawend)
 
     def erase_in_line(self, mode=0):
         """
@@ -456,39 +669,24 @@ class ShSequentialScreen(object):
         :param mode:
         :return:
         """
+        line_start, line_end = self._line_range(self.cursor_xs)
         # Calculate the range for erase
         if mode == 0:  # erase from cursor to end of line, including cursor
-            rng = [self.cursor_xs, self._find_nth_nl(default=self.text_length)]
-            try:  # do not include the newline character
-                if self._buffer[rng[0]] == '\n':
-                    rng[0] += 1
-            except IndexError:
-                pass
-
+            rng = [self.cursor_xs, line_end]
         elif mode == 1:  # erase form beginning of line to cursor, including cursor
-            rng = [self._rfind_nth_nl(default=-1) + 1, min(self.cursor_xs + 1, self.text_length)]
-            try:
-                if self._buffer[rng[1] - 1] == '\n':
-                    rng[1] -= 1
-            except IndexError:
-                pass
-
+            rng = [line_start, min(self.cursor_xs + 1, line_end)]
         else:  # mode == 2:  # erase the complete line
-            rng = [self._rfind_nth_nl(default=-1) + 1, self._find_nth_nl(default=self.text_length)]
+            rng = [line_start, line_end]
 
         # fast fail when there is nothing to erase
         if rng[0] >= rng[1]:
             return
 
         # Erase characters in the range
-        with self.buffer_rotate(self.text_length - rng[1]):
-            for _ in xrange(*rng):
-                self._buffer.pop()
-            self._buffer.extend(take(rng[1] - rng[0], DEFAULT_LINE))
-            self.x_drawend = rng[0]
-            # update the intact right bound
-            if self.x_drawend < self.intact_right_bound:
-                self.intact_right_bound = self.x_drawend
+        self._splice(rng[0], rng[1], DEFAULT_CHAR.data * (rng[1] - rng[0]), DEFAULT_STYLE)
+        self.x_drawend = rng[0]
+        # update the intact right bound
+        self._invalidate(self.x_drawend)
 
     # noinspection PyProtectedMember
     def select_graphic_rendition(self, *attrs):
@@ -544,46 +742,29 @@ class ShSequentialScreen(object):
 
             idx_dirty_char = (ncolumns + 1) * min_idx_dirty_line
 
-            # self.logger.info(
-            #     'min_idx_dirty_line={}, idx_dirty_char={}, nchars_pyte_screen={}, self.text_length={}'.format(
-            #         min_idx_dirty_line, idx_dirty_char, nchars_pyte_screen, self.text_length
-            #     )
-            # )
-
             if idx_dirty_char > self.text_length - 1:
                 self.intact_right_bound = self.text_length
             else:
                 self.intact_right_bound = min(self.text_length, nchars_pyte_screen)
-                for idx in xrange(idx_dirty_char, nchars_pyte_screen):
-                    # self.logger.info('idx = %s' % idx)
-                    if idx >= self.text_length:
-                        break
-                    idx_line, idx_column = idx / (ncolumns + 1), idx % (ncolumns + 1)
+                chars = self._iter_chars(idx_dirty_char)
+                for idx, char in zip(xrange(idx_dirty_char, self.intact_right_bound), chars):
+                    idx_line, idx_column = divmod(idx, ncolumns + 1)
                     if idx_column == ncolumns:
                         continue
                     pyte_char = pyte_screen.buffer[idx_line][idx_column]
-                    # self.logger.info('HERE = %s' % idx)
-                    if self._buffer[idx].data != pyte_char.data \
-                            or not ShChar.same_style(self._buffer[idx], pyte_char):
-                        # self.logger.info('breaking %s' % idx)
+                    if char.data != pyte_char.data \
+                            or not ShChar.same_style(char, pyte_char):
                         self.intact_right_bound = idx
                         break
 
-            for _ in xrange(self.intact_right_bound, self.text_length):
-                self._buffer.pop()
+            self._splice(self.intact_right_bound, self.text_length, '', DEFAULT_STYLE)
 
             for idx in xrange(self.intact_right_bound, nchars_pyte_screen):
-                idx_line, idx_column = idx / (ncolumns + 1), idx % (ncolumns + 1)
+                idx_line, idx_column = divmod(idx, ncolumns + 1)
                 if idx_column != ncolumns:
-                    c = pyte_screen.buffer[idx_line][idx_column]
-                    self._buffer.append(ShChar(**c._asdict()))
+                    c = ShChar(**pyte_screen.buffer[idx_line][idx_column]._asdict())
+                    self._append(c.data, _style_of(c))
                 else:
-                    self._buffer.append(ShChar('\n'))
+                    self._append('\n', DEFAULT_STYLE)
 
             self.cursor_x = idx_cursor_pyte_screen
-
-        # self.logger.info('intact_right_bound={}, cursor={}'.format(self.intact_right_bound, self.cursor_xs))
-        # self.logger.info('|%s|' % pyte_screen.display)
-        # self.logger.info('text=|%s|' % self.text)
-        # self.logger.info('text_length=%s' % self.text_length)
-
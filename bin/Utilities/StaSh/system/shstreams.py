@@ -343,6 +343,9 @@ class ShStream(object):
     STATE_ESCAPE = 1
     STATE_ARGUMENTS = 2
 
+    #: Characters which can be drawn as they are, in runs as long as possible
+    PLAIN_CHARS = re.compile(u'[^{}]+'.format(re.escape(u''.join(list(basic) + [ctrl.NUL, ctrl.DEL, ctrl.ESC, ctrl.CSI]))))
+
     def __init__(self, stash, main_screen, debug=False):
 
         self.consume_handlers = (self._stream, self._escape, self._arguments)
@@ -382,8 +385,20 @@ class ShStream(object):
             chars = chars.decode('utf-8', errors='ignore')
 
         with self.main_screen.acquire_lock():
-            for char in chars:
-                self.consume(char)
+            pos = 0
+            while pos < len(chars):
+                if self.state == self.STATE_STREAM:
+                    # draw all the plain characters up to the next control character at once
+                    m = self.PLAIN_CHARS.match(chars, pos)
+                    if m is not None:
+                        try:
+                            self.dispatch('draw', m.group(), reset=False)
+                        except Exception:
+                            self.reset()
+                        pos = m.end()
+                        continue
+                self.consume(chars[pos])
+                pos += 1
 
         if render_it:
             self.stash.renderer.render(no_wait=no_wait)
@@ -44,6 +44,8 @@ class ShState(object):
         self.sys_stdout__ = self.sys_stdout = sys_stdout or sys.stdout
         self.sys_stderr__ = self.sys_stderr = sys_stderr or sys.stderr
         self.sys_path = sys_path or sys.path[:]
+        # argv of the running script, see ShArgvWrapper
+        self.sys_argv = None
 
         self.temporary_environ = {}
 
@@ -201,6 +203,41 @@ class ShWorkerRegistry(object):
             # The worker removes itself from the registry when killed.
 
 
+class ShArgvWrapper(list):
+    """
+    Stand-in for sys.argv while commands of a pipe sequence run concurrently.
+    Every access is dispatched to the argv of the script run by the current
+    worker thread, so that the commands do not see each other's arguments.
+    """
+
+    def __init__(self, default):
+        super(ShArgvWrapper, self).__init__()
+        self.default = default
+
+    def _get_argv(self):
+        thread = threading.current_thread()
+        if isinstance(thread, ShBaseThread) and thread.state.sys_argv is not None:
+            return thread.state.sys_argv
+        return self.default
+
+
+def _dispatch_to_argv(name):
+    def method(self, *args, **kwargs):
+        return getattr(self._get_argv(), name)(*args, **kwargs)
+
+    method.__name__ = name
+    return method
+
+
+for _name in (
+        '__getitem__', '__setitem__', '__delitem__', '__getslice__', '__setslice__', '__delslice__', '__len__',
+        '__iter__', '__reversed__', '__contains__', '__eq__', '__ne__', '__lt__', '__le__', '__gt__', '__ge__',
+        '__add__', '__mul__', '__rmul__', '__repr__', '__str__', 'append', 'extend', 'insert', 'pop', 'remove',
+        'index', 'count', 'reverse', 'sort', 'clear', 'copy'):
+    if hasattr(list, _name):
+        setattr(ShArgvWrapper, _name, _dispatch_to_argv(_name))
+
+
 class ShBaseThread(threading.Thread):
     """ The basic Thread class provides life cycle management.
     """
@@ -219,7 +256,7 @@ class ShBaseThread(threading.Thread):
 
         # The command that the thread runs
         if command.__class__.__name__ == 'ShIO':
-            self.command = ''.join(command._buffer)[::-1].strip()
+            self.command = command.peek().strip()
         else:
             self.command = command
 
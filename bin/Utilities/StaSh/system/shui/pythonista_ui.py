@@ -850,34 +850,26 @@ class ShSequentialRenderer(ShBaseSequentialRenderer):
             'NSStrikethrough': 1 if attrs.strikethrough else 0,
         }
 
-    def _build_attributed_string(self, chars):
+    def _build_attributed_string(self, runs):
         """
         Build attributed text in a more efficient way than char by char.
-        It groups characters with the same attributes and apply the attributes
-        to them at once.
-        :param [ShChar] chars: A list of ShChar upon which the attributed text is built.
+        The screen already groups characters with the same attributes into
+        runs, so the attributes are applied once per run.
+        :param [ShChar] runs: A list of ShChar, each holding a run of characters, upon which the attributed text is built.
         :rtype: object
         """
         # Initialize a string with default attributes
         attributed_text = NSMutableAttributedString.alloc().initWithString_attributes_(
-            ''.join(char.data for char in chars),
+            ''.join(run.data for run in runs),
             self._build_attributes(DEFAULT_CHAR),
         ).autorelease()
 
-        prev_char = chars[0]
-        location = length = 0
-        for idx, curr_char in enumerate(chars):
-            length += 1
-            if not ShChar.same_style(prev_char, curr_char):  # a group is found
-                if not ShChar.same_style(prev_char, DEFAULT_CHAR):  # skip default attrs
-                    attributed_text.setAttributes_range_(self._build_attributes(prev_char), (location, length - 1))
-                length = 1
-                location = idx
-                prev_char = curr_char
-
-            if idx == len(chars) - 1:  # last char
-                if not ShChar.same_style(prev_char, DEFAULT_CHAR):
-                    attributed_text.setAttributes_range_(self._build_attributes(prev_char), (location, length))
+        location = 0
+        for run in runs:
+            length = len(run.data)
+            if not ShChar.same_style(run, DEFAULT_CHAR):  # skip default attrs
+                attributed_text.setAttributes_range_(self._build_attributes(run), (location, length))
+            location += length
 
         return attributed_text
 
@@ -909,7 +901,7 @@ class ShSequentialRenderer(ShBaseSequentialRenderer):
             intact_left_bound, intact_right_bound = self.screen.get_bounds()
             screen_buffer_length = self.screen.text_length
             cursor_xs, cursor_xe = self.screen.cursor_x
-            renderable_chars = self.screen.renderable_chars
+            renderable_runs = self.screen.renderable_runs
             self.screen.clean()
 
         # Specific code for ios 8 to fix possible crash
@@ -930,11 +922,11 @@ class ShSequentialRenderer(ShBaseSequentialRenderer):
         # When there are contents beyond the right bound, either on screen
         # or on terminal, the contents need to be re-rendered.
         if intact_right_bound < max(tv_text_length, screen_buffer_length):
-            if len(renderable_chars) > 0:
+            if len(renderable_runs) > 0:
                 tvo_texts.replaceCharactersInRange_withAttributedString_(
                     (intact_right_bound,
                      tv_text_length - intact_right_bound),
-                    self._build_attributed_string(renderable_chars)
+                    self._build_attributed_string(renderable_runs)
                 )
             else:  # empty string, pure deletion
                 tvo_texts.replaceCharactersInRange_withString_(
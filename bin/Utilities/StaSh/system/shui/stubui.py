@@ -74,7 +74,7 @@ class ShSequentialRenderer(ShBaseSequentialRenderer):
             intact_left_bound, intact_right_bound = self.screen.get_bounds()
             screen_buffer_length = self.screen.text_length
             cursor_xs, cursor_xe = self.screen.cursor_x
-            renderable_chars = self.screen.renderable_chars
+            renderable_runs = self.screen.renderable_runs
             self.screen.clean()
         
         self.terminal.text = self.screen.text
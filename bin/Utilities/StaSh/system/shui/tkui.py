@@ -566,7 +566,7 @@ class ShTerminal(ShBaseTerminal):
         :param rng: range to replace (start, length)
         :type rng: tuple of (int, int)
         :param text: text to insert
-        :type text: iterable of str or ShChar
+        :type text: iterable of str or ShChar (the data of a ShChar may be a run of characters)
         """
         rstart, length = rng
         start, end = self._rel_cursor_pos_to_abs_pos(rstart), self._rel_cursor_pos_to_abs_pos(rstart + length)
@@ -575,17 +575,17 @@ class ShTerminal(ShBaseTerminal):
         self._txt.delete(tkstart, tkend)
         cp = rstart
         for c in text:
-            a = 1
             ctkp = self._tuple_to_tk_index(self._rel_cursor_pos_to_abs_pos(cp))
             if isinstance(c, (six.binary_type, six.text_type)):
+                a = len(c)
                 self._txt.insert(ctkp, c)
             elif isinstance(c, ShChar):
                 if not self._colors_initialized:
                     self._add_color_tags()
                 ch = c.data
                 if c.strikethrough:
-                    ch = u"\u0336" + ch
-                    a += 1
+                    ch = u"".join(u"\u0336" + x for x in ch)
+                a = len(ch)
                 self._txt.insert(ctkp, ch, self._tag_for_char(c))
             else:
                 raise TypeError("Unknown character type {!r}!".format(type(c)))
@@ -670,7 +670,7 @@ class ShSequentialRenderer(ShBaseSequentialRenderer):
             intact_left_bound, intact_right_bound = self.screen.get_bounds()
             screen_buffer_length = self.screen.text_length
             cursor_xs, cursor_xe = self.screen.cursor_x
-            renderable_chars = self.screen.renderable_chars
+            renderable_runs = self.screen.renderable_runs
             self.screen.clean()
         
         # First remove any leading texts that are rotated out
@@ -683,12 +683,11 @@ class ShSequentialRenderer(ShBaseSequentialRenderer):
         # When there are contents beyond the right bound, either on screen
         # or on terminal, the contents need to be re-rendered.
         if intact_right_bound < max(tv_text_length, screen_buffer_length):
-            if len(renderable_chars) > 0:
+            if len(renderable_runs) > 0:
                 self.terminal.replace_in_range(
                     (intact_right_bound,
                      tv_text_length - intact_right_bound),
-                    # "".join([c.data for c in renderable_chars]),
-                    renderable_chars,
+                    renderable_runs,
                 )
             else:  # empty string, pure deletion
                 self.terminal.replace_in_range(
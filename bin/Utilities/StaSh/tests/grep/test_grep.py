@@ -0,0 +1,118 @@
+# -*- coding: utf-8 -*-
+"""tests for the 'grep' command."""
+import os
+import time
+
+from six import StringIO
+
+from stash.system.shio import ShPipe
+from stash.tests.stashtest import StashTestCase
+
+
+class GrepTests(StashTestCase):
+    """Tests for the 'grep' command."""
+
+    def setUp(self):
+        """setup the tests"""
+        self.cwd = self.get_data_path()
+        StashTestCase.setUp(self)
+        self.stash("stashconf enable_styles 0")
+
+    def get_data_path(self):
+        """return the data/ sibling path"""
+        return os.path.abspath(os.path.join(os.path.dirname(__file__), "data"))
+
+    def test_help(self):
+        """test 'grep --help'."""
+        output = self.run_command("grep --help", exitcode=0)
+        self.assertIn("--recursive", output)
+        self.assertIn("--max-count", output)
+
+    def test_grep(self):
+        """test 'grep <pattern> <file>'."""
+        output = self.run_command("grep line lines.txt", exitcode=0)
+        self.assertEqual(output, "lines.txt: first line\nlines.txt: second line\nlines.txt: fourth line\n")
+
+    def test_no_match(self):
+        """test 'grep' without a matching line."""
+        output = self.run_command("grep nope lines.txt", exitcode=1)
+        self.assertEqual(output, "")
+
+    def test_line_numbers(self):
+        """test 'grep -n <pattern> <file>'."""
+        output = self.run_command("grep -n '^[tf]' lines.txt", exitcode=0)
+        self.assertEqual(output, "lines.txt: 1: first line\nlines.txt: 3: third\nlines.txt: 4: fourth line\n")
+
+    def test_invert(self):
+        """test 'grep -v -n <pattern> <file>'."""
+        output = self.run_command("grep -v -n line lines.txt", exitcode=0)
+        self.assertEqual(output, "lines.txt: 3: third\n")
+
+    def test_max_count(self):
+        """test 'grep -m <num> <pattern> <file>'."""
+        output = self.run_command("grep -m 2 line lines.txt", exitcode=0)
+        self.assertEqual(output, "lines.txt: first line\nlines.txt: second line\n")
+
+    def test_count(self):
+        """test 'grep -c <pattern> <file>'."""
+        output = self.run_command("grep -c line lines.txt", exitcode=0)
+        self.assertEqual(output, "     3 lines.txt\n")
+
+    def test_recursive(self):
+        """test 'grep -r -l <pattern> <dir>'."""
+        output = self.run_command("grep -r -l line .", exitcode=0)
+        self.assertEqual(
+            output.splitlines(),
+            [os.path.join(".", "binary.dat"), os.path.join(".", "lines.txt"), os.path.join(".", "sub", "other.txt")],
+        )
+
+    def test_directory_skipped(self):
+        """test 'grep' on a directory without -r."""
+        output = self.run_command("grep line sub", exitcode=1)
+        self.assertEqual(output, "")
+
+    def test_binary(self):
+        """test 'grep' on a binary file."""
+        output = self.run_command("grep ary binary.dat", exitcode=0)
+        self.assertEqual(output, "Binary file binary.dat matches\n")
+
+    def test_unicode(self):
+        """'.' and classes match characters, not bytes."""
+        output = self.run_command("grep 'caf.$' unicode.txt", exitcode=0)
+        self.assertEqual(output, u"unicode.txt: caf\xe9\n")
+        output = self.run_command("grep '^.....$' unicode.txt", exitcode=0)
+        self.assertEqual(output, "unicode.txt: abcde\n")
+        output = self.run_command("grep -c 'f\\w\\b' unicode.txt", exitcode=0)
+        self.assertEqual(output, "     1 unicode.txt\n")
+
+    def test_stdin(self):
+        """test 'cat <file> | grep -n <pattern>'."""
+        output = self.run_command("cat lines.txt | grep -n third", exitcode=0)
+        self.assertEqual(output, "3: third\n")
+
+    def test_stdin_open_pipe(self):
+        """test that 'grep' prints matches of stdin before the pipe is closed."""
+        pipe = ShPipe()
+        outs = StringIO()
+        worker = self.stash.runtime.run(
+            "grep ERROR",
+            final_ins=pipe,
+            final_outs=outs,
+            final_errs=outs,
+            add_to_history=False,
+            cwd=self.cwd,
+        )
+        try:
+            pipe.write(u"starting\nERROR first\nok\n")
+            for i in range(50):
+                if "ERROR first" in outs.getvalue():
+                    break
+                time.sleep(0.05)
+            self.assertEqual(outs.getvalue(), "ERROR first\n")
+            self.assertTrue(worker.is_alive())
+            pipe.write(u"ERROR second\n")
+        finally:
+            pipe.close()
+            worker.join(5)
+        self.assertFalse(worker.is_alive())
+        self.assertEqual(outs.getvalue(), "ERROR first\nERROR second\n")
@@ -0,0 +1,39 @@
+# -*- coding: utf-8 -*-
+"""tests for the 'head' command."""
+import os
+
+from stash.tests.stashtest import StashTestCase
+
+
+class HeadTests(StashTestCase):
+    """Tests for the 'head' command."""
+
+    def setUp(self):
+        """setup the tests"""
+        self.cwd = self.get_data_path()
+        StashTestCase.setUp(self)
+
+    def get_data_path(self):
+        """return the data/ sibling path"""
+        return os.path.abspath(os.path.join(os.path.dirname(__file__), "data"))
+
+    def lines(self, start, end):
+        """return the lines of numbers.txt from start to end, inclusive"""
+        return "".join("line {}\n".format(i) for i in range(start, end + 1))
+
+    def test_default(self):
+        """test 'head <file>'."""
+        output = self.run_command("head numbers.txt", exitcode=0)
+        self.assertEqual(output, self.lines(1, 10))
+
+    def test_lines(self):
+        """test 'head -n <n> <file>'."""
+        output = self.run_command("head -n 3 numbers.txt", exitcode=0)
+        self.assertEqual(output, self.lines(1, 3))
+        output = self.run_command("head -n -2 numbers.txt", exitcode=0)
+        self.assertEqual(output, self.lines(19, 20))
+
+    def test_stdin(self):
+        """test 'head' reading from stdin."""
+        output = self.run_command("cat numbers.txt | head -n 2", exitcode=0)
+        self.assertEqual(output, self.lines(1, 2))
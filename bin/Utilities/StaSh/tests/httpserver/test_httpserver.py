@@ -0,0 +1,129 @@
+# -*- coding: utf-8 -*-
+"""tests for the 'httpserver' command."""
+import os
+import threading
+
+from six.moves import http_client
+
+from stash.tests.stashtest import StashTestCase
+
+
+class HttpserverTests(StashTestCase):
+    """Tests for the 'httpserver' command."""
+
+    def setUp(self):
+        """setup the tests"""
+        self.cwd = self.get_data_path()
+        StashTestCase.setUp(self)
+        self.module = self.load_command_module("httpserver")
+        self.server = self.module.make_server(("127.0.0.1", 0), threaded=True)
+        self.thread = threading.Thread(target=self.server.serve_forever)
+        self.thread.daemon = True
+        self.thread.start()
+        self.conn = http_client.HTTPConnection("127.0.0.1", self.server.server_address[1], timeout=10)
+
+    def tearDown(self):
+        self.conn.close()
+        self.server.shutdown()
+        self.server.server_close()
+        StashTestCase.tearDown(self)
+
+    def get_data_path(self):
+        """return the data/ sibling path"""
+        return os.path.abspath(os.path.join(os.path.dirname(__file__), "data"))
+
+    def request(self, method, path, headers={}, body=None):
+        """send a request on the kept-alive connection and return the response and its body"""
+        self.conn.request(method, path, body=body, headers=headers)
+        response = self.conn.getresponse()
+        return response, response.read()
+
+    def test_get(self):
+        """files are served over a single connection"""
+        with open(os.path.join(self.cwd, "numbers.txt"), "rb") as f:
+            content = f.read()
+        response, body = self.request("GET", "/numbers.txt")
+        self.assertEqual(response.status, 200)
+        self.assertEqual(body, content)
+        self.assertEqual(response.getheader("Accept-Ranges"), "bytes")
+        response, body = self.request("HEAD", "/numbers.txt")
+        self.assertEqual(response.getheader("Content-Length"), str(len(content)))
+        self.assertEqual(body, b"")
+        response, body = self.request("GET", "/missing.txt")
+        self.assertEqual(response.status, 404)
+
+    def test_range(self):
+        """byte ranges are served with 206"""
+        with open(os.path.join(self.cwd, "numbers.txt"), "rb") as f:
+            content = f.read()
+        response, body = self.request("GET", "/numbers.txt", {"Range": "bytes=10-19"})
+        self.assertEqual(response.status, 206)
+        self.assertEqual(body, content[10:20])
+        self.assertEqual(response.getheader("Content-Range"), "bytes 10-19/%d" % len(content))
+        response, body = self.request("GET", "/numbers.txt", {"Range": "bytes=-4"})
+        self.assertEqual(body, content[-4:])
+        response, body = self.request("GET", "/numbers.txt", {"Range": "bytes=100000-"})
+        self.assertEqual(response.status, 416)
+
+    def test_not_modified(self):
+        """unchanged files are answered with 304"""
+        response, body = self.request("GET", "/numbers.txt")
+        last_modified = response.getheader("Last-Modified")
+        response, body = self.request("GET", "/numbers.txt", {"If-Modified-Since": last_modified})
+        self.assertEqual(response.status, 304)
+        self.assertEqual(body, b"")
+
+    def test_listing(self):
+        """directory listings are cached until the directory changes"""
+        response, body = self.request("GET", "/")
+        self.assertEqual(response.status, 200)
+        self.assertIn(b'<a href="numbers.txt">numbers.txt</a>', body)
+        self.assertIn(b'<a href="sub/">sub/</a>', body)
+        self.assertEqual(self.request("GET", "/")[1], body)
+        response, body = self.request("GET", "/sub")
+        self.assertEqual(response.status, 301)
+        self.assertEqual(response.getheader("Location"), "/sub/")
+
+    def test_upload(self):
+        """multipart uploads are written to the directory"""
+        content = b"uploaded\r\n--not the boundary\r\n" * 5000
+        body = (
+            b"--XyZ\r\n"
+            b'Content-Disposition: form-data; name="file"; filename="../upload.bin"\r\n'
+            b"Content-Type: application/octet-stream\r\n\r\n" + content + b"\r\n--XyZ--\r\n"
+        )
+        headers = {"Content-Type": "multipart/form-data; boundary=XyZ", "Content-Length": str(len(body))}
+        path = os.path.join(self.cwd, "sub", "upload.bin")
+        try:
+            response, page = self.request("POST", "/sub/", headers, body)
+            self.assertEqual(response.status, 200)
+            self.assertIn(b"upload success", page)
+            with open(path, "rb") as f:
+                self.assertEqual(f.read(), content)
+            # the connection can still be used
+            self.assertEqual(self.request("GET", "/sub/a.txt")[1], b"a\n")
+        finally:
+            if os.path.exists(path):
+                os.remove(path)
+
+    def test_not_threaded(self):
+        """the server without threads closes each connection, so it can serve other clients"""
+        server = self.module.make_server(("127.0.0.1", 0))
+        thread = threading.Thread(target=server.serve_forever)
+        thread.daemon = True
+        thread.start()
+        first = http_client.HTTPConnection("127.0.0.1", server.server_address[1], timeout=10)
+        second = http_client.HTTPConnection("127.0.0.1", server.server_address[1], timeout=5)
+        try:
+            first.request("GET", "/sub/a.txt")
+            response = first.getresponse()
+            self.assertEqual(response.read(), b"a\n")
+            self.assertTrue(response.will_close)
+            # the first client does not close its connection
+            second.request("GET", "/sub/a.txt")
+            self.assertEqual(second.getresponse().read(), b"a\n")
+        finally:
+            first.close()
+            second.close()
+            server.shutdown()
+            server.server_close()
@@ -0,0 +1,183 @@
+# -*- coding: utf-8 -*-
+"""tests for the commit graph of 'git', using a fake object store"""
+import hashlib
+import os
+import shutil
+import tempfile
+
+from stash.tests.stashtest import StashTestCase
+
+
+def make_sha(name):
+    return hashlib.sha1(name.encode("ascii")).hexdigest().encode("ascii")
+
+
+class FakeObject(object):
+    """an object of the fake object store."""
+
+    def __init__(self, type_name, name, parents=(), target=None):
+        self.type_name = type_name
+        self.id = make_sha(name)
+        self.parents = [make_sha(p) for p in parents]
+        if target is not None:
+            self.object = (None, make_sha(target))
+
+
+class FakeObjectStore(dict):
+    """a dict of sha -> object, counting the lookups."""
+
+    def __init__(self, objects):
+        dict.__init__(self, ((obj.id, obj) for obj in objects))
+        self.lookups = 0
+
+    def __getitem__(self, sha):
+        self.lookups += 1
+        return dict.__getitem__(self, sha)
+
+
+class FakeRepo(object):
+    """a repository as returned by gitutils._get_repo()."""
+
+    def __init__(self, controldir, object_store):
+        self.repo = self
+        self._controldir = controldir
+        self.object_store = object_store
+
+    def controldir(self):
+        return self._controldir
+
+
+# a - b - c - d ----- g
+#      \   \     \   /
+#       \   h     \ /
+#        e - f --- m1, m2 (criss-cross merges of d and f)
+COMMITS = [
+    ("a", []),
+    ("b", ["a"]),
+    ("c", ["b"]),
+    ("d", ["c"]),
+    ("e", ["b"]),
+    ("f", ["e"]),
+    ("g", ["f", "d"]),
+    ("h", ["c"]),
+    ("m1", ["d", "f"]),
+    ("m2", ["f", "d"]),
+]
+
+
+class CommitGraphTests(StashTestCase):
+    """tests for git.commitgraph."""
+
+    def setUp(self):
+        StashTestCase.setUp(self)
+        self.tempdir = tempfile.mkdtemp(prefix="stash_commitgraph_test_")
+        self.path = os.path.join(self.tempdir, "stash_commit_graph")
+        objects = [FakeObject(b"commit", name, parents) for name, parents in COMMITS]
+        objects.append(FakeObject(b"tag", "v1", target="d"))
+        objects.append(FakeObject(b"tag", "v1-signed", target="v1"))
+        objects.append(FakeObject(b"blob", "readme"))
+        self.store = FakeObjectStore(objects)
+
+    def tearDown(self):
+        shutil.rmtree(self.tempdir)
+        StashTestCase.tearDown(self)
+
+    def graph(self, *names):
+        """returns a CommitGraph of the fake object store with the commits names added."""
+        from git.commitgraph import CommitGraph
+        graph = CommitGraph(self.store, self.path)
+        graph.add([make_sha(name) for name in names])
+        return graph
+
+    def test_add(self):
+        """commits are added with their ancestors, tags are peeled"""
+        graph = self.graph("g")
+        self.assertEqual(len(graph), 7)
+        self.assertEqual(graph.parents(make_sha("g")), (make_sha("f"), make_sha("d")))
+        self.assertEqual(graph.generation(make_sha("a")), 1)
+        self.assertEqual(graph.generation(make_sha("g")), 5)
+        tips = graph.add([make_sha("v1-signed"), make_sha("readme"), make_sha("missing")])
+        self.assertEqual(tips, [make_sha("d"), None, None])
+        self.assertNotIn(make_sha("h"), graph)
+
+    def test_merge_bases(self):
+        """the best common ancestors are found"""
+        graph = self.graph("g", "h", "m1", "m2")
+        self.assertEqual(graph.merge_bases(make_sha("d"), make_sha("f")), [make_sha("b")])
+        self.assertEqual(graph.merge_bases(make_sha("g"), make_sha("h")), [make_sha("c")])
+        self.assertEqual(graph.merge_bases(make_sha("g"), make_sha("d")), [make_sha("d")])
+        self.assertEqual(sorted(graph.merge_bases(make_sha("m1"), make_sha("m2"))), sorted([make_sha("d"), make_sha("f")]))
+        self.assertEqual(graph.merge_bases(make_sha("a"), make_sha("a")), [make_sha("a")])
+
+    def test_count_between(self):
+        """the commits reachable from only one side are counted"""
+        graph = self.graph("g", "h")
+        self.assertEqual(graph.count_between(make_sha("g"), make_sha("h")), (4, 1))
+        self.assertEqual(graph.count_between(make_sha("d"), make_sha("g")), (0, 3))
+        self.assertEqual(graph.count_between(make_sha("g"), make_sha("g")), (0, 0))
+
+    def test_is_ancestor(self):
+        """ancestry is checked by walking the parents"""
+        graph = self.graph("g", "h")
+        self.assertTrue(graph.is_ancestor(make_sha("b"), make_sha("g")))
+        self.assertTrue(graph.is_ancestor(make_sha("d"), make_sha("g")))
+        self.assertTrue(graph.is_ancestor(make_sha("g"), make_sha("g")))
+        self.assertFalse(graph.is_ancestor(make_sha("h"), make_sha("g")))
+        self.assertFalse(graph.is_ancestor(make_sha("g"), make_sha("b")))
+        self.assertFalse(graph.is_ancestor(make_sha("e"), make_sha("h")))
+
+    def test_find_prefix(self):
+        """abbreviated shas are looked up in the sorted shas"""
+        graph = self.graph("g")
+        sha = make_sha("e")
+        self.assertEqual(graph.find_prefix(sha[:7]), [sha])
+        self.assertEqual(graph.find_prefix(sha[:7].decode("ascii")), [sha])
+        self.assertEqual(graph.find_prefix(b""), graph.shas())
+        self.assertEqual(graph.shas(), sorted(graph.shas()))
+        self.assertEqual(graph.find_prefix(make_sha("h")[:10]), [])
+
+    def test_save_load(self):
+        """the graph is saved to its file and loaded without reading the object store"""
+        graph = self.graph("g", "h")
+        self.assertTrue(os.path.exists(self.path))
+        lookups = self.store.lookups
+        loaded = self.graph()
+        self.assertEqual(self.store.lookups, lookups)
+        self.assertEqual(loaded.shas(), graph.shas())
+        for sha in graph.shas():
+            self.assertEqual(loaded.parents(sha), graph.parents(sha))
+            self.assertEqual(loaded.generation(sha), graph.generation(sha))
+        # only new commits are read
+        loaded.add([make_sha("m1")])
+        self.assertEqual(self.store.lookups, lookups + 2)
+
+    def test_corrupt_file(self):
+        """a corrupt file is ignored and the graph is rebuilt"""
+        from git.commitgraph import CommitGraph
+        corrupt = (
+            b"",
+            b"unknown format\n",
+            b"stash-commit-graph 1\n" + make_sha("a") + b" 1 5\n",
+            b"stash-commit-graph 1\nx y\n",
+        )
+        for data in corrupt:
+            with open(self.path, "wb") as f:
+                f.write(data)
+            graph = self.graph()
+            self.assertEqual(len(graph), 0)
+            graph.add([make_sha("g")])
+            self.assertEqual(graph.generation(make_sha("g")), 5)
+            self.assertEqual(len(CommitGraph(self.store, self.path)), 7)
+
+    def test_get_commit_graph(self):
+        """the graph of a repository is stored in its git directory and kept in memory"""
+        from git import commitgraph
+        repo = FakeRepo(self.tempdir, self.store)
+        try:
+            graph = commitgraph.get_commit_graph(repo, [make_sha("d")])
+            self.assertTrue(os.path.exists(self.path))
+            self.assertEqual(len(graph), 4)
+            self.assertIs(commitgraph.get_commit_graph(repo, [make_sha("h")]), graph)
+            self.assertEqual(len(graph), 5)
+        finally:
+            commitgraph._commit_graphs.pop(self.path, None)
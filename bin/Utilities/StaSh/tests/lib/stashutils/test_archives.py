@@ -0,0 +1,78 @@
+# -*- coding: utf-8 -*-
+"""tests for stashutils.archives"""
+import gzip
+import io
+import os
+import random
+import shutil
+import tempfile
+import zipfile
+import zlib
+
+from stash.tests.stashtest import StashTestCase
+
+
+def make_data(size):
+    """returns compressible, but not trivial, data"""
+    rng = random.Random(size)
+    words = [b"alpha", b"beta", b"gamma", b"delta", b"\n", b" ", b"0123456789"]
+    return b"".join(rng.choice(words) for i in range(size // 4))[:size]
+
+
+class ArchivesTests(StashTestCase):
+    """tests for the parallel compression helpers."""
+
+    def test_gzip(self):
+        """blocks compressed in parallel form a valid gzip file"""
+        from stashutils.archives import ParallelGzipWriter
+        data = make_data(300000)
+        buf = io.BytesIO()
+        with ParallelGzipWriter(buf, block_size=16 * 1024, threads=3) as gz:
+            for i in range(0, len(data), 5000):
+                gz.write(data[i:i + 5000])
+        with gzip.GzipFile(fileobj=io.BytesIO(buf.getvalue())) as f:
+            self.assertEqual(f.read(), data)
+        # the dictionary keeps the compression close to a single stream
+        self.assertLess(len(buf.getvalue()), len(zlib.compress(data)) * 1.1)
+
+    def test_empty(self):
+        """an empty stream is valid too"""
+        from stashutils.archives import ParallelGzipWriter
+        buf = io.BytesIO()
+        ParallelGzipWriter(buf, threads=1).close()
+        with gzip.GzipFile(fileobj=io.BytesIO(buf.getvalue())) as f:
+            self.assertEqual(f.read(), b"")
+
+    def test_zip_writer(self):
+        """zip archives are written with data descriptors to unseekable files"""
+        from stashutils.archives import ParallelZipWriter
+
+        class Unseekable(io.RawIOBase):
+            def __init__(self):
+                self.buf = io.BytesIO()
+
+            def writable(self):
+                return True
+
+            def write(self, data):
+                return self.buf.write(data)
+
+        tempdir = tempfile.mkdtemp(prefix="stash_archives_test_")
+        try:
+            path = os.path.join(tempdir, "data.txt")
+            data = make_data(100000)
+            with open(path, "wb") as f:
+                f.write(data)
+            out = Unseekable()
+            with ParallelZipWriter(out, block_size=8192, threads=2) as zw:
+                zw.write(path, "data.txt")
+                zw.write(tempdir, "dir")
+                zw.write(path, u"d\xe4ta.txt")
+            with zipfile.ZipFile(io.BytesIO(out.buf.getvalue())) as zf:
+                self.assertIsNone(zf.testzip())
+                self.assertEqual(zf.namelist(), ["data.txt", "dir/", u"d\xe4ta.txt"])
+                self.assertEqual(zf.read("data.txt"), data)
+                self.assertEqual(zf.read(u"d\xe4ta.txt"), data)
+                self.assertTrue(zf.getinfo("dir/").is_dir())
+        finally:
+            shutil.rmtree(tempdir)
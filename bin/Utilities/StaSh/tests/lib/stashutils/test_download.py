@@ -0,0 +1,188 @@
+# -*- coding: utf-8 -*-
+"""tests for stashutils.download, run against the 'httpserver' command"""
+import email.utils
+import json
+import os
+import shutil
+import tempfile
+import threading
+import time
+
+from stash.tests.stashtest import StashTestCase
+
+SIZE = 300000
+
+
+class DownloadTests(StashTestCase):
+    """tests for the download engine."""
+
+    def setUp(self):
+        StashTestCase.setUp(self)
+        self.tempdir = tempfile.mkdtemp(prefix="stash_download_test_")
+        self.served = os.path.join(self.tempdir, "served")
+        os.mkdir(self.served)
+        self.content = bytes(bytearray((i * 7) % 251 for i in range(SIZE)))
+        with open(os.path.join(self.served, "data.bin"), "wb") as f:
+            f.write(self.content)
+        with open(os.path.join(self.served, "small.txt"), "wb") as f:
+            f.write(b"small file\n")
+
+        module = self.load_command_module("httpserver")
+        served = self.served
+        self.requests = requests = []
+
+        class Handler(module.SimpleHTTPRequestHandler):
+            def translate_path(self, path):
+                return os.path.join(served, path.lstrip("/"))
+
+            def send_head(self):
+                requests.append((self.path, self.headers.get("Range")))
+                return module.SimpleHTTPRequestHandler.send_head(self)
+
+            def log_message(self, *args):
+                pass
+
+        self.server = module.ThreadedHTTPServer(("127.0.0.1", 0), Handler)
+        thread = threading.Thread(target=self.server.serve_forever)
+        thread.daemon = True
+        thread.start()
+        self.base = "http://127.0.0.1:{p}/".format(p=self.server.server_address[1])
+
+    def tearDown(self):
+        self.server.shutdown()
+        self.server.server_close()
+        # leave the directory before it is removed
+        os.chdir(os.path.dirname(__file__))
+        shutil.rmtree(self.tempdir)
+        StashTestCase.tearDown(self)
+
+    def downloader(self, **kwargs):
+        from stashutils.download import Downloader
+        return Downloader(min_segment_size=50000, chunk_size=4096, **kwargs)
+
+    def read(self, path):
+        with open(path, "rb") as f:
+            return f.read()
+
+    def test_segmented(self):
+        """large files are downloaded in parallel segments"""
+        path = os.path.join(self.tempdir, "data.bin")
+        download = self.downloader(segments=4).download(self.base + "data.bin", path)
+        self.assertEqual(download.size, SIZE)
+        self.assertEqual(self.read(path), self.content)
+        ranges = sorted(r for p, r in self.requests if r is not None)
+        self.assertEqual(ranges, ["bytes=150000-224999", "bytes=225000-299999", "bytes=75000-149999"])
+        self.assertFalse(os.path.exists(path + ".stash-dl"))
+
+    def test_resume(self):
+        """interrupted downloads only fetch the missing ranges"""
+        from stashutils.download import Download
+        path = os.path.join(self.tempdir, "data.bin")
+        with open(path, "wb") as f:
+            f.write(self.content[:1000] + b"\0" * (SIZE - 1000))
+        # the server uses Last-Modified as the validator
+        validator = email.utils.formatdate(os.stat(os.path.join(self.served, "data.bin")).st_mtime, usegmt=True)
+        Download(self.base + "data.bin", path, SIZE, validator, [[1000, SIZE - 1]]).save()
+        self.downloader().download(self.base + "data.bin", path, resume=True)
+        self.assertEqual(self.read(path), self.content)
+        self.assertEqual(self.requests, [("/data.bin", "bytes=1000-%d" % (SIZE - 1))])
+
+    def test_resume_changed(self):
+        """downloads of changed files are not resumed"""
+        from stashutils.download import DownloadError
+        path = os.path.join(self.tempdir, "data.bin")
+        with open(path, "wb") as f:
+            f.write(self.content[:1000])
+        with open(path + ".stash-dl", "w") as f:
+            json.dump(
+                {
+                    "url": self.base + "data.bin",
+                    "size": SIZE,
+                    "validator": "Thu, 01 Jan 1970 00:00:00 GMT",
+                    "ranges": [[1000, SIZE - 1]]
+                },
+                f
+            )
+        self.assertRaises(DownloadError, self.downloader().download, self.base + "data.bin", path, True)
+
+    def test_interrupted(self):
+        """an interrupted download stops its other segments and can be resumed"""
+        path = os.path.join(self.tempdir, "data.bin")
+        main = threading.current_thread()
+
+        def progress(url, downloaded, total):
+            if threading.current_thread() is main:
+                raise KeyboardInterrupt()
+            time.sleep(0.05)
+
+        start = time.time()
+        self.assertRaises(
+            KeyboardInterrupt, self.downloader(segments=4, progress=progress).download, self.base + "data.bin", path
+        )
+        self.assertLess(time.time() - start, 0.5)
+        self.assertTrue(os.path.exists(path + ".stash-dl"))
+        self.downloader().download(self.base + "data.bin", path, resume=True)
+        self.assertEqual(self.read(path), self.content)
+
+    def test_killed_before_save(self):
+        """the state is saved when the file is preallocated, so a killed download is not taken as complete"""
+        from stashutils.download import Download
+        path = os.path.join(self.tempdir, "data.bin")
+        downloader = self.downloader(segments=4)
+        # the download is killed right after it was started
+        downloader._start(self.base + "data.bin", path).close()
+        self.assertEqual(os.path.getsize(path), SIZE)
+        self.assertEqual(Download.load(self.base + "data.bin", path).remaining, SIZE)
+        download = downloader.download(self.base + "data.bin", path, resume=True)
+        self.assertEqual(download.ranges, [])
+        self.assertEqual(self.read(path), self.content)
+
+    def test_concurrent_save(self):
+        """segments saving the state at the same time do not corrupt it"""
+        from stashutils.download import Download
+        path = os.path.join(self.tempdir, "data.bin")
+        with open(path, "wb") as f:
+            f.write(self.content)
+        download = Download(self.base + "data.bin", path, SIZE, "validator", [[i * 1000, i * 1000 + 999] for i in range(300)])
+
+        def save():
+            for i in range(50):
+                download.save()
+
+        threads = [threading.Thread(target=save) for i in range(4)]
+        for thr in threads:
+            thr.start()
+        for thr in threads:
+            thr.join()
+        self.assertEqual(Download.load(self.base + "data.bin", path).ranges, download.ranges)
+
+    def test_download_all_errors(self):
+        """download_all() reports every failed job, not only failed requests"""
+        results = []
+        jobs = [
+            (self.base + "small.txt", os.path.join(self.tempdir, "missing", "small.txt")),
+            (self.base + "small.txt", os.path.join(self.tempdir, "small.txt")),
+        ]
+        failed = self.downloader().download_all(jobs, parallel=1, callback=lambda u, p, e: results.append((p, e)))
+        self.assertEqual(failed, 1)
+        self.assertEqual([p for p, e in results], [p for u, p in jobs])
+        self.assertIsNotNone(results[0][1])
+        self.assertIsNone(results[1][1])
+
+    def test_wget(self):
+        """'wget -c' continues a partial file and 'wget -i' downloads a list"""
+        self.cwd = self.tempdir
+        with open(os.path.join(self.tempdir, "data.bin"), "wb") as f:
+            f.write(self.content[:5000])
+        output = self.run_command("wget -c {u}data.bin".format(u=self.base), exitcode=0)
+        self.assertIn("Save as: data.bin", output)
+        self.assertEqual(self.read(os.path.join(self.tempdir, "data.bin")), self.content)
+        self.assertIn(("/data.bin", "bytes=5000-"), self.requests)
+
+        os.remove(os.path.join(self.tempdir, "data.bin"))
+        with open(os.path.join(self.tempdir, "urls.txt"), "w") as f:
+            f.write("{u}data.bin\n{u}small.txt\n{u}missing.txt\n".format(u=self.base))
+        output = self.run_command("wget -i urls.txt", exitcode=1)
+        self.assertIn("2 of 3 files downloaded.", output)
+        self.assertEqual(self.read(os.path.join(self.tempdir, "small.txt")), b"small file\n")
+        self.assertEqual(self.read(os.path.join(self.tempdir, "data.bin")), self.content)
@@ -0,0 +1,164 @@
+# -*- coding: utf-8 -*-
+"""tests for the caching FSI"""
+import posixpath
+import stat
+import time
+
+from stash.tests.stashtest import StashTestCase
+
+
+def make_fake_fsi():
+    """returns a FSI standing in for a remote server, which counts the requests."""
+    from stashutils.fsi.base import BaseFSI, make_stat, calc_mode
+    from stashutils.fsi.errors import OperationFailure
+
+    class FakeRemoteFSI(BaseFSI):
+        """a FSI keeping files in memory, like a server would on the other side of the network."""
+
+        def __init__(self, logger=None):
+            self.logger = logger
+            self.path = "/"
+            self.files = {"/data.bin": bytes(bytearray(i % 256 for i in range(10000))), "/dir/a.txt": b"hello"}
+            self.dirs = set(["/", "/dir"])
+            self.calls = []
+
+        def connect(self, *args):
+            return True
+
+        def repr(self):
+            return "Fake remote"
+
+        def get_path(self):
+            return self.path
+
+        def cd(self, name):
+            if name not in self.dirs:
+                raise OperationFailure("NotFound!")
+            self.path = name
+
+        def listdir(self, path="."):
+            self.calls.append(("listdir", path))
+            prefix = path.rstrip("/") + "/"
+            names = [p for p in list(self.files) + list(self.dirs) if posixpath.dirname(p) == path and p != "/"]
+            return sorted(p[len(prefix):] for p in names)
+
+        def stat(self, name):
+            self.calls.append(("stat", name))
+            if name in self.dirs:
+                return make_stat(mode=calc_mode(type=stat.S_IFDIR), mtime=0)
+            if name in self.files:
+                return make_stat(mode=calc_mode(type=stat.S_IFREG), size=len(self.files[name]), mtime=0)
+            raise OperationFailure("NotFound!")
+
+        def read_range(self, name, offset, size):
+            self.calls.append(("read_range", name, offset, size))
+            return self.files[name][offset:offset + size]
+
+        def remove(self, name):
+            self.calls.append(("remove", name))
+            del self.files[name]
+
+        def mkdir(self, name):
+            self.calls.append(("mkdir", name))
+            self.dirs.add(name)
+
+    return FakeRemoteFSI()
+
+
+class CachingFSITests(StashTestCase):
+    """tests for the caching FSI."""
+
+    def setUp(self):
+        StashTestCase.setUp(self)
+        from stashutils.fsi.cached import CachingFSI
+        self.remote = make_fake_fsi()
+        self.fsi = CachingFSI(self.remote, ttl=60, block_size=4096, max_cache_size=3 * 4096)
+        self.assertTrue(self.fsi.connect())
+
+    def tearDown(self):
+        self.fsi.close()
+        StashTestCase.tearDown(self)
+
+    def count(self, kind):
+        """returns the number of requests of a kind the remote has seen."""
+        return len([c for c in self.remote.calls if c[0] == kind])
+
+    def test_stat(self):
+        """stat results are reused"""
+        self.assertEqual(self.fsi.stat("/data.bin").st_size, 10000)
+        self.assertTrue(self.fsi.isfile("/data.bin"))
+        self.assertFalse(self.fsi.isdir("/data.bin"))
+        self.assertTrue(self.fsi.isdir("/dir"))
+        self.assertEqual(self.count("stat"), 2)
+        # failures are cached too
+        self.assertFalse(self.fsi.isdir("/missing"))
+        self.assertFalse(self.fsi.isfile("/missing"))
+        self.assertEqual(self.count("stat"), 3)
+
+    def test_ttl(self):
+        """cached entries expire"""
+        self.fsi.ttl = 0.01
+        self.fsi.stat("/data.bin")
+        self.fsi.listdir("/")
+        time.sleep(0.05)
+        self.fsi.stat("/data.bin")
+        self.fsi.listdir("/")
+        self.assertEqual(self.count("stat"), 2)
+        self.assertEqual(self.count("listdir"), 2)
+
+    def test_listdir(self):
+        """directory listings are reused and relative paths are resolved"""
+        self.assertEqual(self.fsi.listdir("/dir"), ["a.txt"])
+        self.fsi.cd("/dir")
+        self.assertEqual(self.fsi.listdir("."), ["a.txt"])
+        self.assertEqual(self.count("listdir"), 1)
+
+    def test_invalidate(self):
+        """changes made through the FSI invalidate the cache"""
+        self.assertEqual(self.fsi.listdir("/"), ["data.bin", "dir"])
+        self.fsi.mkdir("/new")
+        self.assertEqual(self.fsi.listdir("/"), ["data.bin", "dir", "new"])
+        self.assertTrue(self.fsi.isfile("/dir/a.txt"))
+        self.fsi.remove("/dir/a.txt")
+        self.assertFalse(self.fsi.isfile("/dir/a.txt"))
+        self.assertEqual(self.fsi.listdir("/dir"), [])
+
+    def test_read(self):
+        """files are read in blocks, which are cached"""
+        with self.fsi.open("/data.bin", "rb") as f:
+            data = f.read()
+        self.assertEqual(data, self.remote.files["/data.bin"])
+        self.assertEqual(self.count("read_range"), 3)
+        with self.fsi.open("/data.bin", "rb") as f:
+            self.assertEqual(f.read(), data)
+        self.assertEqual(self.count("read_range"), 3)
+
+    def test_read_range(self):
+        """only the blocks containing a range are read"""
+        self.assertEqual(self.fsi.read_range("/data.bin", 5000, 100), self.remote.files["/data.bin"][5000:5100])
+        self.assertEqual(self.remote.calls[-1], ("read_range", "/data.bin", 4096, 4096))
+        with self.fsi.open("/data.bin", "rb") as f:
+            f.seek(9000)
+            self.assertEqual(f.read(), self.remote.files["/data.bin"][9000:])
+        self.assertEqual(self.count("read_range"), 2)
+        # ranges reaching beyond the end are cut
+        self.assertEqual(self.fsi.read_range("/data.bin", 9990, 100), self.remote.files["/data.bin"][9990:])
+
+    def test_eviction(self):
+        """the least recently used blocks are evicted"""
+        self.fsi.blocks.max_size = 2 * 4096
+        with self.fsi.open("/data.bin", "rb") as f:
+            f.read()
+        self.assertEqual(len(self.fsi.blocks), 2)
+        self.assertLessEqual(self.fsi.blocks.size, 2 * 4096)
+        # the first block was evicted, the last one is still cached
+        self.fsi.read_range("/data.bin", 0, 10)
+        self.fsi.read_range("/data.bin", 9000, 10)
+        self.assertEqual(self.count("read_range"), 4)
+
+    def test_changed_file(self):
+        """blocks of a changed file are not used"""
+        self.fsi.read_range("/data.bin", 0, 10)
+        self.remote.files["/data.bin"] = b"changed"
+        self.fsi.invalidate("/data.bin")
+        self.assertEqual(self.fsi.read_range("/data.bin", 0, 10), b"changed")
@@ -0,0 +1,188 @@
+# -*- coding: utf-8 -*-
+"""tests for the FTP FSI"""
+import ftplib
+import socket
+import stat
+import threading
+
+from stash.tests.stashtest import StashTestCase
+
+MLSD_LINES = [
+    "type=cdir;modify=20180101000000; .",
+    "type=pdir;modify=20180101000000; ..",
+    "type=file;size=10;modify=20180102030405; a.txt",
+    "type=dir;modify=20180101000000; sub dir",
+]
+
+
+class FakeFTP(object):
+    """a fake control connection, serving data connections over socket pairs."""
+
+    def __init__(self, server):
+        self.server = server
+        self.upload = None
+        self.transfers = 0
+
+    def voidcmd(self, cmd):
+        return "200 OK"
+
+    def retrlines(self, cmd, callback):
+        self.server.commands.append(cmd)
+        for line in MLSD_LINES:
+            callback(line)
+
+    def sendcmd(self, cmd):
+        self.server.commands.append(cmd)
+        raise ftplib.error_perm("500 Unknown command")
+
+    def transfercmd(self, cmd, rest=None):
+        self.server.commands.append((cmd, rest))
+        verb, path = cmd.split(" ", 1)
+        ours, theirs = socket.socketpair()
+        if verb == "RETR":
+            theirs.sendall(self.server.files[path][rest or 0:])
+            theirs.close()
+        else:
+            self.upload = (verb, path, theirs)
+        return ours
+
+    def voidresp(self):
+        if self.server.fail_transfers:
+            raise ftplib.error_perm("550 Permission denied")
+        if self.upload is not None:
+            verb, path, sock = self.upload
+            self.upload = None
+            data = b"".join(iter(lambda: sock.recv(4096), b""))
+            sock.close()
+            if verb == "APPE":
+                data = self.server.files.get(path, b"") + data
+            self.server.files[path] = data
+        return "226 Transfer complete"
+
+    def quit(self):
+        self.server.connections -= 1
+
+
+class FakeServer(object):
+    """the state of a fake FTP server."""
+
+    def __init__(self):
+        self.files = {"/a.txt": b"0123456789"}
+        self.commands = []
+        self.connections = 0
+        # whether transfers fail after the data was sent
+        self.fail_transfers = False
+
+    def connect(self):
+        self.connections += 1
+        return FakeFTP(self)
+
+
+class FTPFSITests(StashTestCase):
+    """tests for the FTP FSI."""
+
+    def setUp(self):
+        StashTestCase.setUp(self)
+        from stashutils.fsi.FTP import FTPFSI
+        self.server = FakeServer()
+        self.fsi = FTPFSI()
+        self.fsi.ftp = self.server.connect()
+        self.fsi._new_connection = self.server.connect
+
+    def test_parse_facts(self):
+        """lines of MLSD responses are parsed"""
+        from stashutils.fsi.FTP import parse_facts, stat_from_facts
+        name, facts = parse_facts("Type=file;Size=10;modify=20180102030405; a b.txt\r\n")
+        self.assertEqual(name, "a b.txt")
+        self.assertEqual(facts, {"type": "file", "size": "10", "modify": "20180102030405"})
+        st = stat_from_facts(facts)
+        self.assertTrue(stat.S_ISREG(st.st_mode))
+        self.assertEqual(st.st_size, 10)
+        self.assertEqual(st.st_mtime, 1514862245)
+
+    def test_listdir(self):
+        """the facts of a listing are used by stat"""
+        self.assertEqual(self.fsi.listdir("/"), ["a.txt", "sub dir"])
+        self.assertTrue(self.fsi.isfile("/a.txt"))
+        self.assertTrue(self.fsi.isdir("/sub dir"))
+        self.assertEqual(self.fsi.stat("/a.txt").st_size, 10)
+        self.assertEqual(self.server.commands, ["MLSD /"])
+
+    def test_download(self):
+        """files are streamed and seeking restarts the transfer"""
+        with self.fsi.open("/a.txt", "rb") as f:
+            self.assertEqual(f.read(), b"0123456789")
+            f.seek(4)
+            self.assertEqual(f.read(), b"456789")
+        self.assertEqual(self.server.commands, [("RETR /a.txt", None), ("RETR /a.txt", 4)])
+        self.assertEqual(self.fsi.read_range("/a.txt", 2, 3), b"234")
+        # the connections are reused
+        self.assertEqual(self.server.connections, 2)
+
+    def test_upload(self):
+        """uploads are streamed to the server"""
+        with self.fsi.open("/b.txt", "wb") as f:
+            f.write(b"hello ")
+            f.write(b"world")
+            self.assertEqual(f.tell(), 11)
+        self.assertEqual(self.server.files["/b.txt"], b"hello world")
+        with self.fsi.open("/b.txt", "ab") as f:
+            f.write(b"!")
+        self.assertEqual(self.server.files["/b.txt"], b"hello world!")
+
+    def test_facts_threads(self):
+        """listings and invalidations may run in several threads"""
+        errors = []
+
+        def work(i):
+            try:
+                for j in range(300):
+                    if i % 2:
+                        self.fsi._mlsd("/d{}".format(j % 7))
+                    else:
+                        self.fsi._invalidate("/d{}".format(j % 7))
+            except Exception as e:
+                errors.append(e)
+
+        threads = [threading.Thread(target=work, args=(i, )) for i in range(4)]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+        self.assertEqual(errors, [])
+
+    def test_read_range_error(self):
+        """errors reported after a transfer are raised as OperationFailure"""
+        from stashutils.fsi.errors import OperationFailure
+        self.server.fail_transfers = True
+        self.assertRaises(OperationFailure, self.fsi.read_range, "/a.txt", 2, 3)
+        # the connection is not reused
+        self.server.fail_transfers = False
+        self.assertEqual(self.fsi.read_range("/a.txt", 2, 3), b"234")
+        self.assertEqual(self.server.connections, 2)
+
+    def test_cached(self):
+        """a CachingFSI reads blocks of the file using REST"""
+        from stashutils.fsi.cached import CachingFSI
+        from stashutils.fsi.errors import OperationFailure
+        fsi = CachingFSI(self.fsi, ttl=60, block_size=4, max_cache_size=64)
+        self.assertEqual(fsi.listdir("/"), ["a.txt", "sub dir"])
+        with fsi.open("/a.txt", "rb") as f:
+            self.assertEqual(f.read(), b"0123456789")
+        self.assertEqual(self.server.commands, ["MLSD /", ("RETR /a.txt", None), ("RETR /a.txt", 4), ("RETR /a.txt", 8)])
+        # the blocks are cached
+        with fsi.open("/a.txt", "rb") as f:
+            f.seek(5)
+            self.assertEqual(f.read(3), b"567")
+        self.assertEqual(len(self.server.commands), 4)
+
+        fsi.blocks.clear()
+
+        # errors of the server are not cached
+        fsi = CachingFSI(self.fsi, ttl=60, block_size=4, max_cache_size=64)
+        self.server.fail_transfers = True
+        with fsi.open("/a.txt", "rb") as f:
+            self.assertRaises(OperationFailure, f.read)
+        self.server.fail_transfers = False
+        self.assertEqual(fsi.read_range("/a.txt", 0, 10), b"0123456789")
+        fsi.blocks.clear()
@@ -0,0 +1,107 @@
+# -*- coding: utf-8 -*-
+"""tests for the zipfile FSI"""
+import os
+import shutil
+import stat
+import tempfile
+import zipfile
+
+from stash.tests.stashtest import StashTestCase
+
+
+class ZipfileFSITests(StashTestCase):
+    """tests for the zipfile FSI."""
+
+    def setUp(self):
+        StashTestCase.setUp(self)
+        from stashutils.fsi.zip import ZipfileFSI
+        self.tempdir = tempfile.mkdtemp(prefix="stash_zip_test_")
+        self.path = os.path.join(self.tempdir, "test.zip")
+        with zipfile.ZipFile(self.path, "w", zipfile.ZIP_DEFLATED) as zf:
+            zf.writestr("a.txt", b"a" * 1000)
+            zf.writestr("dir/b.txt", b"b" * 1000)
+            zf.writestr("dir/sub/c.txt", b"c")
+            zf.writestr("stored.txt", b"stored", compress_type=zipfile.ZIP_STORED)
+            zf.comment = b"comment"
+        self.fsi = ZipfileFSI(None)
+        self.assertTrue(self.fsi.connect(self.path))
+
+    def tearDown(self):
+        shutil.rmtree(self.tempdir, ignore_errors=True)
+        StashTestCase.tearDown(self)
+
+    def read_archive(self):
+        """returns the contents of the archive as a dict."""
+        with zipfile.ZipFile(self.path, "r") as zf:
+            self.assertIsNone(zf.testzip())
+            return dict((name, zf.read(name)) for name in zf.namelist())
+
+    def test_listdir(self):
+        """directories are answered from the index"""
+        self.assertEqual(self.fsi.listdir("/"), ["a.txt", "dir", "stored.txt"])
+        self.assertEqual(self.fsi.listdir("dir"), ["b.txt", "sub"])
+        self.fsi.cd("dir/sub")
+        self.assertEqual(self.fsi.listdir("."), ["c.txt"])
+        self.assertEqual(self.fsi.listdir(".."), ["b.txt", "sub"])
+        self.assertTrue(self.fsi.isdir("/dir"))
+        self.assertFalse(self.fsi.isfile("/dir"))
+        self.assertTrue(self.fsi.isfile("/a.txt"))
+        st = self.fsi.stat("/a.txt")
+        self.assertEqual(st.st_size, 1000)
+        self.assertTrue(stat.S_ISREG(st.st_mode))
+        self.fsi.close()
+
+    def test_remove(self):
+        """removed members are dropped when the archive is closed"""
+        self.fsi.remove("dir")
+        self.fsi.remove("a.txt")
+        self.assertEqual(self.fsi.listdir("/"), ["stored.txt"])
+        self.assertFalse(self.fsi.isfile("dir/b.txt"))
+        # the archive itself is only rewritten once it is closed
+        self.assertIn("a.txt", self.read_archive())
+        self.fsi.close()
+        self.assertEqual(self.read_archive(), {"stored.txt": b"stored"})
+        with zipfile.ZipFile(self.path, "r") as zf:
+            self.assertEqual(zf.comment, b"comment")
+
+    def test_overwrite(self):
+        """files written replace the old members"""
+        with self.fsi.open("dir/b.txt", "wb") as f:
+            f.write(b"new")
+        with self.fsi.open("dir/new.txt", "wb") as f:
+            f.write(b"created")
+        with self.fsi.open("dir/b.txt", "rb") as f:
+            self.assertEqual(f.read(), b"new")
+        self.assertEqual(self.fsi.listdir("dir"), ["b.txt", "new.txt", "sub"])
+        self.fsi.close()
+        self.assertEqual(
+            self.read_archive(),
+            {
+                "a.txt": b"a" * 1000,
+                "dir/b.txt": b"new",
+                "dir/sub/c.txt": b"c",
+                "stored.txt": b"stored",
+                "dir/new.txt": b"created",
+            },
+        )
+
+    def test_compact_metadata(self):
+        """the names, comments and attributes of the kept members are preserved"""
+        self.fsi.close()
+        with zipfile.ZipFile(self.path, "a", zipfile.ZIP_DEFLATED) as zf:
+            zinfo = zipfile.ZipInfo(u"d\xe4ta.txt", (2020, 5, 17, 12, 30, 10))
+            zinfo.comment = b"member comment"
+            zinfo.external_attr = 0o640 << 16
+            zf.writestr(zinfo, b"data")
+        from stashutils.fsi.zip import ZipfileFSI
+        fsi = ZipfileFSI(None)
+        self.assertTrue(fsi.connect(self.path))
+        fsi.remove("a.txt")
+        fsi.close()
+        self.assertEqual(self.read_archive()[u"d\xe4ta.txt"], b"data")
+        with zipfile.ZipFile(self.path, "r") as zf:
+            self.assertEqual(zf.comment, b"comment")
+            zinfo = zf.getinfo(u"d\xe4ta.txt")
+            self.assertEqual(zinfo.comment, b"member comment")
+            self.assertEqual(zinfo.external_attr, 0o640 << 16)
+            self.assertEqual(zinfo.date_time, (2020, 5, 17, 12, 30, 10))
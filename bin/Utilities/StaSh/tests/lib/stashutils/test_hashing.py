@@ -0,0 +1,81 @@
+# -*- coding: utf-8 -*-
+"""tests for stashutils.hashing and the checksum commands"""
+import hashlib
+import os
+import shutil
+import tempfile
+
+from stash.tests.stashtest import StashTestCase
+
+
+class HashingTests(StashTestCase):
+    """tests for the hashing engine."""
+
+    def setUp(self):
+        StashTestCase.setUp(self)
+        self.tempdir = tempfile.mkdtemp(prefix="stash_hashing_test_")
+        self.contents = {}
+        for i in range(6):
+            self.write("file{i}.txt".format(i=i), ("line {i}\n".format(i=i) * (i * 100)).encode("ascii"))
+        self.cwd = self.tempdir
+
+    def tearDown(self):
+        # leave the directory before it is removed
+        os.chdir(os.path.dirname(__file__))
+        shutil.rmtree(self.tempdir)
+        StashTestCase.tearDown(self)
+
+    def write(self, name, content):
+        self.contents[name] = content
+        with open(os.path.join(self.tempdir, name), "wb") as f:
+            f.write(content)
+
+    def test_hash_file(self):
+        """all digests are computed in one pass, also for mapped files"""
+        from stashutils import hashing
+        self.write("large.bin", bytes(bytearray(i % 253 for i in range(hashing.MMAP_THRESHOLD + 12345))))
+        for name in ("file3.txt", "large.bin", "file0.txt"):
+            content = self.contents[name]
+            digests = hashing.hash_file(os.path.join(self.tempdir, name), ["MD5", "SHA256", "SHA1"])
+            expected = [hashlib.new(name, content).hexdigest() for name in ("md5", "sha256", "sha1")]
+            self.assertEqual(digests, expected)
+
+    def test_hash_files(self):
+        """files are hashed in parallel, results keep their order"""
+        from stashutils.hashing import hash_files
+        names = sorted(self.contents) + ["missing.txt"]
+        jobs = [(os.path.join(self.tempdir, n), ["SHA1"]) for n in names]
+        results = list(hash_files(jobs, threads=4))
+        self.assertEqual([r[0] for r in results], [j[0] for j in jobs])
+        for name, (path, digests, error) in zip(names[:-1], results):
+            self.assertIsNone(error)
+            self.assertEqual(digests, [hashlib.sha1(self.contents[name]).hexdigest()])
+        self.assertIsNone(results[-1][1])
+        self.assertIsNotNone(results[-1][2])
+
+    def test_several_digests(self):
+        """'-a' adds digests, printed in the tagged format"""
+        output = self.run_command("sha256sum -a md5 -j 3 file1.txt file2.txt", exitcode=0)
+        content = self.contents["file2.txt"]
+        self.assertIn("SHA256 (file2.txt) = " + hashlib.sha256(content).hexdigest(), output)
+        self.assertIn("MD5 (file2.txt) = " + hashlib.md5(content).hexdigest(), output)
+        self.assertLess(output.index("(file1.txt)"), output.index("(file2.txt)"))
+
+    def test_check_tagged(self):
+        """checksum lists may mix formats; missing files fail"""
+        lines = []
+        for name in sorted(self.contents):
+            content = self.contents[name]
+            lines.append("{h}  {n}".format(h=hashlib.md5(content).hexdigest(), n=name))
+            lines.append("SHA1 ({n}) = {h}".format(h=hashlib.sha1(content).hexdigest(), n=name))
+        with open(os.path.join(self.tempdir, "list.txt"), "w") as f:
+            f.write("\n".join(lines) + "\n")
+        output = self.run_command("md5sum -c list.txt", exitcode=0)
+        self.assertEqual(output.count("Pass"), 12)
+        self.assertLess(output.index("file0.txt"), output.index("file5.txt"))
+
+        with open(os.path.join(self.tempdir, "list.txt"), "a") as f:
+            f.write("0123456789abcdef0123456789abcdef  missing.txt\nnot a checksum\n")
+        output = self.run_command("md5sum -c list.txt", exitcode=1)
+        self.assertIn("missing.txt: Fail", output)
+        self.assertIn("Invalid format.", output)
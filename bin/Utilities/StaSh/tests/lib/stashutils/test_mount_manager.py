@@ -0,0 +1,56 @@
+# -*- coding: utf-8 -*-
+"""tests for the resolution of mountpoints"""
+import os
+import shutil
+import tempfile
+
+from stash.tests.stashtest import StashTestCase
+
+
+class MountManagerTests(StashTestCase):
+    """tests for MountManager.get_fsi()."""
+
+    def setUp(self):
+        StashTestCase.setUp(self)
+        from stashutils.mount_manager import MountManager
+        from stashutils.fsi.base import BaseFSI
+        self.tempdir = os.path.realpath(tempfile.mkdtemp())
+        for d in ("mnt/a", "mnt/ab", "mnt/a/b"):
+            os.makedirs(os.path.join(self.tempdir, d))
+        self.manager = MountManager()
+        self.fsis = {}
+        for d in ("mnt/a", "mnt/a/b"):
+            self.fsis[d] = BaseFSI()
+            self.manager.mount_fsi(self.path(d), self.fsis[d], readonly=(d == "mnt/a/b"))
+
+    def tearDown(self):
+        shutil.rmtree(self.tempdir)
+        StashTestCase.tearDown(self)
+
+    def path(self, p):
+        """returns the absolute path of p in the temporary directory."""
+        return os.path.join(self.tempdir, p)
+
+    def test_no_mount(self):
+        """paths outside of mountpoints are returned unchanged"""
+        self.assertEqual(self.manager.get_fsi(self.path("mnt")), (None, self.path("mnt"), False))
+        # a mountpoint is not a prefix of a sibling with a longer name
+        self.assertEqual(self.manager.get_fsi(self.path("mnt/ab/x")), (None, self.path("mnt/ab/x"), False))
+
+    def test_mountpoint(self):
+        """paths on a mountpoint are resolved relative to it"""
+        self.assertEqual(self.manager.get_fsi(self.path("mnt/a")), (self.fsis["mnt/a"], "/", False))
+        self.assertEqual(self.manager.get_fsi(self.path("mnt/a/x/y.txt")), (self.fsis["mnt/a"], "/x/y.txt", False))
+
+    def test_nested(self):
+        """the deepest mountpoint is used"""
+        self.assertEqual(self.manager.get_fsi(self.path("mnt/a/b/c")), (self.fsis["mnt/a/b"], "/c", True))
+        self.assertEqual(self.manager.get_fsi(self.path("mnt/a/bc")), (self.fsis["mnt/a"], "/bc", False))
+
+    def test_unmount(self):
+        """resolved paths are forgotten on unmount"""
+        self.assertEqual(self.manager.get_fsi(self.path("mnt/a/b/c"))[0], self.fsis["mnt/a/b"])
+        self.manager.unmount_fsi(self.path("mnt/a/b"), force=True)
+        self.assertEqual(self.manager.get_fsi(self.path("mnt/a/b/c")), (self.fsis["mnt/a"], "/b/c", False))
+        self.manager.unmount_fsi(self.path("mnt/a"), force=True)
+        self.assertEqual(self.manager.get_fsi(self.path("mnt/a/b/c")), (None, self.path("mnt/a/b/c"), False))
@@ -0,0 +1,71 @@
+# -*- coding: utf-8 -*-
+"""tests for stashutils.snapshot"""
+import os
+import shutil
+import tempfile
+
+from stash.tests.stashtest import StashTestCase
+
+
+class TreeSnapshotTests(StashTestCase):
+    """tests for the directory tree snapshots."""
+
+    def setUp(self):
+        StashTestCase.setUp(self)
+        self.root = tempfile.mkdtemp(prefix="stash_snapshot_test_")
+        self.write("a.txt", "a")
+        self.write("dir/b.txt", "b")
+        self.write("dir/sub/c.txt", "c")
+        self.write("other/d.txt", "d")
+
+    def tearDown(self):
+        shutil.rmtree(self.root, ignore_errors=True)
+        StashTestCase.tearDown(self)
+
+    def write(self, path, content):
+        """writes content to path in the tree, creating parent directories."""
+        ap = os.path.join(self.root, path)
+        if not os.path.isdir(os.path.dirname(ap)):
+            os.makedirs(os.path.dirname(ap))
+        with open(ap, "w") as f:
+            f.write(content)
+
+    def snapshot(self, prev=None):
+        from stashutils.snapshot import TreeSnapshot
+        return TreeSnapshot(self.root, prev=prev)
+
+    def test_unchanged(self):
+        """unchanged directories are not listed again"""
+        old = self.snapshot()
+        self.assertEqual(old.listed, 4)
+        new = old.rescan()
+        self.assertEqual(new.listed, 0)
+        changes = old.compare(new)
+        self.assertFalse(changes)
+        self.assertEqual(len(changes), 0)
+
+    def test_changes(self):
+        """added, modified and removed files and directories are reported"""
+        old = self.snapshot()
+        self.write("dir/b.txt", "modified")
+        self.write("dir/new/e.txt", "e")
+        shutil.rmtree(os.path.join(self.root, "dir", "sub"))
+        os.remove(os.path.join(self.root, "a.txt"))
+        new = old.rescan()
+        # only the root, dir and the new directory are listed
+        self.assertEqual(new.listed, 3)
+        changes = old.compare(new)
+        self.assertEqual(changes.added_dirs, ["dir/new"])
+        self.assertEqual(changes.added, ["dir/new/e.txt"])
+        self.assertEqual(changes.modified, ["dir/b.txt"])
+        self.assertEqual(changes.removed, ["a.txt", "dir/sub/c.txt", "dir/sub"])
+
+    def test_replaced(self):
+        """a file replaced by a directory is removed and added"""
+        old = self.snapshot()
+        os.remove(os.path.join(self.root, "a.txt"))
+        self.write("a.txt/f.txt", "f")
+        changes = old.compare(old.rescan())
+        self.assertEqual(changes.removed, ["a.txt"])
+        self.assertEqual(changes.added_dirs, ["a.txt"])
+        self.assertEqual(changes.added, ["a.txt/f.txt"])
@@ -1,13 +1,54 @@
 # -*- coding: utf-8 -*-
 """tests for the wheel-support"""
+import base64
+import hashlib
+import os
+import shutil
+import sys
+import tempfile
+import zipfile
+import zipimport
+
 import six
 
 from stash.tests.stashtest import StashTestCase
 
 
+def make_wheel(path, files, purelib=True):
+    """creates a wheel containing files, a dict of name -> content."""
+    with zipfile.ZipFile(path, "w") as zf:
+        for name, content in files.items():
+            zf.writestr(name, content)
+        zf.writestr(
+            "stashtest_pkg-1.0.dist-info/WHEEL",
+            "Wheel-Version: 1.0\nGenerator: stash-test\nRoot-Is-Purelib: {p}\n".format(p="true" if purelib else "false"),
+        )
+        zf.writestr("stashtest_pkg-1.0.dist-info/METADATA", "Metadata-Version: 2.1\nName: stashtest-pkg\nRequires-Dist: six\n")
+        zf.writestr("stashtest_pkg-1.0.dist-info/RECORD", "")
+
+
 class WheelsTests(StashTestCase):
     """tests fpr the wheel-support."""
 
+    def setUp(self):
+        StashTestCase.setUp(self)
+        self.tempdir = tempfile.mkdtemp(prefix="stash_wheels_test_")
+        self.site_packages = os.path.join(self.tempdir, "site-packages")
+        os.mkdir(self.site_packages)
+        self.path = os.path.join(self.tempdir, "stashtest_pkg-1.0-py2.py3-none-any.whl")
+        self.files = {
+            "stashtest_pkg/__init__.py": "value = 1\n",
+            "stashtest_pkg/sub/module,x.py": "value = 2\n",
+            "stashtest_pkg-1.0.data/purelib/stashtest_single.py": "value = 3\n",
+            "stashtest_pkg-1.0.data/scripts/script.sh": "echo unsupported\n",
+            "stashtest_pkg-1.0.dist-info/top_level.txt": "stashtest_pkg\nstashtest_single\n",
+        }
+
+    def tearDown(self):
+        sys.path[:] = [p for p in sys.path if not p.startswith(self.tempdir)]
+        shutil.rmtree(self.tempdir)
+        StashTestCase.tearDown(self)
+
     def test_wheel_is_compatible(self):
         """test wheel_is_compatible() result"""
         from stashutils import wheels
@@ -84,3 +125,69 @@ class WheelsTests(StashTestCase):
         expected = "somepackage-1.0.0-py27-none-any.whl"
         result = wheels.generate_filename(**data)
         self.assertEqual(result, expected)
+
+    def test_install(self):
+        """files are written from the archive to site-packages and recorded in RECORD"""
+        from stashutils import wheels
+
+        make_wheel(self.path, self.files)
+        # an older installation is replaced
+        os.makedirs(os.path.join(self.site_packages, "stashtest_pkg", "old"))
+        files_installed, dependencies = wheels.Wheel(self.path).install(self.site_packages)
+        self.assertEqual(dependencies, ["six"])
+        self.assertEqual(
+            sorted(files_installed),
+            sorted(
+                os.path.join(self.site_packages, name)
+                for name in ("stashtest_pkg", "stashtest_single.py", "stashtest_pkg-1.0.dist-info")
+            ),
+        )
+        self.assertFalse(os.path.exists(os.path.join(self.site_packages, "stashtest_pkg", "old")))
+        self.assertFalse(os.path.exists(os.path.join(self.site_packages, "script.sh")))
+        self.assertFalse(os.path.exists(os.path.join(self.site_packages, "stashtest_pkg-1.0.data")))
+
+        with open(os.path.join(self.site_packages, "stashtest_pkg-1.0.dist-info", "RECORD")) as f:
+            record = f.read().splitlines()
+        self.assertIn("stashtest_pkg-1.0.dist-info/RECORD,,", record)
+        self.assertIn('"stashtest_pkg/sub/module,x.py",', "\n".join(record))
+        for line in record:
+            if line.startswith('"'):
+                path, rest = line[1:].split('",', 1)
+            else:
+                path, rest = line.split(",", 1)
+            if path.endswith("RECORD"):
+                continue
+            digest, size = rest.split(",")
+            with open(os.path.join(self.site_packages, *path.split("/")), "rb") as f:
+                content = f.read()
+            expected = base64.urlsafe_b64encode(hashlib.sha256(content).digest()).rstrip(b"=").decode("ascii")
+            self.assertEqual(digest, "sha256=" + expected)
+            self.assertEqual(int(size), len(content))
+        self.assertEqual(len(record), 7)
+
+    def test_zip_import(self):
+        """pure python wheels can be installed as archives"""
+        from stashutils import wheels
+
+        del self.files["stashtest_pkg-1.0.data/purelib/stashtest_single.py"]
+        del self.files["stashtest_pkg-1.0.data/scripts/script.sh"]
+        self.files["stashtest_pkg-1.0.dist-info/top_level.txt"] = "stashtest_pkg\n"
+        make_wheel(self.path, self.files)
+        files_installed, dependencies = wheels.Wheel(self.path, zip_import=True).install(self.site_packages)
+        archive = os.path.join(self.site_packages, os.path.basename(self.path))
+        pth = os.path.join(self.site_packages, "stashtest_pkg.pth")
+        self.assertEqual(files_installed, [archive, pth])
+        self.assertEqual(sorted(os.listdir(self.site_packages)), sorted([os.path.basename(archive), "stashtest_pkg.pth"]))
+        with open(pth) as f:
+            self.assertEqual(f.read().strip(), os.path.basename(archive))
+        self.assertIn(archive, sys.path)
+        self.assertEqual(zipimport.zipimporter(archive).get_source("stashtest_pkg"), "value = 1\n")
+
+    def test_zip_import_impure(self):
+        """wheels which are not pure python are installed normally"""
+        from stashutils import wheels
+
+        make_wheel(self.path, self.files, purelib=False)
+        files_installed, dependencies = wheels.Wheel(self.path, zip_import=True).install(self.site_packages)
+        self.assertTrue(os.path.exists(os.path.join(self.site_packages, "stashtest_pkg", "__init__.py")))
+        self.assertFalse(os.path.exists(os.path.join(self.site_packages, "stashtest_pkg.pth")))
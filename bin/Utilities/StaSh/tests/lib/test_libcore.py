@@ -0,0 +1,77 @@
+# -*- coding: utf-8 -*-
+"""
+Test for 'libcore'.
+"""
+import io
+import os
+import shutil
+import tempfile
+
+from stash.tests.stashtest import StashTestCase
+
+
+class LibCoreTests(StashTestCase):
+    """
+    Tests for 'libcore'
+    """
+
+    def setUp(self):
+        StashTestCase.setUp(self)
+        self.tempdir = tempfile.mkdtemp(prefix="stash_libcore_test_")
+        self.cwd = self.tempdir
+
+    def tearDown(self):
+        # leave the directory before it is removed
+        os.chdir(os.path.dirname(__file__))
+        shutil.rmtree(self.tempdir)
+        StashTestCase.tearDown(self)
+
+    def reader(self, data, block_size):
+        """returns a BlockReader reading data in blocks of block_size."""
+        return self.stash.libcore.BlockReader(io.BytesIO(data), block_size=block_size)
+
+    def test_line_batches(self):
+        """
+        Test that lines are split across blocks correctly.
+        """
+        data = u"first line\näöü\nthird\n\nlast".encode("utf-8")
+        expected = [u"first line\n", u"äöü\n", u"third\n", u"\n", u"last"]
+        for block_size in (1, 2, 3, 7, 100):
+            reader = self.reader(data, block_size)
+            self.assertEqual(list(reader.lines()), expected)
+        self.assertEqual(list(self.reader(data, 4).lines(decode=False)), [l.encode("utf-8") for l in expected])
+
+    def test_count(self):
+        """
+        Test that newlines, words and bytes are counted over blocks.
+        """
+        data = b"one two  three\nfour\n  five six\nseven"
+        for block_size in (1, 2, 3, 5, 100):
+            self.assertEqual(self.reader(data, block_size).count(), (3, 7, len(data)))
+        text = self.stash.libcore.BlockReader(io.StringIO(u"ä b\n"), block_size=1)
+        self.assertEqual(text.count(), (1, 2, 5))
+
+    def test_input_stream(self):
+        """
+        Test that input_stream reports errors and continues with the next file.
+        """
+        a = os.path.join(self.tempdir, "a.txt")
+        missing = os.path.join(self.tempdir, "missing.txt")
+        with open(a, "w") as f:
+            f.write("a\nb\n")
+        result = list(self.stash.libcore.input_stream([a, missing, a]))
+        self.assertEqual(result[:2], [("a\n", a, 1), ("b\n", a, 2)])
+        self.assertIsNone(result[2][0])
+        self.assertEqual(result[2][1], missing)
+        self.assertEqual(result[3:], [("a\n", a, 1), ("b\n", a, 2)])
+
+    def test_wc(self):
+        """
+        Test that 'wc' counts bytes, not characters.
+        """
+        with open(os.path.join(self.tempdir, "a.txt"), "wb") as f:
+            f.write(u"äö word\nline two\n".encode("utf-8"))
+        output = self.run_command("wc a.txt", exitcode=0)
+        self.assertEqual(output.split(), ["2", "4", "19", "a.txt"])
+        output = self.run_command("echo x y | wc -l", exitcode=0)
+        self.assertEqual(output.split(), ["1"])
@@ -0,0 +1,77 @@
+"""
+Test for 'libwalk'.
+"""
+import os
+import shutil
+import tempfile
+
+from stash.tests.stashtest import StashTestCase
+
+
+class LibWalkTests(StashTestCase):
+    """
+    Tests for 'libwalk'
+    """
+    def setUp(self):
+        StashTestCase.setUp(self)
+        self.tempdir = tempfile.mkdtemp()
+        for d in ("a", "a/b", "c"):
+            os.mkdir(os.path.join(self.tempdir, d))
+        for f in ("x.txt", "a/y.txt", "a/b/z.txt", "c/w.txt"):
+            with open(os.path.join(self.tempdir, f), "w") as fout:
+                fout.write(f)
+
+    def tearDown(self):
+        shutil.rmtree(self.tempdir)
+        StashTestCase.tearDown(self)
+
+    def walk(self, **kwargs):
+        """
+        Walk the test tree and return (relative dirpath, depth, dir names, file names) tuples.
+        """
+        return [
+            (os.path.relpath(root, self.tempdir), depth, [d.name for d in dirs], [f.name for f in files])
+            for root, depth, dirs, files in self.stash.libwalk.walk(self.tempdir, **kwargs)
+        ]
+
+    def test_libwalk_is_loaded(self):
+        """
+        Test that 'libwalk' is loaded.
+        """
+        loaded_libs = [an for an in dir(self.stash) if an.startswith("lib")]
+        self.assertIn("libwalk", loaded_libs)
+
+    def test_topdown(self):
+        """
+        Test a top down walk.
+        """
+        expected = [
+            (".", 0, ["a", "c"], ["x.txt"]),
+            ("a", 1, ["b"], ["y.txt"]),
+            (os.path.join("a", "b"), 2, [], ["z.txt"]),
+            ("c", 1, [], ["w.txt"]),
+        ]
+        self.assertEqual(self.walk(), expected)
+        self.assertEqual(self.walk(jobs=4), expected)
+
+    def test_bottomup(self):
+        """
+        Test a bottom up walk.
+        """
+        roots = [r[0] for r in self.walk(topdown=False, jobs=4)]
+        self.assertEqual(roots, [os.path.join("a", "b"), "a", "c", "."])
+
+    def test_maxdepth_and_filter(self):
+        """
+        Test limiting the depth and excluding directories.
+        """
+        self.assertEqual([r[0] for r in self.walk(maxdepth=1)], [".", "a", "c"])
+        self.assertEqual([r[0] for r in self.walk(dir_filter=lambda e: e.name != "a")], [".", "c"])
+
+    def test_stat_reused(self):
+        """
+        Test that the entries provide stat results.
+        """
+        for root, depth, dirs, files in self.stash.libwalk.walk(self.tempdir):
+            for f in files:
+                self.assertEqual(f.stat().st_size, len(os.path.relpath(f.path, self.tempdir)))
@@ -32,7 +32,7 @@ class PipTests(StashTestCase):
         for package in packages:
             if package in ("", " ", "\n"):
                 continue
-            self.run_command("pip uninstall " + package)
+            self.run_command("pip uninstall --force " + package)
 
     def reload_module(self, m):
         """reload a module."""
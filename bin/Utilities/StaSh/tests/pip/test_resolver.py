@@ -0,0 +1,229 @@
+# -*- coding: utf-8 -*-
+"""tests for the dependency resolution, the download cache and the package database of 'pip', run against a local index."""
+import hashlib
+import json
+import os
+import shutil
+import tempfile
+import threading
+import zipfile
+
+from stash.tests.stashtest import StashTestCase
+
+# name -> version -> dependencies
+PACKAGES = {
+    "stashtest-a": {
+        "1.0": ["stashtest-b (>=1.0)", "stashtest-c", "stashtest-d ; extra == 'extra'", 'stashtest-e ; python_version < "3"'],
+    },
+    "stashtest-b": {
+        "1.0": ["stashtest-shared"],
+        "2.0": [],
+    },
+    "stashtest-c": {
+        "1.0": ["stashtest-b (<2.0)", "stashtest-shared (>=1.0)"],
+    },
+    "stashtest-d": {
+        "1.0": [],
+    },
+    "stashtest-e": {
+        "1.0": [],
+    },
+    "stashtest-shared": {
+        "1.0": [],
+    },
+    "stashtest-conflict": {
+        "1.0": ["stashtest-b (>=2.0)", "stashtest-c"],
+    },
+}
+
+
+def make_wheel(path, name, version, dependencies):
+    """creates a wheel of a package with a module containing its version."""
+    module = name.replace("-", "_")
+    distinfo = "{m}-{v}.dist-info".format(m=module, v=version)
+    metadata = "Metadata-Version: 2.1\nName: {n}\nVersion: {v}\n".format(n=name, v=version)
+    metadata += "".join("Requires-Dist: {d}\n".format(d=d) for d in dependencies)
+    with zipfile.ZipFile(path, "w") as zf:
+        zf.writestr(module + "/__init__.py", "version = '{v}'\n".format(v=version))
+        zf.writestr(distinfo + "/WHEEL", "Wheel-Version: 1.0\nGenerator: stash-test\n")
+        zf.writestr(distinfo + "/METADATA", metadata)
+        zf.writestr(distinfo + "/top_level.txt", module + "\n")
+
+
+class ResolverTests(StashTestCase):
+    """tests for installing packages with dependencies from a local index."""
+
+    def setUp(self):
+        StashTestCase.setUp(self)
+        self.tempdir = tempfile.mkdtemp(prefix="stash_pip_test_")
+        self.served = os.path.join(self.tempdir, "served")
+        self.cache = os.path.join(self.tempdir, "cache")
+
+        module = self.load_command_module("httpserver")
+        served = self.served
+        self.requests = requests = []
+
+        class Handler(module.SimpleHTTPRequestHandler):
+            def translate_path(self, path):
+                return os.path.join(served, path.lstrip("/"))
+
+            def send_head(self):
+                requests.append(self.path)
+                return module.SimpleHTTPRequestHandler.send_head(self)
+
+            def log_message(self, *args):
+                pass
+
+        self.server = module.ThreadedHTTPServer(("127.0.0.1", 0), Handler)
+        thread = threading.Thread(target=self.server.serve_forever)
+        thread.daemon = True
+        thread.start()
+        self.base = "http://127.0.0.1:{p}/".format(p=self.server.server_address[1])
+        self.create_index()
+
+    def tearDown(self):
+        self.server.shutdown()
+        self.server.server_close()
+        # remove the packages installed into the default site-packages
+        output = self.run_command("pip list", exitcode=0)
+        for line in output.splitlines():
+            name = line.split(" ")[0]
+            if name in PACKAGES:
+                self.run_command("pip uninstall --force " + name)
+        shutil.rmtree(self.tempdir)
+        StashTestCase.tearDown(self)
+
+    def create_index(self):
+        """creates a PyPI-style JSON index of PACKAGES."""
+        os.makedirs(os.path.join(self.served, "files"))
+        for name, versions in PACKAGES.items():
+            releases = {}
+            for version, dependencies in versions.items():
+                filename = "{m}-{v}-py3-none-any.whl".format(m=name.replace("-", "_"), v=version)
+                path = os.path.join(self.served, "files", filename)
+                make_wheel(path, name, version, dependencies)
+                with open(path, "rb") as f:
+                    digest = hashlib.sha256(f.read()).hexdigest()
+                releases[version] = [
+                    {
+                        "url": self.base + "files/" + filename,
+                        "filename": filename,
+                        "digests": {"sha256": digest},
+                        "packagetype": "bdist_wheel",
+                        "python_version": "py3",
+                        "requires_python": None,
+                    }
+                ]
+            latest = max(versions)
+            for version, dependencies in versions.items():
+                info = {"name": name, "version": version, "summary": "test package", "requires_dist": dependencies}
+                if version == latest:
+                    self.write_json(os.path.join("pypi", name, "json"), {"info": info, "releases": releases})
+                self.write_json(os.path.join("pypi", name, version, "json"), {"info": info, "urls": releases[version]})
+
+    def write_json(self, path, data):
+        path = os.path.join(self.served, path)
+        if not os.path.exists(os.path.dirname(path)):
+            os.makedirs(os.path.dirname(path))
+        with open(path, "w") as f:
+            json.dump(data, f)
+
+    def pip_install(self, target, requirement, exitcode=0):
+        """runs 'pip install' against the local index; returns the output."""
+        return self.run_command(
+            "pip --index-url {b}pypi --cache-dir {c} install {d}{r}".format(
+                b=self.base,
+                c=self.cache,
+                d="" if target is None else "-d {t} ".format(t=target),
+                r=requirement,
+            ),
+            exitcode=exitcode,
+        )
+
+    def installed_version(self, target, name):
+        """returns the version of an installed test package or None."""
+        path = os.path.join(target, name.replace("-", "_"), "__init__.py")
+        if not os.path.exists(path):
+            return None
+        with open(path) as f:
+            return f.read().split("'")[1]
+
+    def test_install(self):
+        """the dependencies are resolved to a consistent set and installed first"""
+        target = os.path.join(self.tempdir, "site1")
+        os.mkdir(target)
+        output = self.pip_install(target, "stashtest-a")
+        # stashtest-c requires stashtest-b<2.0, so stashtest-b must be downgraded
+        self.assertEqual(self.installed_version(target, "stashtest-a"), "1.0")
+        self.assertEqual(self.installed_version(target, "stashtest-b"), "1.0")
+        self.assertEqual(self.installed_version(target, "stashtest-shared"), "1.0")
+        self.assertIsNone(self.installed_version(target, "stashtest-d"))
+        self.assertIsNone(self.installed_version(target, "stashtest-e"))
+        installed = [line.split(": ")[1] for line in output.splitlines() if line.startswith("Package installed: ")]
+        self.assertEqual(sorted(installed), ["stashtest-a", "stashtest-b", "stashtest-c", "stashtest-shared"])
+        self.assertEqual(installed[-1], "stashtest-a")
+        self.assertLess(installed.index("stashtest-shared"), installed.index("stashtest-b"))
+        self.assertLess(installed.index("stashtest-b"), installed.index("stashtest-c"))
+        # every archive is downloaded only once, the unused stashtest-b 2.0 never
+        downloads = [path for path in self.requests if path.startswith("/files/")]
+        self.assertEqual(len(downloads), 4)
+        self.assertEqual(len(set(downloads)), 4)
+        self.assertNotIn("/files/stashtest_b-2.0-py3-none-any.whl", downloads)
+
+        # a second install takes all archives from the cache
+        del self.requests[:]
+        target = os.path.join(self.tempdir, "site2")
+        os.mkdir(target)
+        output = self.pip_install(target, "stashtest-a[extra]")
+        self.assertEqual(self.installed_version(target, "stashtest-d"), "1.0")
+        self.assertEqual(output.count("Using cached"), 4)
+        downloads = [path for path in self.requests if path.startswith("/files/")]
+        self.assertEqual(downloads, ["/files/stashtest_d-1.0-py3-none-any.whl"])
+
+    def test_corrupted_download(self):
+        """downloads not matching the digest of the index fail"""
+        with open(os.path.join(self.served, "files", "stashtest_shared-1.0-py3-none-any.whl"), "ab") as f:
+            f.write(b"corrupted")
+        target = os.path.join(self.tempdir, "site")
+        os.mkdir(target)
+        output = self.pip_install(target, "stashtest-c", exitcode=1)
+        self.assertIn("sha256 mismatch", output)
+        self.assertIsNone(self.installed_version(target, "stashtest-c"))
+
+    def test_conflict(self):
+        """requirements which can not be satisfied together are reported before anything is installed"""
+        target = os.path.join(self.tempdir, "site")
+        os.mkdir(target)
+        output = self.pip_install(target, "stashtest-conflict", exitcode=1)
+        self.assertIn("No version of stashtest-b matches the requirements of: stashtest-c, stashtest-conflict", output)
+        self.assertNotIn("Package installed", output)
+
+    def test_package_database(self):
+        """'pip list', 'pip show' and 'pip uninstall' use the database of installed packages"""
+        self.pip_install(None, "stashtest-c")
+        output = self.run_command("pip list", exitcode=0)
+        self.assertIn("stashtest-b (1.0) - test package", output)
+        self.assertIn("stashtest-c (1.0) - test package", output)
+        self.assertIn("stashtest-shared (1.0) - test package", output)
+
+        output = self.run_command("pip show stashtest-c", exitcode=0)
+        self.assertIn("Name: stashtest-c", output)
+        self.assertIn("requires: stashtest-b, stashtest-shared", output)
+        output = self.run_command("pip show stashtest_shared", exitcode=0)
+        self.assertIn("required-by: stashtest-b, stashtest-c", output)
+
+        # packages required by other packages are only removed with --force
+        output = self.run_command("pip uninstall stashtest-b", exitcode=1)
+        self.assertIn("stashtest-b is required by: stashtest-c", output)
+        self.assertIn("stashtest-b (1.0)", self.run_command("pip list", exitcode=0))
+        output = self.run_command("pip uninstall --force stashtest-b", exitcode=0)
+        self.assertIn("Warning: stashtest-b is required by: stashtest-c", output)
+        # stashtest-shared is still required by stashtest-c
+        self.assertNotIn("Removing dependency", output)
+        output = self.run_command("pip show stashtest-shared", exitcode=0)
+        self.assertIn("required-by: stashtest-c", output)
+
+        output = self.run_command("pip uninstall stashtest-c", exitcode=0)
+        self.assertIn("Removing dependency: stashtest-shared", output)
+        output = self.run_command("pip list", exitcode=0)
+        self.assertNotIn("stashtest", output)
@@ -0,0 +1,87 @@
+# -*- coding: utf-8 -*-
+"""tests for the 'sort' command."""
+import os
+
+from stash.tests.stashtest import StashTestCase
+
+
+class SortTests(StashTestCase):
+    """Tests for the 'sort' command."""
+
+    def setUp(self):
+        """setup the tests"""
+        self.cwd = self.get_data_path()
+        StashTestCase.setUp(self)
+
+    def get_data_path(self):
+        """return the data/ sibling path"""
+        return os.path.abspath(os.path.join(os.path.dirname(__file__), "data"))
+
+    def test_help(self):
+        """test 'sort --help'."""
+        output = self.run_command("sort --help", exitcode=0)
+        self.assertIn("-k", output)
+        self.assertIn("--numeric-sort", output)
+
+    def test_sort(self):
+        """test 'sort <file>'."""
+        output = self.run_command("sort fruits.txt", exitcode=0)
+        self.assertEqual(
+            output,
+            "apple 1 green\napple 10 red\nbanana 2 yellow\ncherry 10 red\npear 3 yellow\n",
+        )
+
+    def test_reverse(self):
+        """test 'sort -r <file>'."""
+        output = self.run_command("sort -r fruits.txt", exitcode=0)
+        self.assertEqual(
+            output,
+            "pear 3 yellow\ncherry 10 red\nbanana 2 yellow\napple 10 red\napple 1 green\n",
+        )
+
+    def test_numeric_key(self):
+        """test 'sort -n -k 2 <file>'."""
+        output = self.run_command("sort -n -k 2,2 fruits.txt", exitcode=0)
+        self.assertEqual(
+            output,
+            "apple 1 green\nbanana 2 yellow\npear 3 yellow\napple 10 red\ncherry 10 red\n",
+        )
+
+    def test_multiple_keys(self):
+        """test 'sort -k 3,3 -k 2,2nr <file>'."""
+        output = self.run_command("sort -k 3,3 -k 2,2nr fruits.txt", exitcode=0)
+        self.assertEqual(
+            output,
+            "apple 1 green\napple 10 red\ncherry 10 red\npear 3 yellow\nbanana 2 yellow\n",
+        )
+
+    def test_unique_separator(self):
+        """test 'sort -u -t <sep> -k <key> <file>'."""
+        output = self.run_command("sort -u -t ' ' -k 1,1 fruits.txt", exitcode=0)
+        self.assertEqual(
+            output,
+            "apple 10 red\nbanana 2 yellow\ncherry 10 red\npear 3 yellow\n",
+        )
+
+    def test_unique_first(self):
+        """test that 'sort -u' keeps the first input line of equal keys, also reversed and spilled."""
+        expected = "apple 10 red\nbanana 2 yellow\ncherry 10 red\npear 3 yellow\n"
+        output = self.run_command("sort -u -k 1,1 -S 30 fruits.txt", exitcode=0)
+        self.assertEqual(output, expected)
+        output = self.run_command("sort -r -u -k 1,1 fruits.txt", exitcode=0)
+        self.assertEqual(output, "".join(reversed(expected.splitlines(True))))
+        output = self.run_command("sort -n -u -k 3,3 -S 30 fruits.txt", exitcode=0)
+        self.assertEqual(output, "pear 3 yellow\n")
+
+    def test_spill(self):
+        """test sorting with a buffer too small to hold the input."""
+        output = self.run_command("sort -n -k 2 -S 100 fruits.txt", exitcode=0)
+        self.assertEqual(
+            output,
+            "apple 1 green\nbanana 2 yellow\npear 3 yellow\napple 10 red\ncherry 10 red\n",
+        )
+
+    def test_invalid_key(self):
+        """test 'sort -k 0 <file>'."""
+        output = self.run_command("sort -k 0 fruits.txt", exitcode=2)
+        self.assertIn("invalid key", output)
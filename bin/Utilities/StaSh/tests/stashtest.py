@@ -6,6 +6,13 @@ import unittest
 import logging
 import tempfile
 
+try:
+    import importlib.util
+except ImportError:
+    # py2
+    import imp
+    importlib = None
+
 try:
     from StringIO import StringIO
 except ImportError:
@@ -89,6 +96,22 @@ class StashTestCase(unittest.TestCase):
         curpath = os.path.dirname(sys.modules[self.__module__].__file__)
         return os.path.abspath(os.path.join(curpath, "data"))
 
+    def load_command_module(self, name):
+        """
+        Load a command of bin/ as a module, to use its classes directly.
+        :param name: name of the command
+        :type name: str
+        :return: the module
+        :rtype: module
+        """
+        path = os.path.join(_STASH_ROOT, "bin", name + ".py")
+        if importlib is None:
+            return imp.load_source(name, path)
+        spec = importlib.util.spec_from_file_location(name, path)
+        module = importlib.util.module_from_spec(spec)
+        spec.loader.exec_module(module)
+        return module
+
     def setUp(self):
         self.logger = logging.getLogger(self.__class__.__name__)
         self.stash = stash.StaSh()
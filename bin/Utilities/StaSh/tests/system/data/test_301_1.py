@@ -0,0 +1,7 @@
+# coding=utf-8
+from __future__ import print_function
+
+i = 0
+while True:
+    print('line {}'.format(i))
+    i += 1
@@ -0,0 +1,72 @@
+# coding=utf-8
+"""Tests for the index of BIN_PATH commands"""
+import os
+import shutil
+import tempfile
+import time
+
+from stash.system.shcmdindex import ShCommandIndex
+from stash.tests.stashtest import StashTestCase
+
+
+class CommandIndexTests(StashTestCase):
+
+    def setUp(self):
+        StashTestCase.setUp(self)
+        self.tempdir = tempfile.mkdtemp()
+        self.index = ShCommandIndex()
+
+    def tearDown(self):
+        shutil.rmtree(self.tempdir)
+        StashTestCase.tearDown(self)
+
+    def create(self, name):
+        with open(os.path.join(self.tempdir, name), 'w') as f:
+            f.write('')
+
+    def test_find(self):
+        """commands are found with and without extension"""
+        self.create('foo.py')
+        self.create('bar.sh')
+        self.create('baz')
+        for name, expected in (('foo', 'foo.py'), ('foo.py', 'foo.py'), ('bar', 'bar.sh'), ('baz', 'baz')):
+            path, dir_match = self.index.find([self.tempdir], name)
+            self.assertEqual(path, os.path.join(self.tempdir, expected))
+        self.assertEqual(self.index.find([self.tempdir], 'nope'), (None, False))
+
+    def test_precedence(self):
+        """earlier directories and exact names take precedence"""
+        other = os.path.join(self.tempdir, 'other')
+        os.mkdir(other)
+        with open(os.path.join(other, 'foo.py'), 'w') as f:
+            f.write('')
+        self.create('foo.sh')
+        self.create('foo.py')
+        self.assertEqual(self.index.find([self.tempdir, other], 'foo')[0], os.path.join(self.tempdir, 'foo.py'))
+        self.create('foo')
+        self.assertEqual(self.index.find([other, self.tempdir], 'foo')[0], os.path.join(other, 'foo.py'))
+
+    def test_directory(self):
+        """a matching directory is reported"""
+        os.mkdir(os.path.join(self.tempdir, 'sub'))
+        self.assertEqual(self.index.find([self.tempdir], 'sub'), (None, True))
+
+    def test_invalidation(self):
+        """a directory is scanned again once it changes"""
+        self.create('foo.py')
+        self.assertEqual(self.index.get_script_names([self.tempdir]), ['foo.py'])
+        # make sure the mtime of the directory changes
+        time.sleep(0.01)
+        self.create('bar.py')
+        os.utime(self.tempdir, (time.time() + 10, time.time() + 10))
+        self.assertEqual(sorted(self.index.get_script_names([self.tempdir])), ['bar.py', 'foo.py'])
+        self.assertEqual(self.index.find([self.tempdir], 'bar')[0], os.path.join(self.tempdir, 'bar.py'))
+
+    def test_runtime(self):
+        """the runtime finds new scripts in BIN_PATH"""
+        self.stash('BIN_PATH={}:$BIN_PATH'.format(self.tempdir), persistent_level=1)
+        self.assertIn('pwd.py', self.stash.runtime.get_all_script_names())
+        with open(os.path.join(self.tempdir, 'hello.py'), 'w') as f:
+            f.write('print("hello")\n')
+        os.utime(self.tempdir, (time.time() + 10, time.time() + 10))
+        self.assertEqual(self.run_command('hello', exitcode=0), 'hello\n')
@@ -0,0 +1,110 @@
+# coding=utf-8
+"""Tests for the compiled script cache"""
+import os
+import shutil
+import tempfile
+import time
+
+from stash.system.shcodecache import ShCodeCache
+from stash.tests.stashtest import StashTestCase
+
+
+class CodeCacheTests(StashTestCase):
+
+    def setUp(self):
+        StashTestCase.setUp(self)
+        self.tempdir = tempfile.mkdtemp()
+        self.script = os.path.join(self.tempdir, 'script.py')
+        self.write_script('print("first")\n')
+
+    def tearDown(self):
+        shutil.rmtree(self.tempdir)
+        StashTestCase.tearDown(self)
+
+    def write_script(self, content):
+        with open(self.script, 'w') as f:
+            f.write(content)
+
+    def get_cache(self, size=8, persistent=0):
+        cache = ShCodeCache(self.stash, cache_dir=os.path.join(self.tempdir, 'cache'))
+        cache.code_cache_size = size
+        cache.persistent_code_cache = persistent
+        return cache
+
+    def test_cached(self):
+        """a script is only compiled once"""
+        cache = self.get_cache()
+        code = cache.get_code(self.script)
+        self.assertIs(cache.get_code(self.script), code)
+
+    def test_modified(self):
+        """a modified script is compiled again"""
+        cache = self.get_cache()
+        code = cache.get_code(self.script)
+        self.write_script('print("second one")\n')
+        new_code = cache.get_code(self.script)
+        self.assertIsNot(new_code, code)
+        self.assertIn('second one', new_code.co_consts)
+
+    def test_lru(self):
+        """the least recently used script is evicted"""
+        cache = self.get_cache(size=2)
+        paths = []
+        for i in range(3):
+            path = os.path.join(self.tempdir, 'script_%d.py' % i)
+            with open(path, 'w') as f:
+                f.write('x = %d\n' % i)
+            paths.append(path)
+        first = cache.get_code(paths[0])
+        cache.get_code(paths[1])
+        cache.get_code(paths[0])
+        cache.get_code(paths[2])
+        self.assertEqual(len(cache), 2)
+        self.assertIs(cache.get_code(paths[0]), first)
+
+    def test_disabled(self):
+        """a size of 0 disables the cache"""
+        cache = self.get_cache(size=0)
+        cache.get_code(self.script)
+        self.assertEqual(len(cache), 0)
+
+    def test_persistent(self):
+        """compiled code is stored on disk and loaded by a new cache"""
+        cache = self.get_cache(persistent=1)
+        cache.get_code(self.script)
+        self.assertEqual(len(os.listdir(cache.cache_dir)), 1)
+        new_cache = self.get_cache(persistent=1)
+        new_cache.compile = None  # must not be needed
+        self.assertIn('first', new_cache.get_code(self.script).co_consts)
+
+    def test_modified_same_mtime(self):
+        """an edit keeping the mtime and size of a script is detected"""
+        cache = self.get_cache(persistent=1)
+        st = os.stat(self.script)
+        cache.get_code(self.script)
+        time.sleep(0.05)
+        self.write_script('print("secnd")\n')
+        os.utime(self.script, (st.st_atime, st.st_mtime))
+        self.assertIn('secnd', cache.get_code(self.script).co_consts)
+        self.assertIn('secnd', self.get_cache(persistent=1).get_code(self.script).co_consts)
+
+    def test_persistent_limit(self):
+        """the least recently used files are removed from the disk cache"""
+        cache = self.get_cache(size=2, persistent=1)
+        paths = []
+        for i in range(3):
+            path = os.path.join(self.tempdir, 'script_%d.py' % i)
+            with open(path, 'w') as f:
+                f.write('x = %d\n' % i)
+            paths.append(path)
+            cache.get_code(path)
+            time.sleep(0.05)
+        files = os.listdir(cache.cache_dir)
+        self.assertEqual(len(files), 2)
+        self.assertNotIn(os.path.basename(cache._get_cache_path(os.path.abspath(paths[0]))), files)
+
+    def test_run_modified(self):
+        """the runtime picks up changes of a script"""
+        self.assertEqual(self.run_command(self.script, exitcode=0), 'first\n')
+        self.write_script('print("second one")\n')
+        self.assertEqual(self.run_command(self.script, exitcode=0), 'second one\n')
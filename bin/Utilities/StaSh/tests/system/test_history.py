@@ -2,7 +2,10 @@
 # coding=utf-8
 
 import os
+import shutil
+import tempfile
 
+from stash.system.shcommon import ShEventNotFound
 from stash.system.shhistory import ShHistory
 from stash.tests.stashtest import StashTestCase
 
@@ -196,32 +199,36 @@ class HistoryTests(StashTestCase):
     def test_save_load(self):
         """test saving and loading of the history"""
         elements = ["1", "2", "3", "4", "5"]
-        filename = "history_test_s_l"
-        hname = "SaveLoadTest"
-        self.history.swap(hname)
-        # add elements
-        for e in elements:
-            self.history.add(e)
-        # ensure correctly added
-        self.assertEqual(len(self.history.getlist()), len(elements))
-        # save
-        self.history.save(filename)
-        # assert no changes due to save
-        self.assertEqual(len(self.history.getlist()), len(elements))
-        # load
-        h = ShHistory.load(filename, self.stash)
-        h.swap(hname)
-        # log a few more debug values
-        self.logger.debug("h._histories: " + repr(h._histories))
-        self.logger.debug("h._current: " + repr(h._current))
-        self.logger.debug("self.history._histories: " + repr(self.history._histories))
-        self.logger.debug("self.history._current: " + repr(self.history._current))
-        # assert unique
-        self.assertIsNot(h, self.history)
-        # ensure all elements were loaded
-        self.assertEqual(len(self.history.getlist()), len(elements))
-        # ensure correct order
-        self.assertListEqual(self.history.getlist(), h.getlist())
+        tempdir = tempfile.mkdtemp(prefix="stash_history_test_")
+        try:
+            filename = os.path.join(tempdir, "history_test_s_l")
+            hname = "SaveLoadTest"
+            self.history.swap(hname)
+            # add elements
+            for e in elements:
+                self.history.add(e)
+            # ensure correctly added
+            self.assertEqual(len(self.history.getlist()), len(elements))
+            # save
+            self.history.save(filename)
+            # assert no changes due to save
+            self.assertEqual(len(self.history.getlist()), len(elements))
+            # load
+            h = ShHistory.load(filename, self.stash)
+            h.swap(hname)
+            # log a few more debug values
+            self.logger.debug("h._histories: " + repr(h._histories))
+            self.logger.debug("h._current: " + repr(h._current))
+            self.logger.debug("self.history._histories: " + repr(self.history._histories))
+            self.logger.debug("self.history._current: " + repr(self.history._current))
+            # assert unique
+            self.assertIsNot(h, self.history)
+            # ensure all elements were loaded
+            self.assertEqual(len(self.history.getlist()), len(elements))
+            # ensure correct order
+            self.assertListEqual(self.history.getlist(), h.getlist())
+        finally:
+            shutil.rmtree(tempdir)
 
     def test_load_fail(self):
         """test that loading a nonexistent file fails"""
@@ -242,4 +249,62 @@ class HistoryTests(StashTestCase):
         expected = ["4", "3", "2", "1"]
         self.assertListEqual(h.getlist(), expected)
 
-    # TODO: tests for .up(), .down() and .search()
+    def test_maxsize(self):
+        """test that only the newest maxsize entries are kept"""
+        self.history.maxsize = 3
+        for i in range(10):
+            self.history.add(str(i))
+        self.assertListEqual(self.history.getlist(), ["9", "8", "7"])
+        self.assertEqual(self.history.search("!0"), "7")
+        self.assertEqual(self.history.reverse_search("5"), (-1, None))
+
+    def test_search(self):
+        """test ShHistory.search()"""
+        for e in ["ls -l", "cd foo", "ls -a", "echo a_very_long_line"]:
+            self.history.add(e)
+        self.assertEqual(self.history.search("!!"), "echo a_very_long_line")
+        self.assertEqual(self.history.search("!ls"), "ls -a")
+        self.assertEqual(self.history.search("!cd"), "cd foo")
+        self.assertEqual(self.history.search("!echo a_very"), "echo a_very_long_line")
+        self.assertEqual(self.history.search("!0"), "ls -l")
+        self.assertEqual(self.history.search("!-1"), "echo a_very_long_line")
+        with self.assertRaises(ShEventNotFound):
+            self.history.search("!pwd")
+
+    def test_reverse_search(self):
+        """test ShHistory.reverse_search()"""
+        for e in ["git status", "ls", "git commit", "pwd"]:
+            self.history.add(e)
+        idx, entry = self.history.reverse_search("git")
+        self.assertEqual((idx, entry), (1, "git commit"))
+        idx, entry = self.history.reverse_search("git", idx + 1)
+        self.assertEqual((idx, entry), (3, "git status"))
+        self.assertEqual(self.history.reverse_search("git", idx + 1), (-1, None))
+        self.assertEqual(self.history.reverse_search("s"), (2, "ls"))
+        self.assertEqual(self.history.reverse_search("nothing"), (-1, None))
+
+    def test_save_append(self):
+        """test that saving again only appends the new entries"""
+        filename = os.path.join(self.get_data_path(), "history_test_append")
+        try:
+            self.history.add("a")
+            self.history.add("b")
+            self.history.save(filename)
+            with open(filename) as fin:
+                n_lines = len(fin.readlines())
+            self.history.add("c")
+            self.history.save(filename)
+            with open(filename) as fin:
+                self.assertEqual(len(fin.readlines()), n_lines + 1)
+            h = ShHistory.load(filename, self.stash)
+            h.swap("HistoryTest")
+            self.assertListEqual(h.getlist(), ["c", "b", "a"])
+            # a cleared history requires the log to be rewritten
+            h.clear()
+            h.save(filename)
+            h = ShHistory.load(filename, self.stash)
+            h.swap("HistoryTest")
+            self.assertListEqual(h.getlist(), [])
+        finally:
+            if os.path.exists(filename):
+                os.remove(filename)
@@ -0,0 +1,92 @@
+# coding=utf-8
+"""Tests for the ShIO input buffer"""
+import ctypes
+import threading
+import time
+
+from six import StringIO
+
+from stash.tests.stashtest import StashTestCase
+
+
+class ShIOTests(StashTestCase):
+
+    def test_readline(self):
+        """readline returns whole lines and strips the EOF"""
+        io = self.stash.io
+        io.push(u'first\nsec')
+        io.push(u'ond\nthird\0')
+        self.assertEqual(io.readline(), u'first\n')
+        self.assertEqual(io.readline(), u'second\n')
+        self.assertEqual(io.readline(), u'third')
+
+    def test_read(self):
+        """read returns the requested number of characters across chunks"""
+        io = self.stash.io
+        io.push(u'abc')
+        io.push(u'defg')
+        self.assertEqual(io.read(5), u'abcde')
+        self.assertEqual(io.read(), u'fg')
+
+    def test_readline_no_block(self):
+        """only complete lines are returned, the rest is kept"""
+        io = self.stash.io
+        io.push(u'ls\npwd\nec')
+        self.assertEqual(list(io.readline_no_block()), [u'ls\n', u'pwd\n'])
+        io.push(u'ho\n')
+        self.assertEqual(list(io.readline_no_block()), [u'echo\n'])
+
+    def test_wakeup(self):
+        """a blocked reader is woken up as soon as input is pushed"""
+        io = self.stash.io
+        lines = []
+        t = threading.Thread(target=lambda: lines.append(io.readline()))
+        t.start()
+        time.sleep(0.1)
+        self.assertEqual(lines, [])
+        io.push(u'hello\n')
+        t.join(0.05)
+        self.assertFalse(t.is_alive())
+        self.assertEqual(lines, [u'hello\n'])
+
+    def test_kill_blocked_reader(self):
+        """a reader waiting for input can be killed"""
+        io = self.stash.io
+        interrupted = threading.Event()
+
+        def reader():
+            try:
+                io.readline()
+            except KeyboardInterrupt:
+                interrupted.set()
+
+        t = threading.Thread(target=reader)
+        t.daemon = True
+        t.start()
+        time.sleep(0.2)
+        # the same way a job is killed by ShCtypesThread
+        ctypes.pythonapi.PyThreadState_SetAsyncExc(ctypes.c_ulong(t.ident), ctypes.py_object(KeyboardInterrupt))
+        t.join(2)
+        self.assertFalse(t.is_alive())
+        self.assertTrue(interrupted.is_set())
+
+    def test_peek(self):
+        """peek returns the buffered input in order without consuming it"""
+        io = self.stash.io
+        io.push(u'ls')
+        io.push(u' -l\n')
+        self.assertEqual(io.peek(), u'ls -l\n')
+        self.assertEqual(io.readline(), u'ls -l\n')
+        self.assertEqual(io.peek(), u'')
+
+    def test_job_command(self):
+        """a job started from the input buffer shows its command"""
+        io = self.stash.io
+        io.push(u'echo')
+        io.push(u' hello\n')
+        outs = StringIO()
+        worker = self.stash.runtime.run(final_outs=outs, add_to_history=False, add_new_inp_line=False)
+        self.assertEqual(worker.command, u'echo hello')
+        worker.join(2)
+        self.assertFalse(worker.is_alive())
+        self.assertEqual(outs.getvalue(), u'hello\n')
@@ -0,0 +1,247 @@
+# coding=utf-8
+"""Tests for the command line parser, checked against the original pyparsing grammar"""
+import random
+import unittest
+
+import six
+
+try:
+    import pyparsing as pp
+except ImportError:
+    pp = None
+
+from stash.system.shcommon import ShSyntaxError
+from stash.system.shparsers import ShParser, ShToken, _WORD_CHARS
+from stash.tests.stashtest import StashTestCase
+
+
+class ReferenceParser(object):
+    """
+    The pyparsing implementation of the grammar which was used before the
+    hand written parser, reduced to building the tokens.
+    """
+
+    _NEXT_WORD_CMD = '_NEXT_WORD_CMD'
+    _NEXT_WORD_VAL = '_NEXT_WORD_VAL'
+    _NEXT_WORD_FILE = '_NEXT_WORD_FILE'
+
+    def __init__(self):
+        escaped = pp.Combine("\\" + pp.Word(pp.printables + ' ', exact=1)).setParseAction(self.part_action(ShToken._ESCAPED))
+        escaped_oct = pp.Combine("\\" + pp.Word('01234567', max=3)).setParseAction(self.part_action(ShToken._ESCAPED_OCT))
+        escaped_hex = pp.Combine("\\x" + pp.Word('0123456789abcdefABCDEF', exact=2)).setParseAction(self.part_action(ShToken._ESCAPED_HEX))
+        uq_word = (pp.Literal('&3') | pp.Word(_WORD_CHARS)).setParseAction(self.part_action(ShToken._UQ_WORD))
+        bq_word = pp.QuotedString('`', escChar='\\', unquoteResults=False).setParseAction(self.part_action(ShToken._BQ_WORD))
+        dq_word = pp.QuotedString('"', escChar='\\', unquoteResults=False).setParseAction(self.part_action(ShToken._DQ_WORD))
+        sq_word = pp.QuotedString("'", escChar='\\', unquoteResults=False).setParseAction(self.part_action(ShToken._SQ_WORD))
+        word = pp.Combine(pp.OneOrMore(escaped ^ escaped_oct ^ escaped_hex
+                                       ^ uq_word ^ bq_word ^ dq_word ^ sq_word))\
+            .setParseAction(self.word_action)
+
+        identifier = pp.Word(pp.alphas + '_', pp.alphas + pp.nums + '_')
+        assign_op = pp.Literal('=').setParseAction(self.assign_op_action)
+        assignment_word = pp.Combine(identifier + assign_op + word).setParseAction(self.assignment_word_action)
+
+        punctuator = pp.oneOf('; &').setParseAction(self.punctuator_action)
+        pipe_op = pp.Literal('|').setParseAction(self.op_action(ShToken._PIPE_OP, self._NEXT_WORD_CMD))
+        io_redirect_op = pp.oneOf('>> >').setParseAction(self.op_action(ShToken._IO_REDIRECT_OP, self._NEXT_WORD_FILE))
+        io_redirect = (io_redirect_op + word)('io_redirect')
+
+        cmd_prefix = (pp.OneOrMore(assignment_word) + pp.Optional(' '))('cmd_prefix')
+        cmd_suffix = (pp.OneOrMore(word)('args') + pp.Optional(io_redirect)) ^ io_redirect
+
+        modifier = pp.oneOf('! \\')
+        cmd_word = (pp.Combine(pp.Optional(modifier) + word) ^ word)('cmd_word').setParseAction(self.cmd_word_action)
+
+        simple_command = \
+            (cmd_prefix + pp.Optional(cmd_word) + pp.Optional(cmd_suffix)) \
+            | (cmd_word + pp.Optional(cmd_suffix))
+        simple_command = pp.Group(simple_command)
+
+        pipe_sequence = simple_command + pp.ZeroOrMore(pipe_op + simple_command)
+        pipe_sequence = pp.Group(pipe_sequence)
+
+        complete_command = pp.Optional(pipe_sequence + pp.ZeroOrMore(punctuator + pipe_sequence) + pp.Optional(punctuator))
+
+        uq_word_in_dq = pp.Word(pp.printables.replace('`', ' ').replace('\\', ''))\
+            .setParseAction(self.part_action(ShToken._UQ_WORD))
+        word_in_dq = pp.Combine(pp.OneOrMore(escaped ^ escaped_oct ^ escaped_hex ^ bq_word ^ uq_word_in_dq))
+
+        self.parser = complete_command.parseWithTabs().ignore(pp.pythonStyleComment)
+        self.parser_within_dq = word_in_dq.leaveWhitespace()
+
+    def parse(self, line):
+        self.next_word_type = self._NEXT_WORD_CMD
+        self.tokens = []
+        self.parts = []
+        parsed = self.parser.parseString(line, parseAll=True)
+        return self.tokens, parsed
+
+    def parse_within_dq(self, s):
+        self.parts = []
+        self.parser_within_dq.parseString(s, parseAll=True)
+        return self.parts
+
+    def part_action(self, ttype):
+        def action(s, pos, toks):
+            self.parts.append(ShToken(toks[0], pos, ttype))
+        return action
+
+    def op_action(self, ttype, next_word_type):
+        def action(s, pos, toks):
+            self.tokens.append(ShToken(toks[0], pos, ttype))
+            self.next_word_type = next_word_type
+        return action
+
+    def assign_op_action(self, s, pos, toks):
+        self.next_word_type = self._NEXT_WORD_VAL
+
+    def assignment_word_action(self, s, pos, toks):
+        self.tokens.append(ShToken(toks[0], pos, ShToken._ASSIGN_WORD, self.parts))
+        self.parts = []
+        self.next_word_type = self._NEXT_WORD_CMD
+
+    def word_action(self, s, pos, toks):
+        if self.next_word_type == self._NEXT_WORD_VAL:
+            self.parts = ShToken(toks[0], pos, ShToken._WORD, self.parts)
+            self.next_word_type = self._NEXT_WORD_CMD
+        elif self.next_word_type != self._NEXT_WORD_CMD:
+            ttype = ShToken._FILE if self.next_word_type == self._NEXT_WORD_FILE else ShToken._WORD
+            self.tokens.append(ShToken(toks[0], pos, ttype, self.parts))
+            self.parts = []
+            self.next_word_type = None
+
+    def cmd_word_action(self, s, pos, toks):
+        self.tokens.append(ShToken(toks[0], pos, ShToken._CMD, self.parts))
+        self.next_word_type = None
+        self.parts = []
+
+    def punctuator_action(self, s, pos, toks):
+        if self.tokens[-1].ttype != ShToken._PUNCTUATOR and self.tokens[-1].spos != pos:
+            self.tokens.append(ShToken(toks[0], pos, ShToken._PUNCTUATOR))
+            self.next_word_type = self._NEXT_WORD_CMD
+
+
+def canonical_token(t):
+    """returns a comparable form of a token and its parts."""
+    parts = t.parts
+    if t.ttype == ShToken._CMD and isinstance(parts, ShToken):
+        # the pyparsing grammar left the value of a failed assignment
+        # (e.g. 'a=' as a command) as the parts of the command word
+        parts = parts.parts
+    if isinstance(parts, ShToken):
+        parts = canonical_token(parts)
+    elif parts is not None:
+        parts = [canonical_token(p) for p in parts]
+    return (t.tok, t.spos, t.epos, t.ttype, parts)
+
+
+def canonical(tokens, parsed):
+    """returns a comparable form of the results of a parser."""
+    pseqs = []
+    for item in parsed:
+        if isinstance(item, six.string_types):
+            pseqs.append(item)
+            continue
+        pseq = []
+        for sc in item:
+            if isinstance(sc, six.string_types):
+                pseq.append(sc)
+            else:
+                pseq.append((list(sc.cmd_prefix), sc.cmd_word, list(sc.args), list(sc.io_redirect)))
+        pseqs.append(pseq)
+    return [canonical_token(t) for t in tokens], pseqs
+
+
+# fragments the random command lines are made of
+_FRAGMENTS = [
+    'ls', 'echo', '-l', 'A=1', 'b_2=x', 'c=', 'x=y=z', '9a=1', '!', '!!', '!ls', '\\', '\\ls', '\\x41', '\\x4',
+    '\\123', '\\1234', '\\0', '\\n', '\\ ', '\\"', '"a b"', '"', '"x\\"y"', '"$HOME"', "'c d'", "'", "'a\\'b'",
+    '`pwd`', '`', '`a\\`b`', '&3', '&', '&&', ';', ';;', '|', '||', '>', '>>', '>>>', ' ', '  ', '\t', '\n', '\r',
+    '#c', '# x y', '$HOME', '${A}', '*.py', '~/x', 'a\\ b', 'a#b', 'é', '"ä"', '\x0b', '=', '_', 'f.txt',
+]
+
+
+@unittest.skipIf(pp is None, 'pyparsing is required to compare with the original grammar')
+class ParserDifferentialTests(StashTestCase):
+    """the parser produces the same results as the original pyparsing grammar"""
+
+    def setUp(self):
+        StashTestCase.setUp(self)
+        self.parser = ShParser(cache_size=0)
+        self.reference = ReferenceParser()
+
+    def assertSameParse(self, line):
+        try:
+            expected = canonical(*self.reference.parse(line))
+        except pp.ParseException as e:
+            expected = ('error', e.loc)
+        try:
+            result = canonical(*self.parser.parse(line))
+        except ShSyntaxError as e:
+            result = ('error', e.loc)
+        self.assertEqual(result, expected, 'different results for %r' % line)
+
+    def assertSameDqParse(self, s):
+        try:
+            expected = [canonical_token(t) for t in self.reference.parse_within_dq(s)]
+        except pp.ParseException as e:
+            expected = ('error', e.loc)
+        try:
+            result = [canonical_token(t) for t in self.parser.parse_within_dq(s)[0]]
+        except ShSyntaxError as e:
+            result = ('error', e.loc)
+        self.assertEqual(result, expected, 'different results for %r' % s)
+
+    def test_examples(self):
+        """typical command lines"""
+        for line in [
+                '', '   ', '# comment', 'ls', 'ls -l', 'A=1 B=2 ls -l >> f.txt', 'A=1', 'A=1 > f',
+                'echo "a $B" \'c\' `pwd`x', 'ls | grep x | wc -l; echo done &', 'ls ; ', 'ls ;;', 'ls | ',
+                'ls > f x', 'ls &3 a&3 &3x', 'cd ~/Documents && ls', '!!', '!ls -l', '\\ls', '\\"a"b"',
+                'echo \\x41\\101\\n', 'a=', 'A=1 B= ls', 'echo a#b #c', 'ls #c\n| wc', 'ls > #c\nf', 'echo ä',
+                'ls\tx', 'ls\x0bx', 'python -c "print(1)"', 'x=$(ls)', 'echo "unclosed', "echo 'a\\'b'",
+        ]:
+            self.assertSameParse(line)
+
+    def test_random(self):
+        """random command lines"""
+        rnd = random.Random(1234)
+        for i in range(3000):
+            line = ''.join(rnd.choice(_FRAGMENTS) + rnd.choice(['', '', ' ']) for j in range(rnd.randint(1, 8)))
+            self.assertSameParse(line)
+
+    def test_within_dq(self):
+        """the contents of double quoted words"""
+        for s in ['', 'a b  c', 'x`ls`y', '\\"', '$HOME/x', '`a', 'a\\', '\\x41\\101\\n', 'a\tb', 'ä', 'a`b\\`c`d']:
+            self.assertSameDqParse(s)
+        rnd = random.Random(4321)
+        for i in range(1000):
+            s = ''.join(rnd.choice(_FRAGMENTS) for j in range(rnd.randint(1, 5)))
+            self.assertSameDqParse(s)
+
+
+class ParserTests(StashTestCase):
+    """tests for the parse cache and the errors of the parser"""
+
+    def test_cache(self):
+        """parse results are cached, the tokens can be modified by the caller"""
+        parser = ShParser(cache_size=2)
+        tokens, parsed = parser.parse('ls -l')
+        tokens[0].tok = 'modified'
+        tokens2, parsed2 = parser.parse('ls -l')
+        self.assertIs(parsed2, parsed)
+        self.assertEqual(tokens2[0].tok, 'ls')
+        parser.parse('pwd')
+        parser.parse('cd')
+        self.assertNotIn('ls -l', parser._cache)
+        self.assertEqual(list(parser._cache), ['pwd', 'cd'])
+
+    def test_syntax_error(self):
+        """syntax errors report their position"""
+        parser = ShParser()
+        with self.assertRaises(ShSyntaxError) as cm:
+            parser.parse('ls | ')
+        self.assertEqual(cm.exception.loc, 3)
+        self.assertEqual(cm.exception.pstr, 'ls | ')
+        output = self.run_command('echo a | ', exitcode=0)
+        self.assertIn('syntax error: at char 7', output)
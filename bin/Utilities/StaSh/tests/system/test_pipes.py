@@ -0,0 +1,111 @@
+# coding=utf-8
+"""Tests for concurrent pipe sequences"""
+import ctypes
+import threading
+import time
+
+from stash.system.shcommon import ShBrokenPipe
+from stash.system.shio import ShPipe
+from stash.tests.stashtest import StashTestCase
+
+
+class ShPipeTests(StashTestCase):
+
+    def test_read_write(self):
+        """data written to a pipe can be read back until EOF"""
+        pipe = ShPipe()
+        pipe.write(u'first\nsec')
+        pipe.write(u'ond\nthird')
+        pipe.close()
+        self.assertEqual(pipe.readline(), u'first\n')
+        self.assertEqual(list(pipe), [u'second\n', u'third'])
+        self.assertEqual(pipe.read(), u'')
+
+    def test_bounded(self):
+        """a writer blocks while the pipe is full"""
+        pipe = ShPipe(maxsize=4)
+        done = threading.Event()
+
+        def writer():
+            pipe.write(u'0123456789')
+            pipe.close()
+            done.set()
+
+        t = threading.Thread(target=writer)
+        t.start()
+        time.sleep(0.2)
+        self.assertFalse(done.is_set())
+        self.assertEqual(pipe.read(), u'0123456789')
+        t.join()
+        self.assertTrue(done.is_set())
+
+    def test_broken_pipe(self):
+        """writing after the reader went away raises ShBrokenPipe"""
+        pipe = ShPipe(maxsize=4)
+        pipe.write(u'abc')
+        pipe.close_reader()
+        self.assertRaises(ShBrokenPipe, pipe.write, u'def')
+
+    def assertKillable(self, target):
+        """target blocks on a pipe; a KeyboardInterrupt raised in its thread ends it"""
+        interrupted = threading.Event()
+
+        def run():
+            try:
+                target()
+            except KeyboardInterrupt:
+                interrupted.set()
+
+        t = threading.Thread(target=run)
+        t.daemon = True
+        t.start()
+        time.sleep(0.2)
+        self.assertTrue(t.is_alive())
+        # the same way a job is killed by ShCtypesThread
+        ctypes.pythonapi.PyThreadState_SetAsyncExc(ctypes.c_ulong(t.ident), ctypes.py_object(KeyboardInterrupt))
+        t.join(2)
+        self.assertFalse(t.is_alive())
+        self.assertTrue(interrupted.is_set())
+
+    def test_kill_full_pipe(self):
+        """a writer blocked on a full pipe can be killed"""
+        pipe = ShPipe(maxsize=4)
+        self.assertKillable(lambda: pipe.write(u'0123456789'))
+
+    def test_kill_empty_pipe(self):
+        """a reader blocked on an empty pipe can be killed"""
+        pipe = ShPipe()
+        self.assertKillable(pipe.readline)
+        self.assertKillable(pipe.read)
+
+
+class ConcurrentPipeTests(StashTestCase):
+
+    setup_commands = [
+        'BIN_PATH=$STASH_ROOT/tests/system/data:$BIN_PATH',
+        'stashconf concurrent_pipes 1',
+    ]
+
+    def test_simple_pipe(self):
+        """output of a command is passed to the next one"""
+        output = self.run_command('echo hello world | grep world', exitcode=0)
+        self.assertIn('hello world', output)
+
+    def test_multiple_stages(self):
+        """longer pipe sequences produce the same output as in sequential mode"""
+        cmd = 'ls $STASH_ROOT/tests/system/data | grep test_ | sort -r'
+        concurrent = self.run_command(cmd, exitcode=0)
+        self.stash('stashconf concurrent_pipes 0')
+        sequential = self.run_command(cmd, exitcode=0)
+        self.assertEqual(concurrent, sequential)
+
+    def test_head_stops_producer(self):
+        """head terminates an endless upstream command"""
+        output = self.run_command('test_301_1.py | head -n 3', exitcode=0)
+        self.assertEqual(output, 'line 0\nline 1\nline 2\n')
+        self.assertEqual(len(self.stash.runtime.worker_registry), 0)
+
+    def test_command_not_found(self):
+        """missing commands are reported before anything runs"""
+        output = self.run_command('echo hello | nonexistingcommand', exitcode=127)
+        self.assertIn('nonexistingcommand: command not found', output)
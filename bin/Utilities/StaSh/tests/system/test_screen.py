@@ -0,0 +1,114 @@
+# coding=utf-8
+"""Tests for the in-memory screen"""
+from stash.system.shscreens import ShSequentialScreen
+from stash.tests.stashtest import StashTestCase
+
+
+class ScreenTests(StashTestCase):
+
+    def setUp(self):
+        StashTestCase.setUp(self)
+        self.screen = ShSequentialScreen(self.stash, nlines_max=5)
+
+    def test_draw(self):
+        """characters are stored as lines"""
+        self.screen.draw('first\nsecond')
+        self.screen.draw('\nthird')
+        self.assertEqual(self.screen.text, 'first\nsecond\nthird')
+        self.assertEqual(self.screen.text_length, len('first\nsecond\nthird'))
+        self.assertEqual(self.screen.nlines, 2)
+        self.assertEqual(self.screen.cursor_x, (18, 18))
+
+    def test_small_writes(self):
+        """a long line written in small pieces is joined when it is read"""
+        self.screen.nlines_max = 100
+        for i in range(2000):
+            self.screen.draw('ab')
+            if i == 1000:
+                self.assertEqual(self.screen.text, 'ab' * 1001)
+        self.screen.draw('c\nd')
+        line = self.screen._lines[-2]
+        self.assertEqual(len(line), 4002)
+        self.assertEqual(line.text, 'ab' * 2000 + 'c\n')
+        self.assertEqual(line._pieces, [])
+        self.assertEqual(self.screen.text_length, 4003)
+        self.assertEqual(self.screen.x_modifiable, max(self.screen.x_drawend, 4002))
+
+    def test_nlines_max(self):
+        """only the last nlines_max lines are kept"""
+        self.screen.clean()
+        self.screen.draw(''.join('line{}\n'.format(i) for i in range(10)))
+        self.assertEqual(self.screen.text, ''.join('line{}\n'.format(i) for i in range(5, 10)))
+        self.assertEqual(self.screen.nlines, 5)
+        # the removed characters must be removed from the terminal too
+        self.assertEqual(self.screen.intact_left_bound, 5 * len('line0\n'))
+        self.assertEqual(self.screen.cursor_xs, self.screen.text_length)
+
+    def test_style_runs(self):
+        """characters with the same style are rendered as a single run"""
+        self.screen.select_graphic_rendition(31)
+        self.screen.draw('red\nre')
+        self.screen.draw('d')
+        self.screen.select_graphic_rendition(0)
+        self.screen.draw('plain')
+        runs = self.screen.renderable_runs
+        self.assertEqual([run.data for run in runs], ['red\nred', 'plain'])
+        self.assertEqual([run.fg for run in runs], ['red', 'default'])
+        self.assertEqual(len(self.screen.renderable_chars), self.screen.text_length)
+        self.assertEqual(self.screen.renderable_chars[0].data, 'r')
+        self.assertEqual(self.screen.renderable_chars[0].fg, 'red')
+
+    def test_dirty_range(self):
+        """only changed characters are rendered again"""
+        self.screen.draw('first\nsecond')
+        self.screen.clean()
+        self.assertEqual(self.screen.renderable_runs, [])
+        self.screen.draw('\nthird')
+        self.assertEqual(self.screen.get_bounds(), (0, 12))
+        self.assertEqual(''.join(run.data for run in self.screen.renderable_runs), '\nthird')
+
+    def test_overwrite(self):
+        """characters after a carriage return replace the line"""
+        self.screen.draw('first\nsecond line')
+        self.screen.clean()
+        self.screen.carriage_return()
+        self.assertEqual(self.screen.cursor_xs, 6)
+        self.screen.select_graphic_rendition(32)
+        self.screen.draw('SECOND')
+        self.assertEqual(self.screen.text, 'first\nSECOND line')
+        self.assertEqual(self.screen.get_bounds(), (0, 6))
+        runs = self.screen.renderable_runs
+        self.assertEqual([(run.data, run.fg) for run in runs], [('SECOND', 'green'), (' line', 'default')])
+        # a newline is inserted, not replaced
+        self.screen.carriage_return()
+        self.screen.draw('x\n')
+        self.assertEqual(self.screen.text, 'first\nx\nECOND line')
+        self.assertEqual(self.screen.nlines, 2)
+
+    def test_replace_in_range(self):
+        """the modifiable range can be replaced"""
+        self.screen.draw('output\n$ ')
+        self.screen.modifiable_string = 'ls'
+        self.assertEqual(self.screen.modifiable_string, 'ls')
+        self.assertEqual(self.screen.text, 'output\n$ ls')
+        self.screen.replace_in_range((0, 2), 'pwd', relative_to_x_modifiable=True)
+        self.assertEqual(self.screen.text, 'output\n$ pwd')
+        self.assertEqual(self.screen.cursor_xs, self.screen.text_length)
+        self.screen.replace_in_range(None, '\n')
+        self.assertEqual(self.screen.text, 'output\n$ pwd\n')
+        self.assertEqual(self.screen.modifiable_string, '')
+
+    def test_erase(self):
+        """characters are deleted or erased within the current line"""
+        self.screen.draw('first\nsecond line')
+        self.screen.carriage_return()
+        self.screen.erase_in_line(2)
+        self.assertEqual(self.screen.text, 'first\n' + ' ' * len('second line'))
+        self.screen.draw('abc')
+        self.screen.backspace()
+        self.screen.delete_characters(0)
+        self.assertEqual(self.screen.text, 'first\nab')
+        # backspace does not cross lines
+        self.screen.carriage_return()
+        self.screen.backspace()
+        self.assertEqual(self.screen.cursor_xs, 6)
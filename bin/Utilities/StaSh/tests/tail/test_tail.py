@@ -0,0 +1,74 @@
+# -*- coding: utf-8 -*-
+"""tests for the 'tail' command."""
+import os
+import shutil
+import tempfile
+
+from stash.tests.stashtest import StashTestCase
+
+
+class TailTests(StashTestCase):
+    """Tests for the 'tail' command."""
+
+    def setUp(self):
+        """setup the tests"""
+        self.cwd = self.get_data_path()
+        StashTestCase.setUp(self)
+
+    def get_data_path(self):
+        """return the data/ sibling path"""
+        return os.path.abspath(os.path.join(os.path.dirname(__file__), "data"))
+
+    def lines(self, start, end):
+        """return the lines of numbers.txt from start to end, inclusive"""
+        return "".join("line {}\n".format(i) for i in range(start, end + 1))
+
+    def test_default(self):
+        """test 'tail <file>'."""
+        output = self.run_command("tail numbers.txt", exitcode=0)
+        self.assertEqual(output, self.lines(11, 20))
+
+    def test_lines(self):
+        """test 'tail -n <n> <file>'."""
+        output = self.run_command("tail -n 3 numbers.txt", exitcode=0)
+        self.assertEqual(output, self.lines(18, 20))
+        output = self.run_command("tail -n 0 numbers.txt", exitcode=0)
+        self.assertEqual(output, "")
+        output = self.run_command("tail -n 50 numbers.txt", exitcode=0)
+        self.assertEqual(output, self.lines(1, 20))
+
+    def test_lines_from_start(self):
+        """test 'tail -n +<n> <file>'."""
+        output = self.run_command("tail -n +18 numbers.txt", exitcode=0)
+        self.assertEqual(output, self.lines(18, 20))
+
+    def test_bytes(self):
+        """test 'tail -c <n> <file>'."""
+        output = self.run_command("tail -c 8 numbers.txt", exitcode=0)
+        self.assertEqual(output, "line 20\n")
+        output = self.run_command("tail -c +136 numbers.txt", exitcode=0)
+        self.assertEqual(output, self.lines(19, 20))
+
+    def test_stdin(self):
+        """test 'tail' reading from stdin."""
+        output = self.run_command("cat numbers.txt | tail -n 2", exitcode=0)
+        self.assertEqual(output, self.lines(19, 20))
+        output = self.run_command("cat numbers.txt | tail -n +20", exitcode=0)
+        self.assertEqual(output, self.lines(20, 20))
+
+    def test_large_file(self):
+        """test 'tail' on a file larger than the blocks read from the end."""
+        tempdir = tempfile.mkdtemp()
+        try:
+            path = os.path.join(tempdir, "large.txt")
+            with open(path, "w") as f:
+                for i in range(1, 30001):
+                    f.write("line {}\n".format(i))
+                # no newline at the end
+                f.write("last line")
+            output = self.run_command("tail -n 3 '{}'".format(path), exitcode=0)
+            self.assertEqual(output, "line 29999\nline 30000\nlast line")
+            output = self.run_command("tail -n +30000 '{}'".format(path), exitcode=0)
+            self.assertEqual(output, "line 30000\nlast line")
+        finally:
+            shutil.rmtree(tempdir)
@@ -0,0 +1,61 @@
+# -*- coding: utf-8 -*-
+"""tests for the 'tar' command."""
+import os
+import shutil
+import tarfile
+import tempfile
+
+from stash.tests.stashtest import StashTestCase
+
+
+class TarTests(StashTestCase):
+    """Tests for the 'tar' command."""
+
+    def setUp(self):
+        """setup the tests"""
+        self.cwd = self.get_data_path()
+        StashTestCase.setUp(self)
+        self.tempdir = tempfile.mkdtemp(prefix="stash_tar_test_")
+
+    def tearDown(self):
+        shutil.rmtree(self.tempdir)
+        StashTestCase.tearDown(self)
+
+    def get_data_path(self):
+        """return the data/ sibling path"""
+        return os.path.abspath(os.path.join(os.path.dirname(__file__), "data"))
+
+    def test_gzip(self):
+        """test creating and extracting a gzip compressed archive."""
+        archive = os.path.join(self.tempdir, "test.tar.gz")
+        output = self.run_command("tar -czf '{}' dir --threads 2".format(archive), exitcode=0)
+        self.assertIn("Archive Created.", output)
+        with tarfile.open(archive, "r:gz") as tar:
+            self.assertEqual(sorted(tar.getnames()), ["dir", "dir/a.txt", "dir/b.txt"])
+        # the compression is detected
+        output = self.run_command("tar -xf '{}' -C '{}'".format(archive, self.tempdir), exitcode=0)
+        self.assertIn("Archive extracted.", output)
+        with open(os.path.join(self.tempdir, "dir", "b.txt")) as f:
+            self.assertEqual(f.read(), "second file\n")
+
+    def test_list(self):
+        """test listing an archive."""
+        archive = os.path.join(self.tempdir, "test.tar")
+        self.run_command("tar -cf '{}' dir".format(archive), exitcode=0)
+        output = self.run_command("tar -tf '{}'".format(archive), exitcode=0)
+        self.assertIn("dir/a.txt", output)
+        self.assertIn("dir/b.txt", output)
+
+    def test_extract_members(self):
+        """test extracting some members."""
+        archive = os.path.join(self.tempdir, "test.tar.gz")
+        self.run_command("tar -czf '{}' dir".format(archive), exitcode=0)
+        self.run_command("tar -xzvf '{}' -C '{}' dir/a.txt".format(archive, self.tempdir), exitcode=0)
+        self.assertTrue(os.path.exists(os.path.join(self.tempdir, "dir", "a.txt")))
+        self.assertFalse(os.path.exists(os.path.join(self.tempdir, "dir", "b.txt")))
+
+    def test_pipe(self):
+        """test streaming an archive through a pipe."""
+        output = self.run_command("tar -cz dir | tar -t", exitcode=0)
+        self.assertIn("dir/a.txt", output)
+        self.assertIn("dir/b.txt", output)
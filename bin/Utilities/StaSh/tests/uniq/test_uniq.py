@@ -0,0 +1,29 @@
+# -*- coding: utf-8 -*-
+"""tests for the 'uniq' command."""
+import os
+
+from stash.tests.stashtest import StashTestCase
+
+
+class UniqTests(StashTestCase):
+    """Tests for the 'uniq' command."""
+
+    def setUp(self):
+        """setup the tests"""
+        self.cwd = self.get_data_path()
+        StashTestCase.setUp(self)
+
+    def get_data_path(self):
+        """return the data/ sibling path"""
+        return os.path.abspath(os.path.join(os.path.dirname(__file__), "data"))
+
+    def test_uniq(self):
+        """test 'uniq <file>'."""
+        output = self.run_command("uniq sorted.txt", exitcode=0)
+        self.assertEqual(output.split(), ["a", "b", "c"])
+
+    def test_missing_file(self):
+        """test 'uniq' with a file which can not be read."""
+        output = self.run_command("uniq missing.txt sorted.txt", exitcode=1)
+        self.assertIn("uniq: ", output)
+        self.assertEqual(output.split()[-3:], ["a", "b", "c"])
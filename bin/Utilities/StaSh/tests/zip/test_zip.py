@@ -0,0 +1,36 @@
+# -*- coding: utf-8 -*-
+"""tests for the 'zip' command."""
+import os
+import shutil
+import tempfile
+import zipfile
+
+from stash.tests.stashtest import StashTestCase
+
+
+class ZipTests(StashTestCase):
+    """Tests for the 'zip' command."""
+
+    def setUp(self):
+        """setup the tests"""
+        StashTestCase.setUp(self)
+        self.tempdir = tempfile.mkdtemp(prefix="stash_zip_test_")
+        self.cwd = self.tempdir
+        os.mkdir(os.path.join(self.tempdir, "dir"))
+        for name in ("a.txt", "b.txt"):
+            with open(os.path.join(self.tempdir, "dir", name), "w") as f:
+                f.write(name * 1000)
+
+    def tearDown(self):
+        # leave the directory before it is removed
+        os.chdir(os.path.dirname(__file__))
+        shutil.rmtree(self.tempdir)
+        StashTestCase.tearDown(self)
+
+    def test_zip(self):
+        """test zipping a directory."""
+        self.run_command("zip test.zip dir --threads 2", exitcode=0)
+        with zipfile.ZipFile(os.path.join(self.tempdir, "test.zip")) as zf:
+            self.assertIsNone(zf.testzip())
+            self.assertEqual(sorted(zf.namelist()), ["dir/", "dir/a.txt", "dir/b.txt"])
+            self.assertEqual(zf.read("dir/a.txt"), b"a.txt" * 1000)